@@ -0,0 +1,41 @@
+"""add photo estimates cache
+
+Revision ID: a6d3e9f1c4b8
+Revises: f2c8a4d6b1e3
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "a6d3e9f1c4b8"
+down_revision: Union[str, Sequence[str], None] = "f2c8a4d6b1e3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "photo_estimates",
+        sa.Column("id", sa.Integer(), primary_key=True, autoincrement=True),
+        sa.Column("scope", sa.String(length=32), nullable=False),
+        sa.Column("phash", sa.BigInteger(), nullable=False),
+        sa.Column("file_unique_id", sa.String(length=128), nullable=True),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("calories", sa.Float(), nullable=False),
+        sa.Column("protein_g", sa.Float(), nullable=False),
+        sa.Column("fat_g", sa.Float(), nullable=False),
+        sa.Column("carbs_g", sa.Float(), nullable=False),
+        sa.Column("meal_type", sa.String(length=32), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+    op.create_index("ix_photo_estimates_scope_id", "photo_estimates", ["scope", "id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_photo_estimates_scope_id", table_name="photo_estimates")
+    op.drop_table("photo_estimates")
@@ -0,0 +1,38 @@
+"""add weight plan trajectory
+
+Revision ID: b8e2f4a7d1c9
+Revises: a6d3e9f1c4b8
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "b8e2f4a7d1c9"
+down_revision: Union[str, Sequence[str], None] = "a6d3e9f1c4b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Пустая таблица: траектории действующих планов дозаписывает первая проверка планов.
+    op.create_table(
+        "weight_plan_trajectory",
+        sa.Column(
+            "telegram_id",
+            sa.Integer(),
+            sa.ForeignKey("users.telegram_id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("inputs_key", sa.String(length=160), nullable=False),
+        sa.Column("weights", sa.LargeBinary(), nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("weight_plan_trajectory")
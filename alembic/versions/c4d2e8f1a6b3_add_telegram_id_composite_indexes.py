@@ -0,0 +1,40 @@
+"""add telegram_id composite indexes
+
+Revision ID: c4d2e8f1a6b3
+Revises: b3a1f5e9c2d7
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "c4d2e8f1a6b3"
+down_revision: Union[str, Sequence[str], None] = "b3a1f5e9c2d7"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+_INDEXES: tuple[tuple[str, str, list[str]], ...] = (
+    ("ix_meal_logs_telegram_id_logged_at", "meal_logs", ["telegram_id", "logged_at"]),
+    ("ix_weight_logs_telegram_id_logged_at", "weight_logs", ["telegram_id", "logged_at"]),
+    ("ix_water_logs_telegram_id_logged_at", "water_logs", ["telegram_id", "logged_at"]),
+    (
+        "ix_conversation_messages_telegram_id_created_at",
+        "conversation_messages",
+        ["telegram_id", "created_at", "id"],
+    ),
+    ("ix_daily_checkins_telegram_id_checkin_date", "daily_checkins", ["telegram_id", "checkin_date"]),
+    ("ix_achievements_telegram_id_badge_key", "achievements", ["telegram_id", "badge_key"]),
+)
+
+
+def upgrade() -> None:
+    for name, table, columns in _INDEXES:
+        op.create_index(name, table, columns)
+
+
+def downgrade() -> None:
+    for name, table, _ in reversed(_INDEXES):
+        op.drop_index(name, table_name=table)
@@ -0,0 +1,34 @@
+"""add fsm state storage
+
+Revision ID: c5f1a8e3b9d2
+Revises: b8e2f4a7d1c9
+Create Date: 2026-10-17 20:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "c5f1a8e3b9d2"
+down_revision: Union[str, Sequence[str], None] = "b8e2f4a7d1c9"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "fsm_state",
+        sa.Column("key", sa.String(length=255), primary_key=True),
+        sa.Column("state", sa.String(length=255), nullable=True),
+        sa.Column("data", sa.Text(), nullable=False, server_default="{}"),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_fsm_state_expires_at", "fsm_state", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_fsm_state_expires_at", table_name="fsm_state")
+    op.drop_table("fsm_state")
@@ -0,0 +1,46 @@
+"""add scheduler lease and job run ledger
+
+Revision ID: d7a4c2e6f8b1
+Revises: c5f1a8e3b9d2
+Create Date: 2026-10-17 22:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "d7a4c2e6f8b1"
+down_revision: Union[str, Sequence[str], None] = "c5f1a8e3b9d2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "scheduler_lease",
+        sa.Column("name", sa.String(length=64), primary_key=True),
+        sa.Column("holder", sa.String(length=128), nullable=False),
+        sa.Column("token", sa.BigInteger(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("heartbeat_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_table(
+        "scheduler_job_run",
+        sa.Column("job", sa.String(length=64), primary_key=True),
+        sa.Column("slot", sa.String(length=32), primary_key=True),
+        sa.Column("holder", sa.String(length=128), nullable=False),
+        sa.Column("token", sa.BigInteger(), nullable=False),
+        sa.Column("status", sa.String(length=16), nullable=False, server_default="running"),
+        sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("finished_at", sa.DateTime(timezone=True), nullable=True),
+    )
+    op.create_index("ix_scheduler_job_run_started_at", "scheduler_job_run", ["started_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_scheduler_job_run_started_at", table_name="scheduler_job_run")
+    op.drop_table("scheduler_job_run")
+    op.drop_table("scheduler_lease")
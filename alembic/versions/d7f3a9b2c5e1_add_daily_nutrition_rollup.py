@@ -0,0 +1,42 @@
+"""add daily nutrition rollup
+
+Revision ID: d7f3a9b2c5e1
+Revises: c4d2e8f1a6b3
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "d7f3a9b2c5e1"
+down_revision: Union[str, Sequence[str], None] = "c4d2e8f1a6b3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Таблица заполняется командой `python -m bot.database.backfill` после миграции.
+    op.create_table(
+        "daily_nutrition",
+        sa.Column(
+            "telegram_id",
+            sa.Integer(),
+            sa.ForeignKey("users.telegram_id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+        sa.Column("local_date", sa.Date(), primary_key=True),
+        sa.Column("calories", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("protein_g", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("fat_g", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("carbs_g", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("meals_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("water_ml", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("daily_nutrition")
@@ -0,0 +1,33 @@
+"""add rate limit window counters
+
+Revision ID: e4c7b2a9d5f3
+Revises: d7a4c2e6f8b1
+Create Date: 2026-10-17 23:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "e4c7b2a9d5f3"
+down_revision: Union[str, Sequence[str], None] = "d7a4c2e6f8b1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "rate_limit_window",
+        sa.Column("telegram_id", sa.BigInteger(), primary_key=True),
+        sa.Column("window_start", sa.BigInteger(), primary_key=True),
+        sa.Column("hits", sa.Integer(), nullable=False, server_default="0"),
+    )
+    op.create_index("ix_rate_limit_window_window_start", "rate_limit_window", ["window_start"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_rate_limit_window_window_start", table_name="rate_limit_window")
+    op.drop_table("rate_limit_window")
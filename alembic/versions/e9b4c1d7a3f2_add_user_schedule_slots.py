@@ -0,0 +1,45 @@
+"""add user schedule slots
+
+Revision ID: e9b4c1d7a3f2
+Revises: d7f3a9b2c5e1
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "e9b4c1d7a3f2"
+down_revision: Union[str, Sequence[str], None] = "d7f3a9b2c5e1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # NULL у всех пользователей — индекс построится на первом тике планировщика.
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.add_column(sa.Column("schedule_valid_until", sa.DateTime(timezone=True), nullable=True))
+        batch_op.create_index("ix_users_schedule_valid_until", ["schedule_valid_until"])
+    op.create_table(
+        "user_schedule_slots",
+        sa.Column("kind", sa.String(length=32), primary_key=True),
+        sa.Column("slot", sa.Integer(), primary_key=True),
+        sa.Column(
+            "telegram_id",
+            sa.Integer(),
+            sa.ForeignKey("users.telegram_id", ondelete="CASCADE"),
+            primary_key=True,
+        ),
+    )
+    op.create_index("ix_user_schedule_slots_telegram_id", "user_schedule_slots", ["telegram_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_user_schedule_slots_telegram_id", table_name="user_schedule_slots")
+    op.drop_table("user_schedule_slots")
+    with op.batch_alter_table("users") as batch_op:
+        batch_op.drop_index("ix_users_schedule_valid_until")
+        batch_op.drop_column("schedule_valid_until")
@@ -0,0 +1,41 @@
+"""add meal estimates cache
+
+Revision ID: f2c8a4d6b1e3
+Revises: e9b4c1d7a3f2
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+from alembic import op
+
+revision: str = "f2c8a4d6b1e3"
+down_revision: Union[str, Sequence[str], None] = "e9b4c1d7a3f2"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "meal_estimates",
+        sa.Column("cache_key", sa.String(length=64), primary_key=True),
+        sa.Column("model", sa.String(length=64), nullable=False),
+        sa.Column("normalized_text", sa.Text(), nullable=False),
+        sa.Column("description", sa.Text(), nullable=False),
+        sa.Column("calories", sa.Float(), nullable=False),
+        sa.Column("protein_g", sa.Float(), nullable=False),
+        sa.Column("fat_g", sa.Float(), nullable=False),
+        sa.Column("carbs_g", sa.Float(), nullable=False),
+        sa.Column("meal_type", sa.String(length=32), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False),
+        sa.Column("expires_at", sa.DateTime(timezone=True), nullable=False),
+    )
+    op.create_index("ix_meal_estimates_expires_at", "meal_estimates", ["expires_at"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_meal_estimates_expires_at", table_name="meal_estimates")
+    op.drop_table("meal_estimates")
@@ -0,0 +1,222 @@
+"""Запись и воспроизведение ответов vision-модели для JFB без сети.
+
+Кассета — gzip-файл JSON-строк: по одной записи на ответ, ключ — (image_id, модель,
+хэш промпта). Хэш считается по тексту запроса без самого изображения, поэтому правка
+промпта даёт промах, а смена размера фото — нет. Запись дописывается сразу после
+ответа (gzip допускает склейку потоков), так что оборванный прогон ничего не теряет.
+
+    client = RecordingClient(AsyncOpenAI(...), Cassette(path))   # --record
+    client = ReplayClient(Cassette(path), latency=parse_latency("lognormal:1.2,0.4"))  # --replay
+
+Запрос привязывается к изображению через `with cassette_image(image_id):` вокруг вызова.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import gzip
+import hashlib
+import json
+import math
+import random
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from benchmark.metrics import mark_first_byte
+
+_CURRENT_IMAGE: contextvars.ContextVar[str | None] = contextvars.ContextVar("cassette_image", default=None)
+
+# Задержка ответа: (генератор, записанная задержка или None) -> секунды.
+LatencyModel = Callable[[random.Random, float | None], float]
+
+
+class CassetteMiss(KeyError):
+    """В кассете нет ответа на такой запрос."""
+
+
+@contextmanager
+def cassette_image(image_id: str) -> Iterator[None]:
+    token = _CURRENT_IMAGE.set(image_id)
+    try:
+        yield
+    finally:
+        _CURRENT_IMAGE.reset(token)
+
+
+def prompt_hash(request: dict[str, Any]) -> str:
+    """Хэш запроса без изображений: системный промпт, текст, detail и response_format."""
+    messages = []
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):
+            content = [
+                {"type": "image_url", "detail": part["image_url"].get("detail")}
+                if part.get("type") == "image_url"
+                else part
+                for part in content
+            ]
+        messages.append({"role": message.get("role"), "content": content})
+    raw = json.dumps(
+        {"messages": messages, "response_format": request.get("response_format")},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _key(image_id: str, model: str, request_hash: str) -> str:
+    return f"{image_id}|{model}|{request_hash}"
+
+
+class Cassette:
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self._entries: dict[str, dict[str, Any]] = {}
+        if self.path.exists():
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, image_id: str, model: str, request_hash: str) -> dict[str, Any] | None:
+        return self._entries.get(_key(image_id, model, request_hash))
+
+    def add(
+        self,
+        image_id: str,
+        model: str,
+        request_hash: str,
+        *,
+        content: str | None,
+        usage: dict[str, int] | None,
+        latency_s: float,
+    ) -> None:
+        entry = {
+            "key": _key(image_id, model, request_hash),
+            "content": content,
+            "usage": usage,
+            "latency_s": round(latency_s, 4),
+        }
+        self._entries[entry["key"]] = entry
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(self.path, "at", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+
+def _usage_dict(response: Any) -> dict[str, int] | None:
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    fields = ("prompt_tokens", "completion_tokens", "total_tokens")
+    values = {name: getattr(usage, name, None) for name in fields}
+    return {name: value for name, value in values.items() if isinstance(value, int)} or None
+
+
+def _response(content: str | None, usage: dict[str, int] | None) -> SimpleNamespace:
+    """Объект с теми же полями, что читает estimator.core из ответа Chat Completions."""
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(**usage) if usage else None,
+    )
+
+
+def _current_image() -> str:
+    image_id = _CURRENT_IMAGE.get()
+    if image_id is None:
+        raise RuntimeError("Cassette request outside of cassette_image()")
+    return image_id
+
+
+class _RecordingCompletions:
+    def __init__(self, inner: Any, cassette: Cassette) -> None:
+        self._inner = inner
+        self._cassette = cassette
+
+    async def create(self, **kwargs: Any) -> Any:
+        image_id = _current_image()
+        started = time.perf_counter()
+        response = await self._inner.create(**kwargs)
+        self._cassette.add(
+            image_id,
+            kwargs["model"],
+            prompt_hash(kwargs),
+            content=response.choices[0].message.content,
+            usage=_usage_dict(response),
+            latency_s=time.perf_counter() - started,
+        )
+        return response
+
+
+class RecordingClient:
+    """Обёртка над AsyncOpenAI: ответы проходят насквозь и пишутся в кассету."""
+
+    def __init__(self, client: Any, cassette: Cassette) -> None:
+        self.cassette = cassette
+        self.chat = SimpleNamespace(completions=_RecordingCompletions(client.chat.completions, cassette))
+
+
+class _ReplayCompletions:
+    def __init__(self, client: ReplayClient) -> None:
+        self._client = client
+
+    async def create(self, **kwargs: Any) -> SimpleNamespace:
+        client = self._client
+        entry = client.cassette.get(_current_image(), kwargs["model"], prompt_hash(kwargs))
+        if entry is None:
+            client.misses += 1
+            raise CassetteMiss(f"No recorded response for image {_current_image()} and model {kwargs['model']}")
+        delay = client.latency(client.rng, entry.get("latency_s"))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        # Ответ без стриминга приходит целиком: первый байт — это весь ответ.
+        mark_first_byte()
+        client.hits += 1
+        return _response(entry.get("content"), entry.get("usage"))
+
+
+class ReplayClient:
+    """Поддельный AsyncOpenAI: отвечает из кассеты с заданной задержкой."""
+
+    def __init__(self, cassette: Cassette, *, latency: LatencyModel | None = None, seed: int = 0) -> None:
+        self.cassette = cassette
+        self.latency = latency or parse_latency("0")
+        self.rng = random.Random(seed)
+        self.hits = 0
+        self.misses = 0
+        self.chat = SimpleNamespace(completions=_ReplayCompletions(self))
+
+
+def parse_latency(spec: str) -> LatencyModel:
+    """Распределение задержки ответа из строки.
+
+    0 или const:S            — постоянная задержка S секунд
+    recorded                 — задержка, записанная в кассете
+    uniform:A,B              — равномерно от A до B секунд
+    lognormal:MEDIAN,SIGMA   — логнормальное с медианой MEDIAN (хвосты как у реального API)
+    """
+    kind, _, params = spec.strip().partition(":")
+    try:
+        values = [float(v) for v in params.split(",")] if params else []
+        if kind in {"0", "const"}:
+            constant = values[0] if values else 0.0
+            return lambda rng, recorded: constant
+        if kind == "recorded" and not values:
+            return lambda rng, recorded: recorded or 0.0
+        if kind == "uniform" and len(values) == 2:
+            low, high = values
+            return lambda rng, recorded: rng.uniform(low, high)
+        if kind == "lognormal" and len(values) == 2:
+            mu, sigma = math.log(values[0]), values[1]
+            return lambda rng, recorded: rng.lognormvariate(mu, sigma)
+    except ValueError:
+        pass
+    raise ValueError(f"Unsupported latency spec: {spec!r}")
@@ -0,0 +1,142 @@
+"""Бенчмарк задержки event loop при отрисовке графиков веса.
+
+Пока рисуются графики, в том же loop тикает «пульс» с шагом --tick-ms; опоздание
+каждого тика — это время, на которое loop был занят и не обрабатывал чужие апдейты.
+Сравниваются режимы: sync (прямой вызов matplotlib в обработчике, как было раньше),
+thread (ChartRenderer без пула), pool (ChartRenderer с прогретыми процессами)
+и cached (повтор тех же графиков из кэша).
+
+Использование:
+    python -m benchmark.chart_stall
+    python -m benchmark.chart_stall --charts 40 --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmark.metrics import percentile  # noqa: E402
+from bot.services.chart_renderer import ChartRenderer  # noqa: E402
+
+MODES = ("sync", "thread", "pool", "cached")
+
+
+def _forecast(start_kg: float, weeks: int, step: float) -> list[dict]:
+    start = date(2026, 1, 1)
+    return [
+        {"date": (start + timedelta(days=day)).isoformat(), "weight_kg": round(start_kg - step * day, 2)}
+        for day in range(weeks * 7 + 1)
+    ]
+
+
+def sample_inputs(count: int) -> list[dict[str, list[dict] | float]]:
+    """Разные наборы входных данных, чтобы графики не совпадали в кэше."""
+    items = []
+    for i in range(count):
+        start_kg = 90.0 + i * 0.1
+        items.append(
+            {
+                "forecasts": {
+                    "light": _forecast(start_kg, 30, 0.035),
+                    "medium": _forecast(start_kg, 20, 0.06),
+                    "hard": _forecast(start_kg, 14, 0.09),
+                },
+                "current_weight": start_kg,
+                "target_weight": 80.0,
+            }
+        )
+    return items
+
+
+async def measure_stall(
+    render_all: Callable[[], Awaitable[None]], tick_s: float
+) -> dict[str, float]:
+    """Опоздания тиков пульса (мс) и общее время, пока выполняется render_all()."""
+    lags: list[float] = []
+    done = asyncio.Event()
+
+    async def heartbeat() -> None:
+        while not done.is_set():
+            expected = time.perf_counter() + tick_s
+            await asyncio.sleep(tick_s)
+            lags.append(max(0.0, time.perf_counter() - expected) * 1000)
+
+    ticker = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await render_all()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker
+    return {
+        "total_s": round(elapsed, 3),
+        "max_lag_ms": round(max(lags, default=0.0), 1),
+        "p99_lag_ms": round(percentile(lags, 99), 1),
+        "p50_lag_ms": round(percentile(lags, 50), 1),
+    }
+
+
+async def run(charts: int, workers: int, concurrency: int, tick_ms: float) -> dict[str, dict[str, float]]:
+    from bot.services.chart import render_three_scenarios_chart
+
+    inputs = sample_inputs(charts)
+    tick_s = tick_ms / 1000
+    # Первый рендер импортирует шрифты и бэкенд — не должен попадать ни в один режим.
+    render_three_scenarios_chart(**inputs[0])
+
+    async def gather_limited(render: Callable[[dict], Awaitable[bytes]]) -> None:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one(item: dict) -> None:
+            async with semaphore:
+                await render(item)
+
+        await asyncio.gather(*(one(item) for item in inputs))
+
+    async def sync_render(item: dict) -> bytes:
+        return render_three_scenarios_chart(**item).getvalue()
+
+    thread = ChartRenderer(workers=0, max_entries=0)
+    pool = ChartRenderer(workers=workers, max_entries=charts)
+    await pool.start()
+    try:
+        results = {
+            "sync": await measure_stall(lambda: gather_limited(sync_render), tick_s),
+            "thread": await measure_stall(lambda: gather_limited(lambda x: thread.three_scenarios(**x)), tick_s),
+            "pool": await measure_stall(lambda: gather_limited(lambda x: pool.three_scenarios(**x)), tick_s),
+            "cached": await measure_stall(lambda: gather_limited(lambda x: pool.three_scenarios(**x)), tick_s),
+        }
+    finally:
+        pool.shutdown()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Event-loop stall while rendering weight charts")
+    parser.add_argument("--charts", type=int, default=20, help="Сколько разных графиков рисовать")
+    parser.add_argument("--workers", type=int, default=2, help="Процессов в пуле")
+    parser.add_argument("--concurrency", type=int, default=4, help="Одновременных запросов графика")
+    parser.add_argument("--tick-ms", type=float, default=5.0, help="Шаг пульса event loop, мс")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.charts, args.workers, args.concurrency, args.tick_ms))
+    print(f"{'mode':<8} {'total_s':>8} {'max_lag_ms':>11} {'p99_lag_ms':>11} {'p50_lag_ms':>11}")
+    for mode in MODES:
+        row = results[mode]
+        print(
+            f"{mode:<8} {row['total_s']:>8.3f} {row['max_lag_ms']:>11.1f} "
+            f"{row['p99_lag_ms']:>11.1f} {row['p50_lag_ms']:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Помощники бенчмарков над БД: счётчик SQL-запросов и наполнение чата лиги; ими пользуются и тесты."""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from bot.database import crud
+from bot.database.models import GroupChatMember, MealLog, User, WeightLog
+
+GOALS = ("lose", "maintain", "gain")
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+
+@contextmanager
+def count_queries(engine: AsyncEngine) -> Iterator[QueryCounter]:
+    """Считает SQL-запросы, выполненные движком внутри блока."""
+    counter = QueryCounter()
+
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        _ = (conn, cursor, statement, parameters, context, executemany)
+        counter.count += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _before)
+    try:
+        yield counter
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", _before)
+
+
+async def seed_league_chat(session: AsyncSession, chat_id: int, members: int) -> None:
+    """Чат с участниками во всех лигах, приёмами пищи и взвешиваниями за последние дни."""
+    await crud.add_group_chat(session, chat_id, "League Chat")
+    now = datetime.now(tz=UTC)
+    for i in range(members):
+        tid = abs(chat_id) * 10_000 + i
+        session.add(
+            User(
+                telegram_id=tid,
+                username=f"user{i}" if i % 3 else None,
+                gender="male",
+                age=30,
+                height_cm=175.0,
+                weight_start_kg=80.0,
+                activity_level="moderate",
+                goal=GOALS[i % 3],
+                daily_calories_target=1800.0 + i,
+                daily_protein_target=100.0,
+                daily_fat_target=60.0,
+                daily_carbs_target=200.0,
+            )
+        )
+        session.add(GroupChatMember(chat_id=chat_id, telegram_id=tid))
+        for day in range(0, 9, 2 + i % 2):
+            session.add(
+                MealLog(
+                    telegram_id=tid,
+                    description="meal",
+                    calories=300.0 + 17.3 * i + day,
+                    protein_g=10.0,
+                    fat_g=5.0,
+                    carbs_g=30.0,
+                    logged_at=now - timedelta(days=day, hours=i % 5),
+                )
+            )
+        # Каждый четвёртый участник без взвешиваний — в отчёте «вес —».
+        if i % 4:
+            for day in range(0, 10, 1 + i % 3):
+                session.add(
+                    WeightLog(
+                        telegram_id=tid,
+                        weight_kg=80.0 - 0.1 * day + 0.01 * i,
+                        logged_at=now - timedelta(days=day, hours=1),
+                    )
+                )
+    await session.commit()
@@ -0,0 +1,86 @@
+"""Локальный «Telegram» без сети: сессия Bot API с записью вызовов и генератор апдейтов.
+
+FakeTelegramSession подменяет HTTP-сессию aiogram: каждый метод Bot API записывается в
+calls и сразу (или после latency_s — имитация задержки API) получает правдоподобный
+ответ. Bot(token=FAKE_TOKEN, session=FakeTelegramSession()) работает с обычными
+обработчиками, а text_update() даёт сырые апдейты для webhook или Dispatcher.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import itertools
+import json
+import time
+from collections.abc import AsyncGenerator
+from typing import TYPE_CHECKING, Any
+
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import GetMe, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+FAKE_TOKEN = "123456:fake-telegram-token"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "NutriBot", "username": "nutri_test_bot"}
+
+
+class FakeTelegramSession(BaseSession):
+    def __init__(self, latency_s: float = 0.0) -> None:
+        super().__init__()
+        self.latency_s = latency_s
+        self.calls: list[TelegramMethod[Any]] = []
+        self._message_ids = itertools.count(1)
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod[TelegramType], timeout: int | None = None
+    ) -> TelegramType:
+        self.calls.append(method)
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        payload = json.dumps({"ok": True, "result": self._result(method)})
+        return self.check_response(bot, method, 200, payload).result  # type: ignore[return-value]
+
+    async def stream_content(
+        self, url: str, headers: dict[str, Any] | None = None, timeout: int = 30,
+        chunk_size: int = 65536, raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
+
+    def sent(self, api_method: str = "sendMessage") -> list[TelegramMethod[Any]]:
+        return [call for call in self.calls if call.__api_method__ == api_method]
+
+    def _result(self, method: TelegramMethod[Any]) -> Any:
+        if isinstance(method, GetMe):
+            return BOT_USER
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(("send", "edit")):
+            return True
+        message: dict[str, Any] = {
+            "message_id": getattr(method, "message_id", None) or next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "group"},
+            "from": BOT_USER,
+        }
+        if text := getattr(method, "text", None):
+            message["text"] = text
+        return message
+
+
+def text_update(update_id: int, user_id: int, text: str, *, chat_id: int | None = None) -> dict[str, Any]:
+    """Сырой апдейт с текстовым сообщением пользователя, как его присылает Telegram."""
+    chat_id = user_id if chat_id is None else chat_id
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "group"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"},
+            "text": text,
+        },
+    }
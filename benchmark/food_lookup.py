@@ -0,0 +1,76 @@
+"""Бенчмарк поиска по справочнику продуктов: задержка lookup на синтетической таблице.
+
+Использование:
+    python -m benchmark.food_lookup                    # таблицы на 1k, 10k, 50k продуктов
+    python -m benchmark.food_lookup --sizes 100000 --queries 5000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from bot.services.food_db import FoodRow, FoodTable  # noqa: E402
+
+_SYLLABLES = ("ка", "ро", "ми", "ту", "ла", "не", "зо", "пи", "ве", "ду", "ск", "ор", "ан", "ель", "ис", "ур")
+
+
+def _word(rng: random.Random) -> str:
+    return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def synthetic_table(size: int, *, seed: int = 7) -> tuple[FoodTable, list[str]]:
+    """Таблица из size продуктов с названиями из 1–3 псевдослов и список их названий."""
+    rng = random.Random(seed)
+    vocabulary = [_word(rng) for _ in range(max(200, size // 10))]
+    names = [" ".join(rng.sample(vocabulary, rng.randint(1, 3))) for _ in range(size)]
+    rows = [
+        FoodRow(
+            name=name,
+            name_en="",
+            synonyms=(),
+            calories=rng.uniform(10, 900),
+            protein_g=rng.uniform(0, 80),
+            fat_g=rng.uniform(0, 99),
+            carbs_g=rng.uniform(0, 99),
+        )
+        for i, name in enumerate(names)
+    ]
+    return FoodTable(rows), names
+
+
+def measure_lookup_us(table: FoodTable, queries: list[str]) -> list[float]:
+    timings: list[float] = []
+    for query in queries:
+        started = time.perf_counter()
+        table.lookup(query)
+        timings.append((time.perf_counter() - started) * 1_000_000)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк поиска по справочнику продуктов")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 50_000], help="Размеры таблиц")
+    parser.add_argument("--queries", type=int, default=2_000, help="Число запросов на таблицу")
+    args = parser.parse_args()
+
+    print(f"{'foods':>8} {'build_ms':>10} {'p50_us':>8} {'p99_us':>8}")
+    for size in args.sizes:
+        started = time.perf_counter()
+        table, names = synthetic_table(size)
+        build_ms = (time.perf_counter() - started) * 1000
+        rng = random.Random(size)
+        timings = measure_lookup_us(table, [rng.choice(names) for _ in range(args.queries)])
+        p99 = statistics.quantiles(timings, n=100)[98]
+        print(f"{size:>8} {build_ms:>10.0f} {statistics.median(timings):>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
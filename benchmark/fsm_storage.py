@@ -0,0 +1,117 @@
+"""Бенчмарк задержки хранилищ FSM: MemoryStorage против SQLAlchemyStorage.
+
+Один «апдейт» повторяет шаг онбординга: чтение состояния (как делает FSM-middleware),
+update_data и set_state на следующий шаг; каждый пятый апдейт завершает диалог через
+clear(). SQL-хранилище меряется без буфера (каждая запись — отдельный запрос) и с
+буфером FSMWriteBatchMiddleware (запись одним запросом в конце апдейта).
+
+Использование:
+    python -m benchmark.fsm_storage                       # временная SQLite-база
+    python -m benchmark.fsm_storage --updates 5000 --concurrency 16
+    python -m benchmark.fsm_storage --database-url postgresql+asyncpg://...
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import tempfile
+import time
+from collections.abc import AsyncIterator, Callable
+from contextlib import AbstractAsyncContextManager, asynccontextmanager, nullcontext
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.fsm.storage.base import BaseStorage, StorageKey  # noqa: E402
+from aiogram.fsm.storage.memory import MemoryStorage  # noqa: E402
+
+from benchmark.metrics import percentile_table  # noqa: E402
+from bot.database.connection import get_sessionmaker, init_engine  # noqa: E402
+from bot.database.models import Base  # noqa: E402
+from bot.services.fsm_storage import SQLAlchemyStorage  # noqa: E402
+
+STEPS = ("gender", "age", "height", "weight", "activity")
+
+
+async def _one_update(storage: BaseStorage, user_id: int, step: int) -> None:
+    state = FSMContext(storage=storage, key=StorageKey(bot_id=1, chat_id=user_id, user_id=user_id))
+    await state.get_state()
+    if step % len(STEPS) == len(STEPS) - 1:
+        await state.clear()
+        return
+    await state.update_data({STEPS[step % len(STEPS)]: step})
+    await state.set_state(f"Onboarding:{STEPS[(step + 1) % len(STEPS)]}")
+
+
+async def measure(
+    storage: BaseStorage,
+    scope: Callable[[], AbstractAsyncContextManager[None]],
+    updates: int,
+    users: int,
+    concurrency: int,
+) -> dict[str, float]:
+    """Задержка одного апдейта (мс) и пропускная способность (апдейтов/с)."""
+    latencies: list[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            async with scope():
+                await _one_update(storage, 1000 + i % users, i // users)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    # Апдейты одного пользователя идут по порядку, разные пользователи — параллельно.
+    for offset in range(0, updates, users):
+        await asyncio.gather(*(run(i) for i in range(offset, min(offset + users, updates))))
+    elapsed = time.perf_counter() - started
+    return {**percentile_table(latencies), "updates_per_s": round(updates / elapsed, 1)}
+
+
+@asynccontextmanager
+async def _sql_storage(database_url: str | None) -> AsyncIterator[SQLAlchemyStorage]:
+    with tempfile.TemporaryDirectory() as tmp:
+        # Тот же движок, что у бота: пул и PRAGMA (WAL, synchronous=NORMAL) из настроек по умолчанию.
+        init_engine(database_url or f"sqlite+aiosqlite:///{Path(tmp) / 'fsm.db'}")
+        sessionmaker = get_sessionmaker()
+        engine = sessionmaker.kw["bind"]
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            yield SQLAlchemyStorage(sessionmaker)
+        finally:
+            await engine.dispose()
+
+
+async def run(updates: int, users: int, concurrency: int, database_url: str | None) -> dict[str, dict[str, float]]:
+    results = {"memory": await measure(MemoryStorage(), nullcontext, updates, users, concurrency)}
+    async with _sql_storage(database_url) as storage:
+        results["sql"] = await measure(storage, nullcontext, updates, users, concurrency)
+        results["sql+batch"] = await measure(storage, storage.batch, updates, users, concurrency)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="FSM storage latency: memory vs SQL")
+    parser.add_argument("--updates", type=int, default=2000, help="Сколько апдейтов прогнать на бэкенд")
+    parser.add_argument("--users", type=int, default=50, help="Сколько разных пользователей")
+    parser.add_argument("--concurrency", type=int, default=8, help="Апдейтов одновременно")
+    parser.add_argument("--database-url", default=None, help="БД для SQL-хранилища (по умолчанию временная SQLite)")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.updates, args.users, args.concurrency, args.database_url))
+    print(f"{'backend':<10} {'p50_ms':>8} {'p90_ms':>8} {'p99_ms':>8} {'max_ms':>8} {'upd/s':>9}")
+    for name, row in results.items():
+        print(
+            f"{name:<10} {row['p50']:>8.3f} {row['p90']:>8.3f} {row['p99']:>8.3f} "
+            f"{row['max']:>8.3f} {row['updates_per_s']:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,14 @@
     python -m benchmark.jfb --max-items 200    # 200 изображений
     python -m benchmark.jfb --max-items 0      # весь датасет (1000)
     python -m benchmark.jfb --model gpt-4o     # конкретная модель
+    python -m benchmark.jfb --no-vision-cache  # не брать оценки из кэша повторов
+    python -m benchmark.jfb --max-side 768 --image-format webp --detail low
+    python -m benchmark.jfb --sweep-sizes 0,512,768,1024   # точность против размера фото
+    python -m benchmark.jfb --record jfb.cassette.gz          # записать ответы модели
+    python -m benchmark.jfb --replay jfb.cassette.gz --replay-latency lognormal:1.5,0.4
+    python -m benchmark.jfb --dataset-dir tests/fixtures/jfb --replay jfb.cassette.gz  # без сети
+    python -m benchmark.jfb --sweep-concurrency 1,5,10,20   # пропускная способность и перцентили
+    python -m benchmark.jfb --max-items 0 --resume            # продолжить оборванный прогон
 """
 
 from __future__ import annotations
@@ -17,6 +25,7 @@ import argparse
 import asyncio
 import base64
 import csv
+import heapq
 import json
 import mimetypes
 import os
@@ -24,7 +33,11 @@ import sys
 import tarfile
 import time
 import urllib.request
+from array import array
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import TextIO
 
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
@@ -32,7 +45,18 @@ from openai import AsyncOpenAI
 ROOT = Path(__file__).resolve().parent.parent
 sys.path.insert(0, str(ROOT))
 
-from estimator import analyze_meal_photo  # noqa: E402
+from estimator import (  # noqa: E402
+    ImageOptions,
+    SQLiteVisionStore,
+    VisionCache,
+    VisionUsage,
+    analyze_meal_photo,
+    analyze_meal_photo_cached,
+    preprocess_image,
+)
+from benchmark.cassette import Cassette, RecordingClient, ReplayClient, cassette_image, parse_latency  # noqa: E402
+from benchmark.metrics import cost_usd, percentile_table, timed_http_client, track_request  # noqa: E402
+from estimator.preprocess import DETAILS, FORMATS  # noqa: E402
 
 # ---------------------------------------------------------------------------
 # Dataset
@@ -43,6 +67,7 @@ DATASET_URL = (
     "food-scan-benchmark-dataset.tar.gz"
 )
 CACHE_DIR = ROOT / ".benchmark_cache"
+VISION_CACHE_PATH = CACHE_DIR / "vision_cache.sqlite"
 RESULTS_DIR = Path(__file__).resolve().parent / "results"
 
 
@@ -96,19 +121,25 @@ def _download_dataset() -> Path:
     return dataset_dir
 
 
-def _load_dataset(dataset_dir: Path, max_items: int) -> list[dict]:
-    """Загрузить CSV с аннотациями и вернуть список сэмплов."""
-    csv_path = dataset_dir / "food_scan_bench_v1.csv"
-    img_dir = dataset_dir / "fsb_images"
-
-    samples: list[dict] = []
-    with open(csv_path, newline="", encoding="utf-8") as f:
-        for row in csv.DictReader(f):
-            img_path = img_dir / row["image_filename"]
-            if not img_path.exists():
-                continue
-            samples.append(
-                {
+class _Dataset:
+    """Сэмплы из CSV с аннотациями; читаются заново при каждом проходе, а не списком в памяти."""
+
+    def __init__(self, dataset_dir: Path, max_items: int) -> None:
+        self.csv_path = dataset_dir / "food_scan_bench_v1.csv"
+        self.img_dir = dataset_dir / "fsb_images"
+        self.max_items = max_items
+
+    def __iter__(self) -> Iterator[dict]:
+        count = 0
+        with open(self.csv_path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                if 0 < self.max_items <= count:
+                    return
+                img_path = self.img_dir / row["image_filename"]
+                if not img_path.exists():
+                    continue
+                count += 1
+                yield {
                     "image_id": row["image_id"],
                     "image_path": img_path,
                     "meal_name": row["meal_name"],
@@ -119,11 +150,14 @@ def _load_dataset(dataset_dir: Path, max_items: int) -> list[dict]:
                         "carbs": float(row["total_carbs"]),
                     },
                 }
-            )
 
-    if max_items > 0:
-        samples = samples[:max_items]
-    return samples
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def _load_dataset(dataset_dir: Path, max_items: int) -> _Dataset:
+    """Сэмплы датасета (первые max_items, 0 — все)."""
+    return _Dataset(dataset_dir, max_items)
 
 
 # ---------------------------------------------------------------------------
@@ -131,11 +165,14 @@ def _load_dataset(dataset_dir: Path, max_items: int) -> list[dict]:
 # ---------------------------------------------------------------------------
 
 
+def _image_mime(path: Path) -> str:
+    return mimetypes.guess_type(str(path))[0] or "image/jpeg"
+
+
 def _image_to_data_uri(path: Path) -> str:
-    mime = mimetypes.guess_type(str(path))[0] or "image/jpeg"
     with open(path, "rb") as f:
         b64 = base64.b64encode(f.read()).decode()
-    return f"data:{mime};base64,{b64}"
+    return f"data:{_image_mime(path)};base64,{b64}"
 
 
 # ---------------------------------------------------------------------------
@@ -176,33 +213,583 @@ def _per_macro_ae(gt: dict, pred: dict) -> dict[str, float]:
 # ---------------------------------------------------------------------------
 
 
+async def _score_sample(
+    client: AsyncOpenAI | RecordingClient | ReplayClient,
+    model: str,
+    sample: dict,
+    options: ImageOptions | None,
+    vision_cache: VisionCache | None,
+    queue_wait_s: float,
+) -> dict:
+    """Оценить одно фото; исключения пробрасываются вызывающему."""
+    from_cache = False
+    usage = VisionUsage()
+    image_bytes = sample["image_path"].read_bytes()
+    mime = _image_mime(sample["image_path"])
+    # Время обслуживания и до первого байта — от взятия фото из очереди, включая подготовку.
+    with cassette_image(sample["image_id"]), track_request() as timing:
+        prepared = None
+        if options is not None:
+            prepared = await asyncio.to_thread(preprocess_image, image_bytes, options)
+            sent_bytes = len(prepared.data)
+        else:
+            sent_bytes = len(image_bytes)
+        if vision_cache is not None:
+            pred, from_cache = await analyze_meal_photo_cached(
+                client,
+                model,
+                image_bytes,
+                cache=vision_cache,
+                mime=mime,
+                options=options,
+                prepared=prepared,
+                usage=usage,
+            )
+            if from_cache:
+                sent_bytes = 0
+        elif prepared is not None:
+            pred = await analyze_meal_photo(client, model, prepared.data_uri, detail=prepared.detail, usage=usage)
+        else:
+            pred = await analyze_meal_photo(client, model, _image_to_data_uri(sample["image_path"]), usage=usage)
+    service_s = time.perf_counter() - timing.started_at
+
+    pred_macros = {
+        "calories": pred.get("calories", 0),
+        "protein": pred.get("protein_g", 0),
+        "fat": pred.get("fat_g", 0),
+        "carbs": pred.get("carbs_g", 0),
+    }
+    gt = sample["gt"]
+    return {
+        "image_id": sample["image_id"],
+        "image_filename": sample["image_path"].name,
+        "meal_name": sample["meal_name"],
+        "gt": gt,
+        "pred_macros": pred_macros,
+        "pred_description": pred.get("description", ""),
+        "wmape": _wmape(gt, pred_macros),
+        "ape": _per_macro_ape(gt, pred_macros),
+        "ae": _per_macro_ae(gt, pred_macros),
+        "from_cache": from_cache,
+        "original_bytes": len(image_bytes),
+        "sent_bytes": sent_bytes,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "latency_s": usage.latency_s,
+        "queue_wait_s": queue_wait_s,
+        "ttfb_s": timing.ttfb_s,
+        "service_s": service_s,
+        "total_s": queue_wait_s + service_s,
+    }
+
+
+def _scored_ids(jsonl_path: Path) -> set[str]:
+    """image_id уже оценённых фото; оборванная последняя строка пропускается."""
+    done: set[str] = set()
+    for row in _iter_results(jsonl_path):
+        done.add(row["image_id"])
+    return done
+
+
+def _drop_partial_line(jsonl_path: Path) -> None:
+    """Обрезать недописанную последнюю строку, чтобы новые строки не склеились с ней."""
+    if not jsonl_path.exists():
+        return
+    with open(jsonl_path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return
+        f.seek(size - 1)
+        if f.read(1) == b"\n":
+            return
+        # Ищем начало оборванной строки с конца файла блоками.
+        end = size
+        while end > 0:
+            start = max(0, end - 65536)
+            f.seek(start)
+            cut = f.read(end - start).rfind(b"\n")
+            if cut != -1:
+                f.truncate(start + cut + 1)
+                return
+            end = start
+        f.truncate(0)
+
+
+def _iter_results(jsonl_path: Path) -> Iterator[dict]:
+    if not jsonl_path.exists():
+        return
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                # Процесс упал посреди записи строки — это фото оценится заново.
+                continue
+
+
+async def _evaluate(
+    client: AsyncOpenAI | RecordingClient | ReplayClient,
+    model: str,
+    samples: Iterable[dict],
+    concurrency: int,
+    options: ImageOptions | None,
+    vision_cache: VisionCache | None,
+    jsonl_path: Path,
+    *,
+    total: int,
+    resume: bool = False,
+) -> tuple[int, int, float]:
+    """Прогнать сэмплы через модель, дописывая результаты в JSONL.
+
+    Производитель кладёт фото в очередь на 2 × concurrency мест, concurrency
+    обработчиков забирают их и пишут строку сразу после оценки, так что в памяти
+    одновременно не больше нескольких фото. С resume уже оценённые image_id
+    пропускаются, иначе файл начинается заново. Возвращает (оценено, ошибок, время, с).
+    """
+    jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+    if resume:
+        _drop_partial_line(jsonl_path)
+    done = _scored_ids(jsonl_path) if resume else set()
+    if done:
+        print(f"  Продолжение: {len(done)} фото уже оценены в {jsonl_path}")
+    queue: asyncio.Queue[tuple[int, dict, float] | None] = asyncio.Queue(maxsize=2 * concurrency)
+    scored = 0
+    errors = 0
+    t0 = time.monotonic()
+
+    async def produce() -> None:
+        for idx, sample in enumerate(samples):
+            if sample["image_id"] not in done:
+                await queue.put((idx, sample, time.perf_counter()))
+        for _ in range(concurrency):
+            await queue.put(None)
+
+    async def work(out: TextIO) -> None:
+        nonlocal scored, errors
+        while (item := await queue.get()) is not None:
+            idx, sample, enqueued = item
+            try:
+                row = await _score_sample(
+                    client, model, sample, options, vision_cache, time.perf_counter() - enqueued
+                )
+            except Exception as exc:
+                errors += 1
+                print(f"  [{idx + 1}/{total}] ОШИБКА: {exc}")
+                continue
+            # Запись без await между write и flush: строки обработчиков не перемешиваются.
+            out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            out.flush()
+            scored += 1
+            print(
+                f"  [{idx + 1}/{total}] {row['meal_name'][:40]:<40}  "
+                f"wMAPE={row['wmape']:5.1f}%  Δkcal={row['ae']['calories']:+.0f}"
+                + ("  (кэш)" if row["from_cache"] else "")
+            )
+
+    with open(jsonl_path, "a" if resume else "w", encoding="utf-8") as out:
+        await asyncio.gather(produce(), *(work(out) for _ in range(concurrency)))
+    return scored, errors, time.monotonic() - t0
+
+
+@dataclass(slots=True)
+class _Aggregate:
+    """Итоги по JSONL, собранные одним проходом: суммы, задержки и крайние фото."""
+
+    n: int = 0
+    vision_calls: int = 0
+    wmape_sum: float = 0.0
+    ape_sum: dict[str, float] = field(default_factory=lambda: dict.fromkeys(MACRO_KEYS, 0.0))
+    ae_sum: dict[str, float] = field(default_factory=lambda: dict.fromkeys(MACRO_KEYS, 0.0))
+    sent_bytes: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    called_prompt_tokens: int = 0
+    called_latency_s: float = 0.0
+    queue_wait_s: array = field(default_factory=lambda: array("d"))
+    ttfb_s: array = field(default_factory=lambda: array("d"))
+    service_s: array = field(default_factory=lambda: array("d"))
+    total_s: array = field(default_factory=lambda: array("d"))
+    # Куча (-wMAPE, порядковый номер, название) для лучших и (wMAPE, ...) для худших.
+    best: list[tuple[float, int, str]] = field(default_factory=list)
+    worst: list[tuple[float, int, str]] = field(default_factory=list)
+
+    def add(self, row: dict) -> None:
+        self.n += 1
+        self.wmape_sum += row["wmape"]
+        for key in MACRO_KEYS:
+            self.ape_sum[key] += row["ape"][key]
+            self.ae_sum[key] += row["ae"][key]
+        self.sent_bytes += row["sent_bytes"]
+        self.prompt_tokens += row["prompt_tokens"]
+        self.completion_tokens += row["completion_tokens"]
+        self.queue_wait_s.append(row["queue_wait_s"])
+        self.total_s.append(row["total_s"])
+        if not row["from_cache"]:
+            self.vision_calls += 1
+            self.called_prompt_tokens += row["prompt_tokens"]
+            self.called_latency_s += row["latency_s"]
+            self.service_s.append(row["service_s"])
+            if row["ttfb_s"] is not None:
+                self.ttfb_s.append(row["ttfb_s"])
+        self._keep(self.best, (-row["wmape"], self.n, row["meal_name"]))
+        self._keep(self.worst, (row["wmape"], self.n, row["meal_name"]))
+
+    @staticmethod
+    def _keep(heap: list[tuple[float, int, str]], item: tuple[float, int, str], size: int = 5) -> None:
+        if len(heap) < size:
+            heapq.heappush(heap, item)
+        elif item > heap[0]:
+            heapq.heapreplace(heap, item)
+
+    @property
+    def wmape(self) -> float:
+        return self.wmape_sum / self.n if self.n else 0.0
+
+    def best_rows(self) -> list[tuple[float, str]]:
+        return [(-score, name) for score, _, name in sorted(self.best, reverse=True)]
+
+    def worst_rows(self) -> list[tuple[float, str]]:
+        return [(score, name) for score, _, name in sorted(self.worst)]
+
+
+def _aggregate(jsonl_path: Path) -> _Aggregate:
+    agg = _Aggregate()
+    for row in _iter_results(jsonl_path):
+        agg.add(row)
+    return agg
+
+
+def _size_summary(agg: _Aggregate) -> dict[str, float]:
+    """Средние по сэмплам: размер отправленного фото, а токены и задержка — только по вызовам модели."""
+    calls = agg.vision_calls or 1
+    return {
+        "images": agg.n,
+        "vision_calls": agg.vision_calls,
+        "avg_sent_kb": round(agg.sent_bytes / agg.n / 1024, 1) if agg.n else 0.0,
+        "avg_prompt_tokens": round(agg.called_prompt_tokens / calls, 1),
+        "avg_latency_s": round(agg.called_latency_s / calls, 2),
+        "wmape": round(agg.wmape, 2),
+    }
+
+
+def _latency_summary(
+    agg: _Aggregate,
+    scored: int,
+    elapsed: float,
+    model: str,
+    prices: tuple[float, float] | None = None,
+) -> dict:
+    """Перцентили задержек, токены, стоимость и пропускная способность прогона.
+
+    Время до первого байта и обслуживания — только по реальным вызовам модели,
+    очередь и полное время — по всем изображениям. Пропускная способность — по фото,
+    оценённым в этом запуске (scored), без продолженных из прошлого.
+    """
+    cost = cost_usd(model, agg.prompt_tokens, agg.completion_tokens, prices)
+    return {
+        "throughput_images_per_s": round(scored / elapsed, 3) if elapsed > 0 else 0.0,
+        "vision_calls_per_min": (
+            round(agg.vision_calls * scored / agg.n / elapsed * 60, 1) if elapsed > 0 and agg.n else 0.0
+        ),
+        "queue_wait_s": percentile_table(agg.queue_wait_s),
+        "ttfb_s": percentile_table(agg.ttfb_s),
+        "service_s": percentile_table(agg.service_s),
+        "total_s": percentile_table(agg.total_s),
+        "tokens": {
+            "prompt": agg.prompt_tokens,
+            "completion": agg.completion_tokens,
+            "prompt_per_call": round(agg.called_prompt_tokens / agg.vision_calls, 1) if agg.vision_calls else 0.0,
+        },
+        "cost_usd": round(cost, 6) if cost is not None else None,
+        "cost_per_1k_images_usd": round(cost / agg.n * 1000, 4) if cost is not None and agg.n else None,
+    }
+
+
+def _print_latency(summary: dict) -> None:
+    print(f"  {'Задержка, с':<16} {'p50':>8} {'p90':>8} {'p99':>8} {'макс.':>8}")
+    print("-" * 64)
+    labels = (
+        ("queue_wait_s", "очередь"),
+        ("ttfb_s", "первый байт"),
+        ("service_s", "обслуживание"),
+        ("total_s", "всего"),
+    )
+    for key, label in labels:
+        row = summary[key]
+        print(f"  {label:<16} {row['p50']:>8.2f} {row['p90']:>8.2f} {row['p99']:>8.2f} {row['max']:>8.2f}")
+    print("-" * 64)
+    print(f"  Пропускная способность: {summary['throughput_images_per_s']:.2f} фото/с")
+    tokens = summary["tokens"]
+    print(f"  Токены: {tokens['prompt']} вход / {tokens['completion']} выход")
+    if summary["cost_usd"] is not None:
+        print(
+            f"  Стоимость: ${summary['cost_usd']:.4f} "
+            f"(${summary['cost_per_1k_images_usd']:.2f} за 1000 фото)"
+        )
+
+
+def _level_path(jsonl_path: Path, suffix: str) -> Path:
+    return jsonl_path.with_name(f"{jsonl_path.stem}_{suffix}.jsonl")
+
+
+async def _run_concurrency_sweep(
+    client: AsyncOpenAI | RecordingClient | ReplayClient,
+    model: str,
+    samples: _Dataset,
+    levels: list[int],
+    options: ImageOptions | None,
+    prices: tuple[float, float] | None,
+    jsonl_path: Path,
+) -> list[dict]:
+    """Один и тот же набор фото при разной --concurrency: кривая пропускной способности."""
+    rows: list[dict] = []
+    total = len(samples)
+    for level in levels:
+        print(f"\n--- concurrency={level} ---")
+        level_path = _level_path(jsonl_path, f"c{level}")
+        scored, errors, elapsed = await _evaluate(
+            client, model, samples, level, options, None, level_path, total=total
+        )
+        agg = _aggregate(level_path)
+        if not agg.n:
+            continue
+        rows.append(
+            {
+                "concurrency": level,
+                "images": agg.n,
+                "errors": errors,
+                "elapsed_seconds": round(elapsed, 2),
+                "wmape": round(agg.wmape, 2),
+                **_latency_summary(agg, scored, elapsed, model, prices),
+            }
+        )
+
+    print()
+    print("=" * 80)
+    print("  ПРОПУСКНАЯ СПОСОБНОСТЬ ПО --concurrency")
+    print("=" * 80)
+    print(
+        f"  {'conc.':>6} {'фото/с':>8} {'всего p50':>10} {'p90':>8} {'p99':>8} "
+        f"{'очередь p90':>12} {'$/1000':>8} {'ошибок':>7}"
+    )
+    print("-" * 80)
+    for row in rows:
+        total_s = row["total_s"]
+        cost = row["cost_per_1k_images_usd"]
+        print(
+            f"  {row['concurrency']:>6} {row['throughput_images_per_s']:>8.2f} {total_s['p50']:>10.2f} "
+            f"{total_s['p90']:>8.2f} {total_s['p99']:>8.2f} {row['queue_wait_s']['p90']:>12.2f} "
+            f"{cost if cost is not None else '—':>8} {row['errors']:>7}"
+        )
+    print("=" * 80)
+    return rows
+
+
+async def _run_sweep(
+    client: AsyncOpenAI | RecordingClient | ReplayClient,
+    model: str,
+    samples: _Dataset,
+    concurrency: int,
+    options: ImageOptions | None,
+    sizes: list[int],
+    vision_cache: VisionCache | None,
+    jsonl_path: Path,
+) -> list[dict]:
+    """Один и тот же набор фото с разными max_side: таблица «точность против размера»."""
+    base = options or ImageOptions()
+    rows: list[dict] = []
+    total = len(samples)
+    for size in sizes:
+        print(f"\n--- max_side={size or 'оригинал'} ---")
+        sized = ImageOptions(max_side=size, format=base.format, quality=base.quality, detail=base.detail)
+        level_path = _level_path(jsonl_path, f"s{size}")
+        _, errors, _ = await _evaluate(
+            client, model, samples, concurrency, sized, vision_cache, level_path, total=total
+        )
+        agg = _aggregate(level_path)
+        if agg.n:
+            rows.append({"max_side": size, "errors": errors, **_size_summary(agg)})
+
+    print()
+    print("=" * 72)
+    print(f"  ТОЧНОСТЬ ПРОТИВ РАЗМЕРА ({base.format}, q={base.quality}, detail={base.detail})")
+    print("=" * 72)
+    print(f"  {'max_side':>9} {'КБ/фото':>9} {'вх. токены':>11} {'задержка, с':>12} {'wMAPE, %':>9} {'ошибок':>7}")
+    print("-" * 72)
+    for row in rows:
+        size = row["max_side"] or "ориг."
+        print(
+            f"  {size:>9} {row['avg_sent_kb']:>9.1f} {row['avg_prompt_tokens']:>11.0f} "
+            f"{row['avg_latency_s']:>12.2f} {row['wmape']:>9.1f} {row['errors']:>7}"
+        )
+    print("=" * 72)
+    out = RESULTS_DIR / f"jfb_{model}_{total}_sizes.json"
+    out.write_text(json.dumps({"model": model, "options": base.signature, "rows": rows}, ensure_ascii=False, indent=2))
+    print(f"\nТаблица сохранена в {out}")
+    return rows
+
+
+def _detail(row: dict) -> dict:
+    return {
+        "image_id": row["image_id"],
+        "meal_name": row["meal_name"],
+        "gt": row["gt"],
+        "pred": row["pred_macros"],
+        "wmape": round(row["wmape"], 2),
+        "from_cache": row["from_cache"],
+        "prompt_tokens": row["prompt_tokens"],
+        "completion_tokens": row["completion_tokens"],
+        "queue_wait_s": round(row["queue_wait_s"], 3),
+        "ttfb_s": round(row["ttfb_s"], 3) if row["ttfb_s"] is not None else None,
+        "total_s": round(row["total_s"], 3),
+    }
+
+
+def _write_json_report(out: Path, summary: dict, jsonl_path: Path) -> None:
+    """Сводка и details; details переписываются из JSONL построчно, без списка в памяти."""
+    head = json.dumps(summary, ensure_ascii=False, indent=2)
+    with open(out, "w", encoding="utf-8") as f:
+        f.write(head[: head.rindex("}")].rstrip())
+        f.write(',\n  "details": [')
+        for i, row in enumerate(_iter_results(jsonl_path)):
+            f.write(("," if i else "") + "\n    " + json.dumps(_detail(row), ensure_ascii=False))
+        f.write("\n  ]\n}\n")
+
+
+_CSV_FIELDS = [
+    "image_id",
+    "image_filename",
+    "meal_name",
+    "pred_description",
+    "gt_calories",
+    "gt_protein",
+    "gt_fat",
+    "gt_carbs",
+    "pred_calories",
+    "pred_protein",
+    "pred_fat",
+    "pred_carbs",
+    "wmape",
+    "ape_calories",
+    "ape_protein",
+    "ape_fat",
+    "ape_carbs",
+    "ae_calories",
+    "ae_protein",
+    "ae_fat",
+    "ae_carbs",
+]
+
+
+def _csv_row(r: dict) -> dict:
+    return {
+        "image_id": r["image_id"],
+        "image_filename": r["image_filename"],
+        "meal_name": r["meal_name"],
+        "pred_description": r["pred_description"],
+        "gt_calories": r["gt"]["calories"],
+        "gt_protein": r["gt"]["protein"],
+        "gt_fat": r["gt"]["fat"],
+        "gt_carbs": r["gt"]["carbs"],
+        "pred_calories": r["pred_macros"]["calories"],
+        "pred_protein": r["pred_macros"]["protein"],
+        "pred_fat": r["pred_macros"]["fat"],
+        "pred_carbs": r["pred_macros"]["carbs"],
+        "wmape": round(r["wmape"], 2),
+        "ape_calories": round(r["ape"]["calories"], 2),
+        "ape_protein": round(r["ape"]["protein"], 2),
+        "ape_fat": round(r["ape"]["fat"], 2),
+        "ape_carbs": round(r["ape"]["carbs"], 2),
+        "ae_calories": round(r["ae"]["calories"], 1),
+        "ae_protein": round(r["ae"]["protein"], 1),
+        "ae_fat": round(r["ae"]["fat"], 1),
+        "ae_carbs": round(r["ae"]["carbs"], 1),
+    }
+
+
+def _write_csv(out_csv: Path, jsonl_path: Path) -> None:
+    """CSV по image_id: в памяти только пары (image_id, смещение строки в JSONL)."""
+    index: list[tuple[str, int]] = []
+    with open(jsonl_path, "rb") as src:
+        while True:
+            offset = src.tell()
+            line = src.readline()
+            if not line:
+                break
+            try:
+                index.append((json.loads(line)["image_id"], offset))
+            except json.JSONDecodeError:
+                continue
+        index.sort()
+        with open(out_csv, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=_CSV_FIELDS)
+            writer.writeheader()
+            for _, offset in index:
+                src.seek(offset)
+                writer.writerow(_csv_row(json.loads(src.readline())))
+
+
 async def run_benchmark(
     max_items: int,
     model: str,
     concurrency: int,
     results_file: str | None,
     csv_file: str | None,
+    vision_cache_path: str | None = None,
+    options: ImageOptions | None = None,
+    sweep_sizes: list[int] | None = None,
+    dataset_dir: Path | None = None,
+    record_path: str | None = None,
+    replay_path: str | None = None,
+    replay_latency: str = "recorded",
+    seed: int = 0,
+    sweep_concurrency: list[int] | None = None,
+    prices: tuple[float, float] | None = None,
+    jsonl_file: str | None = None,
+    resume: bool = False,
 ) -> None:
     load_dotenv()
-    api_key = os.getenv("OPENAI_API_KEY", "")
-    base_url = (
-        os.getenv("OPENAI_BASE_URL", "").strip()
-        or os.getenv("BASE_URL", "").strip()
-        or os.getenv("base_url", "").strip()
-        or None
-    )
-    if not api_key:
-        print("Ошибка: OPENAI_API_KEY не задан в .env")
-        sys.exit(1)
-
-    client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+    if replay_path:
+        client = ReplayClient(Cassette(replay_path), latency=parse_latency(replay_latency), seed=seed)
+    else:
+        api_key = os.getenv("OPENAI_API_KEY", "")
+        base_url = (
+            os.getenv("OPENAI_BASE_URL", "").strip()
+            or os.getenv("BASE_URL", "").strip()
+            or os.getenv("base_url", "").strip()
+            or None
+        )
+        if not api_key:
+            print("Ошибка: OPENAI_API_KEY не задан в .env")
+            sys.exit(1)
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=timed_http_client())
+        if record_path:
+            client = RecordingClient(client, Cassette(record_path))
+    if record_path or replay_path or sweep_concurrency:
+        # Кэш повторов отдавал бы ответы мимо кассеты, а в сравнении concurrency
+        # второй и следующие проходы не доходили бы до модели.
+        vision_cache_path = None
+    if jsonl_file is not None:
+        jsonl_path = Path(jsonl_file)
+    elif results_file is not None:
+        jsonl_path = Path(results_file).with_suffix(".jsonl")
+    else:
+        jsonl_path = RESULTS_DIR / f"jfb_{model}_{max_items}.jsonl"
 
     print("=" * 64)
     print("  January Food Benchmark (JFB)")
     print(f"  Модель: {model}")
+    if replay_path:
+        print(f"  Воспроизведение: {replay_path} ({len(client.cassette)} ответов, задержка {replay_latency})")
+    elif record_path:
+        print(f"  Запись ответов: {record_path}")
+    print(f"  Кэш повторов: {vision_cache_path or 'выключен'}")
+    print(f"  Подготовка фото: {options.signature if options is not None else 'оригинал'}")
+    print(f"  Результаты по фото: {jsonl_path}")
     print("=" * 64)
 
-    dataset_dir = _download_dataset()
+    if dataset_dir is None:
+        dataset_dir = _download_dataset()
     samples = _load_dataset(dataset_dir, max_items)
     total = len(samples)
     print(f"Загружено {total} изображений\n")
@@ -211,63 +798,44 @@ async def run_benchmark(
         print("Нет изображений для оценки.")
         return
 
-    results: list[dict] = []
-    errors = 0
-    semaphore = asyncio.Semaphore(concurrency)
-    t0 = time.monotonic()
-
-    async def process(idx: int, sample: dict) -> dict | None:
-        nonlocal errors
-        async with semaphore:
-            data_uri = _image_to_data_uri(sample["image_path"])
-            try:
-                pred = await analyze_meal_photo(client, model, data_uri)
-            except Exception as exc:
-                errors += 1
-                print(f"  [{idx + 1}/{total}] ОШИБКА: {exc}")
-                return None
-
-            pred_macros = {
-                "calories": pred.get("calories", 0),
-                "protein": pred.get("protein_g", 0),
-                "fat": pred.get("fat_g", 0),
-                "carbs": pred.get("carbs_g", 0),
-            }
-            gt = sample["gt"]
-            wmape = _wmape(gt, pred_macros)
-            ae = _per_macro_ae(gt, pred_macros)
-            ape = _per_macro_ape(gt, pred_macros)
-
-            name = sample["meal_name"][:40]
-            print(
-                f"  [{idx + 1}/{total}] {name:<40}  "
-                f"wMAPE={wmape:5.1f}%  Δkcal={ae['calories']:+.0f}"
-            )
-
-            return {
-                "image_id": sample["image_id"],
-                "image_filename": sample["image_path"].name,
-                "meal_name": sample["meal_name"],
-                "gt": gt,
-                "pred_macros": pred_macros,
-                "pred_description": pred.get("description", ""),
-                "wmape": wmape,
-                "ape": ape,
-                "ae": ae,
+    if sweep_concurrency:
+        rows = await _run_concurrency_sweep(
+            client, model, samples, sweep_concurrency, options, prices, jsonl_path
+        )
+        if results_file and rows:
+            report = {
+                "model": model,
+                "image_options": options.signature if options is not None else None,
+                "concurrency_sweep": rows,
             }
+            Path(results_file).write_text(json.dumps(report, ensure_ascii=False, indent=2))
+            print(f"\nJSON-отчёт сохранён в {results_file}")
+        return
 
-    tasks = [process(i, s) for i, s in enumerate(samples)]
-    completed = await asyncio.gather(*tasks)
-    results = [r for r in completed if r is not None]
-    elapsed = time.monotonic() - t0
+    # Повторы и почти-повторы изображений (по перцептивному хэшу) не отправляются в модель.
+    store = SQLiteVisionStore(vision_cache_path) if vision_cache_path else None
+    vision_cache = VisionCache(store) if store is not None else None
+    try:
+        if sweep_sizes:
+            await _run_sweep(client, model, samples, concurrency, options, sweep_sizes, vision_cache, jsonl_path)
+            return
+        scored, errors, elapsed = await _evaluate(
+            client, model, samples, concurrency, options, vision_cache, jsonl_path, total=total, resume=resume
+        )
+    finally:
+        if store is not None:
+            store.close()
 
-    # ----- Итоги -----
-    n = len(results)
+    # ----- Итоги: одним проходом по JSONL, включая продолженные из прошлых запусков -----
+    agg = _aggregate(jsonl_path)
+    n = agg.n
     if n == 0:
         print("\nНет результатов для подсчёта.")
         return
 
-    avg_wmape = sum(r["wmape"] for r in results) / n
+    avg_wmape = agg.wmape
+    size_summary = _size_summary(agg)
+    latency_summary = _latency_summary(agg, scored, elapsed, model, prices)
 
     macro_labels = {
         "calories": ("Калории", "ккал"),
@@ -282,24 +850,35 @@ async def run_benchmark(
     print("=" * 64)
     print(f"  Модель:            {model}")
     print(f"  Изображений:       {n} (ошибок: {errors})")
+    if scored != n:
+        print(f"  В этом запуске:    {scored}")
     print(f"  Общий wMAPE:       {avg_wmape:.1f}%")
-    print(f"  Время:             {elapsed:.1f} с ({elapsed / n:.1f} с/фото)")
+    if scored:
+        print(f"  Время:             {elapsed:.1f} с ({elapsed / scored:.1f} с/фото)")
+    if isinstance(client, ReplayClient) and client.misses:
+        print(f"  Нет в кассете:     {client.misses} запросов")
+    if vision_cache is not None:
+        print(f"  Из кэша повторов:  {vision_cache.saved_calls} (vision-вызовов сэкономлено)")
+    print(f"  Фото в запросе:    {size_summary['avg_sent_kb']:.1f} КБ в среднем")
+    print(f"  Входные токены:    {size_summary['avg_prompt_tokens']:.0f} на вызов")
+    print(f"  Задержка вызова:   {size_summary['avg_latency_s']:.2f} с в среднем")
+    print("-" * 64)
+    _print_latency(latency_summary)
     print("-" * 64)
     print(f"  {'Макронутриент':<14} {'MAPE, %':>10} {'MAE':>10} {'Единица':>10}")
     print("-" * 64)
     for key, (label, unit) in macro_labels.items():
-        mape = sum(r["ape"][key] for r in results) / n
-        mae = sum(r["ae"][key] for r in results) / n
+        mape = agg.ape_sum[key] / n
+        mae = agg.ae_sum[key] / n
         print(f"  {label:<14} {mape:>9.1f}% {mae:>9.1f} {unit:>10}")
     print("=" * 64)
 
-    sorted_results = sorted(results, key=lambda r: r["wmape"])
     print("\n  Лучшие 5 (наименьший wMAPE):")
-    for r in sorted_results[:5]:
-        print(f"    wMAPE={r['wmape']:5.1f}%  {r['meal_name'][:55]}")
+    for wmape, name in agg.best_rows():
+        print(f"    wMAPE={wmape:5.1f}%  {name[:55]}")
     print("\n  Худшие 5 (наибольший wMAPE):")
-    for r in sorted_results[-5:]:
-        print(f"    wMAPE={r['wmape']:5.1f}%  {r['meal_name'][:55]}")
+    for wmape, name in agg.worst_rows():
+        print(f"    wMAPE={wmape:5.1f}%  {name[:55]}")
 
     print()
     print("-" * 64)
@@ -318,82 +897,26 @@ async def run_benchmark(
             "errors": errors,
             "elapsed_seconds": round(elapsed, 1),
             "wmape": round(avg_wmape, 2),
+            "vision_cache": vision_cache.stats() if vision_cache is not None else None,
+            "image_options": options.signature if options is not None else None,
+            "size": size_summary,
+            "concurrency": concurrency,
+            "latency": latency_summary,
             "per_macro": {
                 key: {
-                    "mape": round(sum(r["ape"][key] for r in results) / n, 2),
-                    "mae": round(sum(r["ae"][key] for r in results) / n, 2),
+                    "mape": round(agg.ape_sum[key] / n, 2),
+                    "mae": round(agg.ae_sum[key] / n, 2),
                 }
                 for key in MACRO_KEYS
             },
-            "details": [
-                {
-                    "image_id": r["image_id"],
-                    "meal_name": r["meal_name"],
-                    "gt": r["gt"],
-                    "pred": r["pred_macros"],
-                    "wmape": round(r["wmape"], 2),
-                }
-                for r in results
-            ],
         }
         out = Path(results_file)
-        out.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+        _write_json_report(out, report, jsonl_path)
         print(f"\nJSON-отчёт сохранён в {out}")
 
     if csv_file:
-        csv_fields = [
-            "image_id",
-            "image_filename",
-            "meal_name",
-            "pred_description",
-            "gt_calories",
-            "gt_protein",
-            "gt_fat",
-            "gt_carbs",
-            "pred_calories",
-            "pred_protein",
-            "pred_fat",
-            "pred_carbs",
-            "wmape",
-            "ape_calories",
-            "ape_protein",
-            "ape_fat",
-            "ape_carbs",
-            "ae_calories",
-            "ae_protein",
-            "ae_fat",
-            "ae_carbs",
-        ]
         out_csv = Path(csv_file)
-        with open(out_csv, "w", newline="", encoding="utf-8") as f:
-            writer = csv.DictWriter(f, fieldnames=csv_fields)
-            writer.writeheader()
-            for r in sorted(results, key=lambda x: x["image_id"]):
-                writer.writerow(
-                    {
-                        "image_id": r["image_id"],
-                        "image_filename": r["image_filename"],
-                        "meal_name": r["meal_name"],
-                        "pred_description": r["pred_description"],
-                        "gt_calories": r["gt"]["calories"],
-                        "gt_protein": r["gt"]["protein"],
-                        "gt_fat": r["gt"]["fat"],
-                        "gt_carbs": r["gt"]["carbs"],
-                        "pred_calories": r["pred_macros"]["calories"],
-                        "pred_protein": r["pred_macros"]["protein"],
-                        "pred_fat": r["pred_macros"]["fat"],
-                        "pred_carbs": r["pred_macros"]["carbs"],
-                        "wmape": round(r["wmape"], 2),
-                        "ape_calories": round(r["ape"]["calories"], 2),
-                        "ape_protein": round(r["ape"]["protein"], 2),
-                        "ape_fat": round(r["ape"]["fat"], 2),
-                        "ape_carbs": round(r["ape"]["carbs"], 2),
-                        "ae_calories": round(r["ae"]["calories"], 1),
-                        "ae_protein": round(r["ae"]["protein"], 1),
-                        "ae_fat": round(r["ae"]["fat"], 1),
-                        "ae_carbs": round(r["ae"]["carbs"], 1),
-                    }
-                )
+        _write_csv(out_csv, jsonl_path)
         print(f"CSV-результаты сохранены в {out_csv}")
 
 
@@ -431,7 +954,126 @@ def main() -> None:
         default=None,
         help="Путь для сохранения результатов по каждому фото в CSV",
     )
+    parser.add_argument(
+        "--vision-cache",
+        type=str,
+        default=str(VISION_CACHE_PATH),
+        help="Файл кэша оценок по перцептивному хэшу (по умолчанию .benchmark_cache/vision_cache.sqlite)",
+    )
+    parser.add_argument(
+        "--no-vision-cache",
+        action="store_true",
+        help="Отправлять в модель каждое изображение, даже уже оценённое",
+    )
+    parser.add_argument(
+        "--max-side",
+        type=int,
+        default=ImageOptions().max_side,
+        help="Уменьшать фото до N px по длинной стороне (0 = без уменьшения, по умолчанию 1024)",
+    )
+    parser.add_argument(
+        "--image-format",
+        choices=[name.lower() for name in FORMATS],
+        default="jpeg",
+        help="Формат пережатия фото (по умолчанию jpeg)",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=ImageOptions().quality,
+        help="Качество пережатия 1..100 (по умолчанию 85)",
+    )
+    parser.add_argument(
+        "--detail",
+        choices=DETAILS,
+        default=ImageOptions().detail,
+        help="Детализация изображения для модели (по умолчанию auto)",
+    )
+    parser.add_argument(
+        "--original-images",
+        action="store_true",
+        help="Отправлять исходные файлы без подготовки (как раньше)",
+    )
+    parser.add_argument(
+        "--dataset-dir",
+        type=Path,
+        default=None,
+        help="Локальный датасет в формате JFB (CSV и fsb_images/) вместо загрузки из S3",
+    )
+    parser.add_argument(
+        "--record",
+        type=str,
+        default=None,
+        help="Записывать ответы модели в кассету (gzip JSONL); кэш повторов выключается",
+    )
+    parser.add_argument(
+        "--replay",
+        type=str,
+        default=None,
+        help="Отвечать из кассеты без обращения к API",
+    )
+    parser.add_argument(
+        "--replay-latency",
+        type=str,
+        default="recorded",
+        help="Задержка при воспроизведении: 0, const:S, recorded, uniform:A,B, lognormal:MEDIAN,SIGMA",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed генератора задержек при воспроизведении",
+    )
+    parser.add_argument(
+        "--results-jsonl",
+        type=str,
+        default=None,
+        help="Куда дописывать результаты по фото (по умолчанию рядом с JSON-отчётом, .jsonl)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Продолжить прерванный прогон: пропустить фото, уже записанные в JSONL",
+    )
+    parser.add_argument(
+        "--sweep-concurrency",
+        type=str,
+        default=None,
+        help="Через запятую значения --concurrency для кривой пропускной способности, например 1,5,10,20",
+    )
+    parser.add_argument(
+        "--price-input",
+        type=float,
+        default=None,
+        help="Цена входных токенов, USD за 1M (по умолчанию из таблицы известных моделей)",
+    )
+    parser.add_argument(
+        "--price-output",
+        type=float,
+        default=None,
+        help="Цена выходных токенов, USD за 1M",
+    )
+    parser.add_argument(
+        "--sweep-sizes",
+        type=str,
+        default=None,
+        help="Через запятую max_side для таблицы точность/размер, например 0,512,768,1024",
+    )
     args = parser.parse_args()
+    options = None
+    if not args.original_images:
+        options = ImageOptions(
+            max_side=args.max_side, format=args.image_format.upper(), quality=args.quality, detail=args.detail
+        )
+    sweep_sizes = [int(size) for size in args.sweep_sizes.split(",")] if args.sweep_sizes else None
+    sweep_concurrency = (
+        [int(level) for level in args.sweep_concurrency.split(",")] if args.sweep_concurrency else None
+    )
+    prices = None
+    if args.price_input is not None or args.price_output is not None:
+        prices = (args.price_input or 0.0, args.price_output or 0.0)
+    if args.record and args.replay:
+        parser.error("--record и --replay нельзя использовать вместе")
 
     if args.model is None:
         load_dotenv()
@@ -450,6 +1092,18 @@ def main() -> None:
             args.concurrency,
             args.results_file,
             args.csv_file,
+            None if args.no_vision_cache else args.vision_cache,
+            options,
+            sweep_sizes,
+            dataset_dir=args.dataset_dir,
+            record_path=args.record,
+            replay_path=args.replay,
+            replay_latency=args.replay_latency,
+            seed=args.seed,
+            sweep_concurrency=sweep_concurrency,
+            prices=prices,
+            jsonl_file=args.results_jsonl,
+            resume=args.resume,
         )
     )
 
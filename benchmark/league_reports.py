@@ -0,0 +1,55 @@
+"""Бенчмарк сводок лиг: число SQL-запросов и время построения в зависимости от размера чата.
+
+Использование:
+    python -m benchmark.league_reports                   # чаты на 10, 100, 500 участников
+    python -m benchmark.league_reports --sizes 50 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmark.db import count_queries, seed_league_chat  # noqa: E402
+from bot.database.models import Base  # noqa: E402
+from bot.services.league_reports import build_league_reports  # noqa: E402
+
+
+async def _run(sizes: list[int], timezone_name: str) -> None:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessionmaker = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    print(f"{'members':>8} {'queries':>8} {'ms':>10}")
+    for idx, members in enumerate(sizes, start=1):
+        chat_id = -idx
+        async with sessionmaker() as session:
+            await seed_league_chat(session, chat_id, members)
+        async with sessionmaker() as session:
+            with count_queries(engine) as counter:
+                started = time.perf_counter()
+                await build_league_reports(session, chat_id, timezone_name)
+                elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"{members:>8} {counter.count:>8} {elapsed_ms:>10.1f}")
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарк построения сводок лиг")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 500], help="Размеры чатов")
+    parser.add_argument("--timezone", type=str, default="UTC", help="Часовой пояс сводки")
+    args = parser.parse_args()
+    asyncio.run(_run(args.sizes, args.timezone))
+
+
+if __name__ == "__main__":
+    main()
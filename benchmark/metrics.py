@@ -0,0 +1,94 @@
+"""Метрики задержки и стоимости для JFB: тайминги запросов, перцентили, цена токенов.
+
+На каждое изображение меряется ожидание в очереди за семафором, время до первого байта
+ответа (по событию httpx о получении заголовков) и полное время запроса. Тайминг
+текущего запроса живёт в contextvar: asyncio.gather запускает каждое изображение в своей
+задаче, поэтому хук httpx попадает в тайминг именно своего запроса.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import math
+import time
+from collections.abc import Iterable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from openai import DefaultAsyncHttpxClient
+
+PERCENTILES = (50, 90, 99)
+
+# USD за 1M токенов (вход, выход); для других моделей цена задаётся флагами.
+PRICES_PER_1M: dict[str, tuple[float, float]] = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+}
+
+
+@dataclass(slots=True)
+class RequestTiming:
+    started_at: float = 0.0
+    ttfb_s: float | None = None
+
+
+_CURRENT_TIMING: contextvars.ContextVar[RequestTiming | None] = contextvars.ContextVar(
+    "jfb_request_timing", default=None
+)
+
+
+@contextmanager
+def track_request() -> Iterator[RequestTiming]:
+    """Тайминг запроса к модели внутри блока; время до первого байта отмечает хук httpx."""
+    timing = RequestTiming(started_at=time.perf_counter())
+    token = _CURRENT_TIMING.set(timing)
+    try:
+        yield timing
+    finally:
+        _CURRENT_TIMING.reset(token)
+
+
+def mark_first_byte() -> None:
+    """Отметить получение первых байт ответа (повторные вызовы игнорируются)."""
+    timing = _CURRENT_TIMING.get()
+    if timing is not None and timing.ttfb_s is None:
+        timing.ttfb_s = time.perf_counter() - timing.started_at
+
+
+async def _on_response(response: object) -> None:
+    mark_first_byte()
+
+
+def timed_http_client() -> DefaultAsyncHttpxClient:
+    """httpx-клиент для AsyncOpenAI с отметкой времени до первого байта."""
+    return DefaultAsyncHttpxClient(event_hooks={"response": [_on_response]})
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Перцентиль с линейной интерполяцией по отсортированному списку."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    low = math.floor(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def percentile_table(values: Iterable[float]) -> dict[str, float]:
+    data = list(values)
+    table = {f"p{q}": round(percentile(data, q), 3) for q in PERCENTILES}
+    table["mean"] = round(sum(data) / len(data), 3) if data else 0.0
+    table["max"] = round(max(data), 3) if data else 0.0
+    return table
+
+
+def cost_usd(model: str, prompt_tokens: int, completion_tokens: int, prices: tuple[float, float] | None) -> float | None:
+    """Стоимость токенов; None, если цена модели неизвестна."""
+    price = prices or PRICES_PER_1M.get(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
@@ -0,0 +1,132 @@
+"""Бенчмарк приёма апдейтов: webhook с очередью против обработки внутри HTTP-запроса.
+
+Локальный aiohttp-сервер получает POST-запросы как от Telegram (сырые апдейты с
+секретом), обработчик отвечает на сообщение через FakeTelegramSession с задержкой
+API --api-ms и «работой» --handler-ms. Меряются время ответа на webhook-запрос (то,
+что видит Telegram) и пропускная способность до последнего отправленного ответа.
+
+Режимы:
+- inline — aiogram SimpleRequestHandler без фона: запрос ждёт обработчик;
+- queue/N — QueuedRequestHandler с N воркерами.
+
+Использование:
+    python -m benchmark.webhook
+    python -m benchmark.webhook --updates 5000 --concurrency 40 --workers 4 16 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from aiogram import Bot, Dispatcher, Router  # noqa: E402
+from aiogram.types import Message  # noqa: E402
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler  # noqa: E402
+from aiohttp import web  # noqa: E402
+from aiohttp.test_utils import TestClient, TestServer  # noqa: E402
+
+from benchmark.fake_telegram import FAKE_TOKEN, FakeTelegramSession, text_update  # noqa: E402
+from benchmark.metrics import percentile_table  # noqa: E402
+from bot.config import WebhookSettings  # noqa: E402
+from bot.services.webhook import build_webhook_app  # noqa: E402
+
+SECRET = "benchmark-secret"
+
+
+def _dispatcher(handler_s: float) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def reply(message: Message) -> None:
+        await asyncio.sleep(handler_s)
+        await message.answer(f"ok {message.message_id}")
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def _app(mode: str, workers: int, handler_s: float, session: FakeTelegramSession, queue_size: int) -> web.Application:
+    dp = _dispatcher(handler_s)
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    options = WebhookSettings(url="http://localhost", secret_token=SECRET, workers=workers, queue_size=queue_size)
+    if mode == "inline":
+        app = web.Application()
+        SimpleRequestHandler(dp, bot, handle_in_background=False, secret_token=SECRET).register(app, path=options.path)
+        return app
+    app, _ = build_webhook_app(dp, bot, options)
+    return app
+
+
+async def measure(
+    mode: str, workers: int, updates: int, concurrency: int, handler_s: float, api_s: float, queue_size: int
+) -> dict[str, float]:
+    session = FakeTelegramSession(latency_s=api_s)
+    client = TestClient(TestServer(_app(mode, workers, handler_s, session, queue_size)))
+    await client.start_server()
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    path = WebhookSettings().path
+
+    async def post(i: int) -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                path, json=text_update(i, 1000 + i % 500, "hi"), headers={"X-Telegram-Bot-Api-Secret-Token": SECRET}
+            )
+            await response.read()
+            latencies.append((time.perf_counter() - started) * 1000)
+            statuses[response.status] = statuses.get(response.status, 0) + 1
+
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(post(i) for i in range(updates)))
+        accepted = statuses.get(200, 0)
+        while len(session.sent()) < accepted:
+            await asyncio.sleep(0.005)
+        elapsed = time.perf_counter() - started
+    finally:
+        await client.close()
+    return {
+        **percentile_table(latencies),
+        "updates_per_s": round(accepted / elapsed, 1),
+        "rejected": statuses.get(429, 0),
+    }
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict[str, float]]:
+    common = (args.updates, args.concurrency, args.handler_ms / 1000, args.api_ms / 1000, args.queue_size)
+    results = {"inline": await measure("inline", 0, *common)}
+    for workers in args.workers:
+        results[f"queue/{workers}"] = await measure("queue", workers, *common)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Webhook update handling throughput")
+    parser.add_argument("--updates", type=int, default=2000, help="Сколько апдейтов отправить")
+    parser.add_argument("--concurrency", type=int, default=40, help="Одновременных запросов (как max_connections)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[4, 16, 64], help="Числа воркеров очереди")
+    parser.add_argument("--handler-ms", type=float, default=20.0, help="Работа обработчика, мс")
+    parser.add_argument("--api-ms", type=float, default=30.0, help="Задержка ответа Bot API, мс")
+    parser.add_argument("--queue-size", type=int, default=1000, help="Размер очереди апдейтов")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{'mode':<10} {'p50_ms':>8} {'p90_ms':>8} {'p99_ms':>8} {'upd/s':>9} {'429':>6}")
+    for name, row in results.items():
+        print(
+            f"{name:<10} {row['p50']:>8.2f} {row['p90']:>8.2f} {row['p99']:>8.2f} "
+            f"{row['updates_per_s']:>9.1f} {row['rejected']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,54 @@
 from __future__ import annotations
 
 import os
-from dataclasses import dataclass
+import hashlib
+from dataclasses import dataclass, field
 from datetime import datetime
 from pathlib import Path
 
 from dotenv import load_dotenv
 
 
+@dataclass(slots=True)
+class DatabaseSettings:
+    """Параметры движка БД: пул для PostgreSQL и PRAGMA для файловой SQLite."""
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout_s: float = 30.0
+    pool_recycle_s: int = 1800
+    pool_pre_ping: bool = True
+    # Кэш подготовленных выражений asyncpg на соединение (0 — выключен, нужно за pgbouncer).
+    statement_cache_size: int = 100
+    sqlite_busy_timeout_ms: int = 5000
+    sqlite_mmap_size: int = 256 * 1024 * 1024
+    sqlite_cache_size_kib: int = 64 * 1024
+    # Ожидание соединения из пула дольше порога логируется как warning.
+    slow_checkout_ms: float = 100.0
+
+
+@dataclass(slots=True)
+class WebhookSettings:
+    """Режим webhook: адрес, секрет и очередь апдейтов (bot.services.webhook)."""
+
+    # Публичный https-адрес бота без пути, например https://nutri.example.com.
+    url: str = ""
+    path: str = "/telegram/webhook"
+    secret_token: str = ""
+    host: str = "0.0.0.0"
+    port: int = 8080
+    # Сколько соединений Telegram держит к нам одновременно (1–100).
+    max_connections: int = 40
+    queue_size: int = 1000
+    workers: int = 8
+    # reject — 429 и повтор доставки Telegram; drop — апдейт выбрасывается.
+    overflow: str = "reject"
+    drain_timeout_s: float = 25.0
+
+
+RUN_MODES = ("polling", "webhook")
+
+
 @dataclass(slots=True)
 class Settings:
     telegram_bot_token: str
@@ -18,6 +59,72 @@ class Settings:
     openai_base_url: str | None
     openai_max_requests_per_minute: int
     league_report_timezone: str
+    database: DatabaseSettings = field(default_factory=DatabaseSettings)
+    agent_max_parallel_tools: int = 4
+    agent_tool_timeout_s: float = 30.0
+    meal_cache_ttl_days: float = 30.0
+    # Подготовка фото перед vision-моделью (estimator.preprocess); 0 — без уменьшения.
+    vision_image_max_side: int = 1024
+    vision_image_format: str = "JPEG"
+    vision_image_quality: int = 85
+    vision_image_detail: str = "auto"
+    # Процессы отрисовки графиков (0 — в потоке) и число PNG в кэше.
+    chart_workers: int = 2
+    chart_cache_size: int = 256
+    # Хранилище FSM: sql (таблица fsm_state), memory или redis; TTL состояния в днях.
+    fsm_storage: str = "sql"
+    fsm_redis_url: str | None = None
+    fsm_state_ttl_days: float = 7.0
+    # Получение апдейтов: polling (long polling) или webhook.
+    run_mode: str = "polling"
+    webhook: WebhookSettings = field(default_factory=WebhookSettings)
+    # Процессы бота (больше одного — только webhook) и аренда лидерства планировщика.
+    bot_workers: int = 1
+    scheduler_lease_ttl_s: float = 30.0
+    # Состояние делится с другими процессами или репликами: межпроцессная блокировка FSM,
+    # лимит OpenAI в БД, без кэшей процесса. Включается SHARED_DEPLOYMENT или BOT_WORKERS > 1.
+    shared_deployment: bool = False
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name, "").strip().lower()
+    if not value:
+        return default
+    return value in {"1", "true", "yes", "on"}
+
+
+def _load_database_settings() -> DatabaseSettings:
+    defaults = DatabaseSettings()
+    return DatabaseSettings(
+        pool_size=int(os.getenv("DB_POOL_SIZE", defaults.pool_size)),
+        max_overflow=int(os.getenv("DB_MAX_OVERFLOW", defaults.max_overflow)),
+        pool_timeout_s=float(os.getenv("DB_POOL_TIMEOUT", defaults.pool_timeout_s)),
+        pool_recycle_s=int(os.getenv("DB_POOL_RECYCLE", defaults.pool_recycle_s)),
+        pool_pre_ping=_env_bool("DB_POOL_PRE_PING", defaults.pool_pre_ping),
+        statement_cache_size=int(os.getenv("DB_STATEMENT_CACHE_SIZE", defaults.statement_cache_size)),
+        sqlite_busy_timeout_ms=int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", defaults.sqlite_busy_timeout_ms)),
+        sqlite_mmap_size=int(os.getenv("SQLITE_MMAP_SIZE", defaults.sqlite_mmap_size)),
+        sqlite_cache_size_kib=int(os.getenv("SQLITE_CACHE_SIZE_KIB", defaults.sqlite_cache_size_kib)),
+        slow_checkout_ms=float(os.getenv("DB_SLOW_CHECKOUT_MS", defaults.slow_checkout_ms)),
+    )
+
+
+def _load_webhook_settings(token: str) -> WebhookSettings:
+    defaults = WebhookSettings()
+    # Без явного секрета берём производный от токена: одинаковый у всех реплик и не угадывается.
+    secret = os.getenv("WEBHOOK_SECRET", "").strip() or hashlib.sha256(token.encode()).hexdigest()
+    return WebhookSettings(
+        url=os.getenv("WEBHOOK_URL", "").strip(),
+        path=os.getenv("WEBHOOK_PATH", defaults.path).strip() or defaults.path,
+        secret_token=secret,
+        host=os.getenv("WEBHOOK_HOST", defaults.host).strip() or defaults.host,
+        port=int(os.getenv("WEBHOOK_PORT", defaults.port)),
+        max_connections=int(os.getenv("WEBHOOK_MAX_CONNECTIONS", defaults.max_connections)),
+        queue_size=int(os.getenv("WEBHOOK_QUEUE_SIZE", defaults.queue_size)),
+        workers=int(os.getenv("WEBHOOK_WORKERS", defaults.workers)),
+        overflow=os.getenv("WEBHOOK_OVERFLOW", defaults.overflow).strip().lower() or defaults.overflow,
+        drain_timeout_s=float(os.getenv("WEBHOOK_DRAIN_TIMEOUT_S", defaults.drain_timeout_s)),
+    )
 
 
 _SQLITE_PATH = Path("/data/nutri.db")
@@ -50,6 +157,19 @@ def load_settings() -> Settings:
         raise ValueError("TELEGRAM_BOT_TOKEN is required")
     if not openai_key:
         raise ValueError("OPENAI_API_KEY is required")
+    run_mode = os.getenv("RUN_MODE", "polling").strip().lower() or "polling"
+    if run_mode not in RUN_MODES:
+        raise ValueError(f"RUN_MODE must be one of: {', '.join(RUN_MODES)}")
+    webhook = _load_webhook_settings(token)
+    if run_mode == "webhook" and not webhook.url:
+        raise ValueError("WEBHOOK_URL is required for RUN_MODE=webhook")
+    fsm_storage = os.getenv("FSM_STORAGE", "sql").strip().lower() or "sql"
+    bot_workers = int(os.getenv("BOT_WORKERS", "1"))
+    if bot_workers > 1 and run_mode != "webhook":
+        raise ValueError("BOT_WORKERS > 1 requires RUN_MODE=webhook (long polling allows one consumer)")
+    shared_deployment = _env_bool("SHARED_DEPLOYMENT", False) or bot_workers > 1
+    if shared_deployment and fsm_storage == "memory":
+        raise ValueError("SHARED_DEPLOYMENT or BOT_WORKERS > 1 requires a shared FSM_STORAGE (sql or redis)")
 
     return Settings(
         telegram_bot_token=token,
@@ -60,5 +180,23 @@ def load_settings() -> Settings:
         openai_base_url=base_url,
         openai_max_requests_per_minute=rpm,
         league_report_timezone=league_tz,
+        database=_load_database_settings(),
+        agent_max_parallel_tools=int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4")),
+        agent_tool_timeout_s=float(os.getenv("AGENT_TOOL_TIMEOUT_S", "30")),
+        meal_cache_ttl_days=float(os.getenv("MEAL_CACHE_TTL_DAYS", "30")),
+        vision_image_max_side=int(os.getenv("VISION_IMAGE_MAX_SIDE", "1024")),
+        vision_image_format=os.getenv("VISION_IMAGE_FORMAT", "JPEG").strip().upper() or "JPEG",
+        vision_image_quality=int(os.getenv("VISION_IMAGE_QUALITY", "85")),
+        vision_image_detail=os.getenv("VISION_IMAGE_DETAIL", "auto").strip().lower() or "auto",
+        chart_workers=int(os.getenv("CHART_WORKERS", "2")),
+        chart_cache_size=int(os.getenv("CHART_CACHE_SIZE", "256")),
+        fsm_storage=fsm_storage,
+        fsm_redis_url=os.getenv("FSM_REDIS_URL", "").strip() or None,
+        fsm_state_ttl_days=float(os.getenv("FSM_STATE_TTL_DAYS", "7")),
+        run_mode=run_mode,
+        webhook=webhook,
+        bot_workers=bot_workers,
+        scheduler_lease_ttl_s=float(os.getenv("SCHEDULER_LEASE_TTL_S", "30")),
+        shared_deployment=shared_deployment,
     )
 
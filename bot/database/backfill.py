@@ -0,0 +1,52 @@
+"""Пересборка таблицы daily_nutrition из meal_logs и water_logs.
+
+Использование:
+    python -m bot.database.backfill              # все пользователи
+    python -m bot.database.backfill --user 123   # один пользователь
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+
+from bot.config import load_settings
+from bot.database import crud
+from bot.database.connection import get_sessionmaker, init_db, init_engine
+
+logger = logging.getLogger(__name__)
+
+
+async def backfill(telegram_ids: list[int] | None = None) -> int:
+    sessionmaker = get_sessionmaker()
+    if telegram_ids is None:
+        async with sessionmaker() as session:
+            telegram_ids = await crud.get_all_user_ids(session)
+
+    total_days = 0
+    for telegram_id in telegram_ids:
+        async with sessionmaker() as session:
+            days = await crud.rebuild_daily_nutrition(session, telegram_id)
+        total_days += days
+        logger.info("daily_nutrition rebuilt for user=%s: %s days", telegram_id, days)
+    return total_days
+
+
+async def _main(args: argparse.Namespace) -> None:
+    settings = load_settings()
+    init_engine(settings.database_url, settings.database)
+    await init_db()
+    total_days = await backfill([args.user] if args.user is not None else None)
+    print(f"daily_nutrition: {total_days} days rebuilt")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Rebuild daily_nutrition rollup")
+    parser.add_argument("--user", type=int, default=None, help="Telegram ID одного пользователя")
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,20 @@ from __future__ import annotations
 
 import asyncio
 import logging
-from collections.abc import AsyncGenerator
+import time
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from pathlib import Path
+from typing import Any
 
 from alembic import command
 from alembic.config import Config
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
+
+from bot.config import DatabaseSettings
 
 logger = logging.getLogger(__name__)
 
@@ -16,22 +23,126 @@ _engine: AsyncEngine | None = None
 _sessionmaker: async_sessionmaker[AsyncSession] | None = None
 
 
-def init_engine(database_url: str) -> None:
-    global _engine, _sessionmaker
-    if database_url.startswith("sqlite+aiosqlite:///:memory:"):
+@dataclass(slots=True)
+class PoolCheckoutStats:
+    checkouts: int = 0
+    total_wait_ms: float = 0.0
+    max_wait_ms: float = 0.0
+    slow_checkouts: int = 0
+
+    @property
+    def avg_wait_ms(self) -> float:
+        return self.total_wait_ms / self.checkouts if self.checkouts else 0.0
+
+
+class TimedQueuePool(AsyncAdaptedQueuePool):
+    """Пул, который измеряет ожидание свободного соединения — по нему подбирают pool_size."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.slow_checkout_ms = 100.0
+        self.checkout_stats = PoolCheckoutStats()
+
+    def recreate(self) -> TimedQueuePool:
+        pool = super().recreate()
+        pool.slow_checkout_ms = self.slow_checkout_ms
+        pool.checkout_stats = self.checkout_stats
+        return pool
+
+    def _do_get(self) -> Any:
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited_ms = (time.perf_counter() - started) * 1000
+            stats = self.checkout_stats
+            stats.checkouts += 1
+            stats.total_wait_ms += waited_ms
+            stats.max_wait_ms = max(stats.max_wait_ms, waited_ms)
+            if waited_ms >= self.slow_checkout_ms:
+                stats.slow_checkouts += 1
+                logger.warning(
+                    "DB pool checkout waited %.1f ms (size=%s, checked out=%s, overflow=%s)",
+                    waited_ms,
+                    self.size(),
+                    self.checkedout(),
+                    self.overflow(),
+                )
+            else:
+                logger.debug("DB pool checkout waited %.1f ms", waited_ms)
+
+
+def _is_memory_sqlite(database_url: str) -> bool:
+    return database_url.startswith("sqlite+aiosqlite:///:memory:")
+
+
+def engine_options(database_url: str, options: DatabaseSettings) -> dict[str, Any]:
+    """Аргументы create_async_engine для URL с учётом настроек пула."""
+    if _is_memory_sqlite(database_url):
         # Keep a single in-memory DB across connections (tests/smoke).
-        _engine = create_async_engine(
-            database_url,
-            echo=False,
-            future=True,
-            poolclass=StaticPool,
-            connect_args={"check_same_thread": False},
-        )
-    else:
-        _engine = create_async_engine(database_url, echo=False, future=True)
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    kwargs: dict[str, Any] = {
+        "poolclass": TimedQueuePool,
+        "pool_size": options.pool_size,
+        "max_overflow": options.max_overflow,
+        "pool_timeout": options.pool_timeout_s,
+        "pool_recycle": options.pool_recycle_s,
+        "pool_pre_ping": options.pool_pre_ping,
+    }
+    if database_url.startswith("postgresql+asyncpg"):
+        kwargs["connect_args"] = {"prepared_statement_cache_size": options.statement_cache_size}
+    return kwargs
+
+
+def sqlite_pragmas(options: DatabaseSettings) -> list[str]:
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={int(options.sqlite_busy_timeout_ms)}",
+        f"PRAGMA mmap_size={int(options.sqlite_mmap_size)}",
+        # Отрицательное значение — размер в KiB, а не в страницах.
+        f"PRAGMA cache_size=-{int(options.sqlite_cache_size_kib)}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+
+def _install_sqlite_pragmas(engine: AsyncEngine, options: DatabaseSettings) -> None:
+    pragmas = sqlite_pragmas(options)
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection: Any, connection_record: Any) -> None:
+        _ = connection_record
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def init_engine(database_url: str, options: DatabaseSettings | None = None) -> None:
+    global _engine, _sessionmaker
+    options = options or DatabaseSettings()
+    _engine = create_async_engine(
+        database_url,
+        echo=False,
+        future=True,
+        **engine_options(database_url, options),
+    )
+    pool = _engine.sync_engine.pool
+    if isinstance(pool, TimedQueuePool):
+        pool.slow_checkout_ms = options.slow_checkout_ms
+    if database_url.startswith("sqlite") and not _is_memory_sqlite(database_url):
+        _install_sqlite_pragmas(_engine, options)
     _sessionmaker = async_sessionmaker(bind=_engine, expire_on_commit=False)
 
 
+def get_pool_checkout_stats() -> PoolCheckoutStats | None:
+    if _engine is None:
+        return None
+    return getattr(_engine.sync_engine.pool, "checkout_stats", None)
+
+
 def get_sessionmaker() -> async_sessionmaker[AsyncSession]:
     if _sessionmaker is None:
         raise RuntimeError("Database engine is not initialized. Call init_engine first.")
@@ -44,6 +155,23 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+@asynccontextmanager
+async def unit_of_work(sessionmaker: async_sessionmaker[AsyncSession]) -> AsyncIterator[AsyncSession]:
+    """Одна транзакция на запрос: записи внутри блока вызываются с commit=False.
+
+    Изменения уходят одним flush (INSERT ... RETURNING отдаёт id и метки времени), commit —
+    один на выходе из блока; при исключении транзакция откатывается.
+    """
+    async with sessionmaker() as session:
+        try:
+            yield session
+        except BaseException:
+            await session.rollback()
+            raise
+        if session.in_transaction():
+            await session.commit()
+
+
 def _run_alembic_upgrade(database_url: str) -> None:
     """Apply all pending Alembic migrations (sync, safe to call from a thread)."""
     project_root = Path(__file__).resolve().parents[2]
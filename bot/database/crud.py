@@ -1,22 +1,34 @@
 from __future__ import annotations
 
+from collections.abc import Iterator
 from datetime import UTC, date, datetime, time, timedelta, tzinfo
 from typing import Any
+from zoneinfo import ZoneInfo
 
-from sqlalchemy import delete, func, select, update
+from sqlalchemy import DateTime, case, delete, func, insert, literal, or_, select, union_all, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from bot.database.models import (
     Achievement,
     ConversationMessage,
     DailyCheckin,
+    DailyNutrition,
+    FsmState,
     GroupChat,
     GroupChatMember,
+    MealEstimate,
     MealLog,
     MealTemplate,
+    PhotoEstimate,
+    RateLimitWindow,
+    SchedulerJobRun,
+    SchedulerLease,
     User,
+    UserScheduleSlot,
     WaterLog,
     WeightLog,
+    WeightPlanTrajectory,
 )
 
 
@@ -31,6 +43,49 @@ def day_bounds(
     return start_local.astimezone(UTC), end_local.astimezone(UTC)
 
 
+def _as_utc(value: datetime) -> datetime:
+    # SQLite отдаёт naive datetime — там всегда UTC.
+    if value.tzinfo is None:
+        return value.replace(tzinfo=UTC)
+    return value.astimezone(UTC)
+
+
+def _zone_or_utc(timezone_name: str | None) -> tzinfo:
+    if timezone_name:
+        try:
+            return ZoneInfo(timezone_name)
+        except Exception:  # noqa: BLE001
+            pass
+    return UTC
+
+
+async def _commit_or_flush(session: AsyncSession, commit: bool) -> None:
+    """commit=False оставляет транзакцию вызывающему (unit_of_work): только flush.
+
+    id и server_default-поля приходят из INSERT ... RETURNING, отдельный refresh не нужен.
+    """
+    if commit:
+        await session.commit()
+    else:
+        await session.flush()
+
+
+def _dialect_insert(session: AsyncSession):  # noqa: ANN202
+    """insert() с поддержкой ON CONFLICT для текущего диалекта (PostgreSQL или SQLite)."""
+    if session.bind is not None and session.bind.dialect.name == "postgresql":
+        return postgresql.insert
+    return sqlite.insert
+
+
+_ID_BATCH = 500
+
+
+def _id_batches(ids: list[int]) -> Iterator[list[int]]:
+    """Делит список id на пачки, чтобы IN (...) не упирался в лимит 32767 параметров asyncpg."""
+    for offset in range(0, len(ids), _ID_BATCH):
+        yield ids[offset : offset + _ID_BATCH]
+
+
 async def get_user(session: AsyncSession, telegram_id: int) -> User | None:
     result = await session.execute(select(User).where(User.telegram_id == telegram_id))
     return result.scalar_one_or_none()
@@ -68,14 +123,16 @@ async def get_user_ids_by_timezones(
 
 
 async def get_users_by_ids(session: AsyncSession, telegram_ids: list[int]) -> list[User]:
-    if not telegram_ids:
-        return []
-    result = await session.execute(select(User).where(User.telegram_id.in_(telegram_ids)))
-    return list(result.scalars().all())
+    users: list[User] = []
+    for batch in _id_batches(telegram_ids):
+        result = await session.execute(select(User).where(User.telegram_id.in_(batch)))
+        users.extend(result.scalars().all())
+    return users
 
 
 async def create_or_update_user(session: AsyncSession, data: dict[str, Any]) -> User:
     user = await get_user(session, int(data["telegram_id"]))
+    timezone_changed = False
     if user is None:
         user = User(**data)
         if user.meal_reminder_times is None:
@@ -84,6 +141,7 @@ async def create_or_update_user(session: AsyncSession, data: dict[str, Any]) ->
             user.daily_water_target_ml = max(1200, int(float(user.weight_start_kg) * 30))
         session.add(user)
     else:
+        timezone_changed = "timezone" in data and data["timezone"] != user.timezone
         for key, value in data.items():
             setattr(user, key, value)
         if user.daily_water_target_ml is None:
@@ -91,20 +149,96 @@ async def create_or_update_user(session: AsyncSession, data: dict[str, Any]) ->
         if user.meal_reminder_times is None:
             user.meal_reminder_times = "9,13,19"
     await session.commit()
+    if timezone_changed:
+        await rebuild_daily_nutrition(session, user.telegram_id)
     await session.refresh(user)
     return user
 
 
+async def get_users_with_stale_schedule(
+    session: AsyncSession, now: datetime
+) -> list[tuple[int, str | None, str | None]]:
+    """(telegram_id, timezone, meal_reminder_times) пользователей, чей индекс расписания устарел."""
+    result = await session.execute(
+        select(User.telegram_id, User.timezone, User.meal_reminder_times).where(
+            (User.schedule_valid_until.is_(None)) | (User.schedule_valid_until <= now.astimezone(UTC))
+        )
+    )
+    return [(int(tid), tz_name, reminder_times) for tid, tz_name, reminder_times in result]
+
+
+_SCHEDULE_BATCH = 500
+
+
+async def replace_schedule_slots(
+    session: AsyncSession, entries: list[tuple[int, dict[str, set[int]], datetime]]
+) -> None:
+    """Заменяет слоты расписания пользователей; entries — (telegram_id, {kind: слоты}, valid_until)."""
+    for offset in range(0, len(entries), _SCHEDULE_BATCH):
+        batch = entries[offset : offset + _SCHEDULE_BATCH]
+        await session.execute(
+            delete(UserScheduleSlot).where(
+                UserScheduleSlot.telegram_id.in_([telegram_id for telegram_id, _, _ in batch])
+            )
+        )
+        rows = [
+            {"kind": kind, "slot": slot, "telegram_id": telegram_id}
+            for telegram_id, slots_by_kind, _ in batch
+            for kind, slots in slots_by_kind.items()
+            for slot in slots
+        ]
+        if rows:
+            # Почасовые задачи стартуют в одну минуту и могут пересчитывать одних и тех же пользователей:
+            # строки, уже вставленные параллельной транзакцией, пропускаем.
+            await session.execute(
+                _dialect_insert(session)(UserScheduleSlot).on_conflict_do_nothing(
+                    index_elements=["kind", "slot", "telegram_id"]
+                ),
+                rows,
+            )
+        by_valid_until: dict[datetime, list[int]] = {}
+        for telegram_id, _, valid_until in batch:
+            by_valid_until.setdefault(valid_until.astimezone(UTC), []).append(telegram_id)
+        for valid_until, telegram_ids in by_valid_until.items():
+            await session.execute(
+                update(User)
+                .where(User.telegram_id.in_(telegram_ids))
+                .values(schedule_valid_until=valid_until)
+                .execution_options(synchronize_session=False)
+            )
+    await session.commit()
+
+
+async def get_scheduled_user_ids(session: AsyncSession, kind: str, slot: int) -> list[int]:
+    result = await session.execute(
+        select(UserScheduleSlot.telegram_id)
+        .where(UserScheduleSlot.kind == kind, UserScheduleSlot.slot == slot)
+        .order_by(UserScheduleSlot.telegram_id.asc())
+    )
+    return [int(x) for x in result.scalars().all()]
+
+
+async def set_daily_water_target(
+    session: AsyncSession, telegram_id: int, target_ml: int, *, commit: bool = True
+) -> None:
+    await session.execute(
+        update(User).where(User.telegram_id == telegram_id).values(daily_water_target_ml=target_ml)
+    )
+    if commit:
+        await session.commit()
+
+
 async def delete_user_data(session: AsyncSession, telegram_id: int) -> None:
     await session.execute(delete(User).where(User.telegram_id == telegram_id))
     await session.commit()
 
 
-async def add_weight_log(session: AsyncSession, telegram_id: int, weight_kg: float) -> WeightLog:
+async def add_weight_log(
+    session: AsyncSession, telegram_id: int, weight_kg: float, *, commit: bool = True
+) -> WeightLog:
     row = WeightLog(telegram_id=telegram_id, weight_kg=weight_kg)
     session.add(row)
-    await session.commit()
-    await session.refresh(row)
+    await _commit_or_flush(session, commit)
     return row
 
 
@@ -120,6 +254,39 @@ async def get_latest_weight_at_or_before(
     return result.scalar_one_or_none()
 
 
+async def get_latest_weights_at_cutoffs(
+    session: AsyncSession, telegram_ids: list[int], cutoffs: list[datetime]
+) -> dict[int, list[float | None]]:
+    """Последний вес на каждый момент cutoffs для всех пользователей — одним запросом.
+
+    Результат: {telegram_id: [вес на cutoffs[0], вес на cutoffs[1], ...]}, None если записей нет.
+    """
+    weights: dict[int, list[float | None]] = {tid: [None] * len(cutoffs) for tid in telegram_ids}
+    if not telegram_ids or not cutoffs:
+        return weights
+    ranked = [
+        select(
+            literal(idx).label("cutoff_idx"),
+            WeightLog.telegram_id,
+            WeightLog.weight_kg,
+            func.row_number()
+            .over(
+                partition_by=WeightLog.telegram_id,
+                order_by=(WeightLog.logged_at.desc(), WeightLog.id.desc()),
+            )
+            .label("rn"),
+        ).where(WeightLog.telegram_id.in_(telegram_ids), WeightLog.logged_at <= cutoff)
+        for idx, cutoff in enumerate(cutoffs)
+    ]
+    sub = (union_all(*ranked) if len(ranked) > 1 else ranked[0]).subquery()
+    result = await session.execute(
+        select(sub.c.cutoff_idx, sub.c.telegram_id, sub.c.weight_kg).where(sub.c.rn == 1)
+    )
+    for cutoff_idx, telegram_id, weight_kg in result:
+        weights[int(telegram_id)][int(cutoff_idx)] = float(weight_kg)
+    return weights
+
+
 async def get_latest_weight(session: AsyncSession, telegram_id: int) -> WeightLog | None:
     result = await session.execute(
         select(WeightLog)
@@ -166,6 +333,50 @@ async def get_users_with_active_plan(session: AsyncSession) -> list[User]:
     return list(result.scalars().all())
 
 
+async def get_weight_plan_trajectory(session: AsyncSession, telegram_id: int) -> WeightPlanTrajectory | None:
+    result = await session.execute(
+        select(WeightPlanTrajectory).where(WeightPlanTrajectory.telegram_id == telegram_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_weight_plan_trajectory_keys(session: AsyncSession, telegram_ids: list[int]) -> dict[int, str]:
+    """inputs_key сохранённых траекторий пачки пользователей (без самих весов)."""
+    if not telegram_ids:
+        return {}
+    result = await session.execute(
+        select(WeightPlanTrajectory.telegram_id, WeightPlanTrajectory.inputs_key).where(
+            WeightPlanTrajectory.telegram_id.in_(telegram_ids)
+        )
+    )
+    return {int(tid): str(key) for tid, key in result.all()}
+
+
+async def upsert_weight_plan_trajectories(
+    session: AsyncSession, rows: list[tuple[int, str, bytes]], *, commit: bool = True
+) -> None:
+    """rows — (telegram_id, inputs_key, weights); существующая траектория заменяется."""
+    if rows:
+        now = datetime.now(tz=UTC)
+        stmt = _dialect_insert(session)(WeightPlanTrajectory)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["telegram_id"],
+            set_={
+                "inputs_key": stmt.excluded.inputs_key,
+                "weights": stmt.excluded.weights,
+                "updated_at": stmt.excluded.updated_at,
+            },
+        )
+        await session.execute(
+            stmt,
+            [
+                {"telegram_id": tid, "inputs_key": key, "weights": weights, "updated_at": now}
+                for tid, key, weights in rows
+            ],
+        )
+    await _commit_or_flush(session, commit)
+
+
 async def add_meal_log(
     session: AsyncSession,
     telegram_id: int,
@@ -176,6 +387,9 @@ async def add_meal_log(
     carbs_g: float,
     photo_file_id: str | None = None,
     meal_type: str = "snack",
+    *,
+    zone: tzinfo | None = None,
+    commit: bool = True,
 ) -> MealLog:
     row = MealLog(
         telegram_id=telegram_id,
@@ -186,10 +400,21 @@ async def add_meal_log(
         carbs_g=carbs_g,
         photo_file_id=photo_file_id,
         meal_type=meal_type,
+        logged_at=datetime.now(tz=UTC),
     )
     session.add(row)
-    await session.commit()
-    await session.refresh(row)
+    await _apply_daily_nutrition_delta(
+        session,
+        telegram_id,
+        row.logged_at,
+        calories=calories,
+        protein_g=protein_g,
+        fat_g=fat_g,
+        carbs_g=carbs_g,
+        meals_count=1,
+        zone=zone,
+    )
+    await _commit_or_flush(session, commit)
     return row
 
 
@@ -212,23 +437,85 @@ async def has_meals_in_last_hours(
     return int(result.scalar() or 0) > 0
 
 
+async def has_meals_in_last_hours_many(
+    session: AsyncSession,
+    telegram_ids: list[int],
+    *,
+    hours: int = 2,
+    now: datetime | None = None,
+) -> set[int]:
+    """Пакетный has_meals_in_last_hours: множество пользователей с приёмом пищи за последние hours."""
+    anchor = now or datetime.now(tz=UTC)
+    cutoff = anchor - timedelta(hours=max(1, hours))
+    found: set[int] = set()
+    for batch in _id_batches(telegram_ids):
+        result = await session.execute(
+            select(MealLog.telegram_id)
+            .where(
+                MealLog.telegram_id.in_(batch),
+                MealLog.logged_at >= cutoff,
+                MealLog.logged_at <= anchor,
+            )
+            .distinct()
+        )
+        found.update(int(x) for x in result.scalars().all())
+    return found
+
+
+_MEAL_ROLLUP_COLUMNS = (MealLog.logged_at, MealLog.calories, MealLog.protein_g, MealLog.fat_g, MealLog.carbs_g)
+
+
+async def _apply_meal_rollup(
+    session: AsyncSession,
+    telegram_id: int,
+    meal: Any,
+    *,
+    sign: int,
+    zone: tzinfo,
+) -> None:
+    await _apply_daily_nutrition_delta(
+        session,
+        telegram_id,
+        meal.logged_at,
+        calories=sign * float(meal.calories),
+        protein_g=sign * float(meal.protein_g),
+        fat_g=sign * float(meal.fat_g),
+        carbs_g=sign * float(meal.carbs_g),
+        meals_count=sign,
+        zone=zone,
+    )
+
+
 async def update_meal_log(session: AsyncSession, telegram_id: int, meal_id: int, fields: dict[str, Any]) -> bool:
-    q = (
-        update(MealLog)
-        .where(MealLog.id == meal_id, MealLog.telegram_id == telegram_id)
-        .values(**fields)
+    where = (MealLog.id == meal_id, MealLog.telegram_id == telegram_id)
+    before = (await session.execute(select(*_MEAL_ROLLUP_COLUMNS).where(*where))).one_or_none()
+    if before is None:
+        return False
+    result = await session.execute(
+        update(MealLog).where(*where).values(**fields).returning(*_MEAL_ROLLUP_COLUMNS)
     )
-    result = await session.execute(q)
+    after = result.one()
+    zone = await get_rollup_timezone(session, telegram_id)
+    await _apply_meal_rollup(session, telegram_id, before, sign=-1, zone=zone)
+    await _apply_meal_rollup(session, telegram_id, after, sign=1, zone=zone)
     await session.commit()
-    return result.rowcount > 0
+    return True
 
 
 async def delete_meal_log(session: AsyncSession, telegram_id: int, meal_id: int) -> bool:
     result = await session.execute(
-        delete(MealLog).where(MealLog.id == meal_id, MealLog.telegram_id == telegram_id)
+        delete(MealLog)
+        .where(MealLog.id == meal_id, MealLog.telegram_id == telegram_id)
+        .returning(*_MEAL_ROLLUP_COLUMNS)
     )
+    deleted = result.one_or_none()
+    if deleted is None:
+        await session.commit()
+        return False
+    zone = await get_rollup_timezone(session, telegram_id)
+    await _apply_meal_rollup(session, telegram_id, deleted, sign=-1, zone=zone)
     await session.commit()
-    return result.rowcount > 0
+    return True
 
 
 async def get_meals_for_day(
@@ -283,6 +570,45 @@ async def get_meal_summary_for_day(
     }
 
 
+async def get_meal_summaries_for_users(
+    session: AsyncSession,
+    telegram_ids: list[int],
+    target_date: date | None = None,
+    *,
+    timezone: tzinfo = UTC,
+) -> dict[int, dict[str, float]]:
+    """Пакетный get_meal_summary_for_day для пользователей одного часового пояса (+ meals_count)."""
+    summaries = {
+        tid: {"calories": 0.0, "protein_g": 0.0, "fat_g": 0.0, "carbs_g": 0.0, "meals_count": 0.0}
+        for tid in telegram_ids
+    }
+    if not telegram_ids:
+        return summaries
+    start, end = day_bounds(target_date, timezone=timezone)
+    for batch in _id_batches(telegram_ids):
+        result = await session.execute(
+            select(
+                MealLog.telegram_id,
+                func.coalesce(func.sum(MealLog.calories), 0.0),
+                func.coalesce(func.sum(MealLog.protein_g), 0.0),
+                func.coalesce(func.sum(MealLog.fat_g), 0.0),
+                func.coalesce(func.sum(MealLog.carbs_g), 0.0),
+                func.count(MealLog.id),
+            )
+            .where(MealLog.telegram_id.in_(batch), MealLog.logged_at >= start, MealLog.logged_at <= end)
+            .group_by(MealLog.telegram_id)
+        )
+        for tid, calories, protein, fat, carbs, meals_count in result:
+            summaries[int(tid)] = {
+                "calories": float(calories or 0.0),
+                "protein_g": float(protein or 0.0),
+                "fat_g": float(fat or 0.0),
+                "carbs_g": float(carbs or 0.0),
+                "meals_count": float(meals_count or 0),
+            }
+    return summaries
+
+
 async def get_meal_summary_for_period(
     session: AsyncSession, telegram_id: int, start: datetime, end: datetime
 ) -> dict[str, float]:
@@ -303,6 +629,37 @@ async def get_meal_summary_for_period(
     }
 
 
+async def get_calories_for_windows(
+    session: AsyncSession, telegram_ids: list[int], windows: list[tuple[datetime, datetime]]
+) -> dict[int, list[float]]:
+    """Сумма калорий по каждому окну [start, end] для всех пользователей — один GROUP BY.
+
+    Результат: {telegram_id: [калории в windows[0], калории в windows[1], ...]}.
+    """
+    totals: dict[int, list[float]] = {tid: [0.0] * len(windows) for tid in telegram_ids}
+    if not telegram_ids or not windows:
+        return totals
+    sums = [
+        func.coalesce(
+            func.sum(case((MealLog.logged_at.between(start, end), MealLog.calories), else_=None)),
+            0.0,
+        )
+        for start, end in windows
+    ]
+    result = await session.execute(
+        select(MealLog.telegram_id, *sums)
+        .where(
+            MealLog.telegram_id.in_(telegram_ids),
+            MealLog.logged_at >= min(start for start, _ in windows),
+            MealLog.logged_at <= max(end for _, end in windows),
+        )
+        .group_by(MealLog.telegram_id)
+    )
+    for telegram_id, *values in result:
+        totals[int(telegram_id)] = [float(value or 0.0) for value in values]
+    return totals
+
+
 async def get_meal_stats(
     session: AsyncSession, telegram_id: int, start: datetime, end: datetime
 ) -> dict[str, float]:
@@ -328,13 +685,13 @@ async def get_meal_stats(
 async def get_daily_avg_stats(
     session: AsyncSession,
     telegram_id: int,
-    start: datetime,
-    end: datetime,
-    *,
-    timezone: tzinfo = UTC,
+    start: datetime | date,
+    end: datetime | date,
 ) -> dict[str, float]:
-    meals = await get_meals_for_period(session, telegram_id, start, end)
-    if not meals:
+    """Средние КБЖУ по дням с приёмами пищи; читает подневный агрегат daily_nutrition."""
+    rows = await _get_daily_nutrition_window(session, telegram_id, start, end)
+    days = [row for row in rows if row.meals_count > 0]
+    if not days:
         return {
             "avg_calories": 0.0,
             "avg_protein_g": 0.0,
@@ -344,43 +701,29 @@ async def get_daily_avg_stats(
             "days_with_data": 0.0,
         }
 
-    daily: dict[date, dict[str, float]] = {}
-    for meal in meals:
-        if meal.logged_at is None:
-            continue
-        day_key = meal.logged_at.astimezone(timezone).date()
-        if day_key not in daily:
-            daily[day_key] = {
-                "calories": 0.0,
-                "protein_g": 0.0,
-                "fat_g": 0.0,
-                "carbs_g": 0.0,
-            }
-        daily[day_key]["calories"] += float(meal.calories)
-        daily[day_key]["protein_g"] += float(meal.protein_g)
-        daily[day_key]["fat_g"] += float(meal.fat_g)
-        daily[day_key]["carbs_g"] += float(meal.carbs_g)
-
-    days_count = max(1, len(daily))
-    sum_calories = sum(row["calories"] for row in daily.values())
-    sum_protein = sum(row["protein_g"] for row in daily.values())
-    sum_fat = sum(row["fat_g"] for row in daily.values())
-    sum_carbs = sum(row["carbs_g"] for row in daily.values())
+    days_count = len(days)
     return {
-        "avg_calories": sum_calories / days_count,
-        "avg_protein_g": sum_protein / days_count,
-        "avg_fat_g": sum_fat / days_count,
-        "avg_carbs_g": sum_carbs / days_count,
-        "meals_count": float(len(meals)),
-        "days_with_data": float(len(daily)),
+        "avg_calories": sum(float(row.calories) for row in days) / days_count,
+        "avg_protein_g": sum(float(row.protein_g) for row in days) / days_count,
+        "avg_fat_g": sum(float(row.fat_g) for row in days) / days_count,
+        "avg_carbs_g": sum(float(row.carbs_g) for row in days) / days_count,
+        "meals_count": float(sum(int(row.meals_count) for row in days)),
+        "days_with_data": float(days_count),
     }
 
 
-async def add_water_log(session: AsyncSession, telegram_id: int, amount_ml: int) -> WaterLog:
-    row = WaterLog(telegram_id=telegram_id, amount_ml=amount_ml)
+async def add_water_log(
+    session: AsyncSession,
+    telegram_id: int,
+    amount_ml: int,
+    *,
+    zone: tzinfo | None = None,
+    commit: bool = True,
+) -> WaterLog:
+    row = WaterLog(telegram_id=telegram_id, amount_ml=amount_ml, logged_at=datetime.now(tz=UTC))
     session.add(row)
-    await session.commit()
-    await session.refresh(row)
+    await _apply_daily_nutrition_delta(session, telegram_id, row.logged_at, water_ml=amount_ml, zone=zone)
+    await _commit_or_flush(session, commit)
     return row
 
 
@@ -402,6 +745,156 @@ async def get_water_summary_for_day(
     return int(result.scalar() or 0)
 
 
+async def get_rollup_timezone(session: AsyncSession, telegram_id: int) -> tzinfo:
+    """Часовой пояс, в котором считаются даты daily_nutrition: из профиля, иначе UTC."""
+    result = await session.execute(select(User.timezone).where(User.telegram_id == telegram_id))
+    return _zone_or_utc(result.scalar_one_or_none())
+
+
+def rollup_timezone_of(timezone_name: str | None) -> tzinfo:
+    """То же, что get_rollup_timezone, по уже загруженному профилю — без запроса в БД."""
+    return _zone_or_utc(timezone_name)
+
+
+async def _apply_daily_nutrition_delta(
+    session: AsyncSession,
+    telegram_id: int,
+    logged_at: datetime,
+    *,
+    calories: float = 0.0,
+    protein_g: float = 0.0,
+    fat_g: float = 0.0,
+    carbs_g: float = 0.0,
+    meals_count: int = 0,
+    water_ml: int = 0,
+    zone: tzinfo | None = None,
+) -> None:
+    """Прибавляет дельту к строке daily_nutrition одним upsert-ом в текущей транзакции."""
+    if zone is None:
+        zone = await get_rollup_timezone(session, telegram_id)
+    values = {
+        "calories": calories,
+        "protein_g": protein_g,
+        "fat_g": fat_g,
+        "carbs_g": carbs_g,
+        "meals_count": meals_count,
+        "water_ml": water_ml,
+    }
+    stmt = _dialect_insert(session)(DailyNutrition).values(
+        telegram_id=telegram_id,
+        local_date=_as_utc(logged_at).astimezone(zone).date(),
+        **values,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["telegram_id", "local_date"],
+        set_={key: getattr(DailyNutrition, key) + getattr(stmt.excluded, key) for key in values},
+    )
+    await session.execute(stmt)
+
+
+async def get_daily_nutrition(
+    session: AsyncSession, telegram_id: int, date_from: date, date_to: date
+) -> list[DailyNutrition]:
+    result = await session.execute(
+        select(DailyNutrition)
+        .where(
+            DailyNutrition.telegram_id == telegram_id,
+            DailyNutrition.local_date >= date_from,
+            DailyNutrition.local_date <= date_to,
+        )
+        .order_by(DailyNutrition.local_date.asc())
+    )
+    return list(result.scalars().all())
+
+
+def _rollup_day_range(start: datetime | date, end: datetime | date, zone: tzinfo) -> tuple[date, date]:
+    """Локальные даты daily_nutrition, которые начались в [start, end].
+
+    Так «последние N суток» (start = end - N дней) — ровно N дат, end.date() - (N - 1) … end.date(),
+    а не N + 1 частично задетых. date — уже локальная дата пользователя и берётся как есть.
+    """
+    if isinstance(end, datetime):
+        end = _as_utc(end).astimezone(zone).date()
+    if isinstance(start, datetime):
+        start_local = _as_utc(start).astimezone(zone)
+        start = start_local.date()
+        if start_local.time() != time.min:
+            start += timedelta(days=1)
+    return start, end
+
+
+async def _get_daily_nutrition_window(
+    session: AsyncSession, telegram_id: int, start: datetime | date, end: datetime | date
+) -> list[DailyNutrition]:
+    # Пояс тот же, в котором строки daily_nutrition разложены по датам, а не пояс вызывающего.
+    zone = await get_rollup_timezone(session, telegram_id)
+    date_from, date_to = _rollup_day_range(start, end, zone)
+    return await get_daily_nutrition(session, telegram_id, date_from, date_to)
+
+
+async def get_daily_totals(
+    session: AsyncSession,
+    telegram_id: int,
+    start: datetime | date,
+    end: datetime | date,
+) -> list[dict[str, Any]]:
+    """Подневные суммы КБЖУ (только дни с приёмами пищи) в формате для агента."""
+    rows = await _get_daily_nutrition_window(session, telegram_id, start, end)
+    return [
+        {
+            "date": row.local_date.isoformat(),
+            "calories": round(float(row.calories), 1),
+            "protein_g": round(float(row.protein_g), 1),
+            "fat_g": round(float(row.fat_g), 1),
+            "carbs_g": round(float(row.carbs_g), 1),
+            "meals_count": int(row.meals_count),
+        }
+        for row in rows
+        if row.meals_count > 0
+    ]
+
+
+async def rebuild_daily_nutrition(session: AsyncSession, telegram_id: int) -> int:
+    """Пересобирает daily_nutrition пользователя из meal_logs и water_logs. Возвращает число дней."""
+    zone = await get_rollup_timezone(session, telegram_id)
+    await session.execute(delete(DailyNutrition).where(DailyNutrition.telegram_id == telegram_id))
+
+    daily: dict[date, DailyNutrition] = {}
+
+    def _row_for(logged_at: datetime) -> DailyNutrition:
+        day = _as_utc(logged_at).astimezone(zone).date()
+        if day not in daily:
+            daily[day] = DailyNutrition(
+                telegram_id=telegram_id,
+                local_date=day,
+                calories=0.0,
+                protein_g=0.0,
+                fat_g=0.0,
+                carbs_g=0.0,
+                meals_count=0,
+                water_ml=0,
+            )
+        return daily[day]
+
+    meals = await session.execute(select(*_MEAL_ROLLUP_COLUMNS).where(MealLog.telegram_id == telegram_id))
+    for meal in meals:
+        row = _row_for(meal.logged_at)
+        row.calories += float(meal.calories)
+        row.protein_g += float(meal.protein_g)
+        row.fat_g += float(meal.fat_g)
+        row.carbs_g += float(meal.carbs_g)
+        row.meals_count += 1
+    water = await session.execute(
+        select(WaterLog.logged_at, WaterLog.amount_ml).where(WaterLog.telegram_id == telegram_id)
+    )
+    for item in water:
+        _row_for(item.logged_at).water_ml += int(item.amount_ml)
+
+    session.add_all(daily.values())
+    await session.commit()
+    return len(daily)
+
+
 async def create_meal_template(
     session: AsyncSession,
     telegram_id: int,
@@ -412,6 +905,8 @@ async def create_meal_template(
     fat_g: float,
     carbs_g: float,
     meal_type: str = "snack",
+    *,
+    commit: bool = True,
 ) -> MealTemplate:
     row = MealTemplate(
         telegram_id=telegram_id,
@@ -424,8 +919,7 @@ async def create_meal_template(
         meal_type=meal_type,
     )
     session.add(row)
-    await session.commit()
-    await session.refresh(row)
+    await _commit_or_flush(session, commit)
     return row
 
 
@@ -451,14 +945,15 @@ async def get_meal_template_by_id(
 
 
 async def increment_meal_template_usage(
-    session: AsyncSession, telegram_id: int, template_id: int
+    session: AsyncSession, telegram_id: int, template_id: int, *, commit: bool = True
 ) -> bool:
     result = await session.execute(
         update(MealTemplate)
         .where(MealTemplate.id == template_id, MealTemplate.telegram_id == telegram_id)
         .values(use_count=MealTemplate.use_count + 1)
     )
-    await session.commit()
+    if commit:
+        await session.commit()
     return result.rowcount > 0
 
 
@@ -473,16 +968,118 @@ async def delete_meal_template(session: AsyncSession, telegram_id: int, template
     return result.rowcount > 0
 
 
+async def get_meal_estimate(
+    session: AsyncSession, cache_key: str, *, now: datetime | None = None
+) -> MealEstimate | None:
+    """Неистёкшая запись кэша оценок или None."""
+    moment = now or datetime.now(tz=UTC)
+    result = await session.execute(
+        select(MealEstimate).where(MealEstimate.cache_key == cache_key, MealEstimate.expires_at > moment)
+    )
+    return result.scalar_one_or_none()
+
+
+async def upsert_meal_estimate(
+    session: AsyncSession,
+    cache_key: str,
+    *,
+    model: str,
+    normalized_text: str,
+    estimate: dict[str, Any],
+    expires_at: datetime,
+    commit: bool = True,
+) -> None:
+    """Записывает оценку; повторная оценка того же ключа заменяет старую."""
+    values = {
+        "model": model,
+        "normalized_text": normalized_text,
+        "description": str(estimate["description"]),
+        "calories": float(estimate["calories"]),
+        "protein_g": float(estimate["protein_g"]),
+        "fat_g": float(estimate["fat_g"]),
+        "carbs_g": float(estimate["carbs_g"]),
+        "meal_type": str(estimate.get("meal_type") or "snack"),
+        "created_at": datetime.now(tz=UTC),
+        "expires_at": expires_at,
+    }
+    stmt = _dialect_insert(session)(MealEstimate).values(cache_key=cache_key, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=["cache_key"], set_=values)
+    await session.execute(stmt)
+    if commit:
+        await session.commit()
+
+
+async def delete_expired_meal_estimates(
+    session: AsyncSession, *, now: datetime | None = None, commit: bool = True
+) -> int:
+    moment = now or datetime.now(tz=UTC)
+    result = await session.execute(delete(MealEstimate).where(MealEstimate.expires_at <= moment))
+    if commit:
+        await session.commit()
+    return int(result.rowcount or 0)
+
+
+async def get_photo_estimates(
+    session: AsyncSession, scope: str, *, limit: int | None = None
+) -> list[PhotoEstimate]:
+    """Последние limit оценок области (все без limit) в порядке добавления."""
+    result = await session.execute(
+        select(PhotoEstimate).where(PhotoEstimate.scope == scope).order_by(PhotoEstimate.id.desc()).limit(limit)
+    )
+    return list(reversed(result.scalars().all()))
+
+
+async def add_photo_estimate(
+    session: AsyncSession,
+    scope: str,
+    phash: int,
+    estimate: dict[str, Any],
+    *,
+    file_unique_id: str | None = None,
+    commit: bool = True,
+) -> PhotoEstimate:
+    """phash — знаковое 64-битное представление хэша."""
+    row = PhotoEstimate(
+        scope=scope,
+        phash=phash,
+        file_unique_id=file_unique_id,
+        description=str(estimate["description"]),
+        calories=float(estimate["calories"]),
+        protein_g=float(estimate["protein_g"]),
+        fat_g=float(estimate["fat_g"]),
+        carbs_g=float(estimate["carbs_g"]),
+        meal_type=str(estimate.get("meal_type") or "snack"),
+    )
+    session.add(row)
+    await _commit_or_flush(session, commit)
+    return row
+
+
 async def add_conversation_message(
-    session: AsyncSession, telegram_id: int, role: str, content: str
+    session: AsyncSession, telegram_id: int, role: str, content: str, *, commit: bool = True
 ) -> ConversationMessage:
     row = ConversationMessage(telegram_id=telegram_id, role=role, content=content)
     session.add(row)
-    await session.commit()
-    await session.refresh(row)
+    await _commit_or_flush(session, commit)
     return row
 
 
+async def add_conversation_turn(
+    session: AsyncSession,
+    telegram_id: int,
+    user_content: str,
+    assistant_content: str,
+    *,
+    commit: bool = True,
+) -> tuple[ConversationMessage, ConversationMessage]:
+    """Реплика пользователя и ответ ассистента одним flush."""
+    user_row = ConversationMessage(telegram_id=telegram_id, role="user", content=user_content)
+    assistant_row = ConversationMessage(telegram_id=telegram_id, role="assistant", content=assistant_content)
+    session.add_all([user_row, assistant_row])
+    await _commit_or_flush(session, commit)
+    return user_row, assistant_row
+
+
 async def get_recent_conversation(
     session: AsyncSession,
     telegram_id: int,
@@ -512,22 +1109,28 @@ async def clear_old_conversation(
     session: AsyncSession,
     telegram_id: int,
     keep_pairs: int = 10,
+    *,
+    commit: bool = True,
 ) -> int:
-    result = await session.execute(
+    """Оставляет последние keep_pairs пар одним DELETE ... WHERE id < (подзапрос)."""
+    keep = max(2, keep_pairs * 2)
+    oldest_kept_id = (
         select(ConversationMessage.id)
         .where(ConversationMessage.telegram_id == telegram_id)
-        .order_by(ConversationMessage.created_at.desc(), ConversationMessage.id.desc())
+        .order_by(ConversationMessage.id.desc())
+        .offset(keep - 1)
+        .limit(1)
+        .scalar_subquery()
     )
-    ids = list(result.scalars().all())
-    keep = max(2, keep_pairs * 2)
-    to_delete = ids[keep:]
-    if not to_delete:
-        return 0
-    del_result = await session.execute(
-        delete(ConversationMessage).where(ConversationMessage.id.in_(to_delete))
+    result = await session.execute(
+        delete(ConversationMessage).where(
+            ConversationMessage.telegram_id == telegram_id,
+            ConversationMessage.id < oldest_kept_id,
+        )
     )
-    await session.commit()
-    return int(del_result.rowcount or 0)
+    if commit:
+        await session.commit()
+    return int(result.rowcount or 0)
 
 
 async def get_daily_checkin(
@@ -550,6 +1153,7 @@ async def upsert_daily_checkin(
     calories_ok: bool,
     protein_ok: bool,
     logged_meals: int,
+    commit: bool = True,
 ) -> DailyCheckin:
     row = await get_daily_checkin(session, telegram_id, checkin_date)
     if row is None:
@@ -565,8 +1169,7 @@ async def upsert_daily_checkin(
         row.calories_ok = calories_ok
         row.protein_ok = protein_ok
         row.logged_meals = logged_meals
-    await session.commit()
-    await session.refresh(row)
+    await _commit_or_flush(session, commit)
     return row
 
 
@@ -597,6 +1200,96 @@ async def get_recent_calorie_streak(
     return streak
 
 
+async def upsert_daily_checkins(
+    session: AsyncSession, checkin_date: date, checkins: dict[int, dict[str, Any]]
+) -> None:
+    """Пакетный upsert чек-инов за день: {telegram_id: {calories_ok, protein_ok, logged_meals}}.
+
+    Не коммитит — вызывающий фиксирует всю пачку одним commit.
+    """
+    if not checkins:
+        return
+    existing: dict[int, int] = {}
+    for batch in _id_batches(list(checkins)):
+        result = await session.execute(
+            select(DailyCheckin.id, DailyCheckin.telegram_id).where(
+                DailyCheckin.telegram_id.in_(batch),
+                DailyCheckin.checkin_date == checkin_date,
+            )
+        )
+        existing.update((int(tid), int(row_id)) for row_id, tid in result)
+    updates = [{"id": existing[tid], **values} for tid, values in checkins.items() if tid in existing]
+    inserts = [
+        {"telegram_id": tid, "checkin_date": checkin_date, **values}
+        for tid, values in checkins.items()
+        if tid not in existing
+    ]
+    if updates:
+        await session.execute(update(DailyCheckin), updates)
+    if inserts:
+        await session.execute(insert(DailyCheckin), inserts)
+
+
+async def get_recent_calorie_streaks(
+    session: AsyncSession,
+    telegram_ids: list[int],
+    *,
+    as_of: date,
+    max_days: int = 365,
+) -> dict[int, int]:
+    """Пакетный get_recent_calorie_streak: длина серии дней с calories_ok до as_of включительно."""
+    streaks = dict.fromkeys(telegram_ids, 0)
+    if not telegram_ids:
+        return streaks
+    day_maps: dict[int, dict[date, bool]] = {tid: {} for tid in telegram_ids}
+    for batch in _id_batches(telegram_ids):
+        result = await session.execute(
+            select(DailyCheckin.telegram_id, DailyCheckin.checkin_date, DailyCheckin.calories_ok)
+            .where(
+                DailyCheckin.telegram_id.in_(batch),
+                DailyCheckin.checkin_date <= as_of,
+                DailyCheckin.checkin_date > as_of - timedelta(days=max_days),
+            )
+            .order_by(DailyCheckin.telegram_id.asc(), DailyCheckin.checkin_date.desc())
+        )
+        for tid, checkin_date, calories_ok in result:
+            day_maps[int(tid)][checkin_date] = bool(calories_ok)
+    for tid, day_map in day_maps.items():
+        streak = 0
+        cursor = as_of
+        while day_map.get(cursor, False):
+            streak += 1
+            cursor = cursor.fromordinal(cursor.toordinal() - 1)
+        streaks[tid] = streak
+    return streaks
+
+
+async def get_achievement_badges(
+    session: AsyncSession, telegram_ids: list[int], badge_keys: list[str]
+) -> set[tuple[int, str]]:
+    earned: set[tuple[int, str]] = set()
+    if not badge_keys:
+        return earned
+    for batch in _id_batches(telegram_ids):
+        result = await session.execute(
+            select(Achievement.telegram_id, Achievement.badge_key).where(
+                Achievement.telegram_id.in_(batch),
+                Achievement.badge_key.in_(badge_keys),
+            )
+        )
+        earned.update((int(tid), str(badge_key)) for tid, badge_key in result)
+    return earned
+
+
+async def add_achievements(session: AsyncSession, badges: list[tuple[int, str]]) -> None:
+    """Пакетная выдача бейджей. Не коммитит."""
+    if badges:
+        await session.execute(
+            insert(Achievement),
+            [{"telegram_id": tid, "badge_key": badge_key} for tid, badge_key in badges],
+        )
+
+
 async def has_achievement_badge(session: AsyncSession, telegram_id: int, badge_key: str) -> bool:
     result = await session.execute(
         select(func.count(Achievement.id)).where(
@@ -607,11 +1300,12 @@ async def has_achievement_badge(session: AsyncSession, telegram_id: int, badge_k
     return int(result.scalar() or 0) > 0
 
 
-async def add_achievement(session: AsyncSession, telegram_id: int, badge_key: str) -> Achievement:
+async def add_achievement(
+    session: AsyncSession, telegram_id: int, badge_key: str, *, commit: bool = True
+) -> Achievement:
     row = Achievement(telegram_id=telegram_id, badge_key=badge_key)
     session.add(row)
-    await session.commit()
-    await session.refresh(row)
+    await _commit_or_flush(session, commit)
     return row
 
 
@@ -636,39 +1330,9 @@ async def get_weekly_coaching_data(
         return {"error": "User not found"}
     end = datetime.now(tz=UTC)
     start = end - timedelta(days=max(1, days))
-    meals = await get_meals_for_period(session, telegram_id, start, end)
+    daily_totals = await get_daily_totals(session, telegram_id, start, end)
     weights = await get_weight_logs(session, telegram_id, limit=max(14, days * 2))
 
-    daily_map: dict[str, dict[str, float]] = {}
-    for meal in meals:
-        if meal.logged_at is None:
-            continue
-        day_key = meal.logged_at.astimezone(timezone).date().isoformat()
-        if day_key not in daily_map:
-            daily_map[day_key] = {
-                "calories": 0.0,
-                "protein_g": 0.0,
-                "fat_g": 0.0,
-                "carbs_g": 0.0,
-                "meals_count": 0.0,
-            }
-        daily_map[day_key]["calories"] += float(meal.calories)
-        daily_map[day_key]["protein_g"] += float(meal.protein_g)
-        daily_map[day_key]["fat_g"] += float(meal.fat_g)
-        daily_map[day_key]["carbs_g"] += float(meal.carbs_g)
-        daily_map[day_key]["meals_count"] += 1.0
-
-    daily_totals = [
-        {
-            "date": day,
-            "calories": round(values["calories"], 1),
-            "protein_g": round(values["protein_g"], 1),
-            "fat_g": round(values["fat_g"], 1),
-            "carbs_g": round(values["carbs_g"], 1),
-            "meals_count": int(values["meals_count"]),
-        }
-        for day, values in sorted(daily_map.items())
-    ]
     weight_history = [
         {
             "date": row.logged_at.astimezone(timezone).date().isoformat() if row.logged_at else None,
@@ -736,3 +1400,232 @@ async def get_chat_member_user_ids(session: AsyncSession, chat_id: int) -> list[
     )
     return list(result.scalars().all())
 
+
+
+async def get_fsm_state(session: AsyncSession, key: str, *, now: datetime | None = None) -> FsmState | None:
+    """Неистёкшая запись FSM или None."""
+    moment = now or datetime.now(tz=UTC)
+    result = await session.execute(select(FsmState).where(FsmState.key == key, FsmState.expires_at > moment))
+    return result.scalar_one_or_none()
+
+
+async def upsert_fsm_state(
+    session: AsyncSession,
+    key: str,
+    values: dict[str, Any],
+    *,
+    expires_at: datetime,
+    commit: bool = True,
+) -> None:
+    """Одним запросом пишет изменённые поля (state и/или data); остальные поля строки не трогает.
+
+    Запись, истёкшая к моменту вставки, начинается заново — старые поля не воскресают.
+    """
+    stmt = _dialect_insert(session)(FsmState).values(
+        key=key, **{"state": None, "data": "{}", **values}, expires_at=expires_at
+    )
+    now = datetime.now(tz=UTC)
+    stale = FsmState.expires_at <= now
+    set_: dict[str, Any] = {"expires_at": stmt.excluded.expires_at}
+    for column in ("state", "data"):
+        target = getattr(FsmState, column)
+        excluded = getattr(stmt.excluded, column)
+        set_[column] = excluded if column in values else case((stale, excluded), else_=target)
+    await session.execute(stmt.on_conflict_do_update(index_elements=["key"], set_=set_))
+    if commit:
+        await session.commit()
+
+
+async def delete_fsm_state(session: AsyncSession, key: str, *, commit: bool = True) -> None:
+    await session.execute(delete(FsmState).where(FsmState.key == key))
+    if commit:
+        await session.commit()
+
+
+async def delete_expired_fsm_states(
+    session: AsyncSession, *, now: datetime | None = None, commit: bool = True
+) -> int:
+    moment = now or datetime.now(tz=UTC)
+    result = await session.execute(delete(FsmState).where(FsmState.expires_at <= moment))
+    if commit:
+        await session.commit()
+    return int(result.rowcount or 0)
+
+
+async def get_scheduler_lease(session: AsyncSession, name: str) -> SchedulerLease | None:
+    result = await session.execute(select(SchedulerLease).where(SchedulerLease.name == name))
+    return result.scalar_one_or_none()
+
+
+async def acquire_scheduler_lease(
+    session: AsyncSession,
+    name: str,
+    holder: str,
+    *,
+    ttl_s: float,
+    now: datetime | None = None,
+    commit: bool = True,
+) -> int | None:
+    """Берёт или продлевает аренду; возвращает токен ограждения или None, если её держит другой.
+
+    Продление тем же держателем сохраняет токен, захват свободной или истёкшей чужой
+    аренды увеличивает его. Условие проверяется в самом UPDATE, поэтому из нескольких
+    одновременных претендентов аренду получает ровно один.
+    """
+    moment = now or datetime.now(tz=UTC)
+    expires_at = moment + timedelta(seconds=ttl_s)
+    result = await session.execute(
+        update(SchedulerLease)
+        .where(
+            SchedulerLease.name == name,
+            or_(SchedulerLease.holder == holder, SchedulerLease.expires_at <= moment),
+        )
+        .values(
+            token=case((SchedulerLease.holder == holder, SchedulerLease.token), else_=SchedulerLease.token + 1),
+            holder=holder,
+            expires_at=expires_at,
+            heartbeat_at=moment,
+        )
+        .returning(SchedulerLease.token)
+        .execution_options(synchronize_session=False)
+    )
+    token = result.scalar_one_or_none()
+    if token is None:
+        stmt = _dialect_insert(session)(SchedulerLease).values(
+            name=name, holder=holder, token=1, expires_at=expires_at, heartbeat_at=moment
+        )
+        result = await session.execute(
+            stmt.on_conflict_do_nothing(index_elements=["name"]).returning(SchedulerLease.token)
+        )
+        token = result.scalar_one_or_none()
+    if commit:
+        await session.commit()
+    return None if token is None else int(token)
+
+
+async def release_scheduler_lease(
+    session: AsyncSession, name: str, holder: str, *, now: datetime | None = None, commit: bool = True
+) -> None:
+    """Досрочно завершает свою аренду; токен остаётся, следующий держатель получит больший."""
+    moment = now or datetime.now(tz=UTC)
+    await session.execute(
+        update(SchedulerLease)
+        .where(SchedulerLease.name == name, SchedulerLease.holder == holder)
+        .values(expires_at=moment)
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        await session.commit()
+
+
+async def delete_scheduler_lease(session: AsyncSession, name: str, holder: str, *, commit: bool = True) -> None:
+    """Удаляет свою аренду целиком — для короткоживущих блокировок, которым токен не нужен."""
+    await session.execute(
+        delete(SchedulerLease).where(SchedulerLease.name == name, SchedulerLease.holder == holder)
+    )
+    if commit:
+        await session.commit()
+
+
+async def claim_scheduler_job_run(
+    session: AsyncSession,
+    job: str,
+    slot: str,
+    *,
+    lease: str,
+    holder: str,
+    token: int,
+    now: datetime | None = None,
+    commit: bool = True,
+) -> bool:
+    """Записывает запуск (job, slot), если его ещё нет и аренда с этим токеном действует.
+
+    Вставка и проверка токена — один INSERT ... SELECT: бывший лидер, чья аренда
+    истекла или перехвачена, не сможет занять слот даже с опозданием.
+    """
+    moment = now or datetime.now(tz=UTC)
+    fenced = (
+        select(
+            literal(job),
+            literal(slot),
+            literal(holder),
+            literal(token),
+            literal("running"),
+            literal(moment, DateTime(timezone=True)),
+        )
+        .select_from(SchedulerLease)
+        .where(
+            SchedulerLease.name == lease,
+            SchedulerLease.holder == holder,
+            SchedulerLease.token == token,
+            SchedulerLease.expires_at > moment,
+        )
+    )
+    stmt = (
+        _dialect_insert(session)(SchedulerJobRun)
+        .from_select(["job", "slot", "holder", "token", "status", "started_at"], fenced)
+        .on_conflict_do_nothing(index_elements=["job", "slot"])
+        .returning(SchedulerJobRun.job)
+    )
+    claimed = (await session.execute(stmt)).scalar_one_or_none() is not None
+    if commit:
+        await session.commit()
+    return claimed
+
+
+async def finish_scheduler_job_run(
+    session: AsyncSession,
+    job: str,
+    slot: str,
+    *,
+    token: int,
+    status: str,
+    now: datetime | None = None,
+    commit: bool = True,
+) -> None:
+    await session.execute(
+        update(SchedulerJobRun)
+        .where(SchedulerJobRun.job == job, SchedulerJobRun.slot == slot, SchedulerJobRun.token == token)
+        .values(status=status, finished_at=now or datetime.now(tz=UTC))
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        await session.commit()
+
+
+async def get_scheduler_job_runs(session: AsyncSession, job: str) -> list[SchedulerJobRun]:
+    result = await session.execute(
+        select(SchedulerJobRun).where(SchedulerJobRun.job == job).order_by(SchedulerJobRun.slot.asc())
+    )
+    return list(result.scalars().all())
+
+
+async def delete_scheduler_job_runs_before(
+    session: AsyncSession, before: datetime, *, commit: bool = True
+) -> int:
+    result = await session.execute(delete(SchedulerJobRun).where(SchedulerJobRun.started_at < before))
+    if commit:
+        await session.commit()
+    return int(result.rowcount or 0)
+
+
+async def hit_rate_limit_window(
+    session: AsyncSession, telegram_id: int, window_start: int, *, commit: bool = True
+) -> int:
+    """Засчитывает запрос в окно одним upsert-ом; возвращает число запросов в окне вместе с этим."""
+    stmt = _dialect_insert(session)(RateLimitWindow).values(telegram_id=telegram_id, window_start=window_start, hits=1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["telegram_id", "window_start"],
+        set_={"hits": RateLimitWindow.hits + 1},
+    ).returning(RateLimitWindow.hits)
+    hits = (await session.execute(stmt)).scalar_one()
+    await _commit_or_flush(session, commit)
+    return int(hits)
+
+
+async def delete_rate_limit_windows_before(
+    session: AsyncSession, window_start: int, *, commit: bool = True
+) -> int:
+    result = await session.execute(delete(RateLimitWindow).where(RateLimitWindow.window_start < window_start))
+    await _commit_or_flush(session, commit)
+    return int(result.rowcount or 0)
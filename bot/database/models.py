@@ -2,8 +2,21 @@ from __future__ import annotations
 
 from datetime import date, datetime
 
-from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Integer, String, Text, func
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
+from sqlalchemy import (
+    BigInteger,
+    Boolean,
+    Date,
+    DateTime,
+    Float,
+    ForeignKey,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    func,
+)
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship, validates
 
 
 class Base(DeclarativeBase):
@@ -12,6 +25,7 @@ class Base(DeclarativeBase):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (Index("ix_users_schedule_valid_until", "schedule_valid_until"),)
 
     telegram_id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str | None] = mapped_column(String(255), nullable=True)
@@ -40,6 +54,10 @@ class User(Base):
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
     )
+    # До какого момента актуальны строки user_schedule_slots; NULL — пересчитать на ближайшем тике.
+    schedule_valid_until: Mapped[datetime | None] = mapped_column(
+        DateTime(timezone=True), nullable=True, default=None
+    )
 
     weight_logs: Mapped[list["WeightLog"]] = relationship(
         back_populates="user", cascade="all, delete-orphan"
@@ -50,6 +68,9 @@ class User(Base):
     water_logs: Mapped[list["WaterLog"]] = relationship(
         back_populates="user", cascade="all, delete-orphan"
     )
+    daily_nutrition: Mapped[list["DailyNutrition"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
     meal_templates: Mapped[list["MealTemplate"]] = relationship(
         back_populates="user", cascade="all, delete-orphan"
     )
@@ -62,10 +83,57 @@ class User(Base):
     achievements: Mapped[list["Achievement"]] = relationship(
         back_populates="user", cascade="all, delete-orphan"
     )
+    schedule_slots: Mapped[list["UserScheduleSlot"]] = relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
+    weight_plan_trajectory: Mapped["WeightPlanTrajectory | None"] = relationship(
+        back_populates="user", cascade="all, delete-orphan"
+    )
+
+    @validates("timezone", "meal_reminder_times")
+    def _invalidate_schedule(self, key: str, value: str | None) -> str | None:
+        _ = key
+        self.schedule_valid_until = None
+        return value
+
+
+class UserScheduleSlot(Base):
+    """Индекс расписания: в какой UTC-слот недели (weekday * 24 + hour) пользователь ждёт задачу kind."""
+
+    __tablename__ = "user_schedule_slots"
+    __table_args__ = (Index("ix_user_schedule_slots_telegram_id", "telegram_id"),)
+
+    kind: Mapped[str] = mapped_column(String(32), primary_key=True)
+    slot: Mapped[int] = mapped_column(Integer, primary_key=True)
+    telegram_id: Mapped[int] = mapped_column(
+        ForeignKey("users.telegram_id", ondelete="CASCADE"), primary_key=True
+    )
+
+    user: Mapped[User] = relationship(back_populates="schedule_slots")
+
+
+class WeightPlanTrajectory(Base):
+    """Понедельные веса прогноза активного плана; пишется при выборе или смене режима."""
+
+    __tablename__ = "weight_plan_trajectory"
+
+    telegram_id: Mapped[int] = mapped_column(
+        ForeignKey("users.telegram_id", ondelete="CASCADE"), primary_key=True
+    )
+    # PlanInputs.key: траектория с другим ключом устарела (поменялся профиль или модель).
+    inputs_key: Mapped[str] = mapped_column(String(160))
+    # float64 little-endian подряд, индекс — номер недели (Trajectory.to_bytes).
+    weights: Mapped[bytes] = mapped_column(LargeBinary)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now(), onupdate=func.now()
+    )
+
+    user: Mapped[User] = relationship(back_populates="weight_plan_trajectory")
 
 
 class WeightLog(Base):
     __tablename__ = "weight_logs"
+    __table_args__ = (Index("ix_weight_logs_telegram_id_logged_at", "telegram_id", "logged_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"))
@@ -79,6 +147,7 @@ class WeightLog(Base):
 
 class MealLog(Base):
     __tablename__ = "meal_logs"
+    __table_args__ = (Index("ix_meal_logs_telegram_id_logged_at", "telegram_id", "logged_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"))
@@ -98,6 +167,7 @@ class MealLog(Base):
 
 class WaterLog(Base):
     __tablename__ = "water_logs"
+    __table_args__ = (Index("ix_water_logs_telegram_id_logged_at", "telegram_id", "logged_at"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"))
@@ -109,6 +179,25 @@ class WaterLog(Base):
     user: Mapped[User] = relationship(back_populates="water_logs")
 
 
+class DailyNutrition(Base):
+    """Подневный агрегат КБЖУ и воды; local_date — дата в часовом поясе пользователя (или UTC)."""
+
+    __tablename__ = "daily_nutrition"
+
+    telegram_id: Mapped[int] = mapped_column(
+        ForeignKey("users.telegram_id", ondelete="CASCADE"), primary_key=True
+    )
+    local_date: Mapped[date] = mapped_column(Date, primary_key=True)
+    calories: Mapped[float] = mapped_column(Float, default=0.0)
+    protein_g: Mapped[float] = mapped_column(Float, default=0.0)
+    fat_g: Mapped[float] = mapped_column(Float, default=0.0)
+    carbs_g: Mapped[float] = mapped_column(Float, default=0.0)
+    meals_count: Mapped[int] = mapped_column(Integer, default=0)
+    water_ml: Mapped[int] = mapped_column(Integer, default=0)
+
+    user: Mapped[User] = relationship(back_populates="daily_nutrition")
+
+
 class MealTemplate(Base):
     __tablename__ = "meal_templates"
 
@@ -129,8 +218,110 @@ class MealTemplate(Base):
     user: Mapped[User] = relationship(back_populates="meal_templates")
 
 
+class MealEstimate(Base):
+    """Кэш оценок КБЖУ по нормализованному тексту; ключ учитывает модель и версию промпта."""
+
+    __tablename__ = "meal_estimates"
+    __table_args__ = (Index("ix_meal_estimates_expires_at", "expires_at"),)
+
+    cache_key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    model: Mapped[str] = mapped_column(String(64))
+    normalized_text: Mapped[str] = mapped_column(Text)
+    description: Mapped[str] = mapped_column(Text)
+    calories: Mapped[float] = mapped_column(Float)
+    protein_g: Mapped[float] = mapped_column(Float)
+    fat_g: Mapped[float] = mapped_column(Float)
+    carbs_g: Mapped[float] = mapped_column(Float)
+    meal_type: Mapped[str] = mapped_column(String(32), default="snack")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class PhotoEstimate(Base):
+    """Оценки фото для кэша повторов (estimator.cache): scope — модель, версия промпта и подпись."""
+
+    __tablename__ = "photo_estimates"
+    __table_args__ = (Index("ix_photo_estimates_scope_id", "scope", "id"),)
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    scope: Mapped[str] = mapped_column(String(32))
+    # 64-битный dHash в знаковом представлении (estimator.fingerprint.to_signed64).
+    phash: Mapped[int] = mapped_column(BigInteger)
+    file_unique_id: Mapped[str | None] = mapped_column(String(128), nullable=True, default=None)
+    description: Mapped[str] = mapped_column(Text)
+    calories: Mapped[float] = mapped_column(Float)
+    protein_g: Mapped[float] = mapped_column(Float)
+    fat_g: Mapped[float] = mapped_column(Float)
+    carbs_g: Mapped[float] = mapped_column(Float)
+    meal_type: Mapped[str] = mapped_column(String(32), default="snack")
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True), server_default=func.now()
+    )
+
+
+class FsmState(Base):
+    """Состояние и данные FSM aiogram (bot.services.fsm_storage); key — StorageKey в виде строки."""
+
+    __tablename__ = "fsm_state"
+    __table_args__ = (Index("ix_fsm_state_expires_at", "expires_at"),)
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str | None] = mapped_column(String(255), nullable=True, default=None)
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class SchedulerLease(Base):
+    """Аренда лидерства (bot.services.leader): кто держит, до какого момента и токен ограждения.
+
+    token растёт при каждой смене держателя, поэтому запись бывшего лидера с устаревшим
+    токеном можно отвергнуть даже после того, как его аренда истекла.
+    """
+
+    __tablename__ = "scheduler_lease"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(128))
+    token: Mapped[int] = mapped_column(BigInteger, default=1)
+    expires_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    heartbeat_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class SchedulerJobRun(Base):
+    """Журнал запусков задач планировщика: не больше одного запуска на (job, slot)."""
+
+    __tablename__ = "scheduler_job_run"
+    __table_args__ = (Index("ix_scheduler_job_run_started_at", "started_at"),)
+
+    job: Mapped[str] = mapped_column(String(64), primary_key=True)
+    # Момент запуска по расписанию (UTC, с точностью до минуты) в ISO-формате.
+    slot: Mapped[str] = mapped_column(String(32), primary_key=True)
+    holder: Mapped[str] = mapped_column(String(128))
+    token: Mapped[int] = mapped_column(BigInteger)
+    status: Mapped[str] = mapped_column(String(16), default="running")
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True, default=None)
+
+
+class RateLimitWindow(Base):
+    """Счётчик запросов пользователя к ИИ за минутное окно — общий лимит для всех процессов бота."""
+
+    __tablename__ = "rate_limit_window"
+    __table_args__ = (Index("ix_rate_limit_window_window_start", "window_start"),)
+
+    telegram_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Начало окна — Unix-время в секундах, кратное длине окна.
+    window_start: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    hits: Mapped[int] = mapped_column(Integer, default=0)
+
+
 class ConversationMessage(Base):
     __tablename__ = "conversation_messages"
+    __table_args__ = (
+        Index("ix_conversation_messages_telegram_id_created_at", "telegram_id", "created_at", "id"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"))
@@ -145,6 +336,9 @@ class ConversationMessage(Base):
 
 class DailyCheckin(Base):
     __tablename__ = "daily_checkins"
+    __table_args__ = (
+        Index("ix_daily_checkins_telegram_id_checkin_date", "telegram_id", "checkin_date"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"))
@@ -158,6 +352,7 @@ class DailyCheckin(Base):
 
 class Achievement(Base):
     __tablename__ = "achievements"
+    __table_args__ = (Index("ix_achievements_telegram_id_badge_key", "telegram_id", "badge_key"),)
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_id: Mapped[int] = mapped_column(ForeignKey("users.telegram_id", ondelete="CASCADE"))
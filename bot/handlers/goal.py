@@ -12,7 +12,7 @@ from bot.database import crud
 from bot.handlers.utils import parse_float
 from bot.keyboards import BTN_GOAL
 from bot.runtime import get_app_context
-from bot.services.chart import render_three_scenarios_chart, render_weight_plan_chart
+from bot.services.plan_trajectory import save_plan_trajectory
 from bot.services.weight_plan import build_weight_forecast, calculate_plan_targets
 
 router = Router()
@@ -37,8 +37,7 @@ async def start_goal_flow(message: Message, state: FSMContext) -> None:
     if not message.from_user:
         return
     ctx = get_app_context()
-    async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+    user = await ctx.profiles.get(message.from_user.id)
     if user is None:
         await message.answer("Сначала пройди /start.")
         return
@@ -73,6 +72,7 @@ async def receive_target_weight(message: Message, state: FSMContext) -> None:
         user.target_weight_kg = float(value)
         user.goal = direction
         await session.commit()
+        ctx.profiles.invalidate(message.from_user.id)
 
         forecasts: dict[str, list[dict]] = {}
         lines: list[str] = []
@@ -101,13 +101,13 @@ async def receive_target_weight(message: Message, state: FSMContext) -> None:
                 f"{plan['weekly_loss_kg']:.2f} кг/нед"
             )
 
-    chart = render_three_scenarios_chart(
+    chart = await ctx.charts.three_scenarios(
         forecasts=forecasts,
         current_weight=current_weight,
         target_weight=float(value),
     )
     await message.answer_photo(
-        photo=BufferedInputFile(chart.getvalue(), filename="weight_scenarios.png"),
+        photo=BufferedInputFile(chart, filename="weight_scenarios.png"),
         caption=(
             f"Цель сохранена: {value:.1f} кг.\n"
             f"Текущий вес: {current_weight:.1f} кг.\n"
@@ -173,7 +173,9 @@ async def goal_mode_selected(callback) -> None:  # type: ignore[no-untyped-def]
         user.daily_protein_target = float(targets["daily_protein"])
         user.daily_fat_target = float(targets["daily_fat"])
         user.daily_carbs_target = float(targets["daily_carbs"])
+        await save_plan_trajectory(session, user, commit=False)
         await session.commit()
+    ctx.profiles.invalidate(user_id)
 
     actual_weights = [
         {
@@ -183,7 +185,7 @@ async def goal_mode_selected(callback) -> None:  # type: ignore[no-untyped-def]
         for x in reversed(logs)
         if x.logged_at is not None
     ]
-    chart = render_weight_plan_chart(
+    chart = await ctx.charts.weight_plan(
         forecast=forecast,
         actual_weights=actual_weights,
         target_weight=target_weight,
@@ -201,7 +203,7 @@ async def goal_mode_selected(callback) -> None:  # type: ignore[no-untyped-def]
     await callback.answer("Режим сохранен")
     if callback.message:
         await callback.message.answer_photo(
-            BufferedInputFile(chart.getvalue(), filename="weight_plan.png"),
+            BufferedInputFile(chart, filename="weight_plan.png"),
             caption=caption,
             parse_mode="HTML",
         )
@@ -1,25 +1,32 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from datetime import datetime
+from io import BytesIO
 from zoneinfo import ZoneInfo
 
 from aiogram import F, Router
-from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command, or_f, StateFilter
 from aiogram.types import BufferedInputFile, InlineKeyboardButton, InlineKeyboardMarkup, Message
 
 from bot.database import crud
+from bot.database.connection import unit_of_work
 from bot.handlers.start import OnboardingStates
 from bot.handlers.weight import WeightStates
 from bot.keyboards import BTN_HISTORY, MAIN_MENU_BUTTONS
-from bot.prompts import context_message
-from bot.runtime import get_app_context
+from bot.prompts import AGENT_SYSTEM, context_message
+from bot.runtime import AppContext, get_app_context
+from bot.services.food_db import default_food_table
+from bot.services.meal_cache import agent_turn, is_self_contained, prompt_fingerprint, split_reestimate
 from bot.services.pending_media import pop_pending_photos
+from bot.services.telegram_stream import stream_reply
+from estimator.cache import scope_key
+from estimator.fingerprint import dhash
+from estimator.preprocess import preprocess_image
 
 logger = logging.getLogger(__name__)
 
-MAX_HISTORY_PAIRS = 10
-
 router = Router()
 
 
@@ -30,7 +37,7 @@ async def history(message: Message) -> None:
     ctx = get_app_context()
     tz = ZoneInfo(ctx.settings.league_report_timezone)
     async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+        user = await ctx.profiles.get(message.from_user.id, session)
         if user is None:
             await message.answer("Сначала пройди /start.")
             return
@@ -67,50 +74,122 @@ async def meal_delete(callback) -> None:  # type: ignore[no-untyped-def]
         await callback.message.edit_text("Удалено.")
 
 
+_CACHED_NOTE = "Оценка взята из прошлой такой же записи. Чтобы посчитать заново, начни сообщение с «пересчитай»."
+_PHOTO_CACHED_NOTE = "Это фото уже оценивалось — взял прошлую оценку. Чтобы посчитать заново, добавь в подпись «пересчитай»."
+_FOOD_DB_NOTE = "Посчитано по справочнику продуктов. Чтобы оценить иначе, начни сообщение с «пересчитай»."
+
+
+def _meal_type_at(hour: int) -> str:
+    if 5 <= hour < 11:
+        return "breakfast"
+    if 11 <= hour < 16:
+        return "lunch"
+    if 16 <= hour < 22:
+        return "dinner"
+    return "snack"
+
+
+async def _log_meal_without_llm(ctx: AppContext, user_id: int, estimate: dict, note: str) -> str:
+    """Записывает приём пищи по готовой оценке (кэш, справочник) и возвращает текст ответа."""
+    user = await ctx.profiles.get(user_id)
+    async with unit_of_work(ctx.sessionmaker) as session:
+        await crud.add_meal_log(
+            session=session,
+            telegram_id=user_id,
+            description=str(estimate["description"]),
+            calories=float(estimate["calories"]),
+            protein_g=float(estimate["protein_g"]),
+            fat_g=float(estimate["fat_g"]),
+            carbs_g=float(estimate["carbs_g"]),
+            meal_type=str(estimate["meal_type"]),
+            zone=crud.rollup_timezone_of(user.timezone if user is not None else None),
+            commit=False,
+        )
+        consumed = await crud.get_meal_summary_for_day(
+            session, user_id, timezone=ZoneInfo(ctx.settings.league_report_timezone)
+        )
+    lines = [
+        f"Записал: {estimate['description']}",
+        f"{float(estimate['calories']):.0f} ккал | Б {float(estimate['protein_g']):.1f} | "
+        f"Ж {float(estimate['fat_g']):.1f} | У {float(estimate['carbs_g']):.1f}",
+    ]
+    if user is not None:
+        lines.append(f"За сегодня: {consumed['calories']:.0f} из {user.daily_calories_target:.0f} ккал")
+    lines.append(note)
+    return "\n".join(lines)
+
+
 @router.message(F.photo)
 async def photo_meal(message: Message) -> None:
     if not message.from_user or not message.photo:
         return
     ctx = get_app_context()
-    async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
-        if user is None:
-            await message.answer("Сначала пройди /start.")
-            return
+    user = await ctx.profiles.get(message.from_user.id)
+    if user is None:
+        await message.answer("Сначала пройди /start.")
+        return
 
+    user_id = message.from_user.id
+    reestimate, user_caption = split_reestimate((message.caption or "").strip())
+    user_caption = user_caption.strip()
     photo = message.photo[-1]
-    file = await message.bot.get_file(photo.file_id)  # type: ignore[union-attr]
-    image_url = f"https://api.telegram.org/file/bot{ctx.settings.telegram_bot_token}/{file.file_path}"
-    caption = (message.caption or "").strip() or "Пользователь отправил фото еды. Оцени КБЖУ и запиши приём пищи."
+    # Повторно присланное или пересланное фото с той же подписью записываем без vision-модели.
+    prompt_version = f"{prompt_fingerprint(AGENT_SYSTEM)}:{ctx.image_options.signature}"
+    scope = scope_key(ctx.agent.vision_model, prompt_version, user_caption)
+    phash: int | None = None
+    image_url: str | None = None
+    estimate = None if reestimate else await ctx.photo_estimates.lookup_file_id(scope, photo.file_unique_id)
+    if estimate is None:
+        file = await message.bot.get_file(photo.file_id)  # type: ignore[union-attr]
+        try:
+            # Качаем сессией бота и отдаём модели уменьшенную копию без EXIF,
+            # а не ссылку на оригинал с токеном бота.
+            buffer = BytesIO()
+            await message.bot.download(file, destination=buffer)  # type: ignore[union-attr]
+            data = buffer.getvalue()
+            phash = await asyncio.to_thread(dhash, data)
+            prepared = await asyncio.to_thread(preprocess_image, data, ctx.image_options)
+            image_url = prepared.data_uri
+        except Exception:  # noqa: BLE001
+            logger.warning("Failed to preprocess photo of user %s", user_id, exc_info=True)
+            image_url = f"https://api.telegram.org/file/bot{ctx.settings.telegram_bot_token}/{file.file_path}"
+        if phash is not None and not reestimate:
+            estimate = await ctx.photo_estimates.lookup(scope, phash)
+    if estimate is not None:
+        estimate["meal_type"] = _meal_type_at(datetime.now(crud.rollup_timezone_of(user.timezone)).hour)
+        answer = await _log_meal_without_llm(ctx, user_id, estimate, _PHOTO_CACHED_NOTE)
+        await message.answer(answer)
+        await ctx.conversations.append(user_id, f"[фото еды] {user_caption}".strip(), answer)
+        return
+
+    assert image_url is not None
+    caption = user_caption or "Пользователь отправил фото еды. Оцени КБЖУ и запиши приём пищи."
 
     context = context_message(
         message.from_user.id,
         timezone_name=ctx.settings.league_report_timezone,
         chat_id=message.chat.id if message.chat else None,
     )
-    user_id = message.from_user.id
-    async with ctx.sessionmaker() as session:
-        history = await crud.get_recent_conversation(session, user_id, limit=MAX_HISTORY_PAIRS)
-    try:
-        answer = await ctx.agent.ask(
-            caption,
-            context=context,
-            history=history if history else None,
-            image_urls=[image_url],
+    history = await ctx.conversations.history(user_id)
+    with agent_turn() as turn:
+        answer = await stream_reply(
+            message,
+            ctx.agent.ask_stream(
+                caption,
+                context=context,
+                history=history if history else None,
+                image_urls=[image_url],
+            ),
+            error_text="Не удалось распознать фото. Попробуй ещё раз или опиши блюдо текстом.",
         )
-    except Exception:  # noqa: BLE001
-        logger.exception("Agent failed on photo message")
-        await message.answer("Не удалось распознать фото. Попробуй ещё раз или опиши блюдо текстом.")
+    if answer is None:
         return
+    # Записи по фото не привязываем к тексту подписи, но кэшируем по самому фото.
+    logged = turn.single_meal()
+    if logged is not None and phash is not None:
+        await ctx.photo_estimates.put(scope, phash, logged, file_unique_id=photo.file_unique_id)
 
-    async with ctx.sessionmaker() as session:
-        await crud.add_conversation_message(session, user_id, "user", f"[фото еды] {caption}")
-        await crud.add_conversation_message(session, user_id, "assistant", answer)
-        await crud.clear_old_conversation(session, user_id, keep_pairs=MAX_HISTORY_PAIRS)
-    try:
-        await message.answer(answer, parse_mode="HTML")
-    except TelegramBadRequest:
-        await message.answer(answer)
+    await ctx.conversations.append(user_id, f"[фото еды] {caption}", answer)
     pending = pop_pending_photos(user_id)
     for item in pending:
         await message.answer_photo(
@@ -131,8 +210,7 @@ async def text_message(message: Message) -> None:
     ctx = get_app_context()
     is_group_chat = message.chat.type in {"group", "supergroup"}
     league_request = "лига" in message.text.lower()
-    async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+    user = await ctx.profiles.get(message.from_user.id)
     if user is None and not is_group_chat:
         await message.answer("Сначала пройди /start.")
         return
@@ -140,32 +218,55 @@ async def text_message(message: Message) -> None:
         await message.answer("Для личного учёта открой бота в личке и пройди /start.")
         return
 
+    user_id = message.from_user.id
+    reestimate, meal_text = split_reestimate(message.text)
+    self_contained = is_self_contained(meal_text)
+    if user is not None and not reestimate and self_contained:
+        meal_type = _meal_type_at(datetime.now(crud.rollup_timezone_of(user.timezone)).hour)
+        estimate = await ctx.meal_estimates.get(
+            meal_text, model=ctx.agent.model, prompt=AGENT_SYSTEM, user_id=user_id
+        )
+        note = _CACHED_NOTE
+        if estimate is not None:
+            # Приём пищи определяется временем записи, а не временем закэшированной оценки.
+            estimate["meal_type"] = meal_type
+        else:
+            resolution = default_food_table().resolve_meal(meal_text)
+            if resolution.confident:
+                estimate = resolution.as_estimate(meal_type)
+                note = _FOOD_DB_NOTE
+        if estimate is not None:
+            answer = await _log_meal_without_llm(ctx, user_id, estimate, note)
+            await message.answer(answer)
+            await ctx.conversations.append(user_id, message.text.strip(), answer)
+            return
+
     context = context_message(
         message.from_user.id,
         timezone_name=ctx.settings.league_report_timezone,
         chat_id=message.chat.id if message.chat else None,
     )
-    user_id = message.from_user.id
-    async with ctx.sessionmaker() as session:
-        history = await crud.get_recent_conversation(session, user_id, limit=MAX_HISTORY_PAIRS)
-    try:
-        answer = await ctx.agent.ask(
-            message.text,
-            context=context,
-            history=history if history else None,
+    history = await ctx.conversations.history(user_id)
+    with agent_turn() as turn:
+        answer = await stream_reply(
+            message,
+            ctx.agent.ask_stream(
+                message.text,
+                context=context,
+                history=history if history else None,
+            ),
+            error_text="Сервис ИИ временно недоступен. Попробуй позже.",
         )
-    except Exception:  # noqa: BLE001
-        logger.exception("Agent failed on text message")
-        await message.answer("Сервис ИИ временно недоступен. Попробуй позже.")
+    if answer is None:
         return
-    async with ctx.sessionmaker() as session:
-        await crud.add_conversation_message(session, user_id, "user", message.text.strip())
-        await crud.add_conversation_message(session, user_id, "assistant", answer)
-        await crud.clear_old_conversation(session, user_id, keep_pairs=MAX_HISTORY_PAIRS)
-    try:
-        await message.answer(answer, parse_mode="HTML")
-    except TelegramBadRequest:
-        await message.answer(answer)
+    # Ход только записал одно блюдо по самодостаточному описанию — в следующий раз
+    # запишем его без модели.
+    logged = turn.single_meal()
+    if logged is not None and self_contained:
+        await ctx.meal_estimates.put(
+            meal_text, logged, model=ctx.agent.model, prompt=AGENT_SYSTEM, user_id=user_id
+        )
+    await ctx.conversations.append(user_id, message.text.strip(), answer)
     pending = pop_pending_photos(user_id)
     for item in pending:
         await message.answer_photo(
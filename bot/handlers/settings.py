@@ -87,6 +87,8 @@ async def profile_update(message: Message) -> None:
                 return
             user.timezone = tz_value
             await session.commit()
+            ctx.profiles.invalidate(user.telegram_id)
+            await crud.rebuild_daily_nutrition(session, user.telegram_id)
             await message.answer(f"Часовой пояс установлен: {tz_value}")
             return
         else:
@@ -106,6 +108,7 @@ async def profile_update(message: Message) -> None:
         user.daily_fat_target = targets["daily_fat_target"]
         user.daily_carbs_target = targets["daily_carbs_target"]
         await session.commit()
+    ctx.profiles.invalidate(message.from_user.id)
 
     await message.answer("Профиль обновлен и цели пересчитаны.")
 
@@ -135,6 +138,8 @@ async def reset_confirm(callback) -> None:  # type: ignore[no-untyped-def]
     ctx = get_app_context()
     async with ctx.sessionmaker() as session:
         await crud.delete_user_data(session, callback.from_user.id)
+    ctx.conversations.forget(callback.from_user.id)
+    ctx.profiles.invalidate(callback.from_user.id)
     await callback.message.answer(
         "Данные удалены. Можешь начать заново: /start",
         reply_markup=MAIN_MENU_KB,
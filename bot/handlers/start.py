@@ -100,8 +100,7 @@ async def command_start(message: Message, state: FSMContext) -> None:
     ctx = get_app_context()
     if not message.from_user:
         return
-    async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+    user = await ctx.profiles.get(message.from_user.id)
 
     if user:
         await message.answer(
@@ -227,6 +226,7 @@ async def _complete_onboarding(
     async with ctx.sessionmaker() as session:
         user = await crud.create_or_update_user(session, payload)
         await crud.add_weight_log(session, user.telegram_id, user.weight_start_kg)
+    ctx.profiles.invalidate(user.telegram_id)
 
     await state.clear()
     await message.answer(
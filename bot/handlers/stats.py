@@ -1,7 +1,6 @@
 from __future__ import annotations
 
 from datetime import UTC, datetime, timedelta
-from zoneinfo import ZoneInfo
 
 from aiogram import F, Router
 from aiogram.filters import Command, or_f
@@ -25,20 +24,13 @@ async def stats(message: Message) -> None:
         period = parts[1]
 
     ctx = get_app_context()
-    tz = ZoneInfo(ctx.settings.league_report_timezone)
-    now_local = datetime.now(tz=tz)
-    now = now_local.astimezone(UTC)
-    if period == "day":
-        start, end = crud.day_bounds(timezone=tz)
-    elif period == "month":
-        start = now - timedelta(days=30)
-        end = now
-    else:
-        start = now - timedelta(days=7)
-        end = now
+    # Границы дней — в поясе пользователя: его get_daily_avg_stats берёт из профиля сам.
+    days = {"day": 1, "week": 7, "month": 30}[period]
+    end = datetime.now(tz=UTC)
+    start = end - timedelta(days=days)
 
     async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+        user = await ctx.profiles.get(message.from_user.id, session)
         if user is None:
             await message.answer("Сначала пройди /start.")
             return
@@ -47,7 +39,6 @@ async def stats(message: Message) -> None:
             message.from_user.id,
             start,
             end,
-            timezone=tz,
         )
 
     meals_count = int(stats_data["meals_count"])
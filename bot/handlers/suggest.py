@@ -25,7 +25,7 @@ async def suggest(message: Message) -> None:
     ctx = get_app_context()
     tz = ZoneInfo(ctx.settings.league_report_timezone)
     async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+        user = await ctx.profiles.get(message.from_user.id, session)
         if user is None:
             await message.answer("Сначала пройди /start.")
             return
@@ -72,10 +72,9 @@ async def suggest(message: Message) -> None:
         stats_block=stats_block,
         meals_block=meals_block,
     )
-    try:
-        answer = await ctx.agent.ask(prompt, use_tools=False)
-    except Exception:  # noqa: BLE001
-        await message.answer("Не удалось получить рекомендацию, попробуй позже.")
-        return
-    await message.answer(answer)
+    await stream_reply(
+        message,
+        ctx.agent.ask_stream(prompt, use_tools=False),
+        error_text="Не удалось получить рекомендацию, попробуй позже.",
+    )
 
@@ -19,7 +19,7 @@ async def today(message: Message) -> None:
         return
     ctx = get_app_context()
     async with ctx.sessionmaker() as session:
-        user = await crud.get_user(session, message.from_user.id)
+        user = await ctx.profiles.get(message.from_user.id, session)
         if user is None:
             await message.answer("Сначала пройди /start")
             return
@@ -48,6 +48,7 @@ async def water_quick_add(message: Message) -> None:
         if user.daily_water_target_ml is None:
             user.daily_water_target_ml = max(1200, int(float(user.weight_start_kg) * 30))
             await session.commit()
+            ctx.profiles.invalidate(message.from_user.id)
         tz = _user_tz_or_default(user.timezone, ctx.settings.league_report_timezone)
         await crud.add_water_log(session, message.from_user.id, 250)
         total_ml = await crud.get_water_summary_for_day(
@@ -77,6 +78,7 @@ async def water_command(message: Message) -> None:
         if user.daily_water_target_ml is None:
             user.daily_water_target_ml = max(1200, int(float(user.weight_start_kg) * 30))
             await session.commit()
+            ctx.profiles.invalidate(message.from_user.id)
         tz = _user_tz_or_default(user.timezone, ctx.settings.league_report_timezone)
         if amount is not None:
             await crud.add_water_log(session, message.from_user.id, amount)
@@ -2,10 +2,10 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import multiprocessing
 import os
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from bot.config import load_settings
 from bot.database.connection import get_sessionmaker, init_db, init_engine
@@ -13,7 +13,16 @@ from bot.handlers import ALL_ROUTERS
 from bot.middlewares.rate_limit import OpenAIRateLimitMiddleware
 from bot.runtime import AppContext, set_app_context
 from bot.services.ai_agent import AIAgent
+from bot.services.fsm_storage import (
+    FSMWriteBatchMiddleware,
+    SQLAlchemyStorage,
+    create_event_isolation,
+    create_fsm_storage,
+)
+from bot.services.leader import LeaderElector
 from bot.services.league_scheduler import start_league_scheduler
+from bot.services.webhook import run_webhook
+from bot.tools.food_tools import food_tool_handlers, food_tools_schema
 from bot.tools.group_tools import group_tool_handlers, group_tools_schema
 from bot.tools.goal_tools import goal_tool_handlers, goal_tools_schema
 from bot.tools.meal_tools import meal_tool_handlers, meal_tools_schema
@@ -29,6 +38,7 @@ def configure_agent(ctx: AppContext) -> None:
     schemas = []
     handlers = {}
     schemas.extend(meal_tools_schema())
+    schemas.extend(food_tools_schema())
     schemas.extend(stats_tools_schema())
     schemas.extend(user_tools_schema())
     schemas.extend(weight_tools_schema())
@@ -37,53 +47,118 @@ def configure_agent(ctx: AppContext) -> None:
     schemas.extend(template_tools_schema())
     schemas.extend(streak_tools_schema())
     schemas.extend(group_tools_schema())
-    handlers.update(meal_tool_handlers(ctx.sessionmaker, timezone_name=ctx.settings.league_report_timezone))
-    handlers.update(stats_tool_handlers(ctx.sessionmaker))
-    handlers.update(user_tool_handlers(ctx.sessionmaker))
+    tz_name = ctx.settings.league_report_timezone
+    profiles = ctx.profiles
+    handlers.update(meal_tool_handlers(ctx.sessionmaker, timezone_name=tz_name, profiles=profiles))
+    handlers.update(food_tool_handlers())
+    handlers.update(stats_tool_handlers(ctx.sessionmaker, profiles=profiles))
+    handlers.update(
+        user_tool_handlers(ctx.sessionmaker, conversations=ctx.conversations, profiles=profiles)
+    )
     handlers.update(weight_tool_handlers(ctx.sessionmaker))
-    handlers.update(goal_tool_handlers(ctx.sessionmaker))
-    handlers.update(water_tool_handlers(ctx.sessionmaker, timezone_name=ctx.settings.league_report_timezone))
-    handlers.update(template_tool_handlers(ctx.sessionmaker))
-    handlers.update(streak_tool_handlers(ctx.sessionmaker))
-    handlers.update(group_tool_handlers(ctx.sessionmaker, timezone_name=ctx.settings.league_report_timezone))
+    handlers.update(goal_tool_handlers(ctx.sessionmaker, profiles=profiles, charts=ctx.charts))
+    handlers.update(water_tool_handlers(ctx.sessionmaker, timezone_name=tz_name, profiles=profiles))
+    handlers.update(template_tool_handlers(ctx.sessionmaker, profiles=profiles))
+    handlers.update(streak_tool_handlers(ctx.sessionmaker, profiles=profiles))
+    handlers.update(group_tool_handlers(ctx.sessionmaker, timezone_name=tz_name))
     ctx.agent.register_tools(schemas, handlers)
+    ctx.agent.meal_cache = ctx.meal_estimates
+
+
+def _run_worker(worker_index: int) -> None:
+    asyncio.run(main(worker_index))
+
 
+def _spawn_workers(count: int) -> list[multiprocessing.Process]:
+    """Дополнительные процессы бота; каждый слушает тот же порт webhook (SO_REUSEPORT)."""
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(target=_run_worker, args=(index,), name=f"nutri-worker-{index}")
+        for index in range(1, count + 1)
+    ]
+    for process in processes:
+        process.start()
+    return processes
 
-async def main() -> None:
+
+async def _stop_workers(processes: list[multiprocessing.Process], timeout_s: float) -> None:
+    # SIGTERM запускает в процессе ту же мягкую остановку, что и у основного.
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    for process in processes:
+        await asyncio.to_thread(process.join, timeout_s)
+        if process.is_alive():
+            process.kill()
+
+
+async def main(worker_index: int = 0) -> None:
     logging.basicConfig(level=logging.INFO)
     settings = load_settings()
     if settings.openai_base_url:
         # Дублируем в env, чтобы SDK и любые внутренние клиенты использовали тот же endpoint.
         os.environ["OPENAI_BASE_URL"] = settings.openai_base_url
     logging.info("OpenAI base URL: %s", settings.openai_base_url or "default")
-    init_engine(settings.database_url)
-    await init_db()
+    init_engine(settings.database_url, settings.database)
+    workers: list[multiprocessing.Process] = []
+    if worker_index == 0:
+        # Миграции — один раз в основном процессе, до запуска остальных.
+        await init_db()
+        workers = _spawn_workers(settings.bot_workers - 1)
 
     bot = Bot(token=settings.telegram_bot_token)
-    dp = Dispatcher(storage=MemoryStorage())
-    dp.message.middleware(OpenAIRateLimitMiddleware(settings.openai_max_requests_per_minute))
+    storage = create_fsm_storage(settings, get_sessionmaker())
+    dp = Dispatcher(storage=storage, events_isolation=create_event_isolation(settings, storage, get_sessionmaker()))
+    if isinstance(storage, SQLAlchemyStorage):
+        dp.update.outer_middleware(FSMWriteBatchMiddleware(storage))
+        await storage.purge_expired()
+    # Процессы и реплики бота делят один лимит пользователя через БД.
+    dp.message.middleware(
+        OpenAIRateLimitMiddleware(
+            settings.openai_max_requests_per_minute,
+            sessionmaker=get_sessionmaker() if settings.shared_deployment else None,
+        )
+    )
 
     agent = AIAgent(
         api_key=settings.openai_api_key,
         model=settings.openai_model_text,
         base_url=settings.openai_base_url,
         vision_model=settings.openai_model_vision,
+        max_parallel_tools=settings.agent_max_parallel_tools,
+        tool_timeout_s=settings.agent_tool_timeout_s,
+        image_detail=settings.vision_image_detail,
     )
-    ctx = AppContext(settings=settings, sessionmaker=get_sessionmaker(), agent=agent)
+    ctx = AppContext(settings=settings, sessionmaker=get_sessionmaker(), agent=agent, worker_index=worker_index)
     set_app_context(ctx)
     configure_agent(ctx)
+    await ctx.meal_estimates.purge_expired()
+    await ctx.charts.start()
 
     for router in ALL_ROUTERS:
         dp.include_router(router)
+    # Таймеры тикают в каждом процессе и реплике, задачи выполняет только держатель аренды.
+    leader = LeaderElector(ctx.sessionmaker, ttl_s=settings.scheduler_lease_ttl_s)
+    await leader.start()
     scheduler = start_league_scheduler(
         bot=bot,
         sessionmaker=ctx.sessionmaker,
         timezone_name=ctx.settings.league_report_timezone,
+        profiles=ctx.profiles,
+        leader=leader,
     )
     try:
-        await dp.start_polling(bot)
+        if settings.run_mode == "webhook":
+            await run_webhook(
+                dp, bot, settings.webhook, register=worker_index == 0, reuse_port=settings.bot_workers > 1
+            )
+        else:
+            await dp.start_polling(bot)
     finally:
         scheduler.shutdown(wait=False)
+        await leader.stop()
+        ctx.charts.shutdown()
+        await _stop_workers(workers, settings.webhook.drain_timeout_s + 5)
 
 
 if __name__ == "__main__":
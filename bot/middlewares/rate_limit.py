@@ -1,3 +1,5 @@
+"""Custom middlewares."""
+
 from __future__ import annotations
 
 import time
@@ -7,13 +9,29 @@ from typing import Any
 
 from aiogram import BaseMiddleware
 from aiogram.types import Message
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+
+WINDOW_S = 60
 
 
 class OpenAIRateLimitMiddleware(BaseMiddleware):
-    def __init__(self, max_requests_per_minute: int = 20) -> None:
+    """Лимит запросов пользователя к ИИ в минуту.
+
+    Без sessionmaker счётчики живут в памяти процесса (скользящее окно). При SHARED_DEPLOYMENT
+    так каждый процесс пропускал бы свой лимит, поэтому с sessionmaker счётчик общий —
+    в таблице rate_limit_window, по фиксированным минутным окнам.
+    """
+
+    def __init__(
+        self, max_requests_per_minute: int = 20, *, sessionmaker: async_sessionmaker | None = None
+    ) -> None:
         super().__init__()
         self.max_requests = max_requests_per_minute
+        self.sessionmaker = sessionmaker
         self.user_calls: dict[int, deque[float]] = defaultdict(deque)
+        self._purged_window = 0
 
     async def __call__(
         self,
@@ -26,15 +44,31 @@ class OpenAIRateLimitMiddleware(BaseMiddleware):
 
         user_id = event.from_user.id
         now = time.time()
+        if self.sessionmaker is not None:
+            allowed = await self._hit_shared_window(self.sessionmaker, user_id, now)
+        else:
+            allowed = self._hit_local_window(user_id, now)
+        if not allowed:
+            await event.answer("Слишком много запросов к ИИ. Попробуйте через минуту.")
+            return None
+        return await handler(event, data)
+
+    def _hit_local_window(self, user_id: int, now: float) -> bool:
         calls = self.user_calls[user_id]
-        one_minute_ago = now - 60
+        one_minute_ago = now - WINDOW_S
         while calls and calls[0] < one_minute_ago:
             calls.popleft()
-
         if len(calls) >= self.max_requests:
-            await event.answer("Слишком много запросов к ИИ. Попробуйте через минуту.")
-            return None
-
+            return False
         calls.append(now)
-        return await handler(event, data)
+        return True
 
+    async def _hit_shared_window(self, sessionmaker: async_sessionmaker, user_id: int, now: float) -> bool:
+        window_start = int(now) // WINDOW_S * WINDOW_S
+        async with sessionmaker() as session:
+            hits = await crud.hit_rate_limit_window(session, user_id, window_start)
+            # Прошлые окна удаляет первый запрос нового окна в каждом процессе.
+            if window_start != self._purged_window:
+                self._purged_window = window_start
+                await crud.delete_rate_limit_windows_before(session, window_start)
+        return hits <= self.max_requests
@@ -1,11 +1,20 @@
 from __future__ import annotations
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.config import Settings
 from bot.services.ai_agent import AIAgent
+from bot.services.chart_renderer import ChartRenderer, workers_share
+from bot.services.conversation_store import DEFAULT_MAX_USERS, ConversationStore
+from bot.services.meal_cache import DEFAULT_MAX_ENTRIES as DEFAULT_MEAL_CACHE_ENTRIES
+from bot.services.meal_cache import MealEstimateCache
+from bot.services.photo_cache import DatabaseVisionStore
+from bot.services.profile_cache import DEFAULT_TTL_S as DEFAULT_PROFILE_TTL_S
+from bot.services.profile_cache import UserProfileCache
+from estimator.cache import VisionCache
+from estimator.preprocess import ImageOptions
 
 
 @dataclass(slots=True)
@@ -13,6 +22,41 @@ class AppContext:
     settings: Settings
     sessionmaker: async_sessionmaker
     agent: AIAgent
+    # Номер процесса бота (0 — основной) при BOT_WORKERS > 1.
+    worker_index: int = 0
+    conversations: ConversationStore = field(init=False)
+    profiles: UserProfileCache = field(init=False)
+    meal_estimates: MealEstimateCache = field(init=False)
+    photo_estimates: VisionCache = field(init=False)
+    charts: ChartRenderer = field(init=False)
+
+    def __post_init__(self) -> None:
+        # Кэши процесса не узнают о записях других процессов и реплик: при общем развёртывании
+        # профили и история читаются из БД, оценки блюд — из meal_estimates. Кэш фото
+        # только дополняется: чужие записи дают лишь промах, а не устаревшую оценку.
+        shared = self.settings.shared_deployment
+        self.conversations = ConversationStore(self.sessionmaker, max_users=0 if shared else DEFAULT_MAX_USERS)
+        self.profiles = UserProfileCache(self.sessionmaker, ttl_s=0 if shared else DEFAULT_PROFILE_TTL_S)
+        self.meal_estimates = MealEstimateCache(
+            self.sessionmaker,
+            ttl_s=self.settings.meal_cache_ttl_days * 24 * 3600,
+            max_entries=0 if shared else DEFAULT_MEAL_CACHE_ENTRIES,
+        )
+        self.photo_estimates = VisionCache(DatabaseVisionStore(self.sessionmaker))
+        self.charts = ChartRenderer(
+            workers=workers_share(self.settings.chart_workers, self.settings.bot_workers, self.worker_index),
+            max_entries=self.settings.chart_cache_size,
+        )
+
+    @property
+    def image_options(self) -> ImageOptions:
+        """Параметры подготовки фото перед vision-моделью из настроек."""
+        return ImageOptions(
+            max_side=self.settings.vision_image_max_side,
+            format=self.settings.vision_image_format,
+            quality=self.settings.vision_image_quality,
+            detail=self.settings.vision_image_detail,
+        )
 
 
 app_context: AppContext | None = None
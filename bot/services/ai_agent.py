@@ -1,18 +1,31 @@
 from __future__ import annotations
 
+import asyncio
 import json
 import logging
-from collections.abc import Awaitable, Callable
-from typing import Any
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import TYPE_CHECKING, Any
 
 from openai import AsyncOpenAI
 
 from bot.prompts import AGENT_SYSTEM, MEAL_PARSE
+from bot.services.meal_cache import record_tool_call
+
+if TYPE_CHECKING:
+    from bot.services.meal_cache import MealEstimateCache
 
 logger = logging.getLogger(__name__)
 
 ToolHandler = Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]
 
+DEFAULT_MAX_PARALLEL_TOOLS = 4
+DEFAULT_TOOL_TIMEOUT_S = 30.0
+# Ключи описания инструмента, которые читает только агент; в OpenAI они не отправляются.
+# "serial": True — инструмент меняет данные и выполняется отдельно, в порядке вызовов модели.
+# "timeout_s": число — собственный таймаут инструмента вместо tool_timeout_s.
+_AGENT_SCHEMA_KEYS = ("serial", "timeout_s")
+
 
 class AIAgent:
     def __init__(
@@ -22,6 +35,10 @@ class AIAgent:
         *,
         base_url: str | None = None,
         vision_model: str | None = None,
+        max_parallel_tools: int = DEFAULT_MAX_PARALLEL_TOOLS,
+        tool_timeout_s: float = DEFAULT_TOOL_TIMEOUT_S,
+        meal_cache: MealEstimateCache | None = None,
+        image_detail: str | None = None,
     ):
         kwargs: dict[str, Any] = {"api_key": api_key}
         if base_url:
@@ -29,36 +46,109 @@ class AIAgent:
         self.client = AsyncOpenAI(**kwargs)
         self.model = model
         self.vision_model = vision_model or model
+        self.max_parallel_tools = max(1, max_parallel_tools)
+        self.tool_timeout_s = tool_timeout_s
+        self.meal_cache = meal_cache
+        self.image_detail = image_detail
         self._tools_schema: list[dict[str, Any]] = []
         self._tool_handlers: dict[str, ToolHandler] = {}
+        self._serial_tools: set[str] = set()
+        self._tool_timeouts: dict[str, float] = {}
 
     def register_tools(
         self, tools_schema: list[dict[str, Any]], handlers: dict[str, ToolHandler]
     ) -> None:
-        self._tools_schema = tools_schema
+        self._serial_tools = set()
+        self._tool_timeouts = {}
+        cleaned: list[dict[str, Any]] = []
+        for tool in tools_schema:
+            name = tool.get("function", {}).get("name")
+            if tool.get("serial"):
+                self._serial_tools.add(name)
+            if tool.get("timeout_s") is not None:
+                self._tool_timeouts[name] = float(tool["timeout_s"])
+            cleaned.append({k: v for k, v in tool.items() if k not in _AGENT_SCHEMA_KEYS})
+        self._tools_schema = cleaned
         self._tool_handlers = handlers
 
-    @staticmethod
+    async def _run_tool(self, name: str, raw_arguments: str | None) -> dict[str, Any]:
+        record_tool_call(name, serial=name in self._serial_tools)
+        handler = self._tool_handlers.get(name)
+        if handler is None:
+            return {"error": f"Unknown tool: {name}"}
+        timeout = self._tool_timeouts.get(name, self.tool_timeout_s)
+        try:
+            args = json.loads(raw_arguments or "{}")
+            return await asyncio.wait_for(handler(args), timeout=timeout)
+        except TimeoutError:
+            logger.warning("Tool %s timed out after %.1fs", name, timeout)
+            return {"error": f"Tool {name} timed out"}
+        except Exception as exc:  # noqa: BLE001
+            logger.exception("Tool %s failed", name)
+            return {"error": str(exc)}
+
+    async def _run_tool_calls(self, calls: list[tuple[str, str | None]]) -> list[dict[str, Any]]:
+        """Выполняет вызовы (имя, аргументы JSON) одного раунда; результаты — в порядке calls.
+
+        Независимые инструменты идут параллельно (не больше max_parallel_tools сразу),
+        serial-инструмент ждёт завершения предыдущих и выполняется один.
+        """
+        results: list[dict[str, Any]] = [{} for _ in calls]
+        semaphore = asyncio.Semaphore(self.max_parallel_tools)
+
+        async def _run(index: int) -> None:
+            name, arguments = calls[index]
+            async with semaphore:
+                results[index] = await self._run_tool(name, arguments)
+
+        batch: list[int] = []
+        for index, (name, _) in enumerate(calls):
+            if name in self._serial_tools:
+                if batch:
+                    await asyncio.gather(*(_run(i) for i in batch))
+                    batch = []
+                await _run(index)
+            else:
+                batch.append(index)
+        if batch:
+            await asyncio.gather(*(_run(i) for i in batch))
+        return results
+
     def _build_user_content(
-        text: str, image_urls: list[str] | None = None
+        self, text: str, image_urls: list[str] | None = None
     ) -> str | list[dict[str, Any]]:
         if not image_urls:
             return text
         parts: list[dict[str, Any]] = [{"type": "text", "text": text}]
         for url in image_urls:
-            parts.append({"type": "image_url", "image_url": {"url": url}})
+            image: dict[str, str] = {"url": url}
+            if self.image_detail:
+                image["detail"] = self.image_detail
+            parts.append({"type": "image_url", "image_url": image})
         return parts
 
-    async def ask(
+    async def _append_tool_results(
+        self, messages: list[dict[str, Any]], calls: list[tuple[str, str, str | None]]
+    ) -> None:
+        """Выполняет вызовы (id, имя, аргументы) и дописывает tool-сообщения в порядке вызовов."""
+        results = await self._run_tool_calls([(name, arguments) for _, name, arguments in calls])
+        for (call_id, name, _), result in zip(calls, results):
+            messages.append(
+                {
+                    "role": "tool",
+                    "tool_call_id": call_id,
+                    "name": name,
+                    "content": json.dumps(result, ensure_ascii=False),
+                }
+            )
+
+    def _build_messages(
         self,
         user_text: str,
-        context: str | None = None,
-        *,
-        use_tools: bool = True,
-        history: list[tuple[str, str]] | None = None,
-        image_urls: list[str] | None = None,
-        max_tool_rounds: int = 10,
-    ) -> str:
+        context: str | None,
+        history: list[tuple[str, str]] | None,
+        image_urls: list[str] | None,
+    ) -> list[dict[str, Any]]:
         messages: list[dict[str, Any]] = [{"role": "system", "content": AGENT_SYSTEM}]
         if context:
             messages.append({"role": "system", "content": f"Контекст:\n{context}"})
@@ -69,7 +159,19 @@ class AIAgent:
 
         user_content = self._build_user_content(user_text, image_urls)
         messages.append({"role": "user", "content": user_content})
+        return messages
 
+    async def ask(
+        self,
+        user_text: str,
+        context: str | None = None,
+        *,
+        use_tools: bool = True,
+        history: list[tuple[str, str]] | None = None,
+        image_urls: list[str] | None = None,
+        max_tool_rounds: int = 10,
+    ) -> str:
+        messages = self._build_messages(user_text, context, history, image_urls)
         model = self.vision_model if image_urls else self.model
 
         if not use_tools or not self._tools_schema:
@@ -91,29 +193,92 @@ class AIAgent:
                 return msg.content or "Готово."
 
             messages.append(msg.model_dump())
-            for call in msg.tool_calls:
-                name = call.function.name
-                args = json.loads(call.function.arguments or "{}")
-                handler = self._tool_handlers.get(name)
-                if handler is None:
-                    result = {"error": f"Unknown tool: {name}"}
-                else:
-                    try:
-                        result = await handler(args)
-                    except Exception as exc:  # noqa: BLE001
-                        logger.exception("Tool %s failed", name)
-                        result = {"error": str(exc)}
-                messages.append(
-                    {
-                        "role": "tool",
-                        "tool_call_id": call.id,
-                        "name": name,
-                        "content": json.dumps(result, ensure_ascii=False),
-                    }
-                )
+            await self._append_tool_results(
+                messages, [(c.id, c.function.name, c.function.arguments) for c in msg.tool_calls]
+            )
         return "Извини, не удалось обработать запрос. Попробуй переформулировать."
 
-    async def parse_meal_text(self, text: str) -> dict[str, float | str]:
+    async def ask_stream(
+        self,
+        user_text: str,
+        context: str | None = None,
+        *,
+        use_tools: bool = True,
+        history: list[tuple[str, str]] | None = None,
+        image_urls: list[str] | None = None,
+        max_tool_rounds: int = 10,
+    ) -> AsyncIterator[str]:
+        """То же, что ask, но отдаёт текст ответа по мере генерации.
+
+        Вызовы инструментов собираются из потоковых фрагментов и выполняются между раундами;
+        время до первого токена пишется в лог.
+        """
+        messages = self._build_messages(user_text, context, history, image_urls)
+        model = self.vision_model if image_urls else self.model
+        with_tools = use_tools and bool(self._tools_schema)
+        started = time.perf_counter()
+        first_token_at: float | None = None
+
+        for _ in range(max_tool_rounds if with_tools else 1):
+            request: dict[str, Any] = {"model": model, "messages": messages, "stream": True}
+            if with_tools:
+                request.update(tools=self._tools_schema, tool_choice="auto", temperature=0.3)
+            else:
+                request["temperature"] = 0.4
+            stream = await self.client.chat.completions.create(**request)
+
+            text_parts: list[str] = []
+            # index -> [id, имя, аргументы]; OpenAI присылает аргументы кусками.
+            pending_calls: dict[int, list[str]] = {}
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta
+                for tool_delta in delta.tool_calls or []:
+                    entry = pending_calls.setdefault(tool_delta.index, ["", "", ""])
+                    if tool_delta.id:
+                        entry[0] = tool_delta.id
+                    if tool_delta.function is not None:
+                        entry[1] += tool_delta.function.name or ""
+                        entry[2] += tool_delta.function.arguments or ""
+                if delta.content:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        logger.info(
+                            "Agent TTFT %.0f ms (model=%s)", (first_token_at - started) * 1000, model
+                        )
+                    text_parts.append(delta.content)
+                    yield delta.content
+
+            if not pending_calls:
+                if first_token_at is None:
+                    yield "Готово." if with_tools else "Не удалось сформировать ответ."
+                logger.info("Agent stream finished in %.0f ms", (time.perf_counter() - started) * 1000)
+                return
+
+            calls = [tuple(pending_calls[index]) for index in sorted(pending_calls)]
+            messages.append(
+                {
+                    "role": "assistant",
+                    "content": "".join(text_parts) or None,
+                    "tool_calls": [
+                        {"id": call_id, "type": "function", "function": {"name": name, "arguments": args}}
+                        for call_id, name, args in calls
+                    ],
+                }
+            )
+            await self._append_tool_results(messages, calls)  # type: ignore[arg-type]
+        yield "Извини, не удалось обработать запрос. Попробуй переформулировать."
+
+    async def parse_meal_text(self, text: str, *, refresh: bool = False) -> dict[str, float | str]:
+        """КБЖУ по описанию; повтор того же блюда берётся из meal_cache без запроса к модели.
+
+        refresh=True — оценить заново и перезаписать кэш.
+        """
+        if self.meal_cache is not None and not refresh:
+            cached = await self.meal_cache.get(text, model=self.model, prompt=MEAL_PARSE)
+            if cached is not None:
+                return cached
         response = await self.client.chat.completions.create(
             model=self.model,
             messages=[
@@ -124,7 +289,7 @@ class AIAgent:
         )
         content = response.choices[0].message.content or "{}"
         parsed = json.loads(content)
-        return {
+        result: dict[str, float | str] = {
             "description": str(parsed.get("description", text)),
             "calories": float(parsed.get("calories", 0.0)),
             "protein_g": float(parsed.get("protein_g", 0.0)),
@@ -132,4 +297,7 @@ class AIAgent:
             "carbs_g": float(parsed.get("carbs_g", 0.0)),
             "meal_type": str(parsed.get("meal_type", "snack")),
         }
+        if self.meal_cache is not None:
+            await self.meal_cache.put(text, result, model=self.model, prompt=MEAL_PARSE)
+        return result
 
@@ -0,0 +1,204 @@
+"""Рассылка сообщений с учётом лимитов Telegram.
+
+Telegram ограничивает бота примерно 30 сообщениями в секунду суммарно и одним сообщением
+в секунду в один чат. Broadcaster обрабатывает получателей пулом воркеров фиксированного
+размера, выдерживает оба лимита и повторяет отправку после TelegramRetryAfter.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Iterable
+from dataclasses import dataclass
+from typing import Literal
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 20
+DEFAULT_GLOBAL_RATE = 30.0
+DEFAULT_PER_CHAT_INTERVAL = 1.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_BASE = 0.5
+
+DeliveryStatus = Literal["sent", "blocked", "failed"]
+
+
+@dataclass(slots=True)
+class BroadcastStats:
+    name: str
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    skipped: int = 0
+    retried: int = 0
+    duration_s: float = 0.0
+
+    def record(self, status: DeliveryStatus) -> None:
+        if status == "sent":
+            self.sent += 1
+        elif status == "blocked":
+            self.blocked += 1
+        else:
+            self.failed += 1
+
+
+class TokenBucket:
+    """Глобальный лимит: не больше rate отправок в секунду, всплеск до capacity."""
+
+    def __init__(self, rate: float, capacity: float | None = None) -> None:
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Останавливает выдачу токенов (после RetryAfter лимит общий для всего бота)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1.0:
+                    self._tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    def __init__(
+        self,
+        bot: Bot,
+        *,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        global_rate: float = DEFAULT_GLOBAL_RATE,
+        per_chat_interval: float = DEFAULT_PER_CHAT_INTERVAL,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        backoff_base: float = DEFAULT_BACKOFF_BASE,
+    ) -> None:
+        self.bot = bot
+        self.concurrency = max(1, concurrency)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._bucket = TokenBucket(global_rate)
+        # chat_id -> монотонное время, раньше которого в чат писать нельзя.
+        self._chat_next_at: dict[int, float] = {}
+
+    async def run(
+        self,
+        chat_ids: Iterable[int],
+        render: Callable[[int], Awaitable[str | list[str] | None]],
+        *,
+        name: str,
+        on_blocked: Callable[[int], Awaitable[None]] | None = None,
+    ) -> BroadcastStats:
+        """Готовит и отправляет сообщения в chat_ids.
+
+        render возвращает текст, список текстов (уходят в чат по порядку) или None, если слать не нужно.
+        """
+        stats = BroadcastStats(name=name)
+        started = time.monotonic()
+        targets = iter(chat_ids)
+
+        async def _worker() -> None:
+            for chat_id in targets:
+                await self._deliver(chat_id, render, stats, on_blocked)
+
+        await asyncio.gather(*(_worker() for _ in range(self.concurrency)))
+        stats.duration_s = time.monotonic() - started
+        logger.info(
+            "Broadcast %s: sent=%s failed=%s blocked=%s skipped=%s retried=%s duration=%.2fs",
+            name,
+            stats.sent,
+            stats.failed,
+            stats.blocked,
+            stats.skipped,
+            stats.retried,
+            stats.duration_s,
+        )
+        return stats
+
+    async def send(self, chat_id: int, text: str, stats: BroadcastStats | None = None) -> DeliveryStatus:
+        for attempt in range(self.max_retries + 1):
+            await self._wait_chat_slot(chat_id)
+            await self._bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text)
+                return "sent"
+            except TelegramRetryAfter as exc:
+                logger.warning("Flood control for chat %s: retry after %ss", chat_id, exc.retry_after)
+                self._bucket.pause(exc.retry_after)
+                delay = float(exc.retry_after)
+            except (TelegramForbiddenError, TelegramBadRequest):
+                logger.warning("Cannot send message to chat %s (chat unavailable)", chat_id)
+                return "blocked"
+            except (TelegramNetworkError, TelegramServerError):
+                logger.warning("Transient error sending to chat %s (attempt %s)", chat_id, attempt + 1)
+                delay = self.backoff_base * (2**attempt)
+            except Exception:  # noqa: BLE001
+                logger.exception("Failed to send message to chat %s", chat_id)
+                return "failed"
+            if attempt < self.max_retries:
+                if stats is not None:
+                    stats.retried += 1
+                await asyncio.sleep(delay)
+        logger.error("Giving up on chat %s after %s attempts", chat_id, self.max_retries + 1)
+        return "failed"
+
+    async def _deliver(
+        self,
+        chat_id: int,
+        render: Callable[[int], Awaitable[str | list[str] | None]],
+        stats: BroadcastStats,
+        on_blocked: Callable[[int], Awaitable[None]] | None,
+    ) -> None:
+        try:
+            rendered = await render(chat_id)
+        except Exception:  # noqa: BLE001
+            logger.exception("Broadcast %s: failed to prepare message for chat %s", stats.name, chat_id)
+            stats.failed += 1
+            return
+        texts = [text for text in ([rendered] if isinstance(rendered, str) else rendered or []) if text]
+        if not texts:
+            stats.skipped += 1
+            return
+        for text in texts:
+            status = await self.send(chat_id, text, stats)
+            stats.record(status)
+            if status != "sent":
+                break
+        if status == "blocked" and on_blocked is not None:
+            try:
+                await on_blocked(chat_id)
+            except Exception:  # noqa: BLE001
+                logger.exception("Broadcast %s: on_blocked failed for chat %s", stats.name, chat_id)
+
+    async def _wait_chat_slot(self, chat_id: int) -> None:
+        now = time.monotonic()
+        next_at = self._chat_next_at.get(chat_id, 0.0)
+        # Слот резервируем до ожидания, чтобы параллельные отправки в тот же чат встали в очередь.
+        self._chat_next_at[chat_id] = max(now, next_at) + self.per_chat_interval
+        if len(self._chat_next_at) > 10_000:
+            self._chat_next_at = {cid: at for cid, at in self._chat_next_at.items() if at > now}
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
@@ -0,0 +1,198 @@
+"""Асинхронная отрисовка графиков веса в пуле процессов с кэшем готовых PNG.
+
+matplotlib держит GIL 100–300 мс на график, поэтому синхронный вызов из обработчика
+останавливает обработку апдейтов всех пользователей. ChartRenderer рисует в отдельных
+процессах: при start() воркеры создаются заранее и один раз импортируют matplotlib
+и прогревают кэш шрифтов. Готовые PNG хранятся в LRU по хэшу входных данных — повторный
+запрос того же плана не рисуется заново, одинаковые одновременные запросы ждут одну
+отрисовку. Замер задержки event loop: `python -m benchmark.chart_stall`.
+
+Без start() (тесты, скрипты) или при workers=0 график рисуется в потоке через
+asyncio.to_thread: loop всё равно не блокируется целиком, но делит GIL с отрисовкой.
+pyplot не потокобезопасен, поэтому отрисовки в потоках идут по одной (_THREAD_RENDER_LOCK).
+
+При BOT_WORKERS > 1 CHART_WORKERS — общее число процессов отрисовки: каждый процесс
+бота поднимает свою долю (workers_share), а не полный пул.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_MAX_ENTRIES = 256
+
+# Глобальное состояние pyplot общее для потоков процесса: две отрисовки разом портят фигуры.
+_THREAD_RENDER_LOCK = threading.Lock()
+
+
+def _warm_up_worker() -> None:
+    """initializer воркера: импорт matplotlib и первый (самый медленный) рендер."""
+    from bot.services import chart
+
+    chart.render_three_scenarios_chart({}, current_weight=80.0, target_weight=75.0)
+
+
+def _worker_pid() -> int:
+    return os.getpid()
+
+
+def _render(kind: str, params: dict[str, Any]) -> bytes:
+    """Отрисовка в воркере (или в потоке); возвращает PNG."""
+    from bot.services import chart
+
+    if kind == "weight_plan":
+        return chart.render_weight_plan_chart(**params).getvalue()
+    if kind == "three_scenarios":
+        return chart.render_three_scenarios_chart(**params).getvalue()
+    raise ValueError(f"Unknown chart kind: {kind}")
+
+
+def _render_in_thread(kind: str, params: dict[str, Any]) -> bytes:
+    with _THREAD_RENDER_LOCK:
+        return _render(kind, params)
+
+
+def workers_share(total: int, processes: int, index: int) -> int:
+    """Доля процесса index из processes в total воркерах; остаток достаётся первым."""
+    processes = max(1, processes)
+    return max(0, total) // processes + (index < max(0, total) % processes)
+
+
+def chart_key(kind: str, params: dict[str, Any]) -> str:
+    """Адрес графика в кэше: sha256 от типа и канонического JSON входных данных."""
+    raw = json.dumps({"kind": kind, "params": params}, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ChartRenderer:
+    def __init__(self, *, workers: int = DEFAULT_WORKERS, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        self.workers = workers
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._inflight: dict[str, asyncio.Task[bytes]] = {}
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    async def start(self) -> None:
+        """Поднимает воркеры и ждёт, пока каждый импортирует matplotlib."""
+        if self._executor is not None or self.workers <= 0:
+            return
+        # spawn, а не fork: в родителе уже работают потоки aiosqlite и to_thread.
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_up_worker,
+        )
+        loop = asyncio.get_running_loop()
+        # Пул создаёт процесс на каждую задачу, пока нет свободных: workers задач сразу
+        # поднимают все воркеры, initializer отрабатывает в каждом до первой задачи.
+        pids = await asyncio.gather(
+            *(loop.run_in_executor(self._executor, _worker_pid) for _ in range(self.workers))
+        )
+        logger.info("Chart workers ready: %s", sorted(set(pids)))
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._cache)}
+
+    async def weight_plan(
+        self,
+        forecast: list[dict],
+        actual_weights: list[dict],
+        target_weight: float,
+        mode: str,
+    ) -> bytes:
+        return await self._get(
+            "weight_plan",
+            {
+                "forecast": forecast,
+                "actual_weights": actual_weights,
+                "target_weight": float(target_weight),
+                "mode": mode,
+            },
+        )
+
+    async def three_scenarios(
+        self,
+        forecasts: dict[str, list[dict]],
+        current_weight: float,
+        target_weight: float,
+    ) -> bytes:
+        return await self._get(
+            "three_scenarios",
+            {
+                "forecasts": forecasts,
+                "current_weight": float(current_weight),
+                "target_weight": float(target_weight),
+            },
+        )
+
+    async def _get(self, kind: str, params: dict[str, Any]) -> bytes:
+        key = chart_key(kind, params)
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return png
+        task = self._inflight.get(key)
+        if task is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # Отдельная задача: отмена одного вызывающего (таймаут инструмента) не отменяет
+            # отрисовку для остальных, ждущих тот же график.
+            task = asyncio.ensure_future(self._render_and_remember(key, kind, params))
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    async def _render_and_remember(self, key: str, kind: str, params: dict[str, Any]) -> bytes:
+        try:
+            png = await self._render(kind, params)
+        finally:
+            self._inflight.pop(key, None)
+        self._remember(key, png)
+        return png
+
+    async def _render(self, kind: str, params: dict[str, Any]) -> bytes:
+        executor = self._executor
+        if executor is not None:
+            try:
+                return await asyncio.get_running_loop().run_in_executor(executor, _render, kind, params)
+            except BrokenProcessPool:
+                # Воркер упал (OOM, kill): пул больше не принимает задачи, рисуем в потоке.
+                # Сломанный пул закрываем, чтобы не остались его поток управления и живые воркеры.
+                if self._executor is executor:
+                    logger.exception("Chart process pool is broken, falling back to thread")
+                    self._executor = None
+                    executor.shutdown(wait=False, cancel_futures=True)
+        return await asyncio.to_thread(_render_in_thread, kind, params)
+
+    def _remember(self, key: str, png: bytes) -> None:
+        if self.max_entries <= 0:
+            return
+        self._cache[key] = png
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
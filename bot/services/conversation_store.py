@@ -0,0 +1,74 @@
+"""История диалога с ИИ: LRU-кэш последних пар в памяти и запись насквозь в conversation_messages.
+
+Ход диалога стоит одного чтения из БД при промахе кэша и одной транзакции на запись:
+INSERT обеих реплик и обрезка хвоста одним DELETE.
+
+Кэш не видит записей других процессов, поэтому при SHARED_DEPLOYMENT он выключен
+(max_users=0): история каждый раз читается из БД.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict, deque
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+from bot.database.connection import unit_of_work
+
+DEFAULT_MAX_PAIRS = 10
+DEFAULT_MAX_USERS = 2_000
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        *,
+        max_pairs: int = DEFAULT_MAX_PAIRS,
+        max_users: int = DEFAULT_MAX_USERS,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.max_pairs = max(1, max_pairs)
+        self.max_users = max(0, max_users)
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[int, deque[tuple[str, str]]] = OrderedDict()
+
+    async def history(self, telegram_id: int) -> list[tuple[str, str]]:
+        """Последние пары (вопрос, ответ) от старых к новым."""
+        pairs = self._cache.get(telegram_id)
+        if pairs is not None:
+            self.hits += 1
+            self._cache.move_to_end(telegram_id)
+            return list(pairs)
+        self.misses += 1
+        async with self.sessionmaker() as session:
+            loaded = await crud.get_recent_conversation(session, telegram_id, limit=self.max_pairs)
+        self._remember(telegram_id, deque(loaded, maxlen=self.max_pairs))
+        return loaded
+
+    async def append(self, telegram_id: int, user_content: str, assistant_content: str) -> None:
+        async with unit_of_work(self.sessionmaker) as session:
+            await crud.add_conversation_turn(
+                session, telegram_id, user_content, assistant_content, commit=False
+            )
+            await crud.clear_old_conversation(session, telegram_id, keep_pairs=self.max_pairs, commit=False)
+        # Кэш обновляем только после commit; без загруженной истории пару не добавляем —
+        # следующий history() прочитает её из БД целиком.
+        pairs = self._cache.get(telegram_id)
+        if pairs is not None:
+            pairs.append((user_content, assistant_content))
+            self._cache.move_to_end(telegram_id)
+
+    def forget(self, telegram_id: int) -> None:
+        """Сбрасывает кэш пользователя (например, после удаления его данных)."""
+        self._cache.pop(telegram_id, None)
+
+    def _remember(self, telegram_id: int, pairs: deque[tuple[str, str]]) -> None:
+        if self.max_users == 0:
+            return
+        self._cache[telegram_id] = pairs
+        self._cache.move_to_end(telegram_id)
+        while len(self._cache) > self.max_users:
+            self._cache.popitem(last=False)
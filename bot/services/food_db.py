@@ -0,0 +1,306 @@
+"""Локальный справочник состава продуктов: КБЖУ на 100 г без обращения к модели.
+
+Таблица (bot/data/foods.csv) хранится в плоских массивах, поиск идёт по индексу основ
+слов (грубый стемминг русских окончаний), а опечатки ловит триграммный индекс по словарю
+основ. Разбор «200г курицы, 150 г риса» даёт позиции с граммовкой; если каждая позиция
+уверенно найдена в справочнике, приём пищи можно записать без LLM.
+"""
+
+from __future__ import annotations
+
+import csv
+import re
+from array import array
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+
+DEFAULT_FOODS_PATH = Path(__file__).resolve().parent.parent / "data" / "foods.csv"
+HIGH_CONFIDENCE = 0.85
+FUZZY_MIN_SIMILARITY = 0.6
+# Число без единицы до этого значения считается штуками («2 яйца»), больше — граммами.
+MAX_BARE_PIECES = 10.0
+
+_NUTRIENTS = ("calories", "protein_g", "fat_g", "carbs_g")
+_ENDINGS = tuple(
+    sorted(
+        (
+            "ами ями ого его ому ему ыми ими ой ей ом ем ам ям ах ях ов ев ую юю ая яя ое ее ые ие ый ий "
+            "а я о е ы и у ю ь й"
+        ).split(),
+        key=len,
+        reverse=True,
+    )
+)
+_STOPWORDS = frozenset(
+    {"с", "и", "в", "во", "на", "из", "по", "без", "со", "я", "съел", "съела", "поел", "поела",
+     "выпил", "выпила", "скушал", "скушала", "with", "and", "of"}
+)
+_WORD_RE = re.compile(r"[^\W\d_]+(?:-[^\W\d_]+)?")
+_SPLIT_RE = re.compile(r"\s*(?:,(?!\d)|[;+\n]|\s(?:и|с|со|плюс|and|with)\s)\s*")
+_NUMBER = r"(?P<num>\d+(?:[.,]\d+)?)"
+_UNIT = r"(?P<unit>кг|kg|граммов|грамма|грамм|гр|г|g|мл|ml|литра|литров|литр|л|l|штуки|штука|штук|шт)?\.?"
+_LEADING_QTY_RE = re.compile(rf"^{_NUMBER}\s*{_UNIT}\s+(?P<food>.+)$")
+_TRAILING_QTY_RE = re.compile(rf"^(?P<food>.+?)\s+{_NUMBER}\s*{_UNIT}$")
+_GRAMS_PER_UNIT = {
+    "кг": 1000.0, "kg": 1000.0,
+    "г": 1.0, "гр": 1.0, "грамм": 1.0, "грамма": 1.0, "граммов": 1.0, "g": 1.0,
+    # Плотность напитков считаем равной воде.
+    "мл": 1.0, "ml": 1.0, "л": 1000.0, "литр": 1000.0, "литра": 1000.0, "литров": 1000.0, "l": 1000.0,
+}
+_PIECE_UNITS = frozenset({"шт", "штука", "штуки", "штук"})
+
+
+def stem(word: str) -> str:
+    """Основа слова: «курицы», «курица», «курицей» -> «куриц»."""
+    word = word.lower().replace("ё", "е")
+    if word.isascii():
+        return word[:-1] if len(word) > 3 and word.endswith("s") else word
+    for ending in _ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[: -len(ending)]
+    return word
+
+
+def stems_of(text: str) -> tuple[str, ...]:
+    """Основы значимых слов без повторов, в порядке появления."""
+    seen: dict[str, None] = {}
+    for word in _WORD_RE.findall(text.lower().replace("ё", "е")):
+        if word not in _STOPWORDS:
+            seen.setdefault(stem(word), None)
+    return tuple(seen)
+
+
+def _trigrams(token: str) -> set[str]:
+    padded = f"^{token}$"
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+@dataclass(frozen=True, slots=True)
+class FoodRow:
+    name: str
+    name_en: str
+    synonyms: tuple[str, ...]
+    calories: float
+    protein_g: float
+    fat_g: float
+    carbs_g: float
+    piece_g: float | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class FoodMatch:
+    food_id: int
+    name: str
+    confidence: float
+
+
+@dataclass(frozen=True, slots=True)
+class MealItem:
+    """Позиция из текста: что съедено и сколько (граммы или штуки, если указаны)."""
+
+    text: str
+    grams: float | None = None
+    pieces: float | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class ResolvedItem:
+    item: MealItem
+    match: FoodMatch | None
+    grams: float | None
+    nutrients: dict[str, float] | None
+
+
+@dataclass(frozen=True, slots=True)
+class MealResolution:
+    items: tuple[ResolvedItem, ...]
+    min_confidence: float = HIGH_CONFIDENCE
+
+    @property
+    def confident(self) -> bool:
+        """Все позиции найдены уверенно и у всех известен вес."""
+        return bool(self.items) and all(
+            r.match is not None and r.match.confidence >= self.min_confidence and r.nutrients is not None
+            for r in self.items
+        )
+
+    def totals(self) -> dict[str, float]:
+        totals = dict.fromkeys(_NUTRIENTS, 0.0)
+        for resolved in self.items:
+            for key, value in (resolved.nutrients or {}).items():
+                totals[key] += value
+        return {key: round(value, 1) for key, value in totals.items()}
+
+    def description(self) -> str:
+        parts = []
+        for resolved in self.items:
+            name = resolved.match.name if resolved.match is not None else resolved.item.text
+            parts.append(f"{name} {resolved.grams:.0f} г" if resolved.grams is not None else name)
+        return ", ".join(parts)
+
+    def as_estimate(self, meal_type: str = "snack") -> dict[str, float | str]:
+        """Оценка в формате parse_meal_text / add_meal."""
+        return {"description": self.description(), **self.totals(), "meal_type": meal_type}
+
+
+def parse_meal_items(text: str) -> list[MealItem]:
+    """Делит описание на позиции и вытаскивает количество: «200г курицы, 150 г риса», «2 яйца»."""
+    items: list[MealItem] = []
+    for segment in _SPLIT_RE.split(text.lower().replace("ё", "е").strip(" .!")):
+        segment = segment.strip(" .!:-")
+        if not segment:
+            continue
+        match = _LEADING_QTY_RE.match(segment) or _TRAILING_QTY_RE.match(segment)
+        if match is None:
+            items.append(MealItem(segment))
+            continue
+        value = float(match["num"].replace(",", "."))
+        unit = match["unit"]
+        food = match["food"].strip()
+        if unit in _PIECE_UNITS or (unit is None and value <= MAX_BARE_PIECES):
+            items.append(MealItem(food, pieces=value))
+        else:
+            items.append(MealItem(food, grams=value * _GRAMS_PER_UNIT.get(unit or "г", 1.0)))
+    return items
+
+
+class FoodTable:
+    """Справочник в плоских массивах: food_id — индекс строки, КБЖУ — 4 double подряд на продукт."""
+
+    def __init__(self, rows: Iterable[FoodRow]) -> None:
+        self._names: list[str] = []
+        self._names_en: list[str] = []
+        self._nutrients = array("d")
+        # 0 — размер штуки неизвестен.
+        self._piece_g = array("d")
+        # Синоним (alias_id) -> продукт и основы его слов.
+        self._alias_food = array("I")
+        self._alias_stems: list[tuple[str, ...]] = []
+        self._postings: dict[str, array] = {}
+        for food_id, row in enumerate(rows):
+            self._names.append(row.name)
+            self._names_en.append(row.name_en)
+            self._nutrients.extend((row.calories, row.protein_g, row.fat_g, row.carbs_g))
+            self._piece_g.append(row.piece_g or 0.0)
+            for alias in (row.name, row.name_en, *row.synonyms):
+                alias_stems = stems_of(alias)
+                if not alias_stems:
+                    continue
+                alias_id = len(self._alias_stems)
+                self._alias_food.append(food_id)
+                self._alias_stems.append(alias_stems)
+                for s in alias_stems:
+                    self._postings.setdefault(s, array("I")).append(alias_id)
+        self._vocabulary_trigrams: dict[str, list[str]] = {}
+        for s in self._postings:
+            for gram in _trigrams(s):
+                self._vocabulary_trigrams.setdefault(gram, []).append(s)
+
+    @classmethod
+    def from_csv(cls, path: Path = DEFAULT_FOODS_PATH) -> FoodTable:
+        with path.open(encoding="utf-8", newline="") as fh:
+            rows = [
+                FoodRow(
+                    name=record["name"].strip(),
+                    name_en=record["name_en"].strip(),
+                    synonyms=tuple(s.strip() for s in record["synonyms"].split("|") if s.strip()),
+                    calories=float(record["kcal"]),
+                    protein_g=float(record["protein_g"]),
+                    fat_g=float(record["fat_g"]),
+                    carbs_g=float(record["carbs_g"]),
+                    piece_g=float(record["piece_g"]) if record["piece_g"] else None,
+                )
+                for record in csv.DictReader(fh)
+            ]
+        return cls(rows)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def name(self, food_id: int) -> str:
+        return self._names[food_id]
+
+    def name_en(self, food_id: int) -> str:
+        return self._names_en[food_id]
+
+    def piece_g(self, food_id: int) -> float | None:
+        return self._piece_g[food_id] or None
+
+    def per_100g(self, food_id: int) -> dict[str, float]:
+        base = food_id * 4
+        return {key: round(self._nutrients[base + i], 2) for i, key in enumerate(_NUTRIENTS)}
+
+    def nutrients_for(self, food_id: int, grams: float) -> dict[str, float]:
+        base = food_id * 4
+        factor = grams / 100.0
+        return {key: round(self._nutrients[base + i] * factor, 1) for i, key in enumerate(_NUTRIENTS)}
+
+    def lookup(self, query: str, limit: int = 3) -> list[FoodMatch]:
+        """Лучшие совпадения по убыванию уверенности (0..1).
+
+        Уверенность — доля совпавших основ от большего из (слов запроса, слов синонима),
+        так что «сколько калорий в рисе» не примет вопрос за запись риса.
+        """
+        query_stems = stems_of(query)
+        if not query_stems:
+            return []
+        # alias_id -> сумма сходства совпавших основ
+        scores: dict[int, float] = {}
+        for query_stem in query_stems:
+            for vocab_stem, similarity in self._resolve_stem(query_stem):
+                for alias_id in self._postings[vocab_stem]:
+                    scores[alias_id] = scores.get(alias_id, 0.0) + similarity
+        best: dict[int, tuple[float, int]] = {}
+        for alias_id, score in scores.items():
+            alias_len = len(self._alias_stems[alias_id])
+            confidence = min(1.0, score / max(alias_len, len(query_stems)))
+            food_id = self._alias_food[alias_id]
+            current = best.get(food_id)
+            if current is None or (confidence, -alias_len) > (current[0], -current[1]):
+                best[food_id] = (confidence, alias_len)
+        ranked = sorted(best.items(), key=lambda item: (-item[1][0], item[1][1], item[0]))
+        return [
+            FoodMatch(food_id=food_id, name=self._names[food_id], confidence=round(confidence, 3))
+            for food_id, (confidence, _) in ranked[:limit]
+        ]
+
+    def resolve_meal(self, text: str, *, min_confidence: float = HIGH_CONFIDENCE) -> MealResolution:
+        resolved: list[ResolvedItem] = []
+        for item in parse_meal_items(text):
+            matches = self.lookup(item.text, limit=2)
+            match = matches[0] if matches else None
+            # Две равно уверенные кандидатуры («масло») — не угадываем.
+            if match is not None and len(matches) > 1 and matches[1].confidence >= match.confidence:
+                match = FoodMatch(match.food_id, match.name, round(match.confidence / 2, 3))
+            grams = item.grams
+            if grams is None and item.pieces is not None and match is not None:
+                piece = self.piece_g(match.food_id)
+                grams = item.pieces * piece if piece else None
+            nutrients = self.nutrients_for(match.food_id, grams) if match is not None and grams else None
+            resolved.append(ResolvedItem(item=item, match=match, grams=grams, nutrients=nutrients))
+        return MealResolution(items=tuple(resolved), min_confidence=min_confidence)
+
+    def _resolve_stem(self, query_stem: str) -> list[tuple[str, float]]:
+        """Точная основа из словаря или ближайшие по триграммам (коэффициент Дайса)."""
+        if query_stem in self._postings:
+            return [(query_stem, 1.0)]
+        grams = _trigrams(query_stem)
+        shared: dict[str, int] = {}
+        for gram in grams:
+            for vocab_stem in self._vocabulary_trigrams.get(gram, ()):
+                shared[vocab_stem] = shared.get(vocab_stem, 0) + 1
+        candidates = []
+        for vocab_stem, count in shared.items():
+            similarity = 2 * count / (len(grams) + len(vocab_stem))
+            if similarity >= FUZZY_MIN_SIMILARITY:
+                candidates.append((vocab_stem, round(similarity, 3)))
+        candidates.sort(key=lambda item: -item[1])
+        return candidates[:3]
+
+
+@lru_cache(maxsize=1)
+def default_food_table() -> FoodTable:
+    """Встроенный справочник; загружается один раз на процесс."""
+    return FoodTable.from_csv(DEFAULT_FOODS_PATH)
@@ -0,0 +1,294 @@
+"""Хранилище FSM aiogram в нашей БД (таблица fsm_state) и выбор бэкенда по настройкам.
+
+MemoryStorage теряет шаги онбординга, ввода веса и цели при каждом перезапуске и не
+позволяет запустить второй процесс. SQLAlchemyStorage хранит состояние и данные одной
+строкой на ключ с TTL: истёкшие записи не читаются и удаляются purge_expired().
+
+За один апдейт обработчик обычно пишет несколько раз (set_state + update_data, clear —
+это set_state(None) + set_data({})). FSMWriteBatchMiddleware открывает на время апдейта
+буфер: чтения берут значения из него, записи копятся и уходят одним запросом на ключ
+после обработчика — upsert изменённых полей или DELETE, если состояние очищено. Без
+middleware (скрипты, тесты) каждая запись сразу уходит в БД.
+
+Буфер безопасен только под блокировкой событий диспетчера (events_isolation): иначе
+два апдейта одного ключа читают и пишут состояние вперемешку. Один процесс —
+SimpleEventIsolation; несколько (SHARED_DEPLOYMENT) — SQLAlchemyEventIsolation, аренда
+ключа в таблице scheduler_lease, или RedisEventIsolation для FSM_STORAGE=redis.
+
+Данные FSM хранятся как JSON: класть в state.update_data можно только JSON-значения.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import hashlib
+import json
+import logging
+from collections.abc import AsyncIterator, Awaitable, Callable, Mapping
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime, timedelta
+from typing import Any
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import DataNotDictLikeError
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import (
+    BaseEventIsolation,
+    BaseStorage,
+    DefaultKeyBuilder,
+    KeyBuilder,
+    StateType,
+    StorageKey,
+)
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from aiogram.types import TelegramObject
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.config import Settings
+from bot.database import crud
+from bot.services.leader import default_holder
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_S = 7 * 24 * 3600.0
+DEFAULT_LOCK_TTL_S = 30.0
+LOCK_POLL_S = 0.05
+BACKENDS = ("sql", "memory", "redis")
+
+
+@dataclass(slots=True)
+class _Entry:
+    state: str | None = None
+    data: dict[str, Any] = field(default_factory=dict)
+    loaded: bool = False
+    state_dirty: bool = False
+    data_dirty: bool = False
+
+
+_BATCH: contextvars.ContextVar[dict[str, _Entry] | None] = contextvars.ContextVar("fsm_write_batch", default=None)
+
+
+class SQLAlchemyStorage(BaseStorage):
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        *,
+        ttl_s: float = DEFAULT_TTL_S,
+        key_builder: KeyBuilder | None = None,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.ttl_s = ttl_s
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+
+    async def close(self) -> None:
+        pass
+
+    @asynccontextmanager
+    async def batch(self) -> AsyncIterator[None]:
+        """Буфер записей на время блока; при выходе — один запрос на каждый изменённый ключ."""
+        if _BATCH.get() is not None:
+            yield
+            return
+        entries: dict[str, _Entry] = {}
+        token = _BATCH.set(entries)
+        try:
+            yield
+        finally:
+            _BATCH.reset(token)
+            # Записи сохраняются и при исключении в обработчике — как без буфера.
+            for key, entry in entries.items():
+                if entry.state_dirty or entry.data_dirty:
+                    await self._flush(key, entry)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        entry = self._pending(key)
+        if entry is None:
+            await self._flush(self._key(key), _Entry(state=value, state_dirty=True))
+            return
+        entry.state = value
+        entry.state_dirty = True
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._read(key, want_state=True)).state
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        if not isinstance(data, dict):
+            msg = f"Data must be a dict or dict-like object, got {type(data).__name__}"
+            raise DataNotDictLikeError(msg)
+        entry = self._pending(key)
+        if entry is None:
+            await self._flush(self._key(key), _Entry(data=data.copy(), data_dirty=True))
+            return
+        entry.data = data.copy()
+        entry.data_dirty = True
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return (await self._read(key, want_state=False)).data.copy()
+
+    async def purge_expired(self) -> int:
+        async with self.sessionmaker() as session:
+            return await crud.delete_expired_fsm_states(session)
+
+    def _key(self, key: StorageKey) -> str:
+        return self.key_builder.build(key)
+
+    def _pending(self, key: StorageKey) -> _Entry | None:
+        batch = _BATCH.get()
+        if batch is None:
+            return None
+        return batch.setdefault(self._key(key), _Entry())
+
+    async def _read(self, key: StorageKey, *, want_state: bool) -> _Entry:
+        entry = self._pending(key)
+        if entry is not None and (entry.loaded or (entry.state_dirty if want_state else entry.data_dirty)):
+            return entry
+        async with self.sessionmaker() as session:
+            row = await crud.get_fsm_state(session, self._key(key))
+        state, data = (row.state, json.loads(row.data)) if row is not None else (None, {})
+        if entry is None:
+            return _Entry(state=state, data=data)
+        # Незаписанные изменения буфера важнее прочитанного из БД.
+        if not entry.state_dirty:
+            entry.state = state
+        if not entry.data_dirty:
+            entry.data = data
+        entry.loaded = True
+        return entry
+
+    async def _flush(self, key: str, entry: _Entry) -> None:
+        async with self.sessionmaker() as session:
+            if entry.state_dirty and entry.data_dirty and entry.state is None and not entry.data:
+                await crud.delete_fsm_state(session, key)
+                return
+            values: dict[str, Any] = {}
+            if entry.state_dirty:
+                values["state"] = entry.state
+            if entry.data_dirty:
+                values["data"] = json.dumps(entry.data, ensure_ascii=False)
+            expires_at = datetime.now(tz=UTC) + timedelta(seconds=self.ttl_s)
+            await crud.upsert_fsm_state(session, key, values, expires_at=expires_at)
+
+
+class FSMWriteBatchMiddleware(BaseMiddleware):
+    """Outer-middleware апдейта: все записи FSM за апдейт уходят в БД одним запросом на ключ.
+
+    Регистрируется после FSM-middleware диспетчера и потому работает внутри его
+    блокировки событий — но только если Dispatcher создан с events_isolation из
+    create_event_isolation(): по умолчанию aiogram ничего не блокирует, и буфер
+    перетёр бы запись параллельного апдейта того же ключа.
+    """
+
+    def __init__(self, storage: SQLAlchemyStorage) -> None:
+        super().__init__()
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        async with self.storage.batch():
+            return await handler(event, data)
+
+
+class SQLAlchemyEventIsolation(BaseEventIsolation):
+    """Блокировка событий ключа FSM между процессами через аренду в таблице scheduler_lease.
+
+    Внутри процесса апдейты одного ключа сначала выстраиваются на asyncio.Lock, так что
+    аренду опрашивает не больше одной задачи процесса. Пока обработчик работает, аренда
+    продлевается каждые ttl_s / 3 — долгий ход агента её не теряет; блокировку упавшего
+    процесса через ttl_s заберёт другой.
+    """
+
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        *,
+        ttl_s: float = DEFAULT_LOCK_TTL_S,
+        heartbeat_s: float | None = None,
+        holder: str | None = None,
+        key_builder: KeyBuilder | None = None,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.ttl_s = ttl_s
+        self.heartbeat_s = heartbeat_s if heartbeat_s is not None else ttl_s / 3
+        self.holder = holder or default_holder()
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self._local = SimpleEventIsolation()
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncIterator[None]:
+        name = "fsm:" + hashlib.sha1(self.key_builder.build(key).encode()).hexdigest()
+        async with self._local.lock(key):
+            while True:
+                async with self.sessionmaker() as session:
+                    if await crud.acquire_scheduler_lease(session, name, self.holder, ttl_s=self.ttl_s) is not None:
+                        break
+                await asyncio.sleep(LOCK_POLL_S)
+            heartbeat = asyncio.create_task(self._heartbeat(name), name=f"fsm-lock-{name}")
+            try:
+                yield
+            finally:
+                heartbeat.cancel()
+                await asyncio.gather(heartbeat, return_exceptions=True)
+                async with self.sessionmaker() as session:
+                    await crud.delete_scheduler_lease(session, name, self.holder)
+
+    async def _heartbeat(self, name: str) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            try:
+                async with self.sessionmaker() as session:
+                    token = await crud.acquire_scheduler_lease(session, name, self.holder, ttl_s=self.ttl_s)
+            except Exception:  # noqa: BLE001
+                logger.exception("Failed to renew FSM lock %s", name)
+                continue
+            if token is None:
+                logger.warning("FSM lock %s was taken over by another process", name)
+                return
+
+    async def close(self) -> None:
+        await self._local.close()
+
+
+def create_event_isolation(
+    settings: Settings, storage: BaseStorage, sessionmaker: async_sessionmaker
+) -> BaseEventIsolation:
+    """Блокировка событий для Dispatcher: межпроцессная при общем развёртывании, иначе в процессе."""
+    if not settings.shared_deployment:
+        return SimpleEventIsolation()
+    if isinstance(storage, SQLAlchemyStorage):
+        return SQLAlchemyEventIsolation(sessionmaker, key_builder=storage.key_builder)
+    create_isolation = getattr(storage, "create_isolation", None)
+    if create_isolation is not None:
+        return create_isolation()
+    raise ValueError(f"FSM storage {type(storage).__name__} cannot isolate events across bot processes")
+
+
+def create_fsm_storage(settings: Settings, sessionmaker: async_sessionmaker) -> BaseStorage:
+    """Бэкенд FSM из настроек: sql (наша БД), memory или redis (нужен пакет redis)."""
+    backend = settings.fsm_storage
+    ttl_s = settings.fsm_state_ttl_days * 24 * 3600
+    if backend == "sql":
+        return SQLAlchemyStorage(sessionmaker, ttl_s=ttl_s)
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "redis":
+        if not settings.fsm_redis_url:
+            raise ValueError("FSM_REDIS_URL is required for FSM_STORAGE=redis")
+        try:
+            from aiogram.fsm.storage.redis import RedisStorage
+        except ImportError as exc:  # pragma: no cover - ветка зависит от окружения
+            raise RuntimeError("FSM_STORAGE=redis requires the redis package (pip install redis)") from exc
+        ttl = timedelta(seconds=ttl_s) if ttl_s > 0 else None
+        return RedisStorage.from_url(
+            settings.fsm_redis_url,
+            key_builder=DefaultKeyBuilder(with_bot_id=True, with_destiny=True),
+            state_ttl=ttl,
+            data_ttl=ttl,
+        )
+    raise ValueError(f"Unknown FSM storage backend: {backend!r} (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,163 @@
+"""Выбор лидера для планировщика при нескольких процессах и репликах бота.
+
+Таймеры планировщика тикают в каждом процессе, но задача выполняется только там, где
+LeaderElector держит аренду в таблице scheduler_lease. Аренда продлевается heartbeat'ом
+каждые ttl_s / 3; упавший лидер перестаёт её продлевать, и через ttl_s её забирает
+другой процесс с увеличенным токеном ограждения (fencing token).
+
+Перед запуском задача занимает слот (job, slot) в журнале scheduler_job_run одним
+INSERT, который проверяет и токен аренды: слот выполняется не больше одного раза, даже
+если смена лидера пришлась на момент запуска, а бывший лидер с устаревшим токеном слот
+уже не займёт. Запуск, прерванный падением процесса, не повторяется: позднее
+напоминание хуже пропущенного.
+
+Время берётся с часов процесса: у реплик они должны быть синхронизированы (NTP) с
+точностью заметно лучше ttl_s.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any, TypeVar
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DEFAULT_LEASE_TTL_S = 30.0
+JOB_RUN_RETENTION = timedelta(days=14)
+
+
+def default_holder() -> str:
+    """Уникальный id процесса: хост, pid и случайный суффикс (pid в контейнерах повторяется)."""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def job_slot(moment: datetime) -> str:
+    """Слот запуска — момент по расписанию, округлённый до минуты (UTC, ISO)."""
+    rounded = (moment.astimezone(UTC) + timedelta(seconds=30)).replace(second=0, microsecond=0)
+    return rounded.strftime("%Y-%m-%dT%H:%MZ")
+
+
+class LeaderElector:
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        *,
+        name: str = "scheduler",
+        holder: str | None = None,
+        ttl_s: float = DEFAULT_LEASE_TTL_S,
+        heartbeat_s: float | None = None,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.name = name
+        self.holder = holder or default_holder()
+        self.ttl_s = ttl_s
+        self.heartbeat_s = heartbeat_s if heartbeat_s is not None else ttl_s / 3
+        self.token: int | None = None
+        # Локальный срок лидерства по monotonic: отсчёт от начала запроса, а не от ответа.
+        self._valid_until = 0.0
+        self._task: asyncio.Task[None] | None = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self.token is not None and time.monotonic() < self._valid_until
+
+    async def start(self) -> None:
+        if self._task is None:
+            await self.heartbeat()
+            self._task = asyncio.create_task(self._run(), name=f"leader-{self.name}")
+
+    async def stop(self, *, release: bool = True) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if release and self.token is not None:
+            async with self.sessionmaker() as session:
+                await crud.release_scheduler_lease(session, self.name, self.holder)
+        self.token = None
+
+    async def heartbeat(self) -> bool:
+        """Одна попытка взять или продлить аренду; True — процесс сейчас лидер."""
+        started = time.monotonic()
+        try:
+            async with self.sessionmaker() as session:
+                token = await crud.acquire_scheduler_lease(session, self.name, self.holder, ttl_s=self.ttl_s)
+        except Exception:  # noqa: BLE001
+            # Ошибка БД не продлевает аренду: лидерство истечёт само по _valid_until.
+            logger.exception("Lease %s heartbeat failed", self.name)
+            return self.is_leader
+        if token is None:
+            if self.token is not None:
+                logger.warning("Lost lease %s (holder %s)", self.name, self.holder)
+            self.token = None
+            return False
+        if token != self.token:
+            logger.info("Acquired lease %s with token %s (holder %s)", self.name, token, self.holder)
+            await self._purge_old_runs()
+        self.token = token
+        self._valid_until = started + self.ttl_s
+        return True
+
+    async def run_once(
+        self,
+        job: str,
+        func: Callable[..., Awaitable[T]],
+        *args: Any,
+        slot: str | None = None,
+        **kwargs: Any,
+    ) -> T | None:
+        """Выполняет задачу, если процесс лидер и слот (job, slot) ещё не занят; иначе None."""
+        token = self.token
+        if token is None or not self.is_leader:
+            logger.debug("Skip %s: not a leader", job)
+            return None
+        slot = slot or job_slot(datetime.now(tz=UTC))
+        async with self.sessionmaker() as session:
+            claimed = await crud.claim_scheduler_job_run(
+                session, job, slot, lease=self.name, holder=self.holder, token=token
+            )
+        if not claimed:
+            logger.info("Skip %s at %s: slot already taken or lease lost", job, slot)
+            return None
+        status = "failed"
+        try:
+            result = await func(*args, **kwargs)
+            status = "done"
+            return result
+        finally:
+            async with self.sessionmaker() as session:
+                await crud.finish_scheduler_job_run(session, job, slot, token=token, status=status)
+
+    def guard(self, job: str, func: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T | None]]:
+        """Обёртка задачи планировщика: выполнять только на лидере и один раз за слот."""
+
+        async def guarded(*args: Any, **kwargs: Any) -> T | None:
+            return await self.run_once(job, func, *args, **kwargs)
+
+        guarded.__name__ = getattr(func, "__name__", job)
+        return guarded
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_s)
+            await self.heartbeat()
+
+    async def _purge_old_runs(self) -> None:
+        try:
+            async with self.sessionmaker() as session:
+                await crud.delete_scheduler_job_runs_before(session, datetime.now(tz=UTC) - JOB_RUN_RETENTION)
+        except Exception:  # noqa: BLE001
+            logger.exception("Failed to purge old scheduler job runs")
@@ -1,6 +1,7 @@
 from __future__ import annotations
 
 from collections import defaultdict
+from dataclasses import dataclass
 from datetime import UTC, date, datetime, time, timedelta
 from zoneinfo import ZoneInfo
 
@@ -47,40 +48,49 @@ async def _users_for_chat(session: AsyncSession, chat_id: int) -> list[User]:
     return await crud.get_users_by_ids(session, member_ids)
 
 
-async def build_daily_league_report(
-    session: AsyncSession, chat_id: int, timezone_name: str
-) -> str | None:
-    tz = ZoneInfo(timezone_name)
+@dataclass(frozen=True, slots=True)
+class _LeagueSnapshot:
+    """Данные чата для дневной и недельной сводки, собранные фиксированным числом запросов."""
+
+    users: list[User]
+    today_local: date
+    week_start_local: date
+    # telegram_id -> [калории за сегодня, калории за неделю]
+    calories: dict[int, list[float]]
+    # telegram_id -> [вес на конец сегодня, на конец вчера, на начало недели]
+    weights: dict[int, list[float | None]]
+
+
+_TODAY, _WEEK = 0, 1
+_W_TODAY_END, _W_YESTERDAY_END, _W_WEEK_START = 0, 1, 2
+
+
+async def _collect_league_snapshot(
+    session: AsyncSession, chat_id: int, tz: ZoneInfo
+) -> _LeagueSnapshot:
     users = await _users_for_chat(session, chat_id)
+    today_local = datetime.now(tz=tz).date()
+    week_start_local = today_local - timedelta(days=today_local.weekday())
     if not users:
-        return "Сегодня нет данных для сводки."
+        return _LeagueSnapshot(users, today_local, week_start_local, {}, {})
 
-    today_local = datetime.now(tz=tz).date()
-    yesterday_local = today_local - timedelta(days=1)
     today_start_utc, today_end_utc = _day_bounds_utc(today_local, tz)
-    _, yday_end_utc = _day_bounds_utc(yesterday_local, tz)
-    sections: dict[str, list[str]] = defaultdict(list)
-
-    for user in users:
-        summary = await crud.get_meal_summary_for_period(
-            session, user.telegram_id, today_start_utc, today_end_utc
-        )
-        calories_pct = _pct(summary["calories"], user.daily_calories_target)
-        weight_today = await crud.get_latest_weight_at_or_before(
-            session, user.telegram_id, today_end_utc
-        )
-        weight_yesterday = await crud.get_latest_weight_at_or_before(
-            session, user.telegram_id, yday_end_utc
-        )
-        delta_text = _weight_delta_pct(
-            weight_today.weight_kg if weight_today else None,
-            weight_yesterday.weight_kg if weight_yesterday else None,
-        )
-        sections[user.goal].append(
-            f"- {_user_display_name(user)}: {calories_pct:.1f}% калорий, вес {delta_text}"
-        )
-
-    lines = [f"Дневная сводка за {today_local.isoformat()}"]
+    _, yday_end_utc = _day_bounds_utc(today_local - timedelta(days=1), tz)
+    week_start_utc, _ = _day_bounds_utc(week_start_local, tz)
+    member_ids = [user.telegram_id for user in users]
+    calories = await crud.get_calories_for_windows(
+        session,
+        member_ids,
+        [(today_start_utc, today_end_utc), (week_start_utc, today_end_utc)],
+    )
+    weights = await crud.get_latest_weights_at_cutoffs(
+        session, member_ids, [today_end_utc, yday_end_utc, week_start_utc]
+    )
+    return _LeagueSnapshot(users, today_local, week_start_local, calories, weights)
+
+
+def _render_report(header: str, sections: dict[str, list[str]], empty_text: str) -> str:
+    lines = [header]
     for goal in GOAL_ORDER:
         members = sections.get(goal, [])
         if not members:
@@ -90,53 +100,64 @@ async def build_daily_league_report(
         lines.extend(members)
 
     if len(lines) == 1:
-        return "Сегодня нет данных для сводки."
+        return empty_text
     return "\n".join(lines)
 
 
-async def build_weekly_league_report(
-    session: AsyncSession, chat_id: int, timezone_name: str
-) -> str | None:
-    tz = ZoneInfo(timezone_name)
-    users = await _users_for_chat(session, chat_id)
-    if not users:
-        return "За неделю нет данных для сводки."
-
-    now_local = datetime.now(tz=tz).date()
-    week_start_local = now_local - timedelta(days=now_local.weekday())
-    week_start_utc, _ = _day_bounds_utc(week_start_local, tz)
-    _, week_end_utc = _day_bounds_utc(now_local, tz)
+def _render_daily(snapshot: _LeagueSnapshot) -> str:
+    if not snapshot.users:
+        return "Сегодня нет данных для сводки."
     sections: dict[str, list[str]] = defaultdict(list)
-
-    for user in users:
-        summary = await crud.get_meal_summary_for_period(
-            session, user.telegram_id, week_start_utc, week_end_utc
+    for user in snapshot.users:
+        calories_pct = _pct(snapshot.calories[user.telegram_id][_TODAY], user.daily_calories_target)
+        weights = snapshot.weights[user.telegram_id]
+        delta_text = _weight_delta_pct(weights[_W_TODAY_END], weights[_W_YESTERDAY_END])
+        sections[user.goal].append(
+            f"- {_user_display_name(user)}: {calories_pct:.1f}% калорий, вес {delta_text}"
         )
+    return _render_report(
+        f"Дневная сводка за {snapshot.today_local.isoformat()}",
+        sections,
+        "Сегодня нет данных для сводки.",
+    )
+
+
+def _render_weekly(snapshot: _LeagueSnapshot) -> str:
+    if not snapshot.users:
+        return "За неделю нет данных для сводки."
+    sections: dict[str, list[str]] = defaultdict(list)
+    for user in snapshot.users:
         weekly_target = user.daily_calories_target * 7
-        calories_pct = _pct(summary["calories"], weekly_target)
-        week_start_weight = await crud.get_latest_weight_at_or_before(
-            session, user.telegram_id, week_start_utc
-        )
-        week_end_weight = await crud.get_latest_weight_at_or_before(
-            session, user.telegram_id, week_end_utc
-        )
-        delta_text = _weight_delta_pct(
-            week_end_weight.weight_kg if week_end_weight else None,
-            week_start_weight.weight_kg if week_start_weight else None,
-        )
+        calories_pct = _pct(snapshot.calories[user.telegram_id][_WEEK], weekly_target)
+        weights = snapshot.weights[user.telegram_id]
+        delta_text = _weight_delta_pct(weights[_W_TODAY_END], weights[_W_WEEK_START])
         sections[user.goal].append(
             f"- {_user_display_name(user)}: {calories_pct:.1f}% недельной цели, вес {delta_text}"
         )
+    return _render_report(
+        f"Недельная сводка за {snapshot.week_start_local.isoformat()} - {snapshot.today_local.isoformat()}",
+        sections,
+        "За неделю нет данных для сводки.",
+    )
 
-    lines = [f"Недельная сводка за {week_start_local.isoformat()} - {now_local.isoformat()}"]
-    for goal in GOAL_ORDER:
-        members = sections.get(goal, [])
-        if not members:
-            continue
-        lines.append("")
-        lines.append(f"Лига: {GOAL_LABELS.get(goal, goal)}")
-        lines.extend(members)
 
-    if len(lines) == 1:
-        return "За неделю нет данных для сводки."
-    return "\n".join(lines)
+async def build_daily_league_report(
+    session: AsyncSession, chat_id: int, timezone_name: str
+) -> str | None:
+    snapshot = await _collect_league_snapshot(session, chat_id, ZoneInfo(timezone_name))
+    return _render_daily(snapshot)
+
+
+async def build_weekly_league_report(
+    session: AsyncSession, chat_id: int, timezone_name: str
+) -> str | None:
+    snapshot = await _collect_league_snapshot(session, chat_id, ZoneInfo(timezone_name))
+    return _render_weekly(snapshot)
+
+
+async def build_league_reports(
+    session: AsyncSession, chat_id: int, timezone_name: str
+) -> tuple[str, str]:
+    """Дневная и недельная сводки из одного набора запросов."""
+    snapshot = await _collect_league_snapshot(session, chat_id, ZoneInfo(timezone_name))
+    return _render_daily(snapshot), _render_weekly(snapshot)
@@ -3,19 +3,24 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
+from collections.abc import Awaitable, Callable
 from datetime import UTC, datetime, timedelta
 from zoneinfo import ZoneInfo
 
 from aiogram import Bot
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from bot.database import crud
 from bot.prompts.loader import load as load_prompt
 from bot.runtime import get_app_context
-from bot.services.league_reports import build_daily_league_report, build_weekly_league_report
-from bot.services.streaks import evaluate_daily_streak_for_user
-from bot.services.weight_plan import calculate_plan_targets, compare_progress, get_expected_weight_for_date
+from bot.services.broadcast import Broadcaster, BroadcastStats
+from bot.services.leader import LeaderElector
+from bot.services.league_reports import build_daily_league_report, build_league_reports
+from bot.services.plan_trajectory import expected_weight_on, refresh_plan_trajectories, save_plan_trajectory
+from bot.services.profile_cache import UserProfileCache
+from bot.services.schedule_index import MEAL_REMINDER, WEEKLY_COACHING, due_user_ids, parse_reminder_hours
+from bot.services.streaks import evaluate_daily_streaks
+from bot.services.weight_plan import calculate_plan_targets, compare_progress
 
 logger = logging.getLogger(__name__)
 
@@ -28,16 +33,25 @@ except ImportError:  # pragma: no cover - ветка зависит от окр
 
 
 class AsyncioLeagueScheduler:
-    def __init__(self, bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
+    def __init__(
+        self,
+        bot: Bot,
+        sessionmaker: async_sessionmaker,
+        timezone_name: str,
+        profiles: UserProfileCache | None = None,
+        leader: LeaderElector | None = None,
+    ) -> None:
         self.bot = bot
         self.sessionmaker = sessionmaker
         self.timezone_name = timezone_name
+        self.profiles = profiles
+        self.leader = leader
         self._tz = ZoneInfo(timezone_name)
+        self._broadcaster = Broadcaster(bot)
         self._tasks: list[asyncio.Task] = []
 
     def start(self) -> None:
         self._tasks.append(asyncio.create_task(self._run_daily(), name="league_daily_report"))
-        self._tasks.append(asyncio.create_task(self._run_weekly(), name="league_weekly_report"))
         self._tasks.append(asyncio.create_task(self._run_weekly_coaching(), name="weekly_coaching_hourly"))
         self._tasks.append(asyncio.create_task(self._run_weight_reminders(), name="weight_reminder_9am"))
         self._tasks.append(asyncio.create_task(self._run_meal_reminders(), name="meal_reminder_hourly"))
@@ -53,37 +67,39 @@ class AsyncioLeagueScheduler:
     async def _run_daily(self) -> None:
         while True:
             await asyncio.sleep(self._seconds_until(hour=23, minute=0))
-            await send_daily_reports(self.bot, self.sessionmaker, self.timezone_name)
-
-    async def _run_weekly(self) -> None:
-        while True:
-            await asyncio.sleep(self._seconds_until(hour=23, minute=0, weekday=6))
-            await send_weekly_reports(self.bot, self.sessionmaker, self.timezone_name)
+            await self._call("league_daily_report", send_daily_reports)
 
     async def _run_weight_reminders(self) -> None:
         while True:
             await asyncio.sleep(self._seconds_until_next_hour())
-            await send_weight_reminders(self.bot, self.sessionmaker, self.timezone_name)
+            await self._call("weight_reminder_hourly", send_weight_reminders)
 
     async def _run_weekly_coaching(self) -> None:
         while True:
             await asyncio.sleep(self._seconds_until_next_hour())
-            await send_weekly_coaching(self.bot, self.sessionmaker, self.timezone_name)
+            await self._call("weekly_coaching_hourly", send_weekly_coaching)
 
     async def _run_weight_plan_checks(self) -> None:
         while True:
             await asyncio.sleep(self._seconds_until_next_hour())
-            await send_weight_plan_checks(self.bot, self.sessionmaker, self.timezone_name)
+            await self._call("weight_plan_check_hourly", send_weight_plan_checks, self.profiles)
 
     async def _run_meal_reminders(self) -> None:
         while True:
             await asyncio.sleep(self._seconds_until_next_hour())
-            await send_meal_reminders(self.bot, self.sessionmaker, self.timezone_name)
+            await self._call("meal_reminder_hourly", send_meal_reminders)
 
     async def _run_streak_checks(self) -> None:
         while True:
             await asyncio.sleep(self._seconds_until_next_half_hour())
-            await send_daily_streak_checks(self.bot, self.sessionmaker, self.timezone_name)
+            await self._call("daily_streak_check_2330", send_daily_streak_checks)
+
+    async def _call(self, job: str, func: Callable[..., Awaitable[object]], *extra: object) -> None:
+        args = (self.bot, self.sessionmaker, self.timezone_name, self._broadcaster, *extra)
+        if self.leader is None:
+            await func(*args)
+        else:
+            await self.leader.run_once(job, func, *args)
 
     def _seconds_until_next_hour(self) -> float:
         now = datetime.now(tz=self._tz)
@@ -137,80 +153,83 @@ def _timezones_with_hour(timezones: list[str | None], target_hour: int, fallback
     return matching
 
 
-async def _send_weight_reminder_for_user(bot: Bot, user_id: int) -> None:
-    text = "Доброе утро! Не забудь взвеситься и отправить вес командой /weight."
-    try:
-        await bot.send_message(chat_id=user_id, text=text)
-    except (TelegramForbiddenError, TelegramBadRequest):
-        logger.warning("Cannot send weight reminder to user %s (chat unavailable)", user_id)
-    except Exception:  # noqa: BLE001
-        logger.exception("Failed to send weight reminder to user %s", user_id)
+WEIGHT_REMINDER_TEXT = "Доброе утро! Не забудь взвеситься и отправить вес командой /weight."
 
 
-async def _send_user_text(bot: Bot, user_id: int, text: str) -> None:
+def _user_zone(tz_name: str | None, fallback_tz: str) -> ZoneInfo:
     try:
-        await bot.send_message(chat_id=user_id, text=text)
-    except (TelegramForbiddenError, TelegramBadRequest):
-        logger.warning("Cannot send message to user %s (chat unavailable)", user_id)
+        return ZoneInfo(tz_name or fallback_tz)
     except Exception:  # noqa: BLE001
-        logger.exception("Failed to send message to user %s", user_id)
-
+        return ZoneInfo(fallback_tz)
+
+
+async def _broadcast_reports(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    *,
+    builder: Callable[[AsyncSession, int, str], Awaitable[str | list[str] | None]],
+    name: str,
+    broadcaster: Broadcaster | None,
+) -> BroadcastStats:
+    async def _render(chat_id: int) -> str | list[str] | None:
+        async with sessionmaker() as session:
+            return await builder(session, chat_id, timezone_name)
 
-async def _send_daily_for_chat(
-    bot: Bot, sessionmaker: async_sessionmaker, chat_id: int, timezone_name: str
-) -> None:
-    async with sessionmaker() as session:
-        report = await build_daily_league_report(session, chat_id, timezone_name)
-    if not report:
-        return
-    try:
-        await bot.send_message(chat_id=chat_id, text=report)
-    except (TelegramForbiddenError, TelegramBadRequest):
-        logger.warning("Removing unavailable chat %s after daily report failure", chat_id)
+    async def _remove_chat(chat_id: int) -> None:
+        logger.warning("Removing unavailable chat %s after %s failure", chat_id, name)
         async with sessionmaker() as session:
             await crud.remove_group_chat(session, chat_id)
-    except Exception:  # noqa: BLE001
-        logger.exception("Failed to send daily report to chat %s", chat_id)
+
+    return await (broadcaster or Broadcaster(bot)).run(
+        await _group_chat_ids(sessionmaker), _render, name=name, on_blocked=_remove_chat
+    )
 
 
-async def _send_weekly_for_chat(
-    bot: Bot, sessionmaker: async_sessionmaker, chat_id: int, timezone_name: str
-) -> None:
-    async with sessionmaker() as session:
-        report = await build_weekly_league_report(session, chat_id, timezone_name)
-    if not report:
-        return
-    try:
-        await bot.send_message(chat_id=chat_id, text=report)
-    except (TelegramForbiddenError, TelegramBadRequest):
-        logger.warning("Removing unavailable chat %s after weekly report failure", chat_id)
-        async with sessionmaker() as session:
-            await crud.remove_group_chat(session, chat_id)
-    except Exception:  # noqa: BLE001
-        logger.exception("Failed to send weekly report to chat %s", chat_id)
+def _is_weekly_report_day(timezone_name: str) -> bool:
+    return datetime.now(tz=ZoneInfo(timezone_name)).weekday() == 6
 
 
-async def send_daily_reports(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
-    for chat_id in await _group_chat_ids(sessionmaker):
-        await _send_daily_for_chat(bot, sessionmaker, chat_id, timezone_name)
+async def build_league_digest(session: AsyncSession, chat_id: int, timezone_name: str) -> str | list[str] | None:
+    """Дневная сводка; в воскресенье — ещё и недельная отдельным сообщением, обе из одного снимка данных чата."""
+    if not _is_weekly_report_day(timezone_name):
+        return await build_daily_league_report(session, chat_id, timezone_name)
+    daily, weekly = await build_league_reports(session, chat_id, timezone_name)
+    return [daily, weekly]
 
 
-async def send_weekly_reports(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
-    for chat_id in await _group_chat_ids(sessionmaker):
-        await _send_weekly_for_chat(bot, sessionmaker, chat_id, timezone_name)
+async def send_daily_reports(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    broadcaster: Broadcaster | None = None,
+) -> BroadcastStats:
+    return await _broadcast_reports(
+        bot,
+        sessionmaker,
+        timezone_name,
+        builder=build_league_digest,
+        name="league_daily_report",
+        broadcaster=broadcaster,
+    )
 
 
-async def send_weight_reminders(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
+async def send_weight_reminders(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    broadcaster: Broadcaster | None = None,
+) -> BroadcastStats | None:
     """Send weight reminders only to users whose local time is currently 9 AM."""
     async with sessionmaker() as session:
         all_tz = await crud.get_distinct_user_timezones(session)
     matching = _timezones_with_hour(all_tz, target_hour=9, fallback_tz=timezone_name)
     if not matching:
-        return
+        return None
     async with sessionmaker() as session:
         user_ids = await crud.get_user_ids_by_timezones(session, matching)
-    for user_id in user_ids:
-        has_weight_today = False
+
+    async def _render(user_id: int) -> str | None:
         try:
             async with sessionmaker() as session:
                 has_weight_today = await crud.has_weight_log_today(
@@ -220,224 +239,205 @@ async def send_weight_reminders(bot: Bot, sessionmaker: async_sessionmaker, time
                 )
         except Exception:  # noqa: BLE001
             logger.debug("Skip has_weight_log_today check for user %s", user_id)
-        if has_weight_today:
-            continue
-        await _send_weight_reminder_for_user(bot, user_id)
+            has_weight_today = False
+        return None if has_weight_today else WEIGHT_REMINDER_TEXT
 
+    return await (broadcaster or Broadcaster(bot)).run(user_ids, _render, name="weight_reminders")
 
-async def send_weight_plan_checks(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
-    # Получаем только ID, чтобы объекты User не стали detached после закрытия сессии.
-    async with sessionmaker() as session:
-        plan_users = await crud.get_users_with_active_plan(session)
-        user_ids = [u.telegram_id for u in plan_users]
-
-    for user_id in user_ids:
-        # Одна сессия на весь цикл обработки пользователя: читаем и пишем в ней же,
-        # поэтому user отслеживается session и изменения корректно сохраняются.
-        async with sessionmaker() as session:
-            user = await crud.get_user(session, user_id)
-            if user is None:
-                continue
 
-            tz_name = user.timezone or timezone_name
-            try:
-                user_tz = ZoneInfo(tz_name)
-            except Exception:  # noqa: BLE001
-                user_tz = ZoneInfo(timezone_name)
-            now_local = datetime.now(tz=user_tz)
-            if now_local.hour != 10:
-                continue
+async def _weight_plan_message(
+    sessionmaker: async_sessionmaker,
+    user_id: int,
+    timezone_name: str,
+    profiles: UserProfileCache | None = None,
+) -> str | None:
+    # Одна сессия на всю обработку пользователя: читаем и пишем в ней же,
+    # поэтому user отслеживается session и изменения корректно сохраняются.
+    async with sessionmaker() as session:
+        user = await crud.get_user(session, user_id)
+        if user is None:
+            return None
 
-            latest = await crud.get_latest_weight(session, user.telegram_id)
-            if latest is None:
-                continue
+        user_tz = _user_zone(user.timezone, timezone_name)
+        now_local = datetime.now(tz=user_tz)
+        if now_local.hour != 10:
+            return None
+
+        latest = await crud.get_latest_weight(session, user.telegram_id)
+        if latest is None:
+            return None
+
+        latest_local_date = latest.logged_at.astimezone(user_tz).date() if latest.logged_at else None
+        if latest_local_date != now_local.date():
+            return None
+
+        if (
+            user.weight_plan_mode is None
+            or user.target_weight_kg is None
+            or user.weight_plan_start_date is None
+            or user.weight_plan_start_kg is None
+        ):
+            return None
+
+        expected = await expected_weight_on(session, user, datetime.now(tz=UTC))
+        if expected is None:
+            return None
+        actual = float(latest.weight_kg)
+        progress = compare_progress(
+            expected_kg=expected,
+            actual_kg=actual,
+            target_weight=float(user.target_weight_kg),
+            current_weight=float(user.weight_plan_start_kg),
+        )
 
-            latest_local_date = latest.logged_at.astimezone(user_tz).date() if latest.logged_at else None
-            if latest_local_date != now_local.date():
-                continue
+        if user.goal == "lose" and actual <= float(user.target_weight_kg):
+            return (
+                "Отличная работа! Цель по весу достигнута 🎉\n"
+                "Рекомендую перейти на режим поддержания и закрепить результат."
+            )
+        if user.goal == "gain" and actual >= float(user.target_weight_kg):
+            return (
+                "Поздравляю, цель по набору достигнута 🎉\n"
+                "Дальше можно перейти на поддержание, чтобы стабилизировать вес."
+            )
 
-            if (
-                user.weight_plan_mode is None
-                or user.target_weight_kg is None
-                or user.weight_plan_start_date is None
-                or user.weight_plan_start_kg is None
-            ):
-                continue
+        lagging = not bool(progress["on_track"]) and float(progress["deviation_kg"]) > 0.5
+        if lagging:
+            mode_order = ["light", "medium", "hard"]
+            current_mode = user.weight_plan_mode if user.weight_plan_mode in mode_order else "medium"
+            current_idx = mode_order.index(current_mode)
+            next_mode = mode_order[min(current_idx + 1, len(mode_order) - 1)]
 
-            expected = get_expected_weight_for_date(
-                plan_start_date=user.weight_plan_start_date,
-                plan_start_kg=float(user.weight_plan_start_kg),
+            targets = calculate_plan_targets(
+                current_weight=actual,
                 target_weight=float(user.target_weight_kg),
-                mode=user.weight_plan_mode,
                 gender=user.gender,
                 age=user.age,
                 height_cm=user.height_cm,
                 activity_level=user.activity_level,
-                check_date=datetime.now(tz=UTC),
+                mode=next_mode,
             )
-            actual = float(latest.weight_kg)
-            progress = compare_progress(
-                expected_kg=expected,
-                actual_kg=actual,
-                target_weight=float(user.target_weight_kg),
-                current_weight=float(user.weight_plan_start_kg),
+            user.weight_plan_mode = next_mode
+            user.daily_calories_target = float(targets["daily_calories"])
+            user.daily_protein_target = float(targets["daily_protein"])
+            user.daily_fat_target = float(targets["daily_fat"])
+            user.daily_carbs_target = float(targets["daily_carbs"])
+            await save_plan_trajectory(session, user, commit=False)
+            await session.commit()
+            if profiles is not None:
+                profiles.invalidate(user_id)
+
+            return (
+                f"Есть отставание от плана: {progress['deviation_kg']:+.2f} кг.\n"
+                f"Ожидалось: {expected:.2f} кг, факт: {actual:.2f} кг.\n"
+                f"Скорректировал режим на {next_mode}: {targets['daily_calories']:.0f} ккал/день.\n"
+                "Усиль контроль порций и ежедневную активность (шаги/кардио)."
             )
 
-            if user.goal == "lose" and actual <= float(user.target_weight_kg):
-                await _send_user_text(
-                    bot,
-                    user.telegram_id,
-                    (
-                        "Отличная работа! Цель по весу достигнута 🎉\n"
-                        "Рекомендую перейти на режим поддержания и закрепить результат."
-                    ),
-                )
-                continue
-            if user.goal == "gain" and actual >= float(user.target_weight_kg):
-                await _send_user_text(
-                    bot,
-                    user.telegram_id,
-                    (
-                        "Поздравляю, цель по набору достигнута 🎉\n"
-                        "Дальше можно перейти на поддержание, чтобы стабилизировать вес."
-                    ),
-                )
-                continue
+        # Поддержка не ежедневно, примерно раз в 4 дня.
+        if now_local.toordinal() % 4 == 0:
+            return (
+                "Ты идешь по плану. Отличный темп!\n"
+                f"Сегодня: факт {actual:.2f} кг, ожидалось {expected:.2f} кг."
+            )
+        return None
 
-            lagging = not bool(progress["on_track"]) and float(progress["deviation_kg"]) > 0.5
-            if lagging:
-                mode_order = ["light", "medium", "hard"]
-                current_mode = user.weight_plan_mode if user.weight_plan_mode in mode_order else "medium"
-                current_idx = mode_order.index(current_mode)
-                next_mode = mode_order[min(current_idx + 1, len(mode_order) - 1)]
-
-                targets = calculate_plan_targets(
-                    current_weight=actual,
-                    target_weight=float(user.target_weight_kg),
-                    gender=user.gender,
-                    age=user.age,
-                    height_cm=user.height_cm,
-                    activity_level=user.activity_level,
-                    mode=next_mode,
-                )
-                user.weight_plan_mode = next_mode
-                user.daily_calories_target = float(targets["daily_calories"])
-                user.daily_protein_target = float(targets["daily_protein"])
-                user.daily_fat_target = float(targets["daily_fat"])
-                user.daily_carbs_target = float(targets["daily_carbs"])
-                await session.commit()
-
-                await _send_user_text(
-                    bot,
-                    user.telegram_id,
-                    (
-                        f"Есть отставание от плана: {progress['deviation_kg']:+.2f} кг.\n"
-                        f"Ожидалось: {expected:.2f} кг, факт: {actual:.2f} кг.\n"
-                        f"Скорректировал режим на {next_mode}: {targets['daily_calories']:.0f} ккал/день.\n"
-                        "Усиль контроль порций и ежедневную активность (шаги/кардио)."
-                    ),
-                )
-                continue
 
-            # Поддержка не ежедневно, примерно раз в 4 дня.
-            if now_local.toordinal() % 4 == 0:
-                await _send_user_text(
-                    bot,
-                    user.telegram_id,
-                    (
-                        "Ты идешь по плану. Отличный темп!\n"
-                        f"Сегодня: факт {actual:.2f} кг, ожидалось {expected:.2f} кг."
-                    ),
-                )
+async def send_weight_plan_checks(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    broadcaster: Broadcaster | None = None,
+    profiles: UserProfileCache | None = None,
+) -> BroadcastStats:
+    # Получаем только ID, чтобы объекты User не стали detached после закрытия сессии.
+    async with sessionmaker() as session:
+        plan_users = await crud.get_users_with_active_plan(session)
+        user_ids = [u.telegram_id for u in plan_users]
+        # Недостающие и устаревшие траектории — одним векторным проходом; дальше каждому
+        # пользователю хватает одного чтения своей траектории.
+        await refresh_plan_trajectories(session, plan_users)
 
+    async def _render(user_id: int) -> str | None:
+        return await _weight_plan_message(sessionmaker, user_id, timezone_name, profiles)
 
-def _parse_reminder_hours(value: str | None) -> set[int]:
-    if not value:
-        return {9, 13, 19}
-    result: set[int] = set()
-    for part in value.split(","):
-        token = part.strip()
-        if not token:
-            continue
-        if token.isdigit():
-            hour = int(token)
-            if 0 <= hour <= 23:
-                result.add(hour)
-    return result or {9, 13, 19}
+    return await (broadcaster or Broadcaster(bot)).run(user_ids, _render, name="weight_plan_checks")
 
 
-async def send_meal_reminders(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
-    async with sessionmaker() as session:
-        user_ids = await crud.get_all_user_ids(session)
-    if not user_ids:
-        return
+async def send_meal_reminders(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    broadcaster: Broadcaster | None = None,
+) -> BroadcastStats | None:
+    now = datetime.now(tz=UTC)
     async with sessionmaker() as session:
-        users = await crud.get_users_by_ids(session, user_ids)
-
-    for user in users:
-        tz_name = user.timezone or timezone_name
-        try:
-            user_tz = ZoneInfo(tz_name)
-        except Exception:  # noqa: BLE001
-            user_tz = ZoneInfo(timezone_name)
-        now_local = datetime.now(tz=user_tz)
-        reminder_hours = _parse_reminder_hours(user.meal_reminder_times)
-
-        if now_local.hour == 21:
-            async with sessionmaker() as session:
-                consumed = await crud.get_meal_summary_for_day(
-                    session,
-                    user.telegram_id,
-                    timezone=user_tz,
+        user_ids = await due_user_ids(session, MEAL_REMINDER, fallback_tz=timezone_name, now=now)
+        if not user_ids:
+            return None
+        users = {user.telegram_id: user for user in await crud.get_users_by_ids(session, user_ids)}
+
+        # Данные для всех пользователей слота читаем пачкой: сводки за день — по одному
+        # запросу на часовой пояс, свежие приёмы пищи — одним запросом.
+        local_now = {
+            tid: now.astimezone(_user_zone(user.timezone, timezone_name)) for tid, user in users.items()
+        }
+        summary_ids_by_zone: dict[str | None, list[int]] = {}
+        reminder_ids: set[int] = set()
+        for tid, user in users.items():
+            hour = local_now[tid].hour
+            if hour == 21:
+                summary_ids_by_zone.setdefault(user.timezone, []).append(tid)
+            elif hour in parse_reminder_hours(user.meal_reminder_times):
+                reminder_ids.add(tid)
+        consumed_by_user: dict[int, dict[str, float]] = {}
+        for tz_name, ids in summary_ids_by_zone.items():
+            consumed_by_user.update(
+                await crud.get_meal_summaries_for_users(
+                    session, ids, timezone=_user_zone(tz_name, timezone_name)
                 )
+            )
+        with_recent_meals = await crud.has_meals_in_last_hours_many(
+            session, list(reminder_ids), hours=2, now=now
+        )
+
+    async def _render(user_id: int) -> str | None:
+        user = users[user_id]
+        if user_id in consumed_by_user:
+            consumed = consumed_by_user[user_id]
             if consumed.get("calories", 0.0) < float(user.daily_calories_target) * 0.6:
-                await _send_user_text(
-                    bot,
-                    user.telegram_id,
-                    (
-                        f"Ты записал {consumed.get('calories', 0.0):.0f} из "
-                        f"{user.daily_calories_target:.0f} ккал. "
-                        "Проверь, не забыл ли записать приемы пищи."
-                    ),
+                return (
+                    f"Ты записал {consumed.get('calories', 0.0):.0f} из "
+                    f"{user.daily_calories_target:.0f} ккал. "
+                    "Проверь, не забыл ли записать приемы пищи."
                 )
-            continue
+            return None
+        if user_id not in reminder_ids or user_id in with_recent_meals:
+            return None
+        return f"Уже {local_now[user_id].hour:02d}:00. Не забудь записать прием пищи."
 
-        if now_local.hour not in reminder_hours:
-            continue
-        async with sessionmaker() as session:
-            has_recent = await crud.has_meals_in_last_hours(
-                session,
-                user.telegram_id,
-                hours=2,
-                now=datetime.now(tz=UTC),
-            )
-        if has_recent:
-            continue
-        await _send_user_text(
-            bot,
-            user.telegram_id,
-            f"Уже {now_local.hour:02d}:00. Не забудь записать прием пищи.",
-        )
+    return await (broadcaster or Broadcaster(bot)).run(list(users), _render, name="meal_reminders")
 
 
-async def send_weekly_coaching(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
+async def send_weekly_coaching(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    broadcaster: Broadcaster | None = None,
+) -> BroadcastStats | None:
     async with sessionmaker() as session:
-        user_ids = await crud.get_all_user_ids(session)
-    if not user_ids:
-        return
-    async with sessionmaker() as session:
-        users = await crud.get_users_by_ids(session, user_ids)
+        user_ids = await due_user_ids(session, WEEKLY_COACHING, fallback_tz=timezone_name)
+        if not user_ids:
+            return None
+        users = {user.telegram_id: user for user in await crud.get_users_by_ids(session, user_ids)}
     app_ctx = get_app_context()
 
-    for user in users:
-        tz_name = user.timezone or timezone_name
-        try:
-            user_tz = ZoneInfo(tz_name)
-        except Exception:  # noqa: BLE001
-            user_tz = ZoneInfo(timezone_name)
+    async def _render(user_id: int) -> str | None:
+        user = users[user_id]
+        user_tz = _user_zone(user.timezone, timezone_name)
         now_local = datetime.now(tz=user_tz)
         if now_local.weekday() != 6 or now_local.hour != 20:
-            continue
+            return None
 
         async with sessionmaker() as session:
             payload = await crud.get_weekly_coaching_data(
@@ -447,7 +447,7 @@ async def send_weekly_coaching(bot: Bot, sessionmaker: async_sessionmaker, timez
                 timezone=user_tz,
             )
         if "error" in payload:
-            continue
+            return None
         prompt = load_prompt(
             "coaching/weekly",
             profile=json.dumps(payload["profile"], ensure_ascii=False),
@@ -455,59 +455,70 @@ async def send_weekly_coaching(bot: Bot, sessionmaker: async_sessionmaker, timez
             weight_history=json.dumps(payload["weight_history"], ensure_ascii=False),
         )
         try:
-            answer = await app_ctx.agent.ask(prompt, use_tools=False)
+            return await app_ctx.agent.ask(prompt, use_tools=False)
         except Exception:  # noqa: BLE001
             logger.exception("Failed to generate weekly coaching for user %s", user.telegram_id)
-            continue
-        await _send_user_text(bot, user.telegram_id, answer)
+            return None
 
+    return await (broadcaster or Broadcaster(bot)).run(list(users), _render, name="weekly_coaching")
 
-async def send_daily_streak_checks(bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str) -> None:
+
+async def send_daily_streak_checks(
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    broadcaster: Broadcaster | None = None,
+) -> BroadcastStats | None:
     """Evaluate daily streaks for users whose local time is 23:30."""
     async with sessionmaker() as session:
         all_tz = await crud.get_distinct_user_timezones(session)
     matching = _timezones_with_hour(all_tz, target_hour=23, fallback_tz=timezone_name)
     if not matching:
-        return
-    async with sessionmaker() as session:
-        user_ids = await crud.get_user_ids_by_timezones(session, matching)
+        return None
 
-    for user_id in user_ids:
+    # Один пакетный расчёт на часовой пояс вместо сессии и ~8 запросов на пользователя.
+    results: dict[int, dict[str, object]] = {}
+    for tz_name in matching:
         async with sessionmaker() as session:
-            user = await crud.get_user(session, user_id)
-            if user is None:
+            bucket_ids = await crud.get_user_ids_by_timezones(session, [tz_name])
+            if not bucket_ids:
                 continue
-            tz_name = user.timezone or timezone_name
             try:
-                user_tz = ZoneInfo(tz_name)
+                results.update(
+                    await evaluate_daily_streaks(
+                        session,
+                        bucket_ids,
+                        timezone=_user_zone(tz_name, timezone_name),
+                    )
+                )
             except Exception:  # noqa: BLE001
-                user_tz = ZoneInfo(timezone_name)
-            result = await evaluate_daily_streak_for_user(
-                session,
-                user_id,
-                timezone=user_tz,
-            )
+                logger.exception("Failed to evaluate daily streaks for timezone %s", tz_name)
 
+    async def _render(user_id: int) -> str | None:
+        result = results[user_id]
         if "error" in result:
-            continue
+            return None
         new_badges = list(result.get("new_badges", []))
         streak_days = int(result.get("streak_days", 0))
         if not new_badges:
-            continue
+            return None
         badges_text = ", ".join(new_badges)
-        await _send_user_text(
-            bot,
-            user_id,
-            (
-                f"Новый бейдж: {badges_text}.\n"
-                f"Текущий стрик по калориям: {streak_days} дн. Продолжай в том же темпе!"
-            ),
+        return (
+            f"Новый бейдж: {badges_text}.\n"
+            f"Текущий стрик по калориям: {streak_days} дн. Продолжай в том же темпе!"
         )
 
+    return await (broadcaster or Broadcaster(bot)).run(list(results), _render, name="daily_streak_checks")
+
 
 def start_league_scheduler(
-    bot: Bot, sessionmaker: async_sessionmaker, timezone_name: str
+    bot: Bot,
+    sessionmaker: async_sessionmaker,
+    timezone_name: str,
+    profiles: UserProfileCache | None = None,
+    leader: LeaderElector | None = None,
 ) -> AsyncIOScheduler | AsyncioLeagueScheduler:
+    """Запускает задачи рассылок; с leader задачи выполняются только на лидере, раз за слот."""
     tz = ZoneInfo(timezone_name)
     if AsyncIOScheduler is None or CronTrigger is None:
         logger.warning(
@@ -517,57 +528,63 @@ def start_league_scheduler(
             bot=bot,
             sessionmaker=sessionmaker,
             timezone_name=timezone_name,
+            profiles=profiles,
+            leader=leader,
         )
         scheduler.start()
         return scheduler
 
+    def job(job_id: str, func: Callable[..., Awaitable[object]]) -> Callable[..., Awaitable[object]]:
+        return func if leader is None else leader.guard(job_id, func)
+
+    # Один Broadcaster на все задачи: глобальный и поштучный лимиты Telegram общие для бота.
+    job_kwargs = {
+        "bot": bot,
+        "sessionmaker": sessionmaker,
+        "timezone_name": timezone_name,
+        "broadcaster": Broadcaster(bot),
+    }
     scheduler = AsyncIOScheduler(timezone=tz)
     scheduler.add_job(
-        send_daily_reports,
+        job("league_daily_report", send_daily_reports),
         CronTrigger(hour=23, minute=0, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
+        kwargs=job_kwargs,
         id="league_daily_report",
         replace_existing=True,
     )
     scheduler.add_job(
-        send_weekly_reports,
-        CronTrigger(day_of_week="sun", hour=23, minute=0, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
-        id="league_weekly_report",
-        replace_existing=True,
-    )
-    scheduler.add_job(
-        send_weight_reminders,
+        job("weight_reminder_hourly", send_weight_reminders),
         CronTrigger(minute=0, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
+        kwargs=job_kwargs,
         id="weight_reminder_hourly",
         replace_existing=True,
     )
     scheduler.add_job(
-        send_weekly_coaching,
+        job("weekly_coaching_hourly", send_weekly_coaching),
         CronTrigger(minute=0, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
+        kwargs=job_kwargs,
         id="weekly_coaching_hourly",
         replace_existing=True,
     )
     scheduler.add_job(
-        send_weight_plan_checks,
+        job("weight_plan_check_hourly", send_weight_plan_checks),
         CronTrigger(minute=0, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
+        # Задача меняет цели пользователей — сбрасывает их профили в кэше.
+        kwargs={**job_kwargs, "profiles": profiles},
         id="weight_plan_check_hourly",
         replace_existing=True,
     )
     scheduler.add_job(
-        send_meal_reminders,
+        job("meal_reminder_hourly", send_meal_reminders),
         CronTrigger(minute=0, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
+        kwargs=job_kwargs,
         id="meal_reminder_hourly",
         replace_existing=True,
     )
     scheduler.add_job(
-        send_daily_streak_checks,
+        job("daily_streak_check_2330", send_daily_streak_checks),
         CronTrigger(minute=30, timezone=tz),
-        kwargs={"bot": bot, "sessionmaker": sessionmaker, "timezone_name": timezone_name},
+        kwargs=job_kwargs,
         id="daily_streak_check_2330",
         replace_existing=True,
     )
@@ -0,0 +1,294 @@
+"""Кэш оценок КБЖУ по тексту: LRU в памяти перед таблицей meal_estimates.
+
+Пользователи по много раз записывают одни и те же блюда. Ключ — нормализованный текст
+(регистр, пробелы, числа и единицы измерения) вместе с моделью и хэшем промпта, поэтому
+смена модели или промпта не отдаёт старые оценки. Записи живут ttl_s; «пересчитай ...»
+в начале сообщения обходит кэш и перезаписывает оценку.
+
+Оценки ходов агента (сообщения пользователя) хранятся отдельно для каждого пользователя
+(user_id в ключе) и только для самодостаточных описаний (is_self_contained): «ещё одну»
+или «как вчера» зависят от истории диалога. Разбор текста без контекста (parse_meal_text)
+делит записи между всеми.
+"""
+
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from typing import Any
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+from bot.database.connection import unit_of_work
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_S = 30 * 24 * 3600.0
+DEFAULT_MAX_ENTRIES = 5_000
+
+# Единица -> (каноническая единица, множитель); кг и л приводятся к г и мл.
+_UNITS: dict[str, tuple[str, float]] = {
+    "г": ("г", 1.0),
+    "гр": ("г", 1.0),
+    "грамм": ("г", 1.0),
+    "грамма": ("г", 1.0),
+    "граммов": ("г", 1.0),
+    "g": ("г", 1.0),
+    "кг": ("г", 1000.0),
+    "kg": ("г", 1000.0),
+    "мл": ("мл", 1.0),
+    "ml": ("мл", 1.0),
+    "л": ("мл", 1000.0),
+    "литр": ("мл", 1000.0),
+    "литра": ("мл", 1000.0),
+    "литров": ("мл", 1000.0),
+    "l": ("мл", 1000.0),
+    "шт": ("шт", 1.0),
+    "штука": ("шт", 1.0),
+    "штуки": ("шт", 1.0),
+    "штук": ("шт", 1.0),
+}
+# Слова, которые не меняют блюдо: «съел овсянку» и «овсянку» — одна запись.
+_FILLER_WORDS = frozenset({"я", "съел", "съела", "поел", "поела", "выпил", "выпила", "скушал", "скушала"})
+_TOKEN_RE = re.compile(r"\d+(?:[.,]\d+)?|[^\W\d_]+")
+_REESTIMATE_RE = re.compile(
+    r"^\s*(?:пересчитай|переоцени|оцени\s+заново|без\s+кэша)(?![^\W\d_])[\s:,.!-]*", re.IGNORECASE
+)
+
+
+# Слова, отсылающие к истории диалога или привычкам пользователя: такой текст без контекста
+# не описывает блюдо.
+_CONTEXT_WORDS = frozenset(
+    {
+        "еще", "ещё", "снова", "опять", "повтори", "повтор", "вчера", "вчерашний", "вчерашнюю",
+        "обычный", "обычную", "обычное", "обычно", "тот", "та", "то", "те", "той", "того", "такой",
+        "такую", "такое", "же", "мой", "моя", "мое", "моё", "мою", "мои", "его", "ее", "её", "их",
+        "это", "этот", "эту", "эти", "половину", "остаток", "остатки",
+    }
+)
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.3f}".rstrip("0").rstrip(".")
+
+
+def normalize_meal_text(text: str) -> str:
+    """Каноническая форма описания: «Овсянка 60 гр, банан» -> «овсянка 60г банан»."""
+    tokens = _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+    out: list[str] = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token[0].isdigit():
+            value = float(token.replace(",", "."))
+            unit = _UNITS.get(tokens[i + 1]) if i + 1 < len(tokens) else None
+            if unit is not None:
+                out.append(_format_number(value * unit[1]) + unit[0])
+                i += 2
+                continue
+            out.append(_format_number(value))
+        elif token not in _FILLER_WORDS:
+            out.append(token)
+        i += 1
+    return " ".join(out)
+
+
+def split_reestimate(text: str) -> tuple[bool, str]:
+    """(True, текст без команды), если пользователь просит оценить заново."""
+    match = _REESTIMATE_RE.match(text)
+    if match is None:
+        return False, text
+    return True, text[match.end():]
+
+
+def is_self_contained(text: str) -> bool:
+    """Описание блюда без отсылок к диалогу: «овсянка 60г с бананом», но не «ещё одну такую»."""
+    words = [token for token in _TOKEN_RE.findall(text.lower()) if not token[0].isdigit()]
+    return bool(words) and not any(word in _CONTEXT_WORDS for word in words)
+
+
+def prompt_fingerprint(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+
+
+def meal_cache_key(normalized_text: str, *, model: str, prompt: str, user_id: int | None = None) -> str:
+    raw = f"{model}\n{prompt_fingerprint(prompt)}\n{normalized_text}"
+    if user_id is not None:
+        raw = f"{user_id}\n{raw}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+_ESTIMATE_FIELDS = ("description", "calories", "protein_g", "fat_g", "carbs_g", "meal_type")
+
+
+def _clean_estimate(estimate: dict[str, Any]) -> dict[str, float | str]:
+    return {
+        "description": str(estimate["description"]),
+        "calories": float(estimate["calories"]),
+        "protein_g": float(estimate["protein_g"]),
+        "fat_g": float(estimate["fat_g"]),
+        "carbs_g": float(estimate["carbs_g"]),
+        "meal_type": str(estimate.get("meal_type") or "snack"),
+    }
+
+
+class MealEstimateCache:
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        *,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        # Часы настенные: срок годности хранится и в БД, и переживает перезапуск.
+        self._clock = clock
+        # cache_key -> (момент истечения, оценка)
+        self._entries: OrderedDict[str, tuple[float, dict[str, float | str]]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        return (self.memory_hits + self.db_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> dict[str, float | int]:
+        return {
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hit_rate, 4),
+            "entries": len(self._entries),
+        }
+
+    async def get(
+        self, text: str, *, model: str, prompt: str, user_id: int | None = None
+    ) -> dict[str, float | str] | None:
+        """Оценка для текста или None; копия, чтобы вызывающий мог её менять."""
+        normalized = normalize_meal_text(text)
+        if not normalized:
+            return None
+        key = meal_cache_key(normalized, model=model, prompt=prompt, user_id=user_id)
+        now = self._clock()
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.memory_hits += 1
+                self._entries.move_to_end(key)
+                return dict(entry[1])
+            del self._entries[key]
+
+        async with self.sessionmaker() as session:
+            row = await crud.get_meal_estimate(session, key, now=datetime.fromtimestamp(now, tz=UTC))
+        if row is None:
+            self.misses += 1
+            return None
+        self.db_hits += 1
+        estimate = _clean_estimate({name: getattr(row, name) for name in _ESTIMATE_FIELDS})
+        expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=UTC)
+        self._store(key, estimate, expires_at.timestamp())
+        return dict(estimate)
+
+    async def put(
+        self, text: str, estimate: dict[str, Any], *, model: str, prompt: str, user_id: int | None = None
+    ) -> None:
+        normalized = normalize_meal_text(text)
+        if not normalized or self.ttl_s <= 0:
+            return
+        key = meal_cache_key(normalized, model=model, prompt=prompt, user_id=user_id)
+        expires = self._clock() + self.ttl_s
+        async with unit_of_work(self.sessionmaker) as session:
+            await crud.upsert_meal_estimate(
+                session,
+                key,
+                model=model,
+                normalized_text=normalized,
+                estimate=estimate,
+                expires_at=datetime.fromtimestamp(expires, tz=UTC),
+                commit=False,
+            )
+        self._store(key, _clean_estimate(estimate), expires)
+
+    async def purge_expired(self) -> int:
+        """Удаляет истёкшие записи из памяти и из БД; возвращает число удалённых строк БД."""
+        now = self._clock()
+        for key in [key for key, (expires, _) in self._entries.items() if expires <= now]:
+            del self._entries[key]
+        async with self.sessionmaker() as session:
+            removed = await crud.delete_expired_meal_estimates(
+                session, now=datetime.fromtimestamp(now, tz=UTC)
+            )
+        logger.info("Meal estimate cache purged %d rows, stats=%s", removed, self.stats())
+        return removed
+
+    def _store(self, key: str, estimate: dict[str, float | str], expires: float) -> None:
+        # max_entries=0 — без памяти процесса, каждый get читает meal_estimates.
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (expires, estimate)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+@dataclass(slots=True)
+class AgentTurn:
+    """Что сделал агент за один ход: меняющие данные (serial) инструменты и записанные add_meal блюда."""
+
+    tools: list[str] = field(default_factory=list)
+    meals: list[dict[str, float | str]] = field(default_factory=list)
+
+    def single_meal(self) -> dict[str, float | str] | None:
+        """Оценка блюда, если за ход был ровно один вызов add_meal и никаких других записей.
+
+        Ход «выпил молоко и 500 мл воды» или «удали банан и запиши яблоко» повтором одной
+        записи не воспроизвести — такие ходы не кэшируются. Чтение (lookup_food, get_meals_today)
+        на повтор не влияет и сюда не попадает.
+        """
+        if len(self.meals) != 1 or any(name != "add_meal" for name in self.tools):
+            return None
+        return self.meals[0]
+
+
+# Ход агента текущего обработчика; задачи инструментов наследуют контекст и пишут в тот же объект.
+_TURN: contextvars.ContextVar[AgentTurn | None] = contextvars.ContextVar("agent_turn", default=None)
+
+
+@contextmanager
+def agent_turn() -> Iterator[AgentTurn]:
+    turn = AgentTurn()
+    token = _TURN.set(turn)
+    try:
+        yield turn
+    finally:
+        _TURN.reset(token)
+
+
+def record_tool_call(name: str, *, serial: bool = True) -> None:
+    """Отмечает вызов инструмента в ходе; serial=False (только чтение) кэширование хода не блокирует."""
+    turn = _TURN.get()
+    if turn is not None and serial:
+        turn.tools.append(name)
+
+
+def record_logged_meal(estimate: dict[str, Any]) -> None:
+    turn = _TURN.get()
+    if turn is not None:
+        turn.meals.append(_clean_estimate(estimate))
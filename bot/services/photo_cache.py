@@ -0,0 +1,31 @@
+"""Хранилище кэша vision-оценок (estimator.cache) в таблице photo_estimates."""
+
+from __future__ import annotations
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+from bot.database.connection import unit_of_work
+from estimator.cache import Estimate
+from estimator.fingerprint import from_signed64, to_signed64
+
+_ESTIMATE_FIELDS = ("description", "calories", "protein_g", "fat_g", "carbs_g", "meal_type")
+
+
+class DatabaseVisionStore:
+    def __init__(self, sessionmaker: async_sessionmaker) -> None:
+        self.sessionmaker = sessionmaker
+
+    async def load(self, scope: str, *, limit: int | None = None) -> list[tuple[int, str | None, Estimate]]:
+        async with self.sessionmaker() as session:
+            rows = await crud.get_photo_estimates(session, scope, limit=limit)
+        return [
+            (from_signed64(row.phash), row.file_unique_id, {name: getattr(row, name) for name in _ESTIMATE_FIELDS})
+            for row in rows
+        ]
+
+    async def save(self, scope: str, phash: int, file_unique_id: str | None, estimate: Estimate) -> None:
+        async with unit_of_work(self.sessionmaker) as session:
+            await crud.add_photo_estimate(
+                session, scope, to_signed64(phash), estimate, file_unique_id=file_unique_id, commit=False
+            )
@@ -0,0 +1,80 @@
+"""Сохранённые траектории планов веса (таблица weight_plan_trajectory).
+
+Траектория считается один раз — при выборе или смене режима — и хранится блобом
+float64 по неделям. Ежедневной проверке плана остаётся одно чтение по первичному
+ключу и интерполяция между двумя соседними неделями (Trajectory.expected_weight),
+без повторного прогона прогноза. Если после сохранения поменялся профиль (возраст,
+рост, активность, цель) или модель прогноза, ключ входных данных не совпадёт —
+траектория пересчитывается и перезаписывается при чтении.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database import crud
+from bot.services.weight_plan import PlanInputs, Trajectory, simulate_batch, trajectory_for
+
+
+def plan_inputs(user: Any) -> PlanInputs | None:
+    """Входные данные прогноза активного плана (User или UserProfile); None — плана нет."""
+    if user.weight_plan_mode is None or user.target_weight_kg is None or user.weight_plan_start_kg is None:
+        return None
+    return PlanInputs.normalized(
+        current_weight=user.weight_plan_start_kg,
+        target_weight=user.target_weight_kg,
+        gender=user.gender,
+        age=user.age,
+        height_cm=user.height_cm,
+        activity_level=user.activity_level,
+        mode=user.weight_plan_mode,
+    )
+
+
+async def save_plan_trajectory(session: AsyncSession, user: Any, *, commit: bool = True) -> Trajectory | None:
+    """Считает и сохраняет траекторию плана; вызывать после изменения режима или старта плана."""
+    plan = plan_inputs(user)
+    if plan is None:
+        return None
+    trajectory = trajectory_for(plan)
+    await crud.upsert_weight_plan_trajectories(
+        session, [(user.telegram_id, plan.key, trajectory.to_bytes())], commit=commit
+    )
+    return trajectory
+
+
+async def load_plan_trajectory(session: AsyncSession, user: Any, *, commit: bool = True) -> Trajectory | None:
+    """Сохранённая траектория плана; устаревшая или отсутствующая пересчитывается."""
+    plan = plan_inputs(user)
+    if plan is None:
+        return None
+    row = await crud.get_weight_plan_trajectory(session, user.telegram_id)
+    if row is not None and row.inputs_key == plan.key:
+        return Trajectory.from_bytes(row.weights)
+    return await save_plan_trajectory(session, user, commit=commit)
+
+
+async def expected_weight_on(session: AsyncSession, user: Any, check_date: datetime) -> float | None:
+    trajectory = await load_plan_trajectory(session, user)
+    if trajectory is None:
+        return None
+    return trajectory.expected_weight((check_date.date() - user.weight_plan_start_date.date()).days)
+
+
+async def refresh_plan_trajectories(session: AsyncSession, users: Sequence[Any], *, commit: bool = True) -> int:
+    """Пересчитывает пачкой (NumPy) отсутствующие и устаревшие траектории; возвращает их число."""
+    plans = {user.telegram_id: plan for user in users if (plan := plan_inputs(user)) is not None}
+    stored = await crud.get_weight_plan_trajectory_keys(session, list(plans))
+    stale = [(tid, plan) for tid, plan in plans.items() if stored.get(tid) != plan.key]
+    if not stale:
+        return 0
+    weights = simulate_batch([plan for _, plan in stale])
+    rows = [
+        (tid, plan.key, Trajectory(values).to_bytes()) for (tid, plan), values in zip(stale, weights)
+    ]
+    await crud.upsert_weight_plan_trajectories(session, rows, commit=commit)
+    return len(rows)
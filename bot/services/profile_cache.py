@@ -0,0 +1,119 @@
+"""Кэш профилей пользователей в памяти процесса.
+
+Профиль читают почти все обработчики и инструменты агента, часто несколько раз за одно
+сообщение. Кэш хранит неизменяемые снимки (UserProfile) с TTL и вытеснением по LRU;
+код, меняющий users, после commit вызывает invalidate(). Отсутствие пользователя тоже
+кэшируется — /start сбрасывает запись при создании профиля.
+
+invalidate() действует только в своём процессе: при SHARED_DEPLOYMENT кэш выключен
+(ttl_s=0), иначе другой процесс до TTL видел бы, например, старый часовой пояс и
+записывал приёмы пищи не в тот день daily_nutrition.
+"""
+
+from __future__ import annotations
+
+import time
+from collections import OrderedDict
+from collections.abc import Callable
+from dataclasses import dataclass, fields
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from bot.database import crud
+from bot.database.models import User
+
+DEFAULT_TTL_S = 60.0
+DEFAULT_MAX_ENTRIES = 10_000
+
+
+@dataclass(frozen=True, slots=True)
+class UserProfile:
+    telegram_id: int
+    username: str | None
+    gender: str
+    age: int
+    height_cm: float
+    weight_start_kg: float
+    activity_level: str
+    goal: str
+    target_weight_kg: float | None
+    weight_plan_mode: str | None
+    weight_plan_start_date: datetime | None
+    weight_plan_start_kg: float | None
+    timezone: str | None
+    daily_water_target_ml: int | None
+    meal_reminder_times: str | None
+    daily_calories_target: float
+    daily_protein_target: float
+    daily_fat_target: float
+    daily_carbs_target: float
+
+    @classmethod
+    def from_user(cls, user: User) -> UserProfile:
+        return cls(**{f.name: getattr(user, f.name) for f in fields(cls)})
+
+
+class UserProfileCache:
+    def __init__(
+        self,
+        sessionmaker: async_sessionmaker,
+        *,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.sessionmaker = sessionmaker
+        self.ttl_s = ttl_s
+        self.max_entries = max(1, max_entries)
+        self.hits = 0
+        self.misses = 0
+        self._clock = clock
+        # telegram_id -> (момент истечения, снимок или None для незарегистрированных)
+        self._entries: OrderedDict[int, tuple[float, UserProfile | None]] = OrderedDict()
+        # Растёт при каждой инвалидации: загрузка, начатая до неё, результат не кэширует.
+        self._generation = 0
+
+    @classmethod
+    def uncached(cls, sessionmaker: async_sessionmaker) -> UserProfileCache:
+        """Без общего кэша (тесты, отдельные скрипты): профиль читается из БД при каждом вызове."""
+        return cls(sessionmaker, ttl_s=0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, telegram_id: int, session: AsyncSession | None = None) -> UserProfile | None:
+        """Снимок профиля; при промахе читает users в переданной сессии или в новой."""
+        now = self._clock()
+        entry = self._entries.get(telegram_id)
+        if entry is not None:
+            if entry[0] > now:
+                self.hits += 1
+                self._entries.move_to_end(telegram_id)
+                return entry[1]
+            del self._entries[telegram_id]
+        self.misses += 1
+        generation = self._generation
+        if session is not None:
+            user = await crud.get_user(session, telegram_id)
+        else:
+            async with self.sessionmaker() as own_session:
+                user = await crud.get_user(own_session, telegram_id)
+        profile = UserProfile.from_user(user) if user is not None else None
+        if generation == self._generation and self.ttl_s > 0:
+            self._store(telegram_id, profile, now)
+        return profile
+
+    def invalidate(self, telegram_id: int) -> None:
+        self._generation += 1
+        self._entries.pop(telegram_id, None)
+
+    def clear(self) -> None:
+        self._generation += 1
+        self._entries.clear()
+
+    def _store(self, telegram_id: int, profile: UserProfile | None, now: float) -> None:
+        self._entries[telegram_id] = (now + self.ttl_s, profile)
+        self._entries.move_to_end(telegram_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,129 @@
+"""Индекс расписания: какие пользователи ждут почасовую задачу в текущем UTC-слоте недели.
+
+Слот — weekday * 24 + hour по UTC (0..167). Строки user_schedule_slots считаются по текущему
+UTC-смещению часового пояса пользователя и действительны до ближайшего перехода на летнее/зимнее
+время (users.schedule_valid_until). Смена timezone или meal_reminder_times обнуляет этот срок,
+и пользователь пересчитывается на ближайшем тике.
+"""
+
+from __future__ import annotations
+
+import math
+from datetime import UTC, datetime, timedelta, tzinfo
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database import crud
+
+MEAL_REMINDER = "meal_reminder"
+WEEKLY_COACHING = "weekly_coaching"
+
+SLOTS_PER_WEEK = 7 * 24
+# Час, в который send_meal_reminders проверяет недобор калорий.
+MEAL_SUMMARY_HOUR = 21
+WEEKLY_COACHING_WEEKDAY = 6
+WEEKLY_COACHING_HOUR = 20
+DEFAULT_REMINDER_HOURS = frozenset({9, 13, 19})
+# Для поясов без переходов индекс всё равно перепроверяется раз в год.
+_MAX_VALIDITY = timedelta(days=366)
+
+
+def parse_reminder_hours(value: str | None) -> set[int]:
+    if not value:
+        return set(DEFAULT_REMINDER_HOURS)
+    result: set[int] = set()
+    for part in value.split(","):
+        token = part.strip()
+        if not token:
+            continue
+        if token.isdigit():
+            hour = int(token)
+            if 0 <= hour <= 23:
+                result.add(hour)
+    return result or set(DEFAULT_REMINDER_HOURS)
+
+
+def slot_for(moment: datetime) -> int:
+    """UTC-слот недели для тика; время округляется до ближайшего часа."""
+    utc = (moment.astimezone(UTC) + timedelta(minutes=30)).replace(minute=0, second=0, microsecond=0)
+    return utc.weekday() * 24 + utc.hour
+
+
+def utc_slot_for_local(weekday: int, hour: int, offset_minutes: int) -> int:
+    """Слот, в тик которого (начало UTC-часа) локальные часы показывают weekday/hour."""
+    local_minutes = weekday * 1440 + hour * 60 - offset_minutes
+    return math.ceil(local_minutes / 60) % SLOTS_PER_WEEK
+
+
+def _offset_minutes(zone: tzinfo, moment: datetime) -> int:
+    offset = moment.astimezone(zone).utcoffset() or timedelta(0)
+    return int(offset.total_seconds() // 60)
+
+
+def next_offset_change(zone: tzinfo, after: datetime) -> datetime | None:
+    """Первый момент после after, когда у пояса меняется UTC-смещение (с точностью до минуты)."""
+    start = after.astimezone(UTC).replace(second=0, microsecond=0)
+    current = _offset_minutes(zone, start)
+    for day in range(1, _MAX_VALIDITY.days + 1):
+        if _offset_minutes(zone, start + timedelta(days=day)) == current:
+            continue
+        low, high = (day - 1) * 1440, day * 1440
+        while high - low > 1:
+            middle = (low + high) // 2
+            if _offset_minutes(zone, start + timedelta(minutes=middle)) == current:
+                low = middle
+            else:
+                high = middle
+        return start + timedelta(minutes=high)
+    return None
+
+
+def _zone(timezone_name: str | None, fallback_tz: str) -> tzinfo:
+    try:
+        return ZoneInfo(timezone_name or fallback_tz)
+    except Exception:  # noqa: BLE001
+        return ZoneInfo(fallback_tz)
+
+
+def user_slots(
+    timezone_name: str | None,
+    meal_reminder_times: str | None,
+    *,
+    fallback_tz: str,
+    now: datetime,
+) -> dict[str, set[int]]:
+    offset = _offset_minutes(_zone(timezone_name, fallback_tz), now)
+    meal_hours = parse_reminder_hours(meal_reminder_times) | {MEAL_SUMMARY_HOUR}
+    return {
+        MEAL_REMINDER: {
+            utc_slot_for_local(weekday, hour, offset) for weekday in range(7) for hour in meal_hours
+        },
+        WEEKLY_COACHING: {utc_slot_for_local(WEEKLY_COACHING_WEEKDAY, WEEKLY_COACHING_HOUR, offset)},
+    }
+
+
+async def refresh_schedule_index(session: AsyncSession, *, fallback_tz: str, now: datetime) -> int:
+    """Пересчитывает слоты пользователей с устаревшим индексом. Возвращает их число."""
+    stale = await crud.get_users_with_stale_schedule(session, now)
+    if not stale:
+        return 0
+    valid_until_by_zone: dict[str | None, datetime] = {}
+    entries: list[tuple[int, dict[str, set[int]], datetime]] = []
+    for telegram_id, timezone_name, meal_reminder_times in stale:
+        if timezone_name not in valid_until_by_zone:
+            change = next_offset_change(_zone(timezone_name, fallback_tz), now)
+            valid_until_by_zone[timezone_name] = change or now + _MAX_VALIDITY
+        slots = user_slots(timezone_name, meal_reminder_times, fallback_tz=fallback_tz, now=now)
+        entries.append((telegram_id, slots, valid_until_by_zone[timezone_name]))
+    await crud.replace_schedule_slots(session, entries)
+    return len(entries)
+
+
+async def due_user_ids(
+    session: AsyncSession, kind: str, *, fallback_tz: str, now: datetime | None = None
+) -> list[int]:
+    """Пользователи, которым задача kind положена в текущем UTC-слоте."""
+    moment = now or datetime.now(tz=UTC)
+    await refresh_schedule_index(session, fallback_tz=fallback_tz, now=moment)
+    return await crud.get_scheduled_user_ids(session, kind, slot_for(moment))
@@ -10,6 +10,18 @@ from bot.database import crud
 BADGE_MILESTONES = (3, 7, 14, 30, 60, 90)
 
 
+def _checkin_flags(
+    calories: float, protein: float, cal_target: float, protein_target: float
+) -> tuple[bool, bool]:
+    calories_ok = False
+    if cal_target > 0:
+        lower = cal_target * 0.9
+        upper = cal_target * 1.1
+        calories_ok = lower <= calories <= upper
+    protein_ok = protein_target > 0 and protein >= protein_target * 0.9
+    return calories_ok, protein_ok
+
+
 async def evaluate_daily_streak_for_user(
     session: AsyncSession,
     telegram_id: int,
@@ -39,12 +51,7 @@ async def evaluate_daily_streak_for_user(
     calories = float(consumed.get("calories", 0.0))
     protein = float(consumed.get("protein_g", 0.0))
 
-    calories_ok = False
-    if cal_target > 0:
-        lower = cal_target * 0.9
-        upper = cal_target * 1.1
-        calories_ok = lower <= calories <= upper
-    protein_ok = protein_target > 0 and protein >= protein_target * 0.9
+    calories_ok, protein_ok = _checkin_flags(calories, protein, cal_target, protein_target)
 
     await crud.upsert_daily_checkin(
         session,
@@ -76,6 +83,71 @@ async def evaluate_daily_streak_for_user(
     }
 
 
+async def evaluate_daily_streaks(
+    session: AsyncSession,
+    telegram_ids: list[int],
+    *,
+    timezone: ZoneInfo,
+    target_date: date | None = None,
+) -> dict[int, dict[str, object]]:
+    """Пакетный evaluate_daily_streak_for_user для пользователей одного часового пояса.
+
+    Те же чек-ины, серии и бейджи, но фиксированное число запросов на всю пачку и один commit.
+    """
+    targets = {
+        user.telegram_id: (float(user.daily_calories_target or 0.0), float(user.daily_protein_target or 0.0))
+        for user in await crud.get_users_by_ids(session, telegram_ids)
+    }
+    found_ids = [tid for tid in telegram_ids if tid in targets]
+    checkin_day = target_date or datetime.now(tz=timezone).date()
+
+    summaries = await crud.get_meal_summaries_for_users(
+        session, found_ids, target_date=target_date, timezone=timezone
+    )
+    checkins: dict[int, dict[str, object]] = {}
+    for tid in found_ids:
+        summary = summaries[tid]
+        calories_ok, protein_ok = _checkin_flags(
+            float(summary["calories"]), float(summary["protein_g"]), *targets[tid]
+        )
+        checkins[tid] = {
+            "calories_ok": calories_ok,
+            "protein_ok": protein_ok,
+            "logged_meals": int(summary["meals_count"]),
+        }
+    await crud.upsert_daily_checkins(session, checkin_day, checkins)
+    await session.flush()
+
+    streaks = await crud.get_recent_calorie_streaks(session, found_ids, as_of=checkin_day)
+    badge_keys = [f"streak_{milestone}" for milestone in BADGE_MILESTONES]
+    earned = await crud.get_achievement_badges(session, found_ids, badge_keys)
+    new_badges: dict[int, list[str]] = {tid: [] for tid in found_ids}
+    for tid in found_ids:
+        for milestone in BADGE_MILESTONES:
+            badge_key = f"streak_{milestone}"
+            if streaks[tid] >= milestone and (tid, badge_key) not in earned:
+                new_badges[tid].append(badge_key)
+    await crud.add_achievements(
+        session, [(tid, badge_key) for tid, badges in new_badges.items() for badge_key in badges]
+    )
+    await session.commit()
+
+    results: dict[int, dict[str, object]] = {}
+    for tid in telegram_ids:
+        if tid not in targets:
+            results[tid] = {"error": "User not found"}
+            continue
+        results[tid] = {
+            "telegram_id": tid,
+            "checkin_date": checkin_day.isoformat(),
+            "calories_ok": checkins[tid]["calories_ok"],
+            "protein_ok": checkins[tid]["protein_ok"],
+            "streak_days": streaks[tid],
+            "new_badges": new_badges[tid],
+        }
+    return results
+
+
 async def get_streak_info(session: AsyncSession, telegram_id: int) -> dict[str, object]:
     streak_days = await crud.get_recent_calorie_streak(session, telegram_id)
     badges = await crud.get_user_achievements(session, telegram_id)
@@ -0,0 +1,175 @@
+"""Потоковый вывод ответа ИИ в Telegram через редактирование одного сообщения.
+
+Сначала отправляется заглушка, затем текст дописывается правками не чаще, чем позволяет
+Telegram (примерно раз в секунду в личке и реже в группах). Промежуточные правки идут
+простым текстом без незакрытых HTML-тегов, финальная — с parse_mode=HTML и запасным
+вариантом простым текстом, если разметка оказалась невалидной.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import html
+import logging
+import re
+import time
+from collections.abc import AsyncIterable, Callable
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER = "…"
+TELEGRAM_TEXT_LIMIT = 4096
+PRIVATE_EDIT_INTERVAL_S = 1.0
+GROUP_EDIT_INTERVAL_S = 3.0
+# Мелкие приросты не стоят отдельной правки: лимит на правки общий с остальными сообщениями.
+MIN_EDIT_DELTA_CHARS = 24
+FINAL_EDIT_ATTEMPTS = 3
+
+_TAG_RE = re.compile(r"<[^>]*>")
+_OPEN_TAG_TAIL_RE = re.compile(r"<[^>]*$")
+
+
+def preview_text(text: str) -> str:
+    """HTML-ответ в виде простого текста для промежуточных правок."""
+    plain = _OPEN_TAG_TAIL_RE.sub("", _TAG_RE.sub("", text))
+    return html.unescape(plain)
+
+
+def split_text(text: str, limit: int = TELEGRAM_TEXT_LIMIT) -> list[str]:
+    """Режет текст на части не длиннее limit, по возможности по переводу строки."""
+    parts: list[str] = []
+    rest = text
+    while len(rest) > limit:
+        cut = rest.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        parts.append(rest[:cut])
+        rest = rest[cut:].lstrip("\n")
+    parts.append(rest)
+    return parts
+
+
+class TelegramStreamSink:
+    def __init__(
+        self,
+        message: Message,
+        *,
+        placeholder: str = PLACEHOLDER,
+        edit_interval_s: float | None = None,
+        min_delta_chars: int = MIN_EDIT_DELTA_CHARS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.message = message
+        self.placeholder = placeholder
+        if edit_interval_s is None:
+            is_group = message.chat is not None and message.chat.type in {"group", "supergroup"}
+            edit_interval_s = GROUP_EDIT_INTERVAL_S if is_group else PRIVATE_EDIT_INTERVAL_S
+        self.edit_interval_s = edit_interval_s
+        self.min_delta_chars = min_delta_chars
+        self.edits = 0
+        self._clock = clock
+        self._sent: Message | None = None
+        self._text = ""
+        self._shown = ""
+        self._next_edit_at = 0.0
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    async def start(self) -> None:
+        self._sent = await self.message.answer(self.placeholder)
+        self._next_edit_at = self._clock() + self.edit_interval_s
+
+    async def push(self, delta: str) -> None:
+        self._text += delta
+        if self._sent is None or self._clock() < self._next_edit_at:
+            return
+        preview = preview_text(self._text)[:TELEGRAM_TEXT_LIMIT]
+        if len(preview) - len(self._shown) < self.min_delta_chars or not preview.strip():
+            return
+        await self._edit(preview)
+
+    async def finish(self, text: str | None = None) -> None:
+        """Финальная правка полным текстом (HTML); хвост сверх лимита уходит новыми сообщениями."""
+        final = text if text is not None else self._text
+        first, *rest = split_text(final)
+        if self._sent is None:
+            await self._answer_html(first)
+        else:
+            await self._final_edit(first)
+        for part in rest:
+            await self._answer_html(part)
+
+    async def fail(self, text: str) -> None:
+        if self._sent is None:
+            await self.message.answer(text)
+            return
+        await self._edit(text)
+
+    async def _final_edit(self, text: str) -> None:
+        assert self._sent is not None
+        parse_mode: str | None = "HTML"
+        for _ in range(FINAL_EDIT_ATTEMPTS):
+            try:
+                await self._sent.edit_text(text, parse_mode=parse_mode)
+                self.edits += 1
+                return
+            except TelegramRetryAfter as exc:
+                await asyncio.sleep(float(exc.retry_after))
+            except TelegramBadRequest as exc:
+                if "not modified" in str(exc):
+                    return
+                if parse_mode is None:
+                    break
+                # Модель прислала невалидную разметку — показываем как есть.
+                parse_mode = None
+        logger.warning("Final stream edit failed, sending reply as a new message")
+        await self._answer_html(text)
+
+    async def _answer_html(self, text: str) -> None:
+        try:
+            await self.message.answer(text, parse_mode="HTML")
+        except TelegramBadRequest:
+            await self.message.answer(text)
+
+    async def _edit(self, text: str) -> None:
+        assert self._sent is not None
+        try:
+            await self._sent.edit_text(text)
+            self._shown = text
+            self.edits += 1
+        except TelegramRetryAfter as exc:
+            # Правки необязательны: просто откладываем следующую.
+            self._next_edit_at = self._clock() + float(exc.retry_after)
+            return
+        except TelegramBadRequest as exc:
+            logger.debug("Stream edit rejected: %s", exc)
+        self._next_edit_at = self._clock() + self.edit_interval_s
+
+
+async def stream_reply(
+    message: Message,
+    chunks: AsyncIterable[str],
+    *,
+    error_text: str,
+    **sink_kwargs,  # noqa: ANN003
+) -> str | None:
+    """Показывает chunks в одном сообщении и возвращает итоговый текст.
+
+    Если поток оборвался ошибкой, заглушка заменяется на error_text и возвращается None.
+    """
+    sink = TelegramStreamSink(message, **sink_kwargs)
+    await sink.start()
+    try:
+        async for delta in chunks:
+            await sink.push(delta)
+    except Exception:  # noqa: BLE001
+        logger.exception("Streaming reply failed")
+        await sink.fail(error_text)
+        return None
+    await sink.finish()
+    return sink.text
@@ -0,0 +1,220 @@
+"""Режим webhook: aiohttp-сервер, проверка секрета и очередь апдейтов с пулом воркеров.
+
+Обработчик запроса только проверяет заголовок X-Telegram-Bot-Api-Secret-Token и
+кладёт апдейт в ограниченную очередь процесса; ответ Telegram уходит сразу, а апдейты
+разбирают N воркеров через Dispatcher. Так медленные обработчики (OpenAI, графики) не
+держат HTTP-запрос Telegram и не копят неограниченное число задач в памяти.
+
+Переполнение очереди (overflow):
+- reject — ответ 429 с Retry-After: Telegram повторит доставку позже, апдейт не теряется;
+- drop — ответ 200 и апдейт выбрасывается (счётчик dropped), очередь Telegram не встаёт.
+
+При остановке сервер перестаёт принимать запросы (503 — Telegram повторит доставку),
+воркеры дорабатывают очередь не дольше drain_timeout_s, остаток отменяется.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+from contextlib import suppress
+from dataclasses import dataclass
+from typing import Any
+
+from aiogram import Bot, Dispatcher
+from aiogram.methods import TelegramMethod
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+
+from bot.config import WebhookSettings
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("reject", "drop")
+RETRY_AFTER_S = 1
+
+
+@dataclass(slots=True)
+class QueueStats:
+    accepted: int = 0
+    rejected: int = 0
+    dropped: int = 0
+    processed: int = 0
+    failed: int = 0
+
+
+class UpdateQueue:
+    """Ограниченная очередь сырых апдейтов и воркеры, отдающие их в Dispatcher."""
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        *,
+        maxsize: int = 1000,
+        workers: int = 8,
+        overflow: str = "reject",
+        **data: Any,
+    ) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow!r} (expected one of {', '.join(OVERFLOW_POLICIES)})")
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.maxsize = maxsize
+        self.workers = max(1, workers)
+        self.overflow = overflow
+        self.data = data
+        self.stats = QueueStats()
+        self.accepting = False
+        self._queue: asyncio.Queue[dict[str, Any]] = asyncio.Queue(maxsize=maxsize)
+        self._tasks: list[asyncio.Task[None]] = []
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker(), name=f"webhook-worker-{i}") for i in range(self.workers)]
+        self.accepting = True
+
+    def offer(self, update: dict[str, Any]) -> bool:
+        """Кладёт апдейт в очередь без ожидания; False — очередь полна."""
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            if self.overflow == "drop":
+                self.stats.dropped += 1
+            else:
+                self.stats.rejected += 1
+            return False
+        self.stats.accepted += 1
+        return True
+
+    async def drain(self, timeout_s: float = 25.0) -> int:
+        """Перестаёт принимать апдейты, ждёт разбора очереди и останавливает воркеров.
+
+        Возвращает число апдейтов, которые не успели обработать за timeout_s.
+        """
+        self.accepting = False
+        if not self._tasks:
+            return len(self)
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout_s)
+        except TimeoutError:
+            logger.warning("Webhook queue drain timed out with %s updates left", len(self))
+        left = len(self)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return left
+
+    async def _worker(self) -> None:
+        while True:
+            update = await self._queue.get()
+            try:
+                result = await self.dispatcher.feed_raw_update(self.bot, update, **self.data)
+                if isinstance(result, TelegramMethod):
+                    await self.dispatcher.silent_call_request(self.bot, result)
+                self.stats.processed += 1
+            except Exception:
+                self.stats.failed += 1
+                logger.exception("Failed to process webhook update %s", update.get("update_id"))
+            finally:
+                self._queue.task_done()
+
+
+class QueuedRequestHandler(SimpleRequestHandler):
+    """Обработчик webhook aiogram, который вместо фоновой задачи кладёт апдейт в UpdateQueue."""
+
+    def __init__(self, queue: UpdateQueue, *, secret_token: str | None = None) -> None:
+        super().__init__(queue.dispatcher, queue.bot, handle_in_background=True, secret_token=secret_token)
+        self.queue = queue
+
+    async def handle(self, request: web.Request) -> web.Response:
+        bot = await self.resolve_bot(request)
+        if not self.verify_secret(request.headers.get("X-Telegram-Bot-Api-Secret-Token", ""), bot):
+            return web.Response(body="Unauthorized", status=401)
+        if not self.queue.accepting:
+            return web.Response(text="Shutting down", status=503, headers={"Retry-After": str(RETRY_AFTER_S)})
+        update = await request.json(loads=bot.session.json_loads)
+        if not self.queue.offer(update) and self.queue.overflow == "reject":
+            return web.Response(text="Queue is full", status=429, headers={"Retry-After": str(RETRY_AFTER_S)})
+        return web.json_response({}, dumps=bot.session.json_dumps)
+
+    __call__ = handle
+
+
+def build_webhook_app(
+    dispatcher: Dispatcher, bot: Bot, options: WebhookSettings, **data: Any
+) -> tuple[web.Application, UpdateQueue]:
+    """aiohttp-приложение с маршрутом webhook, стартом воркеров и мягкой остановкой."""
+    queue = UpdateQueue(
+        dispatcher,
+        bot,
+        maxsize=options.queue_size,
+        workers=options.workers,
+        overflow=options.overflow,
+        **data,
+    )
+    app = web.Application()
+
+    async def on_startup(_: web.Application) -> None:
+        await queue.start()
+
+    async def on_shutdown(_: web.Application) -> None:
+        left = await queue.drain(options.drain_timeout_s)
+        stats = queue.stats
+        logger.info(
+            "Webhook queue drained: processed=%s failed=%s rejected=%s dropped=%s lost=%s",
+            stats.processed, stats.failed, stats.rejected, stats.dropped, left,
+        )
+
+    app.on_startup.append(on_startup)
+    # Очередь дорабатывается до закрытия сессии бота обработчиком запроса.
+    app.on_shutdown.append(on_shutdown)
+    QueuedRequestHandler(queue, secret_token=options.secret_token).register(app, path=options.path)
+    setup_application(app, dispatcher, bot=bot, **data)
+    return app, queue
+
+
+async def run_webhook(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    options: WebhookSettings,
+    *,
+    register: bool = True,
+    reuse_port: bool = False,
+    **data: Any,
+) -> None:
+    """Поднимает сервер, регистрирует webhook в Telegram и работает до SIGINT/SIGTERM.
+
+    reuse_port=True позволяет нескольким процессам слушать один порт (SO_REUSEPORT):
+    ядро распределяет соединения Telegram между ними. register=False — webhook
+    регистрирует другой процесс.
+    """
+    app, _ = build_webhook_app(dispatcher, bot, options, **data)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, options.host, options.port, reuse_port=reuse_port or None)
+    await site.start()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        with suppress(NotImplementedError):
+            loop.add_signal_handler(sig, stop.set)
+    try:
+        if register:
+            await bot.set_webhook(
+                url=options.url.rstrip("/") + options.path,
+                secret_token=options.secret_token,
+                allowed_updates=dispatcher.resolve_used_update_types(),
+                max_connections=options.max_connections,
+            )
+        logger.info("Webhook server listening on %s:%s%s", options.host, options.port, options.path)
+        await stop.wait()
+    finally:
+        # Webhook в Telegram не снимаем: его обслуживают и другие реплики, и следующий запуск.
+        await runner.cleanup()
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
 import math
-from datetime import datetime, timedelta
-from typing import Literal
+import sys
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Any, Literal
 
 from bot.services.nutrition import ACTIVITY_MULTIPLIERS, calculate_bmr
 
@@ -17,6 +22,8 @@ MIN_CALORIES: dict[Gender, float] = {"female": 1200.0, "male": 1500.0}
 
 # 5 лет — достаточно даже для лайт-режима при большой разнице в весе
 _MAX_FORECAST_WEEKS = 560
+# Меняется вместе с моделью прогноза: сохранённые траектории со старой версией пересчитываются.
+FORECAST_VERSION = 1
 
 
 def _resolve_direction(current_weight: float, target_weight: float) -> GoalDirection:
@@ -37,15 +44,98 @@ def _calorie_floor(gender: str) -> float:
     return MIN_CALORIES["female"] if gender == "female" else MIN_CALORIES["male"]
 
 
-def build_weight_forecast(
-    current_weight: float,
-    target_weight: float,
-    gender: str,
-    age: int,
-    height_cm: float,
-    activity_level: str,
-    mode: str,
-) -> list[dict]:
+@dataclass(frozen=True, slots=True)
+class PlanInputs:
+    """Всё, от чего зависят веса прогноза (дата старта сдвигает только даты)."""
+
+    start_kg: float
+    target_kg: float
+    gender: str
+    age: int
+    height_cm: float
+    activity_level: str
+    mode: str
+
+    @classmethod
+    def normalized(
+        cls,
+        current_weight: float,
+        target_weight: float,
+        gender: str,
+        age: int,
+        height_cm: float,
+        activity_level: str,
+        mode: str,
+    ) -> PlanInputs:
+        """Неизвестные режим и активность заменяются значениями по умолчанию, как в прогнозе."""
+        return cls(
+            start_kg=float(current_weight),
+            target_kg=float(target_weight),
+            gender=gender,
+            age=int(age),
+            height_cm=float(height_cm),
+            activity_level=activity_level if activity_level in ACTIVITY_MULTIPLIERS else "moderate",
+            mode=mode if mode in {"light", "medium", "hard"} else "medium",
+        )
+
+    @property
+    def key(self) -> str:
+        """Отпечаток входных данных для сохранённой траектории (repr float точен)."""
+        return (
+            f"v{FORECAST_VERSION}|{self.start_kg!r}|{self.target_kg!r}|{self.gender}|{self.age}|"
+            f"{self.height_cm!r}|{self.activity_level}|{self.mode}"
+        )
+
+
+@dataclass(frozen=True, slots=True)
+class Trajectory:
+    """Понедельные веса прогноза (индекс — номер недели), округлённые до 0.01 кг.
+
+    Массив общий для всех, кто получил траекторию из кэша, — не изменять.
+    """
+
+    weights: array
+
+    def __len__(self) -> int:
+        return len(self.weights)
+
+    def expected_weight(self, days: int) -> float:
+        """Ожидаемый вес через days дней от старта: линейно между недельными точками."""
+        days = max(0, days)
+        week_idx = days // 7
+        last = len(self.weights) - 1
+        if week_idx > last:
+            return self.weights[last]
+        if days % 7 == 0 or week_idx == last:
+            return self.weights[week_idx]
+        left = self.weights[week_idx]
+        right = self.weights[week_idx + 1]
+        return round(left + (right - left) * ((days % 7) / 7.0), 2)
+
+    def to_bytes(self) -> bytes:
+        """float64 little-endian подряд — для хранения в БД без потери точности."""
+        if sys.byteorder == "little":
+            return self.weights.tobytes()
+        swapped = array("d", self.weights)
+        swapped.byteswap()
+        return swapped.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> Trajectory:
+        weights = array("d")
+        weights.frombytes(data)
+        if sys.byteorder != "little":
+            weights.byteswap()
+        return cls(weights)
+
+    def to_forecast(self, start_date: date) -> list[dict]:
+        return [
+            {"week": week, "date": (start_date + timedelta(days=7 * week)).isoformat(), "weight_kg": weight}
+            for week, weight in enumerate(self.weights)
+        ]
+
+
+def _simulate(plan: PlanInputs) -> array:
     """
     Понедельный прогноз веса.
 
@@ -55,36 +145,25 @@ def build_weight_forecast(
     - После 8 недель применяется адаптивный термогенез: эффективный TDEE снижается
       до −5% от расчётного, что немного уменьшает реальный дефицит.
     - Минимальный калораж: 1200 ккал (ж) / 1500 ккал (м).
-    - Прогноз продолжается до достижения цели (не более 260 недель).
+    - Прогноз продолжается до достижения цели (не более 560 недель).
     """
-    direction = _resolve_direction(current_weight, target_weight)
+    direction = _resolve_direction(plan.start_kg, plan.target_kg)
+    weight = plan.start_kg
+    result = array("d", [round(weight, 2)])
     if direction == "maintain":
-        today = datetime.now().date()
-        return [{"week": 0, "date": today.isoformat(), "weight_kg": round(current_weight, 2)}]
-
-    mode_typed: Mode = mode if mode in {"light", "medium", "hard"} else "medium"
-    activity_typed: ActivityLevel = (
-        activity_level if activity_level in ACTIVITY_MULTIPLIERS else "moderate"
-    )
-
-    distance_total = abs(current_weight - target_weight)
-    if distance_total < 0.01:
-        today = datetime.now().date()
-        return [{"week": 0, "date": today.isoformat(), "weight_kg": round(current_weight, 2)}]
-
-    base_delta = _base_delta_kcal(direction, mode_typed)
-    floor_kcal = _calorie_floor(gender)
+        return result
 
-    weight = float(current_weight)
-    date_cursor = datetime.now().date()
-    result = [{"week": 0, "date": date_cursor.isoformat(), "weight_kg": round(weight, 2)}]
+    target_weight = plan.target_kg
+    base_delta = _base_delta_kcal(direction, plan.mode)  # type: ignore[arg-type]
+    floor_kcal = _calorie_floor(plan.gender)
+    multiplier = ACTIVITY_MULTIPLIERS[plan.activity_level]  # type: ignore[index]
 
     for week in range(1, _MAX_FORECAST_WEEKS + 1):
         if abs(weight - target_weight) <= 0.05:
             break
 
-        bmr = calculate_bmr(gender=gender, age=age, height_cm=height_cm, weight_kg=weight)  # type: ignore[arg-type]
-        tdee = bmr * ACTIVITY_MULTIPLIERS[activity_typed]
+        bmr = calculate_bmr(gender=plan.gender, age=plan.age, height_cm=plan.height_cm, weight_kg=weight)  # type: ignore[arg-type]
+        tdee = bmr * multiplier
 
         # Адаптивный термогенез: после 8 недель дефицита тело экономит до 5% энергии.
         if week > 8 and direction == "lose":
@@ -113,12 +192,151 @@ def build_weight_forecast(
             next_weight = target_weight
 
         weight = next_weight
-        date_cursor += timedelta(days=7)
-        result.append({"week": week, "date": date_cursor.isoformat(), "weight_kg": round(weight, 2)})
+        result.append(round(weight, 2))
 
     return result
 
 
+# Траектории по входным данным прогноза, LRU.
+_TRAJECTORIES: OrderedDict[PlanInputs, Trajectory] = OrderedDict()
+FORECAST_CACHE_SIZE = 4096
+
+
+def _cache_put(plan: PlanInputs, trajectory: Trajectory) -> None:
+    _TRAJECTORIES[plan] = trajectory
+    _TRAJECTORIES.move_to_end(plan)
+    while len(_TRAJECTORIES) > FORECAST_CACHE_SIZE:
+        _TRAJECTORIES.popitem(last=False)
+
+
+def clear_forecast_cache() -> None:
+    _TRAJECTORIES.clear()
+
+
+def trajectory_for(plan: PlanInputs) -> Trajectory:
+    trajectory = _TRAJECTORIES.get(plan)
+    if trajectory is not None:
+        _TRAJECTORIES.move_to_end(plan)
+        return trajectory
+    trajectory = Trajectory(_simulate(plan))
+    _cache_put(plan, trajectory)
+    return trajectory
+
+
+def forecast_trajectory(
+    current_weight: float,
+    target_weight: float,
+    gender: str,
+    age: int,
+    height_cm: float,
+    activity_level: str,
+    mode: str,
+) -> Trajectory:
+    """Траектория прогноза из кэша; при промахе считается один раз."""
+    return trajectory_for(
+        PlanInputs.normalized(current_weight, target_weight, gender, age, height_cm, activity_level, mode)
+    )
+
+
+def build_weight_forecast(
+    current_weight: float,
+    target_weight: float,
+    gender: str,
+    age: int,
+    height_cm: float,
+    activity_level: str,
+    mode: str,
+    start_date: date | None = None,
+) -> list[dict]:
+    """Понедельный прогноз веса списком {week, date, weight_kg} от start_date (по умолчанию сегодня)."""
+    trajectory = forecast_trajectory(current_weight, target_weight, gender, age, height_cm, activity_level, mode)
+    return trajectory.to_forecast(start_date or datetime.now().date())
+
+
+_BATCH_CHUNK = 2048
+
+
+def simulate_batch(plans: Sequence[PlanInputs]) -> list[array]:
+    """Те же прогнозы, что _simulate, одним векторным проходом NumPy по всем планам.
+
+    Шаг недели считается для всей пачки сразу, порядок операций совпадает с
+    поштучным циклом, поэтому веса совпадают бит в бит, включая округление до 0.01.
+    Пачка режется на куски по _BATCH_CHUNK, чтобы матрица недель не росла без предела.
+    """
+    import numpy as np
+
+    results: list[array] = [array("d") for _ in plans]
+    pending: list[int] = []
+    for i, plan in enumerate(plans):
+        if _resolve_direction(plan.start_kg, plan.target_kg) == "maintain":
+            results[i].append(round(plan.start_kg, 2))
+        else:
+            pending.append(i)
+
+    for offset in range(0, len(pending), _BATCH_CHUNK):
+        chunk = [plans[i] for i in pending[offset : offset + _BATCH_CHUNK]]
+        size = len(chunk)
+        weight = np.array([p.start_kg for p in chunk], dtype=np.float64)
+        target = np.array([p.target_kg for p in chunk], dtype=np.float64)
+        height = np.array([p.height_cm for p in chunk], dtype=np.float64)
+        age = np.array([5 * p.age for p in chunk], dtype=np.float64)
+        sex = np.array([5.0 if p.gender == "male" else -161.0 for p in chunk])
+        multiplier = np.array([ACTIVITY_MULTIPLIERS[p.activity_level] for p in chunk])  # type: ignore[index]
+        lose = target < weight
+        base_delta = np.array(
+            [_base_delta_kcal("lose" if lose[j] else "gain", p.mode) for j, p in enumerate(chunk)]  # type: ignore[arg-type]
+        )
+        floor_kcal = np.array([_calorie_floor(p.gender) for p in chunk])
+
+        history = np.empty((_MAX_FORECAST_WEEKS + 1, size), dtype=np.float64)
+        history[0] = weight
+        lengths = np.full(size, _MAX_FORECAST_WEEKS + 1)
+        active = np.ones(size, dtype=bool)
+        for week in range(1, _MAX_FORECAST_WEEKS + 1):
+            finished = active & (np.abs(weight - target) <= 0.05)
+            lengths[finished] = week
+            active &= ~finished
+            if not active.any():
+                break
+
+            tdee = (10 * weight + 6.25 * height - age + sex) * multiplier
+            if week > 8:
+                adapt_reduction = min(0.05, 0.005 * (week - 8))
+                effective_tdee = np.where(lose, tdee * (1.0 - adapt_reduction), tdee)
+            else:
+                effective_tdee = tdee
+            calories_target = np.maximum(effective_tdee + base_delta, floor_kcal)
+            weekly_change = ((calories_target - effective_tdee) * 7.0) / 7700.0
+            weekly_change = np.where(lose, np.minimum(0.0, weekly_change), np.maximum(0.0, weekly_change))
+            next_weight = weight + weekly_change
+            next_weight = np.where(lose & (next_weight < target), target, next_weight)
+            next_weight = np.where(~lose & (next_weight > target), target, next_weight)
+            weight = np.where(active, next_weight, weight)
+            history[week] = weight
+
+        rounded = _round2(history[: int(lengths.max())])
+        for j, i in enumerate(pending[offset : offset + _BATCH_CHUNK]):
+            results[i].extend(rounded[: lengths[j], j].tolist())
+    return results
+
+
+def _round2(values: Any) -> Any:
+    """round(x, 2) для массива NumPy с тем же результатом, что у встроенного round.
+
+    rint(x * 100) / 100 даёт ближайший double к k/100, как и round, если только x * 100
+    не лежит у середины между сотыми (там сказывается погрешность умножения) — такие
+    значения досчитываются встроенным round.
+    """
+    import numpy as np
+
+    scaled = values * 100.0
+    rounded = np.rint(scaled) / 100.0
+    near_half = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    for idx in zip(*np.nonzero(near_half)):
+        rounded[idx] = round(float(values[idx]), 2)
+    return rounded
+
+
 def calculate_plan_targets(
     current_weight: float,
     target_weight: float,
@@ -179,7 +397,7 @@ def get_expected_weight_for_date(
     activity_level: str,
     check_date: datetime,
 ) -> float:
-    forecast = build_weight_forecast(
+    trajectory = forecast_trajectory(
         current_weight=plan_start_kg,
         target_weight=target_weight,
         gender=gender,
@@ -188,19 +406,7 @@ def get_expected_weight_for_date(
         activity_level=activity_level,
         mode=mode,
     )
-    days_delta = max(0, (check_date.date() - plan_start_date.date()).days)
-    week_idx = days_delta // 7
-    if week_idx >= len(forecast):
-        return float(forecast[-1]["weight_kg"])
-
-    if days_delta % 7 == 0 or week_idx == len(forecast) - 1:
-        return float(forecast[week_idx]["weight_kg"])
-
-    left = forecast[week_idx]
-    right = forecast[week_idx + 1]
-    ratio = (days_delta % 7) / 7.0
-    interpolated = float(left["weight_kg"]) + (float(right["weight_kg"]) - float(left["weight_kg"])) * ratio
-    return round(interpolated, 2)
+    return trajectory.expected_weight((check_date.date() - plan_start_date.date()).days)
 
 
 def compare_progress(
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from typing import Any
+
+from bot.services.food_db import FoodTable, default_food_table
+
+
+def food_tools_schema() -> list[dict[str, Any]]:
+    return [
+        {
+            "type": "function",
+            "function": {
+                "name": "lookup_food",
+                "description": (
+                    "Ищет продукты в локальном справочнике КБЖУ (значения на 100 г и размер штуки). "
+                    "Можно передать одну позицию или список с количеством, например «200г курицы, 150 г риса» — "
+                    "тогда для каждой позиции посчитано КБЖУ порции. Используй для простых продуктов, "
+                    "чтобы не оценивать КБЖУ на глаз."
+                ),
+                "parameters": {
+                    "type": "object",
+                    "properties": {
+                        "query": {"type": "string", "description": "Продукт или список продуктов с граммовками"},
+                    },
+                    "required": ["query"],
+                },
+            },
+        },
+    ]
+
+
+def food_tool_handlers(table: FoodTable | None = None) -> dict[str, Any]:
+    foods = table if table is not None else default_food_table()
+
+    async def lookup_food(args: dict[str, Any]) -> dict[str, Any]:
+        resolution = foods.resolve_meal(str(args["query"]))
+        items: list[dict[str, Any]] = []
+        for resolved in resolution.items:
+            candidates = foods.lookup(resolved.item.text)
+            items.append(
+                {
+                    "query": resolved.item.text,
+                    "grams": resolved.grams,
+                    "pieces": resolved.item.pieces,
+                    "nutrients": resolved.nutrients,
+                    "matches": [
+                        {
+                            "name": foods.name(match.food_id),
+                            "confidence": match.confidence,
+                            "per_100g": foods.per_100g(match.food_id),
+                            "piece_g": foods.piece_g(match.food_id),
+                        }
+                        for match in candidates
+                    ],
+                }
+            )
+        result: dict[str, Any] = {"items": items, "confident": resolution.confident}
+        if resolution.confident:
+            result["totals"] = resolution.totals()
+        return result
+
+    return {"lookup_food": lookup_food}
@@ -7,13 +7,14 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import crud
-from bot.services.chart import render_three_scenarios_chart, render_weight_plan_chart
+from bot.services.chart_renderer import ChartRenderer
 from bot.services.pending_media import PendingPhoto, add_pending_photo
+from bot.services.plan_trajectory import load_plan_trajectory, save_plan_trajectory
+from bot.services.profile_cache import UserProfileCache
 from bot.services.weight_plan import (
     build_weight_forecast,
     calculate_plan_targets,
     compare_progress,
-    get_expected_weight_for_date,
 )
 
 _MODES = ("light", "medium", "hard")
@@ -23,6 +24,7 @@ def goal_tools_schema() -> list[dict[str, Any]]:
     return [
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "set_weight_goal",
                 "description": "Устанавливает целевой вес и показывает 3 сценария (лайт/медиум/хард).",
@@ -38,6 +40,7 @@ def goal_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "select_weight_plan_mode",
                 "description": "Выбирает режим плана (light/medium/hard), фиксирует старт плана и пересчитывает КБЖУ.",
@@ -77,6 +80,7 @@ def goal_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "adjust_plan_targets",
                 "description": "Корректирует план КБЖУ при отставании от графика в безопасных пределах.",
@@ -108,7 +112,17 @@ def goal_tools_schema() -> list[dict[str, Any]]:
     ]
 
 
-def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
+def goal_tool_handlers(
+    sessionmaker: async_sessionmaker,
+    *,
+    profiles: UserProfileCache | None = None,
+    charts: ChartRenderer | None = None,
+) -> dict[str, Any]:
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
+
+    if charts is None:
+        charts = ChartRenderer(workers=0)
     async def set_weight_goal(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         target_weight = float(args["target_weight_kg"])
@@ -129,6 +143,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             user.target_weight_kg = target_weight
             user.goal = direction
             await session.commit()
+            profiles.invalidate(tid)
 
             scenarios: dict[str, dict[str, Any]] = {}
             forecasts: dict[str, list[dict]] = {}
@@ -154,7 +169,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
                 scenarios[mode] = plan
                 forecasts[mode] = forecast
 
-        chart = render_three_scenarios_chart(
+        chart = await charts.three_scenarios(
             forecasts=forecasts,
             current_weight=current_weight,
             target_weight=target_weight,
@@ -169,7 +184,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
         add_pending_photo(
             tid,
             PendingPhoto(
-                content=chart.getvalue(),
+                content=chart,
                 filename="weight_scenarios.png",
                 caption="Сравнение режимов достижения цели. Выбери режим кнопками ниже.",
                 keyboard=keyboard,
@@ -230,7 +245,9 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             user.daily_protein_target = float(targets["daily_protein"])
             user.daily_fat_target = float(targets["daily_fat"])
             user.daily_carbs_target = float(targets["daily_carbs"])
+            await save_plan_trajectory(session, user, commit=False)
             await session.commit()
+            profiles.invalidate(tid)
 
             actual_logs = await crud.get_weight_logs(session, tid, limit=90)
 
@@ -242,7 +259,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             for x in reversed(actual_logs)
             if x.logged_at is not None
         ]
-        chart = render_weight_plan_chart(
+        chart = await charts.weight_plan(
             forecast=forecast,
             actual_weights=actual_weights,
             target_weight=target_weight,
@@ -251,7 +268,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
         add_pending_photo(
             tid,
             PendingPhoto(
-                content=chart.getvalue(),
+                content=chart,
                 filename="weight_plan.png",
                 caption=f"Твой персональный план ({mode}).",
             ),
@@ -273,7 +290,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
     async def get_weight_plan_status(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found. Сначала пройди /start."}
             if (
@@ -289,17 +306,10 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
                 return {"error": "Нет замеров веса. Отправь вес через /weight."}
 
             now = datetime.now(tz=UTC)
-            expected = get_expected_weight_for_date(
-                plan_start_date=user.weight_plan_start_date,
-                plan_start_kg=float(user.weight_plan_start_kg),
-                target_weight=float(user.target_weight_kg),
-                mode=user.weight_plan_mode,
-                gender=user.gender,
-                age=user.age,
-                height_cm=user.height_cm,
-                activity_level=user.activity_level,
-                check_date=now,
-            )
+            days_elapsed = max(0, (now.date() - user.weight_plan_start_date.date()).days)
+            trajectory = await load_plan_trajectory(session, user)
+            assert trajectory is not None  # план проверен выше
+            expected = trajectory.expected_weight(days_elapsed)
             actual = float(latest.weight_kg)
             compare = compare_progress(
                 expected_kg=expected,
@@ -308,17 +318,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
                 current_weight=float(user.weight_plan_start_kg),
             )
 
-            days_elapsed = max(0, (now.date() - user.weight_plan_start_date.date()).days)
-            forecast = build_weight_forecast(
-                current_weight=float(user.weight_plan_start_kg),
-                target_weight=float(user.target_weight_kg),
-                gender=user.gender,
-                age=user.age,
-                height_cm=user.height_cm,
-                activity_level=user.activity_level,
-                mode=user.weight_plan_mode,
-            )
-            days_remaining = max(0, len(forecast) * 7 - days_elapsed)
+            days_remaining = max(0, len(trajectory) * 7 - days_elapsed)
 
             total_distance = abs(float(user.weight_plan_start_kg) - float(user.target_weight_kg))
             done_distance = abs(float(user.weight_plan_start_kg) - actual)
@@ -340,7 +340,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
     async def get_weight_plan_forecast(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found. Сначала пройди /start."}
             if user.target_weight_kg is None:
@@ -411,7 +411,9 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             user.daily_protein_target = float(targets["daily_protein"])
             user.daily_fat_target = float(targets["daily_fat"])
             user.daily_carbs_target = float(targets["daily_carbs"])
+            await save_plan_trajectory(session, user, commit=False)
             await session.commit()
+            profiles.invalidate(tid)
 
         return {
             "ok": True,
@@ -430,7 +432,7 @@ def goal_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             focus = "general"
 
         async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found. Сначала пройди /start."}
             latest = await crud.get_latest_weight(session, tid)
@@ -6,13 +6,17 @@ from typing import Any
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import crud
+from bot.database.connection import unit_of_work
+from bot.services.meal_cache import record_logged_meal
 from bot.services.nutrition import summarize_progress
+from bot.services.profile_cache import UserProfileCache
 
 
 def meal_tools_schema() -> list[dict[str, Any]]:
     return [
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "add_meal",
                 "description": "Добавляет прием пищи. Возвращает daily_summary с текущим потреблением и целями.",
@@ -67,6 +71,7 @@ def meal_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "delete_meal",
                 "description": "Удаляет прием пищи по id. Используй get_meals_today чтобы узнать id нужного приема.",
@@ -79,6 +84,7 @@ def meal_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "update_meal",
                 "description": (
@@ -102,12 +108,20 @@ def meal_tools_schema() -> list[dict[str, Any]]:
     ]
 
 
-def meal_tool_handlers(sessionmaker: async_sessionmaker, *, timezone_name: str = "UTC") -> dict[str, Any]:
+def meal_tool_handlers(
+    sessionmaker: async_sessionmaker,
+    *,
+    timezone_name: str = "UTC",
+    profiles: UserProfileCache | None = None,
+) -> dict[str, Any]:
     tz = ZoneInfo(timezone_name)
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
 
     async def add_meal(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
-        async with sessionmaker() as session:
+        async with unit_of_work(sessionmaker) as session:
+            user = await profiles.get(tid, session)
             row = await crud.add_meal_log(
                 session=session,
                 telegram_id=tid,
@@ -117,9 +131,11 @@ def meal_tool_handlers(sessionmaker: async_sessionmaker, *, timezone_name: str =
                 fat_g=float(args["fat_g"]),
                 carbs_g=float(args["carbs_g"]),
                 meal_type=str(args.get("meal_type", "snack")),
+                zone=crud.rollup_timezone_of(user.timezone if user is not None else None),
+                commit=False,
             )
-            user = await crud.get_user(session, tid)
             consumed = await crud.get_meal_summary_for_day(session, tid, timezone=tz)
+        record_logged_meal(args)
 
         result: dict[str, Any] = {"ok": True, "meal_id": row.id}
         if user is not None:
@@ -163,7 +179,7 @@ def meal_tool_handlers(sessionmaker: async_sessionmaker, *, timezone_name: str =
     async def get_today_summary(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found"}
             consumed = await crud.get_meal_summary_for_day(session, tid, timezone=tz)
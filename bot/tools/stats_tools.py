@@ -1,11 +1,12 @@
 from __future__ import annotations
 
-from datetime import UTC, datetime, timedelta
+from datetime import UTC, date, datetime, timedelta
 from typing import Any
 
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import crud
+from bot.services.profile_cache import UserProfileCache
 
 
 def stats_tools_schema() -> list[dict[str, Any]]:
@@ -51,13 +52,26 @@ def stats_tools_schema() -> list[dict[str, Any]]:
     ]
 
 
-def stats_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
+def _parse_day(value: Any) -> date | datetime:
+    """Дата без времени — локальная дата пользователя; с временем — момент."""
+    text = str(value)
+    return date.fromisoformat(text) if len(text) == 10 else datetime.fromisoformat(text)
+
+
+def stats_tool_handlers(
+    sessionmaker: async_sessionmaker,
+    *,
+    profiles: UserProfileCache | None = None,
+) -> dict[str, Any]:
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
+
     async def get_stats(args: dict[str, Any]) -> dict[str, Any]:
         period = str(args.get("period", "week"))
         now = datetime.now(tz=UTC)
         if "date_from" in args and "date_to" in args:
-            start = datetime.fromisoformat(str(args["date_from"]))
-            end = datetime.fromisoformat(str(args["date_to"]))
+            start = _parse_day(args["date_from"])
+            end = _parse_day(args["date_to"])
         elif period == "day":
             start = now - timedelta(days=1)
             end = now
@@ -80,43 +94,12 @@ def stats_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
         start = end - timedelta(days=days)
 
         async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found"}
             meals = await crud.get_meals_for_period(session, tid, start, end)
             averages = await crud.get_daily_avg_stats(session, tid, start, end)
-
-        daily_map: dict[str, dict[str, float]] = {}
-        for meal in meals:
-            if meal.logged_at is None:
-                continue
-            day_key = meal.logged_at.astimezone(UTC).date().isoformat()
-            if day_key not in daily_map:
-                daily_map[day_key] = {
-                    "calories": 0.0,
-                    "protein_g": 0.0,
-                    "fat_g": 0.0,
-                    "carbs_g": 0.0,
-                    "meals_count": 0.0,
-                }
-            daily_map[day_key]["calories"] += float(meal.calories)
-            daily_map[day_key]["protein_g"] += float(meal.protein_g)
-            daily_map[day_key]["fat_g"] += float(meal.fat_g)
-            daily_map[day_key]["carbs_g"] += float(meal.carbs_g)
-            daily_map[day_key]["meals_count"] += 1.0
-
-        daily_totals = []
-        for day, totals in sorted(daily_map.items()):
-            daily_totals.append(
-                {
-                    "date": day,
-                    "calories": round(totals["calories"], 1),
-                    "protein_g": round(totals["protein_g"], 1),
-                    "fat_g": round(totals["fat_g"], 1),
-                    "carbs_g": round(totals["carbs_g"], 1),
-                    "meals_count": int(totals["meals_count"]),
-                }
-            )
+            daily_totals = await crud.get_daily_totals(session, tid, start, end)
 
         all_meals = [
             {
@@ -5,6 +5,7 @@ from typing import Any
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import crud
+from bot.services.profile_cache import UserProfileCache
 from bot.services.streaks import get_streak_info
 
 
@@ -25,11 +26,18 @@ def streak_tools_schema() -> list[dict[str, Any]]:
     ]
 
 
-def streak_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
+def streak_tool_handlers(
+    sessionmaker: async_sessionmaker,
+    *,
+    profiles: UserProfileCache | None = None,
+) -> dict[str, Any]:
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
+
     async def _get_streak_info(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found"}
             info = await get_streak_info(session, tid)
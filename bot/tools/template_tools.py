@@ -5,13 +5,16 @@ from typing import Any
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import crud
+from bot.database.connection import unit_of_work
 from bot.services.nutrition import summarize_progress
+from bot.services.profile_cache import UserProfileCache
 
 
 def template_tools_schema() -> list[dict[str, Any]]:
     return [
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "save_meal_template",
                 "description": "Сохраняет блюдо в избранные шаблоны пользователя.",
@@ -53,6 +56,7 @@ def template_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "use_meal_template",
                 "description": "Создает запись приема пищи из выбранного шаблона.",
@@ -68,6 +72,7 @@ def template_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "delete_meal_template",
                 "description": "Удаляет шаблон блюда из избранного по id.",
@@ -84,7 +89,14 @@ def template_tools_schema() -> list[dict[str, Any]]:
     ]
 
 
-def template_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
+def template_tool_handlers(
+    sessionmaker: async_sessionmaker,
+    *,
+    profiles: UserProfileCache | None = None,
+) -> dict[str, Any]:
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
+
     async def save_meal_template(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         async with sessionmaker() as session:
@@ -125,10 +137,11 @@ def template_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
     async def use_meal_template(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         template_id = int(args["template_id"])
-        async with sessionmaker() as session:
+        async with unit_of_work(sessionmaker) as session:
             tpl = await crud.get_meal_template_by_id(session, tid, template_id)
             if tpl is None:
                 return {"error": "Template not found"}
+            user = await profiles.get(tid, session)
             await crud.add_meal_log(
                 session=session,
                 telegram_id=tid,
@@ -138,9 +151,10 @@ def template_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
                 fat_g=float(tpl.fat_g),
                 carbs_g=float(tpl.carbs_g),
                 meal_type=tpl.meal_type,
+                zone=crud.rollup_timezone_of(user.timezone if user is not None else None),
+                commit=False,
             )
-            await crud.increment_meal_template_usage(session, tid, template_id)
-            user = await crud.get_user(session, tid)
+            await crud.increment_meal_template_usage(session, tid, template_id, commit=False)
             consumed = await crud.get_meal_summary_for_day(session, tid)
             result: dict[str, Any] = {"ok": True, "template_id": template_id, "name": tpl.name}
             if user is not None:
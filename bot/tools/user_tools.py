@@ -6,7 +6,9 @@ from zoneinfo import available_timezones
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from bot.database import crud
+from bot.services.conversation_store import ConversationStore
 from bot.services.nutrition import calculate_daily_targets
+from bot.services.profile_cache import UserProfileCache
 
 _VALID_GENDERS = {"male", "female"}
 _VALID_ACTIVITIES = {"low", "light", "moderate", "high", "very_high"}
@@ -41,6 +43,7 @@ def user_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "update_user_profile",
                 "description": (
@@ -64,6 +67,7 @@ def user_tools_schema() -> list[dict[str, Any]]:
         },
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "reset_user_data",
                 "description": "Удаляет все данные пользователя: профиль, питание, вес, историю и достижения.",
@@ -77,10 +81,18 @@ def user_tools_schema() -> list[dict[str, Any]]:
     ]
 
 
-def user_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
+def user_tool_handlers(
+    sessionmaker: async_sessionmaker,
+    *,
+    conversations: ConversationStore | None = None,
+    profiles: UserProfileCache | None = None,
+) -> dict[str, Any]:
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
+
     async def get_user_profile(args: dict[str, Any]) -> dict[str, Any]:
         async with sessionmaker() as session:
-            user = await crud.get_user(session, int(args["telegram_id"]))
+            user = await profiles.get(int(args["telegram_id"]), session)
             if user is None:
                 return {"error": "User not found"}
             return {
@@ -97,7 +109,7 @@ def user_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
 
     async def get_daily_targets(args: dict[str, Any]) -> dict[str, Any]:
         async with sessionmaker() as session:
-            user = await crud.get_user(session, int(args["telegram_id"]))
+            user = await profiles.get(int(args["telegram_id"]), session)
             if user is None:
                 return {"error": "User not found"}
             return {
@@ -166,6 +178,9 @@ def user_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             user.daily_fat_target = targets["daily_fat_target"]
             user.daily_carbs_target = targets["daily_carbs_target"]
             await session.commit()
+            profiles.invalidate(tid)
+            if "timezone" in fields:
+                await crud.rebuild_daily_nutrition(session, tid)
 
         return {
             "ok": True,
@@ -180,6 +195,9 @@ def user_tool_handlers(sessionmaker: async_sessionmaker) -> dict[str, Any]:
             if user is None:
                 return {"error": "User not found"}
             await crud.delete_user_data(session, tid)
+        profiles.invalidate(tid)
+        if conversations is not None:
+            conversations.forget(tid)
         return {"ok": True}
 
     return {
@@ -3,15 +3,18 @@ from __future__ import annotations
 from typing import Any
 from zoneinfo import ZoneInfo
 
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 from bot.database import crud
+from bot.database.connection import unit_of_work
+from bot.services.profile_cache import UserProfile, UserProfileCache
 
 
 def water_tools_schema() -> list[dict[str, Any]]:
     return [
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "add_water",
                 "description": "Добавляет запись о выпитой воде в мл и возвращает прогресс за сегодня.",
@@ -44,60 +47,62 @@ def water_tool_handlers(
     sessionmaker: async_sessionmaker,
     *,
     timezone_name: str = "UTC",
+    profiles: UserProfileCache | None = None,
 ) -> dict[str, Any]:
     default_tz = ZoneInfo(timezone_name)
+    if profiles is None:
+        profiles = UserProfileCache.uncached(sessionmaker)
+
+    def _user_tz(user: UserProfile) -> ZoneInfo:
+        if user.timezone:
+            try:
+                return ZoneInfo(user.timezone)
+            except Exception:  # noqa: BLE001
+                return default_tz
+        return default_tz
+
+    async def _ensure_water_target(session: AsyncSession, user: UserProfile) -> int:
+        if user.daily_water_target_ml is not None:
+            return int(user.daily_water_target_ml)
+        target_ml = max(1200, int(float(user.weight_start_kg) * 30))
+        await crud.set_daily_water_target(session, user.telegram_id, target_ml, commit=False)
+        return target_ml
+
+    def _progress(total_ml: int, target_ml: int) -> dict[str, Any]:
+        return {
+            "today_ml": total_ml,
+            "target_ml": target_ml,
+            "left_ml": max(0, target_ml - total_ml),
+            "progress_pct": round((total_ml / target_ml * 100.0), 1) if target_ml > 0 else 0.0,
+        }
 
     async def add_water(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
         amount_ml = max(1, int(args.get("amount_ml", 250)))
-        async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+        async with unit_of_work(sessionmaker) as session:
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found"}
-            if user.daily_water_target_ml is None:
-                user.daily_water_target_ml = max(1200, int(float(user.weight_start_kg) * 30))
-                await session.commit()
-            tz = default_tz
-            if user.timezone:
-                try:
-                    tz = ZoneInfo(user.timezone)
-                except Exception:  # noqa: BLE001
-                    tz = default_tz
-            await crud.add_water_log(session, tid, amount_ml)
-            total_ml = await crud.get_water_summary_for_day(session, tid, timezone=tz)
-            target_ml = int(user.daily_water_target_ml or max(1200, int(float(user.weight_start_kg) * 30)))
-            return {
-                "ok": True,
-                "added_ml": amount_ml,
-                "today_ml": total_ml,
-                "target_ml": target_ml,
-                "left_ml": max(0, target_ml - total_ml),
-                "progress_pct": round((total_ml / target_ml * 100.0), 1) if target_ml > 0 else 0.0,
-            }
+            target_ml = await _ensure_water_target(session, user)
+            await crud.add_water_log(
+                session, tid, amount_ml, zone=crud.rollup_timezone_of(user.timezone), commit=False
+            )
+            total_ml = await crud.get_water_summary_for_day(session, tid, timezone=_user_tz(user))
+        if user.daily_water_target_ml is None:
+            profiles.invalidate(tid)
+        return {"ok": True, "added_ml": amount_ml, **_progress(total_ml, target_ml)}
 
     async def get_water_today(args: dict[str, Any]) -> dict[str, Any]:
         tid = int(args["telegram_id"])
-        async with sessionmaker() as session:
-            user = await crud.get_user(session, tid)
+        async with unit_of_work(sessionmaker) as session:
+            user = await profiles.get(tid, session)
             if user is None:
                 return {"error": "User not found"}
-            if user.daily_water_target_ml is None:
-                user.daily_water_target_ml = max(1200, int(float(user.weight_start_kg) * 30))
-                await session.commit()
-            tz = default_tz
-            if user.timezone:
-                try:
-                    tz = ZoneInfo(user.timezone)
-                except Exception:  # noqa: BLE001
-                    tz = default_tz
-            total_ml = await crud.get_water_summary_for_day(session, tid, timezone=tz)
-            target_ml = int(user.daily_water_target_ml or max(1200, int(float(user.weight_start_kg) * 30)))
-            return {
-                "today_ml": total_ml,
-                "target_ml": target_ml,
-                "left_ml": max(0, target_ml - total_ml),
-                "progress_pct": round((total_ml / target_ml * 100.0), 1) if target_ml > 0 else 0.0,
-            }
+            target_ml = await _ensure_water_target(session, user)
+            total_ml = await crud.get_water_summary_for_day(session, tid, timezone=_user_tz(user))
+        if user.daily_water_target_ml is None:
+            profiles.invalidate(tid)
+        return _progress(total_ml, target_ml)
 
     return {
         "add_water": add_water,
@@ -11,6 +11,7 @@ def weight_tools_schema() -> list[dict[str, Any]]:
     return [
         {
             "type": "function",
+            "serial": True,
             "function": {
                 "name": "record_weight",
                 "description": "Сохраняет новое взвешивание",
@@ -8,6 +8,17 @@
     python -m estimator photo.jpg --caption "200г курицы с рисом"
 """
 
-from estimator.core import analyze_meal_photo
+from estimator.cache import SQLiteVisionStore, VisionCache, analyze_meal_photo_cached
+from estimator.core import VisionUsage, analyze_meal_photo
+from estimator.preprocess import ImageOptions, PreparedImage, preprocess_image
 
-__all__ = ["analyze_meal_photo"]
+__all__ = [
+    "analyze_meal_photo",
+    "analyze_meal_photo_cached",
+    "preprocess_image",
+    "ImageOptions",
+    "PreparedImage",
+    "SQLiteVisionStore",
+    "VisionCache",
+    "VisionUsage",
+]
@@ -5,15 +5,15 @@
     python -m estimator photo.jpg --caption "200г курицы с рисом"
     python -m estimator photo.jpg --model gpt-4o
     python -m estimator https://example.com/food.jpg
+    python -m estimator photo.jpg --max-side 768 --format webp --detail low
+    python -m estimator photo.jpg --max-side 0 --quality 95   # без уменьшения
 """
 
 from __future__ import annotations
 
 import argparse
 import asyncio
-import base64
 import json
-import mimetypes
 import os
 import sys
 from pathlib import Path
@@ -22,22 +22,32 @@ from dotenv import load_dotenv
 from openai import AsyncOpenAI
 
 from estimator.core import analyze_meal_photo
+from estimator.preprocess import DETAILS, FORMATS, ImageOptions, preprocess_image
 
+_DEFAULTS = ImageOptions()
 
-def _to_image_url(source: str) -> str:
-    """Превратить локальный путь или URL в image_url для API."""
+
+def _to_image_url(source: str, options: ImageOptions) -> tuple[str, str | None]:
+    """Превратить локальный путь или URL в (image_url, detail) для API.
+
+    Локальный файл уменьшается и пережимается; URL отдаются модели как есть.
+    """
     if source.startswith(("http://", "https://", "data:")):
-        return source
+        return source, options.detail
     path = Path(source).expanduser()
     if not path.exists():
         print(f"Файл не найден: {path}", file=sys.stderr)
         sys.exit(1)
-    mime = mimetypes.guess_type(str(path))[0] or "image/jpeg"
-    b64 = base64.b64encode(path.read_bytes()).decode()
-    return f"data:{mime};base64,{b64}"
+    prepared = preprocess_image(path.read_bytes(), options)
+    print(
+        f"Изображение: {prepared.width}x{prepared.height}, "
+        f"{prepared.original_size // 1024} -> {len(prepared.data) // 1024} КБ",
+        file=sys.stderr,
+    )
+    return prepared.data_uri, prepared.detail
 
 
-async def _run(source: str, model: str, caption: str | None) -> None:
+async def _run(source: str, model: str, caption: str | None, options: ImageOptions) -> None:
     load_dotenv()
     api_key = os.getenv("OPENAI_API_KEY", "")
     base_url = (
@@ -51,9 +61,9 @@ async def _run(source: str, model: str, caption: str | None) -> None:
         sys.exit(1)
 
     client = AsyncOpenAI(api_key=api_key, base_url=base_url)
-    image_url = _to_image_url(source)
+    image_url, detail = _to_image_url(source, options)
 
-    result = await analyze_meal_photo(client, model, image_url, caption=caption)
+    result = await analyze_meal_photo(client, model, image_url, caption=caption, detail=detail)
     print(json.dumps(result, ensure_ascii=False, indent=2))
 
 
@@ -75,13 +85,40 @@ def main() -> None:
         default=None,
         help="Подпись к фото (граммовки, название блюда)",
     )
+    parser.add_argument(
+        "--max-side",
+        type=int,
+        default=_DEFAULTS.max_side,
+        help="Уменьшить длинную сторону до N px (0 = без уменьшения, по умолчанию 1024)",
+    )
+    parser.add_argument(
+        "--format",
+        choices=[name.lower() for name in FORMATS],
+        default="jpeg",
+        help="Формат пережатия (по умолчанию jpeg)",
+    )
+    parser.add_argument(
+        "--quality",
+        type=int,
+        default=_DEFAULTS.quality,
+        help="Качество пережатия 1..100 (по умолчанию 85)",
+    )
+    parser.add_argument(
+        "--detail",
+        choices=DETAILS,
+        default=_DEFAULTS.detail,
+        help="Детализация изображения для модели (по умолчанию auto)",
+    )
     args = parser.parse_args()
+    options = ImageOptions(
+        max_side=args.max_side, format=args.format.upper(), quality=args.quality, detail=args.detail
+    )
 
     if args.model is None:
         load_dotenv()
         args.model = os.getenv("OPENAI_MODEL_VISION", "gpt-4o-mini")
 
-    asyncio.run(_run(args.image, args.model, args.caption))
+    asyncio.run(_run(args.image, args.model, args.caption, options))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""Кэш результатов vision-оценки перед analyze_meal_photo.
+
+Ключ — (перцептивный хэш, модель, версия промпта, подпись): повторно присланное или
+пересланное фото с той же подписью не уходит в модель. Telegram file_unique_id проверяется
+до скачивания файла. Хранилище подключаемое: SQLiteVisionStore для CLI и JFB, бот
+хранит результаты в своей БД.
+
+В памяти держится не больше max_scopes областей (LRU) и не больше max_entries последних
+записей в каждой: область без подписи общая для всех пользователей и иначе росла бы без
+предела. Вытесненная область при следующем обращении заново читает из хранилища свои
+последние max_entries записей.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Protocol
+
+from openai import AsyncOpenAI
+
+from estimator.core import PROMPT_VERSION, VisionUsage, analyze_meal_photo
+from estimator.fingerprint import DEFAULT_MAX_DISTANCE, NearDuplicateIndex, dhash
+from estimator.preprocess import ImageOptions, PreparedImage, preprocess_image
+
+Estimate = dict[str, Any]
+
+
+DEFAULT_MAX_SCOPES = 256
+DEFAULT_MAX_ENTRIES = 2000
+
+
+class VisionCacheStore(Protocol):
+    async def load(self, scope: str, *, limit: int | None = None) -> list[tuple[int, str | None, Estimate]]:
+        """Последние limit записей области (все без limit): (хэш, file_unique_id, оценка) в порядке добавления."""
+        ...
+
+    async def save(self, scope: str, phash: int, file_unique_id: str | None, estimate: Estimate) -> None: ...
+
+
+def scope_key(model: str, prompt_version: str, caption: str | None = None) -> str:
+    """Область кэша: модель, версия промпта и подпись (без регистра и лишних пробелов)."""
+    normalized_caption = " ".join((caption or "").lower().split())
+    raw = f"{model}\n{prompt_version}\n{normalized_caption}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+@dataclass(slots=True)
+class _Scope:
+    index: NearDuplicateIndex[Estimate]
+    by_file_id: OrderedDict[str, Estimate] = field(default_factory=OrderedDict)
+
+
+class VisionCache:
+    def __init__(
+        self,
+        store: VisionCacheStore,
+        *,
+        max_distance: int = DEFAULT_MAX_DISTANCE,
+        max_scopes: int = DEFAULT_MAX_SCOPES,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        self.store = store
+        self.max_distance = max_distance
+        self.max_scopes = max(1, max_scopes)
+        self.max_entries = max(1, max_entries)
+        self.file_id_hits = 0
+        self.phash_hits = 0
+        self.misses = 0
+        self._scopes: OrderedDict[str, _Scope] = OrderedDict()
+        self._load_lock = asyncio.Lock()
+
+    @property
+    def saved_calls(self) -> int:
+        """Сколько vision-вызовов не понадобилось благодаря кэшу."""
+        return self.file_id_hits + self.phash_hits
+
+    def stats(self) -> dict[str, int | float]:
+        lookups = self.saved_calls + self.misses
+        return {
+            "file_id_hits": self.file_id_hits,
+            "phash_hits": self.phash_hits,
+            "misses": self.misses,
+            "saved_calls": self.saved_calls,
+            "hit_rate": round(self.saved_calls / lookups, 4) if lookups else 0.0,
+        }
+
+    async def lookup_file_id(self, scope: str, file_unique_id: str) -> Estimate | None:
+        """Быстрый путь без скачивания: тот же файл Telegram уже оценивался."""
+        estimate = (await self._scope(scope)).by_file_id.get(file_unique_id)
+        if estimate is None:
+            return None
+        self.file_id_hits += 1
+        return dict(estimate)
+
+    async def lookup(self, scope: str, phash: int) -> Estimate | None:
+        """Оценка совпадающего или почти совпадающего изображения; промах считается в misses."""
+        found = (await self._scope(scope)).index.nearest(phash, self.max_distance)
+        if found is None:
+            self.misses += 1
+            return None
+        self.phash_hits += 1
+        return dict(found[0])
+
+    async def put(
+        self, scope: str, phash: int, estimate: Estimate, *, file_unique_id: str | None = None
+    ) -> None:
+        await self.store.save(scope, phash, file_unique_id, estimate)
+        self._remember(await self._scope(scope), phash, file_unique_id, dict(estimate))
+
+    async def _scope(self, scope: str) -> _Scope:
+        state = self._scopes.get(scope)
+        if state is not None:
+            self._scopes.move_to_end(scope)
+            return state
+        async with self._load_lock:
+            state = self._scopes.get(scope)
+            if state is None:
+                state = _Scope(index=NearDuplicateIndex(self.max_entries))
+                for phash, file_unique_id, estimate in await self.store.load(scope, limit=self.max_entries):
+                    self._remember(state, phash, file_unique_id, estimate)
+                self._scopes[scope] = state
+                while len(self._scopes) > self.max_scopes:
+                    self._scopes.popitem(last=False)
+        return state
+
+    def _remember(self, state: _Scope, phash: int, file_unique_id: str | None, estimate: Estimate) -> None:
+        state.index.add(phash, estimate)
+        if file_unique_id:
+            state.by_file_id[file_unique_id] = estimate
+            state.by_file_id.move_to_end(file_unique_id)
+            while len(state.by_file_id) > self.max_entries:
+                state.by_file_id.popitem(last=False)
+
+
+class SQLiteVisionStore:
+    """Файловое хранилище кэша на stdlib sqlite3 (для CLI и бенчмарка)."""
+
+    def __init__(self, path: Path | str) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vision_cache ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, scope TEXT NOT NULL, phash TEXT NOT NULL, "
+            "file_unique_id TEXT, estimate TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_vision_cache_scope ON vision_cache (scope, id)")
+        self._conn.commit()
+
+    async def load(self, scope: str, *, limit: int | None = None) -> list[tuple[int, str | None, Estimate]]:
+        rows = self._conn.execute(
+            "SELECT phash, file_unique_id, estimate FROM vision_cache WHERE scope = ? ORDER BY id DESC LIMIT ?",
+            (scope, -1 if limit is None else limit),
+        ).fetchall()
+        return [(int(phash, 16), file_id, json.loads(estimate)) for phash, file_id, estimate in reversed(rows)]
+
+    async def save(self, scope: str, phash: int, file_unique_id: str | None, estimate: Estimate) -> None:
+        self._conn.execute(
+            "INSERT INTO vision_cache (scope, phash, file_unique_id, estimate, created_at) VALUES (?, ?, ?, ?, ?)",
+            (scope, f"{phash:016x}", file_unique_id, json.dumps(estimate, ensure_ascii=False), time.time()),
+        )
+        self._conn.commit()
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+async def analyze_meal_photo_cached(
+    client: AsyncOpenAI,
+    model: str,
+    image_bytes: bytes,
+    *,
+    cache: VisionCache,
+    caption: str | None = None,
+    image_url: str | None = None,
+    mime: str = "image/jpeg",
+    options: ImageOptions | None = None,
+    prepared: PreparedImage | None = None,
+    usage: VisionUsage | None = None,
+) -> tuple[Estimate, bool]:
+    """analyze_meal_photo с кэшем; возвращает (оценка, взята_из_кэша).
+
+    image_url — что отправить модели при промахе; по умолчанию data URI из image_bytes,
+    а с options — из подготовленного (уменьшенного и пережатого) изображения. Параметры
+    подготовки входят в ключ кэша: оценки разных размеров не смешиваются. prepared — уже
+    подготовленное с теми же options изображение, чтобы не готовить его второй раз.
+    """
+    prompt_version = PROMPT_VERSION if options is None else f"{PROMPT_VERSION}:{options.signature}"
+    scope = scope_key(model, prompt_version, caption)
+    phash = await asyncio.to_thread(dhash, image_bytes)
+    cached = await cache.lookup(scope, phash)
+    if cached is not None:
+        return cached, True
+    detail = None
+    if image_url is None and options is not None:
+        if prepared is None:
+            prepared = await asyncio.to_thread(preprocess_image, image_bytes, options)
+        image_url, detail = prepared.data_uri, prepared.detail
+    elif image_url is None:
+        image_url = f"data:{mime};base64,{base64.b64encode(image_bytes).decode()}"
+    estimate = await analyze_meal_photo(client, model, image_url, caption=caption, detail=detail, usage=usage)
+    await cache.put(scope, phash, estimate)
+    return estimate, False
@@ -2,7 +2,10 @@
 
 from __future__ import annotations
 
+import hashlib
 import json
+import time
+from dataclasses import dataclass
 from pathlib import Path
 
 from openai import AsyncOpenAI
@@ -18,6 +21,12 @@ def _load_prompt(name: str, **kwargs: str) -> str:
 
 
 SYSTEM_PROMPT = _load_prompt("system")
+# Меняется при любой правке промптов — кэш оценок (estimator.cache) не отдаёт старые ответы.
+PROMPT_VERSION = hashlib.sha256(
+    "\n".join(
+        (_PROMPTS_DIR / f"{name}.md").read_text(encoding="utf-8") for name in ("system", "user", "user_caption")
+    ).encode("utf-8")
+).hexdigest()[:12]
 
 
 def user_prompt_text(caption: str | None = None) -> str:
@@ -28,10 +37,34 @@ def user_prompt_text(caption: str | None = None) -> str:
     return base
 
 
-def _user_content(image_url: str, caption: str | None) -> list[dict]:
+@dataclass(slots=True)
+class VisionUsage:
+    """Накопитель расхода: токены и время vision-вызовов (для бенчмарков)."""
+
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency_s: float = 0.0
+
+    def add_response(self, response: object, latency_s: float) -> None:
+        self.calls += 1
+        self.latency_s += latency_s
+        usage = getattr(response, "usage", None)
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if isinstance(prompt_tokens, int):
+            self.prompt_tokens += prompt_tokens
+        if isinstance(completion_tokens, int):
+            self.completion_tokens += completion_tokens
+
+
+def _user_content(image_url: str, caption: str | None, detail: str | None = None) -> list[dict]:
+    image: dict[str, str] = {"url": image_url}
+    if detail:
+        image["detail"] = detail
     return [
         {"type": "text", "text": user_prompt_text(caption)},
-        {"type": "image_url", "image_url": {"url": image_url}},
+        {"type": "image_url", "image_url": image},
     ]
 
 
@@ -41,6 +74,8 @@ async def analyze_meal_photo(
     image_url: str,
     *,
     caption: str | None = None,
+    detail: str | None = None,
+    usage: VisionUsage | None = None,
 ) -> dict[str, float | str]:
     """Оценить КБЖУ по фото еды.
 
@@ -49,6 +84,8 @@ async def analyze_meal_photo(
         model: название модели (например gpt-4o-mini)
         image_url: URL изображения или data URI (base64)
         caption: необязательная подпись к фото от пользователя
+        detail: детализация изображения для модели (auto, low, high)
+        usage: сюда добавляются токены и время вызова
 
     Returns:
         dict с ключами description, calories, protein_g, fat_g, carbs_g
@@ -57,16 +94,19 @@ async def analyze_meal_photo(
         model=model,
         messages=[
             {"role": "system", "content": SYSTEM_PROMPT},
-            {"role": "user", "content": _user_content(image_url, caption)},
+            {"role": "user", "content": _user_content(image_url, caption, detail)},
         ],
         temperature=0.0,
     )
+    started = time.perf_counter()
     try:
         kwargs["response_format"] = {"type": "json_object"}
         response = await client.chat.completions.create(**kwargs)
     except Exception:
         kwargs.pop("response_format", None)
         response = await client.chat.completions.create(**kwargs)
+    if usage is not None:
+        usage.add_response(response, time.perf_counter() - started)
 
     content = response.choices[0].message.content or "{}"
     parsed = json.loads(content)
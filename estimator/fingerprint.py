@@ -0,0 +1,108 @@
+"""Отпечатки изображений для поиска повторов: перцептивный хэш и индекс по Хэммингу.
+
+dHash сравнивает яркость соседних пикселей уменьшенного до 9×8 серого изображения,
+поэтому пережатое, уменьшенное или пересланное повторно фото даёт тот же или почти тот
+же 64-битный хэш. Близкие хэши ищутся по четырём 16-битным полосам: если расстояние
+Хэмминга не больше 3, хотя бы одна полоса совпадает точно.
+"""
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from io import BytesIO
+from typing import Generic, TypeVar
+
+from PIL import Image, ImageOps
+
+HASH_BITS = 64
+BANDS = 4
+DEFAULT_MAX_DISTANCE = 3
+
+_BAND_BITS = HASH_BITS // BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+
+T = TypeVar("T")
+
+
+def dhash(data: bytes) -> int:
+    """64-битный difference hash изображения (ориентация по EXIF учитывается)."""
+    with Image.open(BytesIO(data)) as image:
+        gray = ImageOps.exif_transpose(image).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+def to_signed64(value: int) -> int:
+    """Беззнаковый хэш -> BIGINT (знаковый 64-битный) для хранения в БД."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def from_signed64(value: int) -> int:
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+def _bands(value: int) -> Iterator[tuple[int, int]]:
+    for band in range(BANDS):
+        yield band, (value >> (band * _BAND_BITS)) & _BAND_MASK
+
+
+class NearDuplicateIndex(Generic[T]):
+    """Хэши со значениями; nearest() находит ближайший в пределах max_distance.
+
+    С max_entries индекс хранит только столько последних записей: старейшая вытесняется.
+    """
+
+    def __init__(self, max_entries: int | None = None) -> None:
+        self.max_entries = max_entries
+        self._entries: dict[int, tuple[int, T]] = {}
+        self._buckets: list[dict[int, list[int]]] = [{} for _ in range(BANDS)]
+        self._next_slot = 0
+        self._oldest_slot = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, value_hash: int, value: T) -> None:
+        slot = self._next_slot
+        self._next_slot += 1
+        self._entries[slot] = (value_hash, value)
+        for band, key in _bands(value_hash):
+            self._buckets[band].setdefault(key, []).append(slot)
+        if self.max_entries is not None:
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def nearest(self, value_hash: int, max_distance: int = DEFAULT_MAX_DISTANCE) -> tuple[T, int] | None:
+        """(значение, расстояние) ближайшего хэша; при равенстве побеждает более поздний."""
+        best: tuple[int, int] | None = None
+        seen: set[int] = set()
+        for band, key in _bands(value_hash):
+            for slot in self._buckets[band].get(key, ()):
+                if slot in seen:
+                    continue
+                seen.add(slot)
+                distance = hamming(value_hash, self._entries[slot][0])
+                if distance <= max_distance and (best is None or (distance, -slot) < (best[0], -best[1])):
+                    best = (distance, slot)
+        if best is None:
+            return None
+        return self._entries[best[1]][1], best[0]
+
+    def _evict_oldest(self) -> None:
+        while self._oldest_slot not in self._entries:
+            self._oldest_slot += 1
+        value_hash, _ = self._entries.pop(self._oldest_slot)
+        for band, key in _bands(value_hash):
+            bucket = self._buckets[band][key]
+            bucket.remove(self._oldest_slot)
+            if not bucket:
+                del self._buckets[band][key]
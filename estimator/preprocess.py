@@ -0,0 +1,90 @@
+"""Подготовка фото перед vision-вызовом: уменьшение, снятие EXIF, пережатие в data URI.
+
+Модель берёт с полноразмерного фото в разы больше входных токенов, чем с кадра 768–1024 px,
+а точность оценки КБЖУ от этого почти не растёт (см. таблицу `python -m benchmark.jfb
+--sweep-sizes`). Фото перекодируется заново, поэтому EXIF (геопозиция, модель телефона)
+в OpenAI не уходит; ориентация из EXIF применяется к пикселям до этого.
+"""
+
+from __future__ import annotations
+
+import base64
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Any
+
+from PIL import Image, ImageOps
+
+FORMATS = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
+DETAILS = ("auto", "low", "high")
+
+
+@dataclass(slots=True, frozen=True)
+class ImageOptions:
+    """max_side=0 — без уменьшения; detail передаётся модели как есть."""
+
+    max_side: int = 1024
+    format: str = "JPEG"
+    quality: int = 85
+    detail: str = "auto"
+
+    def __post_init__(self) -> None:
+        if self.format.upper() not in FORMATS:
+            raise ValueError(f"Unsupported image format: {self.format}")
+        if self.detail not in DETAILS:
+            raise ValueError(f"Unsupported image detail: {self.detail}")
+        if self.max_side < 0 or not 1 <= self.quality <= 100:
+            raise ValueError("max_side must be >= 0 and quality within 1..100")
+
+    @property
+    def signature(self) -> str:
+        """Короткая строка параметров — часть ключа кэша оценок."""
+        return f"{self.format.lower()}{self.max_side}q{self.quality}{self.detail}"
+
+
+@dataclass(slots=True, frozen=True)
+class PreparedImage:
+    data: bytes
+    mime: str
+    width: int
+    height: int
+    original_size: int
+    detail: str = "auto"
+
+    @property
+    def data_uri(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode()}"
+
+    def image_url_part(self) -> dict[str, Any]:
+        """Значение поля image_url в сообщении Chat Completions."""
+        return {"url": self.data_uri, "detail": self.detail}
+
+
+def preprocess_image(data: bytes, options: ImageOptions = ImageOptions()) -> PreparedImage:
+    """Декодирует, поворачивает по EXIF, уменьшает до max_side и пережимает без метаданных.
+
+    Синхронная и CPU-ёмкая: из обработчиков вызывать через asyncio.to_thread.
+    """
+    fmt = options.format.upper()
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        if image.mode in {"RGBA", "LA", "P"}:
+            # Прозрачность JPEG не поддерживает — подкладываем белый фон.
+            rgba = image.convert("RGBA")
+            image = Image.new("RGB", rgba.size, (255, 255, 255))
+            image.paste(rgba, mask=rgba.getchannel("A"))
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        if options.max_side and max(image.size) > options.max_side:
+            image.thumbnail((options.max_side, options.max_side), Image.Resampling.LANCZOS)
+        out = BytesIO()
+        # exif не передаётся в save — метаданные в результат не попадают.
+        image.save(out, format=fmt, quality=options.quality, optimize=fmt == "JPEG")
+    return PreparedImage(
+        data=out.getvalue(),
+        mime=FORMATS[fmt],
+        width=image.width,
+        height=image.height,
+        original_size=len(data),
+        detail=options.detail,
+    )
@@ -6,6 +6,8 @@ from collections.abc import AsyncGenerator
 import pytest
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
+from bot.config import DatabaseSettings
+from bot.database.connection import _install_sqlite_pragmas, engine_options
 from bot.database.models import Base
 
 
@@ -38,3 +40,19 @@ async def session(sessionmaker) -> AsyncGenerator[AsyncSession, None]:
     """Одна сессия на тест; после теста откат не нужен — БД в памяти новая на каждый db_engine."""
     async with sessionmaker() as s:
         yield s
+
+
+@pytest.fixture
+async def replicas(tmp_path):  # noqa: ANN001, ANN201
+    """Два независимых движка к одному файлу SQLite — как два процесса бота."""
+    url = f"sqlite+aiosqlite:///{tmp_path / 'replicas.db'}"
+    engines = []
+    for _ in range(2):
+        engine = create_async_engine(url, **engine_options(url, DatabaseSettings()))
+        _install_sqlite_pragmas(engine, DatabaseSettings())
+        engines.append(engine)
+    async with engines[0].begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield [async_sessionmaker(bind=engine, expire_on_commit=False) for engine in engines]
+    for engine in engines:
+        await engine.dispose()
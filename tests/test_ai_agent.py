@@ -1,6 +1,10 @@
 """Тесты AI-агента (bot.services.ai_agent)."""
 from __future__ import annotations
 
+import asyncio
+import json
+import time
+from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock
 
 import pytest
@@ -95,3 +99,182 @@ async def test_parse_meal_text_fallback_description(mock_openai_client: MagicMoc
     result = await agent.parse_meal_text("что-то съел")
     assert result["description"] == "что-то съел"
     assert result["meal_type"] == "snack"
+
+
+def _tool_call(call_id: str, name: str, arguments: str = "{}") -> SimpleNamespace:
+    return SimpleNamespace(id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def _tool_round_client(calls: list[SimpleNamespace]) -> MagicMock:
+    """Клиент, который в первом раунде просит вызвать calls, а во втором отвечает текстом."""
+    first = MagicMock(tool_calls=calls)
+    first.model_dump.return_value = {"role": "assistant", "content": None}
+    final = MagicMock(tool_calls=None, content="Готово!")
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        side_effect=[
+            MagicMock(choices=[MagicMock(message=first)]),
+            MagicMock(choices=[MagicMock(message=final)]),
+        ]
+    )
+    return client
+
+
+def _schema(name: str, **flags: object) -> dict:
+    return {"type": "function", **flags, "function": {"name": name}}
+
+
+def _sleeping_handler(log: list[tuple[str, str]], name: str, delay: float):  # noqa: ANN202
+    async def _handler(args: dict) -> dict:
+        log.append(("start", name))
+        await asyncio.sleep(delay)
+        log.append(("end", name))
+        return {"tool": name, **args}
+
+    return _handler
+
+
+async def test_independent_tools_run_concurrently_in_original_order() -> None:
+    log: list[tuple[str, str]] = []
+    names = ["get_today_summary", "get_water_today", "get_streak_info"]
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini")
+    agent.register_tools(
+        [_schema(name) for name in names],
+        {name: _sleeping_handler(log, name, 0.2 - 0.05 * i) for i, name in enumerate(names)},
+    )
+    agent.client = _tool_round_client(
+        [_tool_call(f"c{i}", name, f'{{"i": {i}}}') for i, name in enumerate(names)]
+    )
+
+    started = time.perf_counter()
+    assert await agent.ask("сводка") == "Готово!"
+    elapsed = time.perf_counter() - started
+
+    # Раунд длится как самый медленный инструмент (0.2 с), а не как сумма (0.45 с).
+    assert elapsed < 0.35
+    messages = agent.client.chat.completions.create.await_args_list[1].kwargs["messages"]
+    tool_messages = [m for m in messages if m.get("role") == "tool"]
+    assert [m["tool_call_id"] for m in tool_messages] == ["c0", "c1", "c2"]
+    assert [json.loads(m["content"])["i"] for m in tool_messages] == [0, 1, 2]
+
+
+async def test_serial_tool_runs_alone_between_batches() -> None:
+    log: list[tuple[str, str]] = []
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini", max_parallel_tools=2)
+    agent.register_tools(
+        [_schema("read_a"), _schema("add_meal", serial=True), _schema("read_b"), _schema("read_c")],
+        {
+            "read_a": _sleeping_handler(log, "read_a", 0.02),
+            "add_meal": _sleeping_handler(log, "add_meal", 0.02),
+            "read_b": _sleeping_handler(log, "read_b", 0.02),
+            "read_c": _sleeping_handler(log, "read_c", 0.02),
+        },
+    )
+    agent.client = _tool_round_client(
+        [
+            _tool_call("1", "read_a"),
+            _tool_call("2", "add_meal"),
+            _tool_call("3", "read_b"),
+            _tool_call("4", "read_c"),
+        ]
+    )
+    await agent.ask("запиши и покажи")
+
+    assert log[:4] == [("start", "read_a"), ("end", "read_a"), ("start", "add_meal"), ("end", "add_meal")]
+    assert log[4:6] == [("start", "read_b"), ("start", "read_c")]
+    # Флаги агента не уходят в OpenAI.
+    sent_tools = agent.client.chat.completions.create.await_args_list[0].kwargs["tools"]
+    assert all("serial" not in tool for tool in sent_tools)
+
+
+async def test_concurrency_cap_and_per_tool_timeout() -> None:
+    active = 0
+    peak = 0
+
+    async def _counting(args: dict) -> dict:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.02)
+        active -= 1
+        return {"ok": True}
+
+    async def _hanging(args: dict) -> dict:
+        await asyncio.sleep(10)
+        return {"ok": True}
+
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini", max_parallel_tools=2)
+    agent.register_tools(
+        [_schema("read"), _schema("slow", timeout_s=0.05)],
+        {"read": _counting, "slow": _hanging},
+    )
+    agent.client = _tool_round_client(
+        [_tool_call(str(i), "read") for i in range(5)] + [_tool_call("s", "slow"), _tool_call("x", "missing")]
+    )
+    await agent.ask("много всего")
+
+    assert peak == 2
+    messages = agent.client.chat.completions.create.await_args_list[1].kwargs["messages"]
+    results = {m["tool_call_id"]: json.loads(m["content"]) for m in messages if m.get("role") == "tool"}
+    assert results["s"] == {"error": "Tool slow timed out"}
+    assert results["x"] == {"error": "Unknown tool: missing"}
+    assert results["4"] == {"ok": True}
+
+
+def _chunk(content: str | None = None, tool_calls: list[SimpleNamespace] | None = None) -> SimpleNamespace:
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content, tool_calls=tool_calls))])
+
+
+def _tool_delta(index: int, call_id: str | None = None, name: str | None = None, arguments: str | None = None):  # noqa: ANN202
+    return SimpleNamespace(index=index, id=call_id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def _stream_client(*rounds: list[SimpleNamespace]) -> MagicMock:
+    async def _stream(chunks: list[SimpleNamespace]):  # noqa: ANN202
+        for chunk in chunks:
+            yield chunk
+
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=[_stream(chunks) for chunks in rounds])
+    return client
+
+
+async def test_ask_stream_yields_deltas_and_logs_ttft(caplog: pytest.LogCaptureFixture) -> None:
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini")
+    agent.client = _stream_client([_chunk("При"), SimpleNamespace(choices=[]), _chunk("вет"), _chunk("!")])
+
+    with caplog.at_level("INFO", logger="bot.services.ai_agent"):
+        parts = [part async for part in agent.ask_stream("Привет", use_tools=False)]
+
+    assert parts == ["При", "вет", "!"]
+    assert agent.client.chat.completions.create.await_args.kwargs["stream"] is True
+    assert any("TTFT" in record.getMessage() for record in caplog.records)
+
+
+async def test_ask_stream_assembles_tool_calls_from_chunks() -> None:
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini")
+    handler = AsyncMock(return_value={"ok": True})
+    agent.register_tools([_schema("add_water", serial=True)], {"add_water": handler})
+    agent.client = _stream_client(
+        [
+            _chunk(tool_calls=[_tool_delta(0, "w1", "add_water", '{"amount')]),
+            _chunk(tool_calls=[_tool_delta(0, arguments='_ml": 250}')]),
+        ],
+        [_chunk("Записал "), _chunk("250 мл")],
+    )
+
+    parts = [part async for part in agent.ask_stream("выпил стакан воды")]
+
+    assert "".join(parts) == "Записал 250 мл"
+    handler.assert_awaited_once_with({"amount_ml": 250})
+    messages = agent.client.chat.completions.create.await_args_list[1].kwargs["messages"]
+    assistant = next(m for m in messages if m.get("role") == "assistant")
+    assert assistant["tool_calls"][0]["function"] == {"name": "add_water", "arguments": '{"amount_ml": 250}'}
+    assert (messages[-1]["tool_call_id"], messages[-1]["content"]) == ("w1", '{"ok": true}')
+
+
+def test_image_detail_is_added_to_image_parts() -> None:
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini", image_detail="low")
+    parts = agent._build_user_content("что на фото?", ["data:image/jpeg;base64,AA=="])
+    assert parts[1] == {"type": "image_url", "image_url": {"url": "data:image/jpeg;base64,AA==", "detail": "low"}}
+    assert AIAgent(api_key="sk-fake", model="gpt-4o-mini")._build_user_content("текст") == "текст"
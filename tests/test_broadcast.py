@@ -0,0 +1,150 @@
+"""Тесты рассылки с лимитами Telegram (bot.services.broadcast)."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.services.broadcast import Broadcaster, TokenBucket
+
+
+class _TimelineBot:
+    """Фейковый Bot: записывает (время, chat_id, text) каждой успешной отправки."""
+
+    def __init__(self, errors: dict[int, list[Exception]] | None = None, latency: float = 0.0) -> None:
+        self.timeline: list[tuple[float, int, str]] = []
+        self.errors = errors or {}
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:  # noqa: ANN003
+        _ = kwargs
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+            pending = self.errors.get(chat_id)
+            if pending:
+                raise pending.pop(0)
+            self.timeline.append((time.monotonic(), chat_id, text))
+        finally:
+            self.in_flight -= 1
+
+
+def _method(chat_id: int) -> SendMessage:
+    return SendMessage(chat_id=chat_id, text="x")
+
+
+async def _text(chat_id: int) -> str:
+    return f"hello {chat_id}"
+
+
+async def test_global_rate_limit_is_respected() -> None:
+    bot = _TimelineBot()
+    broadcaster = Broadcaster(bot, concurrency=10, global_rate=50.0, per_chat_interval=0.0)  # type: ignore[arg-type]
+
+    stats = await broadcaster.run(range(100), _text, name="test")
+
+    assert stats.sent == 100
+    times = sorted(t for t, _, _ in bot.timeline)
+    # Всплеск до 50 сообщений, дальше не быстрее 50/с.
+    assert times[-1] - times[0] >= (100 - 50) / 50.0 * 0.9
+    for i in range(len(times)):
+        window = [t for t in times[i:] if t - times[i] < 0.5]
+        assert len(window) <= 50 + 25 + 1
+
+
+async def test_per_chat_interval_spaces_messages_to_same_chat() -> None:
+    bot = _TimelineBot()
+    broadcaster = Broadcaster(bot, concurrency=5, global_rate=1000.0, per_chat_interval=0.1)  # type: ignore[arg-type]
+
+    stats = await broadcaster.run([7, 7, 7, 8], _text, name="test")
+
+    assert stats.sent == 4
+    chat_7 = sorted(t for t, chat_id, _ in bot.timeline if chat_id == 7)
+    assert len(chat_7) == 3
+    assert all(b - a >= 0.09 for a, b in zip(chat_7, chat_7[1:]))
+    # Другой чат не ждёт очереди чата 7.
+    chat_8 = [t for t, chat_id, _ in bot.timeline if chat_id == 8]
+    assert chat_8[0] < chat_7[-1]
+
+
+async def test_concurrency_is_bounded() -> None:
+    bot = _TimelineBot(latency=0.01)
+    broadcaster = Broadcaster(bot, concurrency=4, global_rate=1000.0, per_chat_interval=0.0)  # type: ignore[arg-type]
+
+    stats = await broadcaster.run(range(40), _text, name="test")
+
+    assert stats.sent == 40
+    assert 1 < bot.max_in_flight <= 4
+
+
+async def test_retry_after_is_honoured_and_counted() -> None:
+    bot = _TimelineBot(
+        errors={1: [TelegramRetryAfter(method=_method(1), message="flood", retry_after=1)]}
+    )
+    broadcaster = Broadcaster(bot, concurrency=2, global_rate=1000.0, per_chat_interval=0.0)  # type: ignore[arg-type]
+    started = time.monotonic()
+
+    stats = await broadcaster.run([1], _text, name="test")
+
+    assert (stats.sent, stats.retried, stats.failed) == (1, 1, 0)
+    assert bot.timeline[0][0] - started >= 0.95
+
+
+async def test_blocked_failed_and_skipped_are_reported() -> None:
+    bot = _TimelineBot(
+        errors={
+            1: [TelegramForbiddenError(method=_method(1), message="blocked")],
+            2: [TelegramBadRequest(method=_method(2), message="chat not found")],
+            3: [RuntimeError("boom")],
+        }
+    )
+    blocked: list[int] = []
+
+    async def _on_blocked(chat_id: int) -> None:
+        blocked.append(chat_id)
+
+    async def _render(chat_id: int) -> str | None:
+        if chat_id == 5:
+            return None
+        if chat_id == 6:
+            raise ValueError("render failed")
+        return "hi"
+
+    broadcaster = Broadcaster(bot, global_rate=1000.0, per_chat_interval=0.0)  # type: ignore[arg-type]
+    stats = await broadcaster.run([1, 2, 3, 4, 5, 6], _render, name="test", on_blocked=_on_blocked)
+
+    assert (stats.sent, stats.blocked, stats.failed, stats.skipped) == (1, 2, 2, 1)
+    assert sorted(blocked) == [1, 2]
+    assert stats.duration_s >= 0.0
+
+
+async def test_several_messages_go_to_chat_in_order_until_blocked() -> None:
+    bot = _TimelineBot(errors={2: [TelegramForbiddenError(method=_method(2), message="blocked")]})
+    blocked: list[int] = []
+
+    async def _on_blocked(chat_id: int) -> None:
+        blocked.append(chat_id)
+
+    async def _render(chat_id: int) -> list[str]:
+        return [f"daily {chat_id}", f"weekly {chat_id}"]
+
+    broadcaster = Broadcaster(bot, global_rate=1000.0, per_chat_interval=0.0)  # type: ignore[arg-type]
+    stats = await broadcaster.run([1, 2], _render, name="test", on_blocked=_on_blocked)
+
+    assert [text for _, _, text in bot.timeline] == ["daily 1", "weekly 1"]
+    assert (stats.sent, stats.blocked) == (2, 1)
+    assert blocked == [2]
+
+
+async def test_token_bucket_pause_delays_next_token() -> None:
+    bucket = TokenBucket(rate=1000.0)
+    bucket.pause(0.1)
+    started = time.monotonic()
+    await bucket.acquire()
+    assert time.monotonic() - started >= 0.09
@@ -0,0 +1,164 @@
+"""Тесты асинхронной отрисовки графиков (bot.services.chart_renderer)."""
+from __future__ import annotations
+
+import asyncio
+import time
+
+import pytest
+
+from bot.services import chart_renderer
+from bot.services.chart_renderer import ChartRenderer, chart_key, workers_share
+
+PNG_MAGIC = b"\x89PNG\r\n\x1a\n"
+FORECAST = [
+    {"date": "2026-01-01", "weight_kg": 90.0},
+    {"date": "2026-01-08", "weight_kg": 89.4},
+    {"date": "2026-01-15", "weight_kg": 88.9},
+]
+
+
+def test_chart_key_is_stable_and_content_addressed() -> None:
+    a = chart_key("weight_plan", {"mode": "light", "target_weight": 80.0})
+    b = chart_key("weight_plan", {"target_weight": 80.0, "mode": "light"})
+    c = chart_key("weight_plan", {"mode": "hard", "target_weight": 80.0})
+    assert a == b
+    assert a != c
+    assert a != chart_key("three_scenarios", {"mode": "light", "target_weight": 80.0})
+
+
+async def test_renders_png_in_thread_and_caches() -> None:
+    charts = ChartRenderer(workers=0)
+    png = await charts.weight_plan(FORECAST, [FORECAST[0]], target_weight=85.0, mode="medium")
+    again = await charts.weight_plan(FORECAST, [FORECAST[0]], target_weight=85.0, mode="medium")
+    assert png.startswith(PNG_MAGIC)
+    assert again is png
+    assert charts.stats() == {"hits": 1, "misses": 1, "entries": 1}
+
+
+async def test_concurrent_identical_requests_render_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls: list[str] = []
+    release = asyncio.Event()
+
+    async def fake_render(self: ChartRenderer, kind: str, params: dict) -> bytes:
+        calls.append(kind)
+        await release.wait()
+        return b"png"
+
+    monkeypatch.setattr(ChartRenderer, "_render", fake_render)
+    charts = ChartRenderer(workers=0)
+    pending = [
+        asyncio.create_task(charts.three_scenarios({"light": FORECAST}, current_weight=90, target_weight=80))
+        for _ in range(3)
+    ]
+    await asyncio.sleep(0)
+    release.set()
+    assert await asyncio.gather(*pending) == [b"png"] * 3
+    assert calls == ["three_scenarios"]
+    assert charts.misses == 1 and charts.hits == 2
+
+
+async def test_cancelled_caller_does_not_cancel_shared_render(monkeypatch: pytest.MonkeyPatch) -> None:
+    release = asyncio.Event()
+
+    async def fake_render(self: ChartRenderer, kind: str, params: dict) -> bytes:
+        await release.wait()
+        return b"png"
+
+    monkeypatch.setattr(ChartRenderer, "_render", fake_render)
+    charts = ChartRenderer(workers=0)
+    first = asyncio.create_task(charts.three_scenarios({}, current_weight=90, target_weight=80))
+    second = asyncio.create_task(charts.three_scenarios({}, current_weight=90, target_weight=80))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    assert await second == b"png"
+    assert first.cancelled()
+
+
+async def test_lru_evicts_oldest(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def fake_render(self: ChartRenderer, kind: str, params: dict) -> bytes:
+        return str(params["target_weight"]).encode()
+
+    monkeypatch.setattr(ChartRenderer, "_render", fake_render)
+    charts = ChartRenderer(workers=0, max_entries=2)
+    await charts.three_scenarios({}, current_weight=90, target_weight=80)
+    await charts.three_scenarios({}, current_weight=90, target_weight=81)
+    await charts.three_scenarios({}, current_weight=90, target_weight=80)  # 80 снова самый свежий
+    await charts.three_scenarios({}, current_weight=90, target_weight=82)
+    assert charts.stats()["entries"] == 2
+    await charts.three_scenarios({}, current_weight=90, target_weight=81)
+    assert charts.misses == 4
+
+
+async def test_render_error_is_not_cached(monkeypatch: pytest.MonkeyPatch) -> None:
+    with pytest.raises(ValueError, match="Unknown chart kind"):
+        await ChartRenderer(workers=0)._get("pie", {})
+
+    def broken_render(kind: str, params: dict) -> bytes:
+        raise RuntimeError("boom")
+
+    charts = ChartRenderer(workers=0)
+    monkeypatch.setattr(chart_renderer, "_render", broken_render)
+    with pytest.raises(RuntimeError):
+        await charts.three_scenarios({}, current_weight=90, target_weight=80)
+    assert charts.stats()["entries"] == 0
+    assert not charts._inflight
+
+
+async def test_process_pool_renders_png() -> None:
+    charts = ChartRenderer(workers=1)
+    await charts.start()
+    try:
+        assert charts.started
+        png = await charts.three_scenarios({"light": FORECAST}, current_weight=90.0, target_weight=85.0)
+    finally:
+        charts.shutdown()
+    assert png.startswith(PNG_MAGIC)
+    assert not charts.started
+
+
+def test_workers_share_splits_total_across_bot_processes() -> None:
+    assert [workers_share(2, 1, 0)] == [2]
+    assert [workers_share(2, 4, i) for i in range(4)] == [1, 1, 0, 0]
+    assert [workers_share(5, 2, i) for i in range(2)] == [3, 2]
+    assert workers_share(0, 3, 0) == 0
+
+
+async def test_broken_pool_is_shut_down_before_thread_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    class _BrokenPool:
+        def __init__(self) -> None:
+            self.shutdown_calls: list[dict] = []
+
+        def submit(self, *args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+            raise chart_renderer.BrokenProcessPool("worker died")
+
+        def shutdown(self, **kwargs) -> None:  # noqa: ANN003
+            self.shutdown_calls.append(kwargs)
+
+    pool = _BrokenPool()
+    charts = ChartRenderer(workers=1)
+    charts._executor = pool  # type: ignore[assignment]
+    monkeypatch.setattr(chart_renderer, "_render", lambda kind, params: PNG_MAGIC)
+
+    assert await charts._get("three_scenarios", {}) == PNG_MAGIC
+    assert not charts.started
+    assert pool.shutdown_calls == [{"wait": False, "cancel_futures": True}]
+
+
+async def test_thread_renders_run_one_at_a_time(monkeypatch: pytest.MonkeyPatch) -> None:
+    active = 0
+    peak = 0
+
+    def slow_render(kind: str, params: dict) -> bytes:
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        time.sleep(0.02)
+        active -= 1
+        return PNG_MAGIC
+
+    monkeypatch.setattr(chart_renderer, "_render", slow_render)
+    charts = ChartRenderer(workers=0)
+    # Разные параметры — разные ключи кэша, поэтому это три отдельные отрисовки.
+    await asyncio.gather(*(charts._get("three_scenarios", {"n": n}) for n in range(3)))
+    assert peak == 1
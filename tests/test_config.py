@@ -6,7 +6,7 @@ from unittest.mock import patch
 
 import pytest
 
-from bot.config import Settings, load_settings, _default_sqlite_url
+from bot.config import DatabaseSettings, Settings, load_settings, _default_sqlite_url
 
 
 class TestDefaultSqliteUrl:
@@ -122,6 +122,81 @@ class TestLoadSettings:
         assert s.openai_base_url == "https://api.proxyapi.ru/openai/v1"
 
 
+    def test_uses_env_database_pool_settings(self) -> None:
+        with patch.dict(
+            os.environ,
+            {
+                "TELEGRAM_BOT_TOKEN": "123:abc",
+                "OPENAI_API_KEY": "sk-fake",
+                "DB_POOL_SIZE": "25",
+                "DB_MAX_OVERFLOW": "0",
+                "DB_POOL_PRE_PING": "false",
+                "DB_STATEMENT_CACHE_SIZE": "0",
+                "SQLITE_BUSY_TIMEOUT_MS": "10000",
+            },
+            clear=False,
+        ):
+            with patch("bot.config.load_dotenv"):
+                s = load_settings()
+        assert s.database.pool_size == 25
+        assert s.database.max_overflow == 0
+        assert s.database.pool_pre_ping is False
+        assert s.database.statement_cache_size == 0
+        assert s.database.sqlite_busy_timeout_ms == 10000
+        assert s.database.pool_recycle_s == DatabaseSettings().pool_recycle_s
+
+    def test_webhook_mode_requires_url_and_derives_secret(self) -> None:
+        env = {"TELEGRAM_BOT_TOKEN": "123:abc", "OPENAI_API_KEY": "sk-fake", "RUN_MODE": "webhook", "WEBHOOK_URL": ""}
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                with pytest.raises(ValueError, match="WEBHOOK_URL"):
+                    load_settings()
+        env |= {"WEBHOOK_URL": "https://bot.example", "WEBHOOK_SECRET": "", "WEBHOOK_WORKERS": "3"}
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                s = load_settings()
+        assert s.run_mode == "webhook"
+        assert s.webhook.workers == 3
+        assert s.webhook.path == "/telegram/webhook"
+        assert len(s.webhook.secret_token) == 64
+        assert "abc" not in s.webhook.secret_token
+
+    def test_multiple_workers_require_webhook_and_shared_fsm(self) -> None:
+        env = {"TELEGRAM_BOT_TOKEN": "123:abc", "OPENAI_API_KEY": "sk-fake", "BOT_WORKERS": "4", "RUN_MODE": ""}
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                with pytest.raises(ValueError, match="RUN_MODE=webhook"):
+                    load_settings()
+        env |= {"RUN_MODE": "webhook", "WEBHOOK_URL": "https://bot.example", "FSM_STORAGE": "memory"}
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                with pytest.raises(ValueError, match="FSM_STORAGE"):
+                    load_settings()
+        env["FSM_STORAGE"] = "sql"
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                s = load_settings()
+        assert s.bot_workers == 4
+        assert s.scheduler_lease_ttl_s == 30.0
+        assert s.shared_deployment is True
+
+    def test_shared_deployment_without_extra_workers(self) -> None:
+        env = {"TELEGRAM_BOT_TOKEN": "123:abc", "OPENAI_API_KEY": "sk-fake", "BOT_WORKERS": "1", "RUN_MODE": ""}
+        with patch.dict(os.environ, env | {"SHARED_DEPLOYMENT": ""}, clear=False):
+            with patch("bot.config.load_dotenv"):
+                assert load_settings().shared_deployment is False
+        env |= {"SHARED_DEPLOYMENT": "true", "FSM_STORAGE": "memory"}
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                with pytest.raises(ValueError, match="FSM_STORAGE"):
+                    load_settings()
+        env["FSM_STORAGE"] = "sql"
+        with patch.dict(os.environ, env, clear=False):
+            with patch("bot.config.load_dotenv"):
+                s = load_settings()
+        assert (s.bot_workers, s.shared_deployment) == (1, True)
+
+
 class TestSettingsDataclass:
     def test_settings_instance_has_expected_fields(self) -> None:
         s = Settings(
@@ -53,3 +53,47 @@ async def test_init_db_raises_without_engine() -> None:
             await init_db()
     finally:
         conn._engine = old_engine
+
+
+async def test_file_sqlite_engine_applies_pragmas_and_times_checkouts(tmp_path) -> None:
+    import bot.database.connection as conn
+    from sqlalchemy import text
+
+    from bot.config import DatabaseSettings
+
+    options = DatabaseSettings(sqlite_busy_timeout_ms=1234, sqlite_cache_size_kib=2048, slow_checkout_ms=0.0)
+    init_engine(f"sqlite+aiosqlite:///{tmp_path / 'nutri.db'}", options)
+    try:
+        async with get_sessionmaker()() as session:
+            pragmas = {
+                name: (await session.execute(text(f"PRAGMA {name}"))).scalar()
+                for name in ("journal_mode", "synchronous", "busy_timeout", "cache_size", "temp_store")
+            }
+        assert pragmas == {
+            "journal_mode": "wal",
+            "synchronous": 1,
+            "busy_timeout": 1234,
+            "cache_size": -2048,
+            "temp_store": 2,
+        }
+        stats = conn.get_pool_checkout_stats()
+        assert stats is not None
+        assert stats.checkouts >= 1
+        assert stats.slow_checkouts == stats.checkouts
+    finally:
+        if conn._engine:
+            await conn._engine.dispose()
+        conn._engine = None
+        conn._sessionmaker = None
+
+
+def test_engine_options_for_postgres_include_pool_and_statement_cache() -> None:
+    from bot.config import DatabaseSettings
+    from bot.database.connection import TimedQueuePool, engine_options
+
+    options = DatabaseSettings(pool_size=20, max_overflow=5, pool_recycle_s=600, statement_cache_size=0)
+    kwargs = engine_options("postgresql+asyncpg://localhost/nutri", options)
+    assert kwargs["poolclass"] is TimedQueuePool
+    assert (kwargs["pool_size"], kwargs["max_overflow"], kwargs["pool_recycle"]) == (20, 5, 600)
+    assert kwargs["pool_pre_ping"] is True
+    assert kwargs["connect_args"] == {"prepared_statement_cache_size": 0}
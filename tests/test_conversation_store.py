@@ -0,0 +1,79 @@
+"""Тесты истории диалога (bot.services.conversation_store)."""
+from __future__ import annotations
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmark.db import count_queries
+from bot.database import crud
+from bot.database.models import ConversationMessage
+from bot.services.conversation_store import ConversationStore
+
+
+async def _message_count(sessionmaker: async_sessionmaker, telegram_id: int) -> int:
+    async with sessionmaker() as session:
+        result = await session.execute(
+            select(func.count()).where(ConversationMessage.telegram_id == telegram_id)
+        )
+        return int(result.scalar_one())
+
+
+async def test_clear_old_conversation_keeps_latest_pairs(sessionmaker: async_sessionmaker) -> None:
+    async with sessionmaker() as session:
+        for i in range(5):
+            await crud.add_conversation_turn(session, 1, f"q{i}", f"a{i}")
+        await crud.add_conversation_turn(session, 2, "чужой", "ответ")
+        assert await crud.clear_old_conversation(session, 1, keep_pairs=2) == 6
+        # Меньше сообщений, чем нужно оставить, — ничего не удаляется.
+        assert await crud.clear_old_conversation(session, 2, keep_pairs=2) == 0
+        assert await crud.get_recent_conversation(session, 1) == [("q3", "a3"), ("q4", "a4")]
+        assert await crud.get_recent_conversation(session, 2) == [("чужой", "ответ")]
+
+
+async def test_turn_costs_one_read_on_miss_and_none_on_hit(
+    db_engine, sessionmaker: async_sessionmaker
+) -> None:
+    async with sessionmaker() as session:
+        await crud.add_conversation_turn(session, 1, "старый", "ответ")
+    store = ConversationStore(sessionmaker, max_pairs=2)
+
+    with count_queries(db_engine) as miss:
+        assert await store.history(1) == [("старый", "ответ")]
+    assert miss.count == 1
+
+    await store.append(1, "q1", "a1")
+    await store.append(1, "q2", "a2")
+    with count_queries(db_engine) as hit:
+        assert await store.history(1) == [("q1", "a1"), ("q2", "a2")]
+    assert hit.count == 0
+    assert (store.hits, store.misses) == (1, 1)
+    # Запись насквозь: в БД столько же пар, сколько в кэше.
+    assert await _message_count(sessionmaker, 1) == 4
+    async with sessionmaker() as session:
+        assert await crud.get_recent_conversation(session, 1) == await store.history(1)
+
+
+async def test_lru_evicts_least_recent_user_and_forget(sessionmaker: async_sessionmaker) -> None:
+    store = ConversationStore(sessionmaker, max_users=2)
+    for tid in (1, 2):
+        await store.history(tid)
+    await store.history(1)
+    await store.history(3)
+    await store.history(1)
+    assert (store.hits, store.misses) == (2, 3)
+
+    await store.append(2, "q", "a")
+    store.forget(1)
+    assert await store.history(2) == [("q", "a")]
+    assert await store.history(1) == []
+    assert store.misses == 5
+
+
+async def test_disabled_cache_reads_history_from_db(sessionmaker: async_sessionmaker) -> None:
+    store = ConversationStore(sessionmaker, max_users=0)
+    other = ConversationStore(sessionmaker, max_users=0)
+    assert await store.history(5) == []
+    await other.append(5, "вопрос", "ответ")
+    # Запись другого процесса видна сразу: в памяти ничего не осталось.
+    assert await store.history(5) == [("вопрос", "ответ")]
+    assert store.hits == 0
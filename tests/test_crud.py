@@ -1,13 +1,16 @@
 """Тесты CRUD и вспомогательных функций (bot.database.crud)."""
 from __future__ import annotations
 
-from datetime import UTC, date, datetime, time
+from datetime import UTC, date, datetime, time, timedelta
 from zoneinfo import ZoneInfo
 
 import pytest
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from benchmark.db import count_queries
 from bot.database import crud
+from bot.database.connection import unit_of_work
 from bot.database.models import MealLog, User, WeightLog
 
 
@@ -265,3 +268,189 @@ class TestGroupChatCrud:
         await crud.remove_group_chat(session, -100234)
         chats = await crud.get_group_chats(session)
         assert chats == []
+
+
+class TestDailyNutritionRollup:
+    async def test_writers_maintain_rollup(
+        self, session: AsyncSession, sample_user_data: dict
+    ) -> None:
+        await crud.create_or_update_user(session, sample_user_data)
+        tid = sample_user_data["telegram_id"]
+        first = await crud.add_meal_log(session, tid, "а", 100.0, 10.0, 5.0, 20.0)
+        second = await crud.add_meal_log(session, tid, "б", 200.0, 20.0, 10.0, 40.0)
+        await crud.add_water_log(session, tid, 250)
+        await crud.update_meal_log(session, tid, first.id, {"calories": 150.0})
+        await crud.delete_meal_log(session, tid, second.id)
+
+        today = datetime.now(tz=UTC).date()
+        rows = await crud.get_daily_nutrition(session, tid, today, today)
+        assert len(rows) == 1
+        assert rows[0].calories == 150.0
+        assert rows[0].protein_g == 10.0
+        assert rows[0].meals_count == 1
+        assert rows[0].water_ml == 250
+
+    async def test_update_moving_meal_to_other_day(
+        self, session: AsyncSession, sample_user_data: dict
+    ) -> None:
+        await crud.create_or_update_user(session, sample_user_data)
+        tid = sample_user_data["telegram_id"]
+        row = await crud.add_meal_log(session, tid, "а", 100.0, 10.0, 5.0, 20.0)
+        await crud.update_meal_log(
+            session, tid, row.id, {"logged_at": datetime(2025, 3, 1, 12, 0, tzinfo=UTC)}
+        )
+        rows = await crud.get_daily_nutrition(session, tid, date(2025, 1, 1), date(2030, 1, 1))
+        by_date = {r.local_date: r for r in rows}
+        assert by_date[date(2025, 3, 1)].calories == 100.0
+        assert by_date[date(2025, 3, 1)].meals_count == 1
+        assert by_date[datetime.now(tz=UTC).date()].meals_count == 0
+
+    async def test_rebuild_matches_incremental_and_follows_timezone(
+        self, session: AsyncSession, sample_user_data: dict
+    ) -> None:
+        await crud.create_or_update_user(session, sample_user_data)
+        tid = sample_user_data["telegram_id"]
+        session.add_all(
+            [
+                MealLog(
+                    telegram_id=tid,
+                    description="поздний ужин",
+                    calories=500.0,
+                    protein_g=30.0,
+                    fat_g=20.0,
+                    carbs_g=50.0,
+                    logged_at=datetime(2025, 2, 15, 22, 30, tzinfo=UTC),
+                ),
+                MealLog(
+                    telegram_id=tid,
+                    description="обед",
+                    calories=700.0,
+                    protein_g=40.0,
+                    fat_g=25.0,
+                    carbs_g=80.0,
+                    logged_at=datetime(2025, 2, 15, 12, 0, tzinfo=UTC),
+                ),
+            ]
+        )
+        await session.commit()
+        assert await crud.rebuild_daily_nutrition(session, tid) == 1
+        rows = await crud.get_daily_nutrition(session, tid, date(2025, 2, 15), date(2025, 2, 16))
+        assert [(r.local_date, r.calories, r.meals_count) for r in rows] == [
+            (date(2025, 2, 15), 1200.0, 2)
+        ]
+
+        # Смена часового пояса пересобирает агрегат: ужин 22:30 UTC — уже 16-е по Москве.
+        await crud.create_or_update_user(session, {"telegram_id": tid, "timezone": "Europe/Moscow"})
+        rows = await crud.get_daily_nutrition(session, tid, date(2025, 2, 15), date(2025, 2, 16))
+        assert [(r.local_date, r.calories, r.meals_count) for r in rows] == [
+            (date(2025, 2, 15), 700.0, 1),
+            (date(2025, 2, 16), 500.0, 1),
+        ]
+
+    async def test_daily_avg_stats_reads_rollup(
+        self, session: AsyncSession, sample_user_data: dict
+    ) -> None:
+        await crud.create_or_update_user(session, sample_user_data)
+        tid = sample_user_data["telegram_id"]
+        await crud.add_meal_log(session, tid, "а", 100.0, 10.0, 5.0, 20.0)
+        await crud.add_meal_log(session, tid, "б", 300.0, 20.0, 10.0, 40.0)
+        await crud.add_water_log(session, tid, 500)
+        stats = await crud.get_daily_avg_stats(
+            session, tid, datetime(2020, 1, 1, tzinfo=UTC), datetime(2030, 1, 1, tzinfo=UTC)
+        )
+        assert stats["avg_calories"] == 400.0
+        assert stats["meals_count"] == 2.0
+        assert stats["days_with_data"] == 1.0
+
+    async def test_daily_avg_stats_matches_raw_meals_in_user_timezone(
+        self, session: AsyncSession, sample_user_data: dict
+    ) -> None:
+        tz = ZoneInfo("Asia/Vladivostok")
+        tid = sample_user_data["telegram_id"]
+        await crud.create_or_update_user(session, {**sample_user_data, "timezone": "Asia/Vladivostok"})
+        now = datetime.now(tz=UTC)
+        # Приёмы около полуночи по Владивостоку (14:00 UTC) на протяжении 10 суток.
+        session.add_all(
+            MealLog(
+                telegram_id=tid,
+                description=f"м{i}",
+                calories=100.0 + i,
+                protein_g=1.0,
+                fat_g=1.0,
+                carbs_g=1.0,
+                logged_at=now - timedelta(hours=11 * i + 1),
+            )
+            for i in range(22)
+        )
+        await session.commit()
+        await crud.rebuild_daily_nutrition(session, tid)
+
+        for days in (1, 7):
+            # Старый расчёт по сырым приёмам: N локальных суток пользователя, включая сегодня.
+            first_day = now.astimezone(tz).date() - timedelta(days=days - 1)
+            start, _ = crud.day_bounds(first_day, timezone=tz)
+            daily: dict[date, float] = {}
+            for meal in await crud.get_meals_for_period(session, tid, start, now):
+                day = meal.logged_at.replace(tzinfo=UTC).astimezone(tz).date()
+                daily[day] = daily.get(day, 0.0) + meal.calories
+
+            stats = await crud.get_daily_avg_stats(session, tid, now - timedelta(days=days), now)
+            assert stats["days_with_data"] == len(daily) <= days
+            assert stats["avg_calories"] == pytest.approx(sum(daily.values()) / len(daily))
+            totals = await crud.get_daily_totals(session, tid, now - timedelta(days=days), now)
+            assert [row["date"] for row in totals] == [day.isoformat() for day in sorted(daily)]
+
+
+class TestUnitOfWork:
+    async def test_staged_writes_get_ids_and_commit_once(
+        self, sessionmaker, sample_user_data: dict
+    ) -> None:
+        async with sessionmaker() as s:
+            await crud.create_or_update_user(s, sample_user_data)
+        tid = sample_user_data["telegram_id"]
+        async with unit_of_work(sessionmaker) as s:
+            meal = await crud.add_meal_log(s, tid, "а", 100.0, 10.0, 5.0, 20.0, commit=False)
+            user_row, assistant_row = await crud.add_conversation_turn(s, tid, "вопрос", "ответ", commit=False)
+            assert meal.id is not None
+            assert user_row.id < assistant_row.id
+            assert assistant_row.created_at is not None
+            assert s.in_transaction()
+
+        async with sessionmaker() as s:
+            assert len(await crud.get_meals_for_day(s, tid)) == 1
+            assert await crud.get_recent_conversation(s, tid) == [("вопрос", "ответ")]
+
+    async def test_exception_rolls_back(self, sessionmaker, sample_user_data: dict) -> None:
+        async with sessionmaker() as s:
+            await crud.create_or_update_user(s, sample_user_data)
+        tid = sample_user_data["telegram_id"]
+        with pytest.raises(RuntimeError):
+            async with unit_of_work(sessionmaker) as s:
+                await crud.add_water_log(s, tid, 250, commit=False)
+                raise RuntimeError("boom")
+        async with sessionmaker() as s:
+            assert await crud.get_water_summary_for_day(s, tid) == 0
+            today = datetime.now(tz=UTC).date()
+            assert await crud.get_daily_nutrition(s, tid, today, today) == []
+
+    async def test_conversation_turn_commits_once(
+        self, db_engine, sessionmaker, sample_user_data: dict
+    ) -> None:
+        tid = sample_user_data["telegram_id"]
+        async with sessionmaker() as s:
+            await crud.add_conversation_turn(s, tid, "старый вопрос", "старый ответ")
+        commits: list[int] = []
+        listener = lambda conn: commits.append(1)  # noqa: E731
+        event.listen(db_engine.sync_engine, "commit", listener)
+        try:
+            with count_queries(db_engine) as counter:
+                async with unit_of_work(sessionmaker) as s:
+                    await crud.add_conversation_turn(s, tid, "q", "a", commit=False)
+                    await crud.clear_old_conversation(s, tid, keep_pairs=1, commit=False)
+        finally:
+            event.remove(db_engine.sync_engine, "commit", listener)
+        # Два INSERT ... RETURNING и один DELETE; без refresh после каждой записи.
+        assert counter.count == 3
+        assert len(commits) == 1
+        async with sessionmaker() as s:
+            assert await crud.get_recent_conversation(s, tid) == [("q", "a")]
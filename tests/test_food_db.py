@@ -0,0 +1,78 @@
+"""Тесты справочника продуктов (bot.services.food_db) и инструмента lookup_food."""
+from __future__ import annotations
+
+import random
+import statistics
+
+import pytest
+
+from benchmark.food_lookup import measure_lookup_us, synthetic_table
+from bot.services.food_db import MealItem, default_food_table, parse_meal_items, stem
+from bot.tools.food_tools import food_tool_handlers
+
+
+def test_stem_folds_russian_endings() -> None:
+    assert stem("курицы") == stem("курица") == stem("курицей") == "куриц"
+    assert stem("риса") == stem("рис") == "рис"
+    assert stem("eggs") == "egg"
+
+
+def test_parse_meal_items_extracts_quantities() -> None:
+    assert parse_meal_items("200г курицы, 150 г риса") == [
+        MealItem("курицы", grams=200.0),
+        MealItem("риса", grams=150.0),
+    ]
+    assert parse_meal_items("2 яйца и банан") == [MealItem("яйца", pieces=2.0), MealItem("банан")]
+    assert parse_meal_items("кефир 0,5 л; творог 200") == [
+        MealItem("кефир", grams=500.0),
+        MealItem("творог", grams=200.0),
+    ]
+    assert parse_meal_items("Овсянка 60 гр. с бананом 1 шт") == [
+        MealItem("овсянка", grams=60.0),
+        MealItem("бананом", pieces=1.0),
+    ]
+
+
+def test_lookup_ranks_exact_and_fuzzy_matches() -> None:
+    table = default_food_table()
+    best = table.lookup("куриной грудки")[0]
+    assert (best.name, best.confidence) == ("куриная грудка", 1.0)
+    assert table.lookup("chicken breast")[0].name == "куриная грудка"
+    # Опечатка находится, но без полной уверенности.
+    typo = table.lookup("брокколли")[0]
+    assert typo.name == "брокколи" and 0.6 <= typo.confidence < 1.0
+    assert table.lookup("сколько калорий в рисе")[0].confidence < 0.5
+    assert table.lookup("") == []
+
+
+def test_resolve_meal_is_confident_only_for_fully_known_items() -> None:
+    table = default_food_table()
+    resolution = table.resolve_meal("200г курицы, 150 г риса")
+    assert resolution.confident
+    assert resolution.totals() == {"calories": 400.0, "protein_g": 50.5, "fat_g": 4.6, "carbs_g": 38.1}
+    assert resolution.as_estimate("lunch")["description"] == "куриная грудка 200 г, рис отварной 150 г"
+
+    assert table.resolve_meal("2 яйца").totals()["calories"] == pytest.approx(172.7)
+    # Без граммовки, с неизвестным продуктом или с неоднозначным словом — к модели.
+    assert not table.resolve_meal("курица с рисом").confident
+    assert not table.resolve_meal("200 г курицы, 100 г чебурека").confident
+    assert not table.resolve_meal("масло 10 г").confident
+
+
+async def test_lookup_food_tool_returns_portion_and_per_100g() -> None:
+    lookup_food = food_tool_handlers()["lookup_food"]
+    result = await lookup_food({"query": "150 г гречки, банан"})
+    assert not result["confident"]
+    buckwheat, banana = result["items"]
+    assert buckwheat["nutrients"] == {"calories": 165.0, "protein_g": 6.3, "fat_g": 1.7, "carbs_g": 32.0}
+    assert banana["grams"] is None
+    assert banana["matches"][0]["piece_g"] == 120.0
+    assert banana["matches"][0]["per_100g"]["calories"] == 96.0
+
+
+def test_lookup_is_sub_millisecond_on_50k_items() -> None:
+    table, names = synthetic_table(50_000)
+    rng = random.Random(3)
+    timings = measure_lookup_us(table, [rng.choice(names) for _ in range(500)])
+    assert len(table) == 50_000
+    assert statistics.median(timings) < 1_000
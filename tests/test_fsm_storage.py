@@ -0,0 +1,204 @@
+"""Тесты хранилища FSM в БД (bot.services.fsm_storage)."""
+from __future__ import annotations
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+from unittest.mock import MagicMock
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from sqlalchemy import func, select
+
+from benchmark.db import count_queries
+from bot.database import crud
+from bot.database.models import SchedulerLease
+from bot.services.fsm_storage import (
+    FSMWriteBatchMiddleware,
+    SQLAlchemyEventIsolation,
+    SQLAlchemyStorage,
+    create_event_isolation,
+    create_fsm_storage,
+)
+
+KEY = StorageKey(bot_id=1, chat_id=100, user_id=100)
+
+
+class Onboarding(StatesGroup):
+    age = State()
+    height = State()
+
+
+def _context(storage: SQLAlchemyStorage, key: StorageKey = KEY) -> FSMContext:
+    return FSMContext(storage=storage, key=key)
+
+
+async def test_state_and_data_survive_new_storage_instance(sessionmaker) -> None:  # noqa: ANN001
+    state = _context(SQLAlchemyStorage(sessionmaker))
+    await state.set_state(Onboarding.age)
+    await state.update_data(gender="female", age=31)
+
+    restarted = _context(SQLAlchemyStorage(sessionmaker))
+    assert await restarted.get_state() == Onboarding.age.state
+    assert await restarted.get_data() == {"gender": "female", "age": 31}
+    assert await restarted.get_value("age") == 31
+
+
+async def test_keys_are_isolated(sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker)
+    await _context(storage).set_state(Onboarding.age)
+    other = _context(storage, StorageKey(bot_id=1, chat_id=-5, user_id=100))
+    assert await other.get_state() is None
+    assert await other.get_data() == {}
+
+
+async def test_set_state_keeps_data_and_set_data_keeps_state(sessionmaker) -> None:  # noqa: ANN001
+    state = _context(SQLAlchemyStorage(sessionmaker))
+    await state.update_data(age=30)
+    await state.set_state(Onboarding.height)
+    await state.set_data({"height_cm": 170})
+    assert await state.get_state() == Onboarding.height.state
+    assert await state.get_data() == {"height_cm": 170}
+
+
+async def test_batch_writes_once_per_update(db_engine, sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker)
+    state = _context(storage)
+    await state.set_state(Onboarding.age)
+    with count_queries(db_engine) as counter:
+        async with storage.batch():
+            assert await state.get_state() == Onboarding.age.state
+            await state.update_data(age=40)
+            await state.set_state(Onboarding.height)
+            assert await state.get_data() == {"age": 40}
+    # Одно чтение в начале апдейта и один upsert при выходе.
+    assert counter.count == 2
+    assert await _context(SQLAlchemyStorage(sessionmaker)).get_state() == Onboarding.height.state
+
+
+async def test_clear_in_batch_deletes_row(db_engine, sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker)
+    state = _context(storage)
+    await state.set_state(Onboarding.age)
+    await state.update_data(age=40)
+    with count_queries(db_engine) as counter:
+        async with storage.batch():
+            await state.clear()
+    assert counter.count == 1
+    async with sessionmaker() as session:
+        assert await crud.get_fsm_state(session, storage.key_builder.build(KEY)) is None
+
+
+async def test_batch_flushes_when_handler_fails(sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker)
+    with pytest.raises(RuntimeError):
+        async with storage.batch():
+            await _context(storage).set_state(Onboarding.age)
+            raise RuntimeError("handler failed")
+    assert await _context(storage).get_state() == Onboarding.age.state
+
+
+async def test_expired_state_is_ignored_and_purged(sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker, ttl_s=-1)
+    state = _context(storage)
+    await state.set_state(Onboarding.age)
+    await state.update_data(age=30)
+    assert await state.get_state() is None
+
+    # Запись поверх истёкшей не возвращает старые поля.
+    storage.ttl_s = 3600
+    await state.set_state(Onboarding.height)
+    assert await state.get_data() == {}
+
+    async with sessionmaker() as session:
+        removed = await crud.delete_expired_fsm_states(session, now=datetime.now(tz=UTC) + timedelta(hours=2))
+    assert removed == 1
+    assert await state.get_state() is None
+
+
+async def test_middleware_wraps_handler_in_batch(db_engine, sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker)
+
+    async def handler(event, data):  # noqa: ANN001, ANN202
+        state = _context(storage)
+        await state.set_state(Onboarding.age)
+        await state.update_data(gender="male")
+        return "ok"
+
+    with count_queries(db_engine) as counter:
+        assert await FSMWriteBatchMiddleware(storage)(handler, MagicMock(), {}) == "ok"
+    # update_data читает текущие данные; state и data пишутся одним upsert.
+    assert counter.count == 2
+    assert await _context(storage).get_data() == {"gender": "male"}
+
+
+def test_create_fsm_storage_selects_backend(sessionmaker) -> None:  # noqa: ANN001
+    settings = MagicMock(fsm_storage="sql", fsm_state_ttl_days=1.0, fsm_redis_url=None)
+    storage = create_fsm_storage(settings, sessionmaker)
+    assert isinstance(storage, SQLAlchemyStorage)
+    assert storage.ttl_s == 24 * 3600
+
+    settings.fsm_storage = "memory"
+    assert isinstance(create_fsm_storage(settings, sessionmaker), MemoryStorage)
+
+    settings.fsm_storage = "redis"
+    with pytest.raises(ValueError, match="FSM_REDIS_URL"):
+        create_fsm_storage(settings, sessionmaker)
+
+    settings.fsm_storage = "etcd"
+    with pytest.raises(ValueError, match="Unknown FSM storage"):
+        create_fsm_storage(settings, sessionmaker)
+
+
+async def test_event_isolation_serializes_key_across_processes(replicas) -> None:  # noqa: ANN001
+    first = SQLAlchemyEventIsolation(replicas[0], holder="worker-1")
+    second = SQLAlchemyEventIsolation(replicas[1], holder="worker-2")
+    order: list[str] = []
+
+    async def update(isolation: SQLAlchemyEventIsolation, name: str, key: StorageKey = KEY) -> None:
+        async with isolation.lock(key):
+            order.append(f"{name}:in")
+            await asyncio.sleep(0.1)
+            order.append(f"{name}:out")
+
+    task = asyncio.create_task(update(first, "a"))
+    await asyncio.sleep(0.02)
+    other_key = StorageKey(bot_id=1, chat_id=200, user_id=200)
+    await asyncio.gather(update(second, "b"), update(second, "c", other_key))
+    await task
+    # Чужой ключ не ждёт, тот же ключ ждёт выхода из блокировки другого процесса.
+    assert order.index("c:in") < order.index("a:out") < order.index("b:in")
+    # Блокировки удаляются при выходе и не копятся в scheduler_lease.
+    async with replicas[0]() as session:
+        assert (await session.execute(select(func.count()).select_from(SchedulerLease))).scalar() == 0
+
+
+async def test_event_isolation_renews_lock_during_long_handler(replicas) -> None:  # noqa: ANN001
+    first = SQLAlchemyEventIsolation(replicas[0], ttl_s=0.3, heartbeat_s=0.05, holder="worker-1")
+    second = SQLAlchemyEventIsolation(replicas[1], ttl_s=0.3, heartbeat_s=0.05, holder="worker-2")
+    order: list[str] = []
+
+    async def update(isolation: SQLAlchemyEventIsolation, name: str, duration_s: float) -> None:
+        async with isolation.lock(KEY):
+            order.append(f"{name}:in")
+            await asyncio.sleep(duration_s)
+            order.append(f"{name}:out")
+
+    # Обработчик идёт втрое дольше ttl_s: без продления второй процесс вошёл бы раньше.
+    task = asyncio.create_task(update(first, "a", 0.9))
+    await asyncio.sleep(0.02)
+    await update(second, "b", 0.0)
+    await task
+    assert order == ["a:in", "a:out", "b:in", "b:out"]
+
+
+def test_create_event_isolation_depends_on_shared_deployment(sessionmaker) -> None:  # noqa: ANN001
+    storage = SQLAlchemyStorage(sessionmaker)
+    settings = MagicMock(shared_deployment=False)
+    assert isinstance(create_event_isolation(settings, storage, sessionmaker), SimpleEventIsolation)
+    settings.shared_deployment = True
+    assert isinstance(create_event_isolation(settings, storage, sessionmaker), SQLAlchemyEventIsolation)
+    with pytest.raises(ValueError, match="cannot isolate events"):
+        create_event_isolation(settings, MemoryStorage(), sessionmaker)
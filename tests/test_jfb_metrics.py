@@ -0,0 +1,95 @@
+"""Тесты метрик задержки JFB (benchmark.metrics) и режима --sweep-concurrency."""
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from benchmark import jfb
+from benchmark.metrics import cost_usd, percentile, percentile_table, timed_http_client, track_request
+from estimator import ImageOptions
+
+FIXTURE = Path(__file__).parent / "fixtures" / "jfb"
+
+
+def test_percentile_interpolates() -> None:
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == pytest.approx(50.5)
+    assert percentile(values, 99) == pytest.approx(99.01)
+    assert percentile([], 90) == 0.0
+    assert percentile_table([2.0, 1.0]) == {"p50": 1.5, "p90": 1.9, "p99": 1.99, "mean": 1.5, "max": 2.0}
+
+
+def test_cost_uses_known_prices_or_override() -> None:
+    assert cost_usd("gpt-4o-mini", 1_000_000, 1_000_000, None) == pytest.approx(0.75)
+    assert cost_usd("my-model", 1_000_000, 0, (1.0, 2.0)) == pytest.approx(1.0)
+    assert cost_usd("my-model", 10, 10, None) is None
+
+
+async def test_http_hook_marks_time_to_first_byte() -> None:
+    client = timed_http_client()
+    (hook,) = client.event_hooks["response"]
+    with track_request() as timing:
+        await hook(MagicMock())
+        first = timing.ttfb_s
+        await hook(MagicMock())
+    await client.aclose()
+    # Вне track_request хук ничего не делает.
+    await hook(MagicMock())
+    assert first is not None and first >= 0
+    assert timing.ttfb_s == first
+
+
+async def test_concurrency_sweep_reports_throughput(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    async def _create(**kwargs):  # noqa: ANN003, ANN202
+        content = '{"description": "блюдо", "calories": 300, "protein_g": 10, "fat_g": 10, "carbs_g": 30}'
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=500, completion_tokens=50),
+        )
+
+    live = MagicMock()
+    live.chat.completions.create = AsyncMock(side_effect=_create)
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(jfb, "AsyncOpenAI", lambda **kwargs: live)
+    cassette = tmp_path / "c.gz"
+    await jfb.run_benchmark(
+        0,
+        "gpt-4o-mini",
+        4,
+        None,
+        None,
+        None,
+        ImageOptions(max_side=64),
+        dataset_dir=FIXTURE,
+        record_path=str(cassette),
+        jsonl_file=str(tmp_path / "recorded.jsonl"),
+    )
+
+    report_path = tmp_path / "sweep.json"
+    await jfb.run_benchmark(
+        0,
+        "gpt-4o-mini",
+        1,
+        str(report_path),
+        None,
+        None,
+        ImageOptions(max_side=64),
+        dataset_dir=FIXTURE,
+        replay_path=str(cassette),
+        replay_latency="const:0.05",
+        sweep_concurrency=[1, 4],
+    )
+
+    rows = json.loads(report_path.read_text())["concurrency_sweep"]
+    assert [row["concurrency"] for row in rows] == [1, 4]
+    serial, parallel = rows
+    assert parallel["throughput_images_per_s"] > 2 * serial["throughput_images_per_s"]
+    assert serial["queue_wait_s"]["max"] > parallel["queue_wait_s"]["max"]
+    assert serial["ttfb_s"]["p50"] >= 0.05
+    assert serial["tokens"] == {"prompt": 2000, "completion": 200, "prompt_per_call": 500.0}
+    assert serial["cost_usd"] == pytest.approx((2000 * 0.15 + 200 * 0.6) / 1_000_000)
+    assert serial["wmape"] == parallel["wmape"]
@@ -0,0 +1,202 @@
+"""Тесты записи и воспроизведения JFB без сети (benchmark.cassette, benchmark.jfb)."""
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import random
+from pathlib import Path
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from benchmark import jfb
+from benchmark.cassette import Cassette, CassetteMiss, ReplayClient, cassette_image, parse_latency, prompt_hash
+from estimator import ImageOptions
+from estimator.cache import SQLiteVisionStore, VisionCache
+
+FIXTURE = Path(__file__).parent / "fixtures" / "jfb"
+
+
+def _live_client() -> MagicMock:
+    answers = iter(range(100))
+
+    async def _create(**kwargs):  # noqa: ANN003, ANN202
+        n = next(answers)
+        content = json.dumps({"description": f"блюдо {n}", "calories": 300 + n, "protein_g": 10, "fat_g": 10, "carbs_g": 30})
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(prompt_tokens=700, completion_tokens=40, total_tokens=740),
+        )
+
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=_create)
+    return client
+
+
+async def _run(tmp_path: Path, name: str, **kwargs) -> dict:  # noqa: ANN003
+    await jfb.run_benchmark(
+        0,
+        kwargs.pop("model", "gpt-4o-mini"),
+        2,
+        str(tmp_path / f"{name}.json"),
+        str(tmp_path / f"{name}.csv"),
+        None,
+        ImageOptions(max_side=64),
+        dataset_dir=FIXTURE,
+        **kwargs,
+    )
+    path = tmp_path / f"{name}.json"
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+async def test_record_then_replay_offline(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    live = _live_client()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(jfb, "AsyncOpenAI", lambda **kwargs: live)
+    cassette_path = tmp_path / "jfb.cassette.gz"
+
+    recorded = await _run(tmp_path, "recorded", record_path=str(cassette_path))
+    assert live.chat.completions.create.await_count == 4
+    assert len(Cassette(cassette_path)) == 4
+
+    # Воспроизведение не обращается к API и не требует ключа.
+    monkeypatch.delenv("OPENAI_API_KEY")
+    monkeypatch.setattr(jfb, "load_dotenv", lambda: None)
+    replayed = await _run(
+        tmp_path, "replayed", replay_path=str(cassette_path), replay_latency="uniform:0,0.005", seed=3
+    )
+
+    assert live.chat.completions.create.await_count == 4
+    assert replayed["images_evaluated"] == recorded["images_evaluated"] == 4
+    assert replayed["wmape"] == recorded["wmape"]
+    assert sorted(d["pred"]["calories"] for d in replayed["details"]) == [300, 301, 302, 303]
+    with open(tmp_path / "replayed.csv", encoding="utf-8") as f:
+        assert [row["image_id"] for row in csv.DictReader(f)] == ["fx-1", "fx-2", "fx-3", "fx-4"]
+
+
+async def test_replay_misses_are_reported_as_errors(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(jfb, "load_dotenv", lambda: None)
+    report = await _run(tmp_path, "empty", replay_path=str(tmp_path / "missing.cassette.gz"))
+    assert report == {}
+
+
+async def test_replay_client_keys_by_image_model_and_prompt(tmp_path: Path) -> None:
+    cassette = Cassette(tmp_path / "c.gz")
+    request = {"model": "m", "messages": [{"role": "user", "content": [{"type": "text", "text": "оцени"}]}]}
+    cassette.add("img-1", "m", prompt_hash(request), content='{"calories": 1}', usage=None, latency_s=0.2)
+    client = ReplayClient(Cassette(tmp_path / "c.gz"))
+
+    with cassette_image("img-1"):
+        response = await client.chat.completions.create(**request)
+    assert response.choices[0].message.content == '{"calories": 1}'
+    with cassette_image("img-2"), pytest.raises(CassetteMiss):
+        await client.chat.completions.create(**request)
+    assert (client.hits, client.misses) == (1, 1)
+
+
+def test_prompt_hash_ignores_image_payload() -> None:
+    def request(url: str, text: str = "оцени") -> dict:
+        image = {"type": "image_url", "image_url": {"url": url, "detail": "auto"}}
+        return {"messages": [{"role": "user", "content": [{"type": "text", "text": text}, image]}]}
+
+    assert prompt_hash(request("data:a")) == prompt_hash(request("data:b"))
+    assert prompt_hash(request("data:a")) != prompt_hash(request("data:a", text="оцени точнее"))
+
+
+def test_parse_latency() -> None:
+    rng = random.Random(1)
+    assert parse_latency("0")(rng, 5.0) == 0.0
+    assert parse_latency("const:0.3")(rng, None) == 0.3
+    assert parse_latency("recorded")(rng, 1.25) == 1.25
+    assert 0.5 <= parse_latency("uniform:0.5,1")(rng, None) <= 1
+    samples = sorted(parse_latency("lognormal:1.2,0.4")(rng, None) for _ in range(2001))
+    assert samples[1000] == pytest.approx(1.2, rel=0.1)
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
+
+
+async def test_resume_skips_scored_images(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    live = _live_client()
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(jfb, "AsyncOpenAI", lambda **kwargs: live)
+    first = await _run(tmp_path, "run")
+    jsonl = tmp_path / "run.jsonl"
+    lines = jsonl.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 4 and first["images_evaluated"] == 4
+
+    # Прогон «упал» на середине записи третьей строки.
+    jsonl.write_text("\n".join(lines[:2]) + "\n" + lines[2][:25], encoding="utf-8")
+    resumed = await _run(tmp_path, "run", resume=True)
+
+    assert live.chat.completions.create.await_count == 6
+    assert resumed["images_evaluated"] == 4
+    assert sorted(d["image_id"] for d in resumed["details"]) == ["fx-1", "fx-2", "fx-3", "fx-4"]
+    with open(tmp_path / "run.csv", encoding="utf-8") as f:
+        assert [row["image_id"] for row in csv.DictReader(f)] == ["fx-1", "fx-2", "fx-3", "fx-4"]
+
+
+async def test_evaluate_keeps_bounded_number_of_samples_in_flight(tmp_path: Path) -> None:
+    in_flight = 0
+    peak = 0
+    produced = 0
+
+    async def _create(**kwargs):  # noqa: ANN003, ANN202
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))], usage=None)
+
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(side_effect=_create)
+    image = FIXTURE / "fsb_images" / "fx-1.jpg"
+
+    def _samples():  # noqa: ANN202
+        nonlocal produced
+        for i in range(200):
+            produced += 1
+            # Производитель не убегает дальше очереди и занятых обработчиков.
+            assert produced - (client.chat.completions.create.await_count - in_flight) <= 3 * 3 + 1
+            yield {"image_id": str(i), "image_path": image, "meal_name": "x", "gt": dict.fromkeys(jfb.MACRO_KEYS, 1.0)}
+
+    scored, errors, _ = await jfb._evaluate(
+        client, "m", _samples(), 3, ImageOptions(max_side=32), None, tmp_path / "r.jsonl", total=200
+    )
+    assert (scored, errors, peak) == (200, 0, 3)
+    assert jfb._aggregate(tmp_path / "r.jsonl").n == 200
+
+
+async def test_cached_sample_is_prepared_once_and_sends_nothing(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    prepared: list[int] = []
+    original = jfb.preprocess_image
+
+    def _counting_preprocess(image_bytes: bytes, options: ImageOptions):  # noqa: ANN202
+        prepared.append(len(image_bytes))
+        return original(image_bytes, options)
+
+    monkeypatch.setattr(jfb, "preprocess_image", _counting_preprocess)
+    monkeypatch.setattr("estimator.cache.preprocess_image", _counting_preprocess)
+    client = _live_client()
+    store = SQLiteVisionStore(tmp_path / "vision.db")
+    cache = VisionCache(store)
+    sample = {
+        "image_id": "1",
+        "image_path": FIXTURE / "fsb_images" / "fx-1.jpg",
+        "meal_name": "x",
+        "gt": dict.fromkeys(jfb.MACRO_KEYS, 1.0),
+    }
+
+    miss = await jfb._score_sample(client, "m", sample, ImageOptions(max_side=32), cache, 0.0)
+    hit = await jfb._score_sample(client, "m", sample, ImageOptions(max_side=32), cache, 0.0)
+    store.close()
+
+    # Одна подготовка на вызов: при промахе кэш не готовит фото второй раз.
+    assert len(prepared) == 2
+    assert (miss["from_cache"], hit["from_cache"]) == (False, True)
+    assert miss["sent_bytes"] > 0 and hit["sent_bytes"] == 0
+    assert client.chat.completions.create.await_count == 1
@@ -0,0 +1,149 @@
+"""Тесты выбора лидера планировщика и журнала запусков (bot.services.leader)."""
+from __future__ import annotations
+
+import asyncio
+from datetime import UTC, datetime, timedelta
+
+import pytest
+
+from bot.database import crud
+from bot.services import leader as leader_module
+from bot.services.leader import LeaderElector, job_slot
+
+T0 = datetime(2026, 10, 17, 10, 0, tzinfo=UTC)
+
+
+async def test_lease_has_single_holder_and_fencing_token_grows(session) -> None:  # noqa: ANN001
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "a", ttl_s=30, now=T0) == 1
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "b", ttl_s=30, now=T0) is None
+    # Продление тем же держателем не меняет токен.
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "a", ttl_s=30, now=T0 + timedelta(seconds=10)) == 1
+    # Истёкшую аренду забирает другой держатель с новым токеном, старый продлить уже не может.
+    later = T0 + timedelta(seconds=41)
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "b", ttl_s=30, now=later) == 2
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "a", ttl_s=30, now=later) is None
+    await crud.release_scheduler_lease(session, "scheduler", "b", now=later)
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "a", ttl_s=30, now=later) == 3
+    lease = await crud.get_scheduler_lease(session, "scheduler")
+    assert (lease.holder, lease.token) == ("a", 3)
+
+
+async def test_job_run_is_claimed_once_and_fenced(session) -> None:  # noqa: ANN001
+    await crud.acquire_scheduler_lease(session, "scheduler", "a", ttl_s=30, now=T0)
+    claim = dict(lease="scheduler", now=T0 + timedelta(seconds=1))
+    assert await crud.claim_scheduler_job_run(session, "daily", "s1", holder="a", token=1, **claim)
+    assert not await crud.claim_scheduler_job_run(session, "daily", "s1", holder="a", token=1, **claim)
+
+    # После перехвата аренды бывший лидер со старым токеном не займёт даже свободный слот,
+    # а новый лидер не повторит уже занятый.
+    failover = T0 + timedelta(seconds=45)
+    assert await crud.acquire_scheduler_lease(session, "scheduler", "b", ttl_s=30, now=failover) == 2
+    assert not await crud.claim_scheduler_job_run(
+        session, "daily", "s2", lease="scheduler", holder="a", token=1, now=failover
+    )
+    assert not await crud.claim_scheduler_job_run(
+        session, "daily", "s1", lease="scheduler", holder="b", token=2, now=failover
+    )
+    assert await crud.claim_scheduler_job_run(session, "daily", "s2", lease="scheduler", holder="b", token=2, now=failover)
+
+    await crud.finish_scheduler_job_run(session, "daily", "s1", token=1, status="done")
+    runs = await crud.get_scheduler_job_runs(session, "daily")
+    assert [(r.slot, r.holder, r.token, r.status) for r in runs] == [
+        ("s1", "a", 1, "done"),
+        ("s2", "b", 2, "running"),
+    ]
+
+
+def test_job_slot_rounds_to_minute() -> None:
+    assert job_slot(datetime(2026, 10, 17, 12, 59, 58, tzinfo=UTC)) == "2026-10-17T13:00Z"
+    assert job_slot(datetime(2026, 10, 17, 13, 0, 2, tzinfo=UTC)) == "2026-10-17T13:00Z"
+
+
+async def test_two_schedulers_run_each_slot_once(replicas) -> None:  # noqa: ANN001
+    electors = [
+        LeaderElector(sm, holder=f"replica-{i}", ttl_s=1.0, heartbeat_s=0.1) for i, sm in enumerate(replicas)
+    ]
+    runs: list[tuple[str, str]] = []
+
+    async def job(name: str) -> str:
+        runs.append((name, "x"))
+        await asyncio.sleep(0.01)
+        return name
+
+    for elector in electors:
+        await elector.start()
+    try:
+        assert sum(e.is_leader for e in electors) == 1
+        # Оба процесса «срабатывают» по таймеру на каждый слот, одновременно.
+        for slot in ("10:00", "11:00", "12:00"):
+            results = await asyncio.gather(
+                *(e.run_once("daily", job, e.holder, slot=slot) for e in electors)
+            )
+            assert sum(r is not None for r in results) == 1
+        leader = next(e for e in electors if e.is_leader)
+        assert len(runs) == 3
+        assert {name for name, _ in runs} == {leader.holder}
+    finally:
+        for elector in electors:
+            await elector.stop()
+
+
+async def test_follower_takes_over_after_leader_dies(replicas) -> None:  # noqa: ANN001
+    first = LeaderElector(replicas[0], holder="first", ttl_s=0.6, heartbeat_s=0.1)
+    second = LeaderElector(replicas[1], holder="second", ttl_s=0.6, heartbeat_s=0.1)
+    await first.start()
+    await second.start()
+    calls: list[str] = []
+
+    async def job(who: str) -> None:
+        calls.append(who)
+
+    try:
+        assert first.is_leader and not second.is_leader
+        await first.run_once("hourly", job, "first", slot="s1")
+        # «Падение» лидера: heartbeat прекращается, аренда не освобождается.
+        await first.stop(release=False)
+        for _ in range(40):
+            if second.is_leader:
+                break
+            await asyncio.sleep(0.05)
+        assert second.is_leader
+        assert second.token == 2
+        # Слот, выполненный до смены лидера, не повторяется; следующий выполняет новый лидер.
+        await second.run_once("hourly", job, "second", slot="s1")
+        await second.run_once("hourly", job, "second", slot="s2")
+        # Бывший лидер с устаревшим токеном слот не займёт.
+        first.token, first._valid_until = 1, float("inf")
+        assert await first.run_once("hourly", job, "first", slot="s3") is None
+    finally:
+        await second.stop()
+    assert calls == ["first", "second"]
+
+
+async def test_failed_job_is_recorded_and_not_retried(sessionmaker) -> None:  # noqa: ANN001
+    elector = LeaderElector(sessionmaker, holder="solo")
+    assert await elector.heartbeat()
+
+    async def boom() -> None:
+        raise RuntimeError("telegram is down")
+
+    with pytest.raises(RuntimeError):
+        await elector.run_once("meal", boom, slot="s1")
+    assert await elector.run_once("meal", boom, slot="s1") is None
+    async with sessionmaker() as session:
+        [run] = await crud.get_scheduler_job_runs(session, "meal")
+    assert run.status == "failed"
+    assert run.finished_at is not None
+
+
+async def test_guard_skips_when_not_leader(sessionmaker, monkeypatch) -> None:  # noqa: ANN001
+    async def job(value: int) -> int:
+        return value * 2
+
+    elector = LeaderElector(sessionmaker, holder="x")
+    guarded = elector.guard("weekly", job)
+    assert await guarded(value=2) is None  # аренда ещё не взята
+    await elector.heartbeat()
+    monkeypatch.setattr(leader_module, "job_slot", lambda _: "fixed")
+    assert await guarded(value=2) == 4
+    assert await guarded(value=2) is None
@@ -1,9 +1,23 @@
 from __future__ import annotations
 
-from datetime import UTC, datetime
+from collections import defaultdict
+from datetime import UTC, datetime, timedelta
+from zoneinfo import ZoneInfo
 
+import pytest
+
+from benchmark.db import count_queries, seed_league_chat
 from bot.database import crud
-from bot.services.league_reports import build_daily_league_report, build_weekly_league_report
+from bot.services.league_reports import (
+    _day_bounds_utc,
+    _pct,
+    _render_report,
+    _user_display_name,
+    _weight_delta_pct,
+    build_daily_league_report,
+    build_league_reports,
+    build_weekly_league_report,
+)
 
 
 async def test_build_daily_league_report_contains_leagues_and_metrics(sessionmaker) -> None:
@@ -78,3 +92,71 @@ async def test_build_weekly_league_report_contains_weekly_goal_pct(sessionmaker)
     assert "Лига: Удержание" in report
     assert "@weekly_user" in report
     assert "50.0% недельной цели" in report
+
+
+async def _legacy_daily_report(session, chat_id: int, tz: ZoneInfo) -> str:
+    """Эталон: прежний построчный алгоритм (запросы на каждого участника)."""
+    users = await crud.get_users_by_ids(session, await crud.get_chat_member_user_ids(session, chat_id))
+    today_local = datetime.now(tz=tz).date()
+    today_start, today_end = _day_bounds_utc(today_local, tz)
+    _, yday_end = _day_bounds_utc(today_local - timedelta(days=1), tz)
+    sections: dict[str, list[str]] = defaultdict(list)
+    for user in users:
+        summary = await crud.get_meal_summary_for_period(session, user.telegram_id, today_start, today_end)
+        w_today = await crud.get_latest_weight_at_or_before(session, user.telegram_id, today_end)
+        w_yday = await crud.get_latest_weight_at_or_before(session, user.telegram_id, yday_end)
+        delta = _weight_delta_pct(
+            w_today.weight_kg if w_today else None, w_yday.weight_kg if w_yday else None
+        )
+        pct = _pct(summary["calories"], user.daily_calories_target)
+        sections[user.goal].append(f"- {_user_display_name(user)}: {pct:.1f}% калорий, вес {delta}")
+    return _render_report(
+        f"Дневная сводка за {today_local.isoformat()}", sections, "Сегодня нет данных для сводки."
+    )
+
+
+async def _legacy_weekly_report(session, chat_id: int, tz: ZoneInfo) -> str:
+    users = await crud.get_users_by_ids(session, await crud.get_chat_member_user_ids(session, chat_id))
+    now_local = datetime.now(tz=tz).date()
+    week_start_local = now_local - timedelta(days=now_local.weekday())
+    week_start, _ = _day_bounds_utc(week_start_local, tz)
+    _, week_end = _day_bounds_utc(now_local, tz)
+    sections: dict[str, list[str]] = defaultdict(list)
+    for user in users:
+        summary = await crud.get_meal_summary_for_period(session, user.telegram_id, week_start, week_end)
+        w_start = await crud.get_latest_weight_at_or_before(session, user.telegram_id, week_start)
+        w_end = await crud.get_latest_weight_at_or_before(session, user.telegram_id, week_end)
+        delta = _weight_delta_pct(
+            w_end.weight_kg if w_end else None, w_start.weight_kg if w_start else None
+        )
+        pct = _pct(summary["calories"], user.daily_calories_target * 7)
+        sections[user.goal].append(f"- {_user_display_name(user)}: {pct:.1f}% недельной цели, вес {delta}")
+    return _render_report(
+        f"Недельная сводка за {week_start_local.isoformat()} - {now_local.isoformat()}",
+        sections,
+        "За неделю нет данных для сводки.",
+    )
+
+
+@pytest.mark.parametrize("timezone_name", ["UTC", "Europe/Moscow", "America/New_York"])
+async def test_batch_reports_match_per_member_algorithm(sessionmaker, timezone_name: str) -> None:
+    tz = ZoneInfo(timezone_name)
+    async with sessionmaker() as session:
+        await seed_league_chat(session, -100700, members=25)
+        daily, weekly = await build_league_reports(session, -100700, timezone_name)
+        assert daily == await _legacy_daily_report(session, -100700, tz)
+        assert weekly == await _legacy_weekly_report(session, -100700, tz)
+        assert daily == await build_daily_league_report(session, -100700, timezone_name)
+        assert weekly == await build_weekly_league_report(session, -100700, timezone_name)
+
+
+async def test_report_query_count_is_constant_in_chat_size(db_engine, sessionmaker) -> None:
+    counts = []
+    for chat_id, members in ((-100801, 5), (-100802, 60)):
+        async with sessionmaker() as session:
+            await seed_league_chat(session, chat_id, members)
+        async with sessionmaker() as session:
+            with count_queries(db_engine) as counter:
+                await build_league_reports(session, chat_id, "UTC")
+            counts.append(counter.count)
+    assert counts[0] == counts[1] == 4
@@ -5,7 +5,11 @@ from types import SimpleNamespace
 from unittest.mock import AsyncMock, MagicMock, patch
 from zoneinfo import ZoneInfo
 
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
 from bot.services import league_scheduler
+from bot.services.broadcast import Broadcaster
 
 
 def _sessionmaker_with_session(session_obj: object):
@@ -23,42 +27,84 @@ def _sessionmaker_with_session(session_obj: object):
     return _SessionMaker()
 
 
+class _RecordingBot:
+    def __init__(self, fail_for: dict[int, Exception] | None = None) -> None:
+        self.sent: list[tuple[int, str]] = []
+        self.fail_for = fail_for or {}
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> None:  # noqa: ANN003
+        _ = kwargs
+        if chat_id in self.fail_for:
+            raise self.fail_for[chat_id]
+        self.sent.append((chat_id, text))
+
+
+def _fast_broadcaster(bot: _RecordingBot) -> Broadcaster:
+    return Broadcaster(bot, global_rate=1000.0, per_chat_interval=0.0)  # type: ignore[arg-type]
+
+
 async def test_send_daily_reports_iterates_all_group_chats(monkeypatch) -> None:
     session = object()
     sessionmaker = _sessionmaker_with_session(session)
-    bot = MagicMock()
+    bot = _RecordingBot()
     chat_rows = [SimpleNamespace(chat_id=-10), SimpleNamespace(chat_id=-20)]
 
     monkeypatch.setattr(league_scheduler.crud, "get_group_chats", AsyncMock(return_value=chat_rows))
-    send_daily_for_chat = AsyncMock()
-    monkeypatch.setattr(league_scheduler, "_send_daily_for_chat", send_daily_for_chat)
+    monkeypatch.setattr(league_scheduler, "_is_weekly_report_day", lambda _tz: False)
+    build_daily = AsyncMock(side_effect=lambda _s, chat_id, _tz: f"report {chat_id}")
+    monkeypatch.setattr(league_scheduler, "build_daily_league_report", build_daily)
 
-    await league_scheduler.send_daily_reports(bot, sessionmaker, "UTC")
+    stats = await league_scheduler.send_daily_reports(bot, sessionmaker, "UTC", _fast_broadcaster(bot))
 
-    assert send_daily_for_chat.await_count == 2
-    send_daily_for_chat.assert_any_await(bot, sessionmaker, -10, "UTC")
-    send_daily_for_chat.assert_any_await(bot, sessionmaker, -20, "UTC")
+    assert stats.sent == 2
+    assert sorted(bot.sent) == [(-20, "report -20"), (-10, "report -10")]
+    build_daily.assert_any_await(session, -10, "UTC")
+    build_daily.assert_any_await(session, -20, "UTC")
 
 
-async def test_send_weekly_reports_iterates_all_group_chats(monkeypatch) -> None:
+async def test_sunday_report_sends_weekly_message_from_one_snapshot(monkeypatch) -> None:
     session = object()
     sessionmaker = _sessionmaker_with_session(session)
-    bot = MagicMock()
+    bot = _RecordingBot()
+
+    chat_rows = [SimpleNamespace(chat_id=-10)]
+    monkeypatch.setattr(league_scheduler.crud, "get_group_chats", AsyncMock(return_value=chat_rows))
+    monkeypatch.setattr(league_scheduler, "_is_weekly_report_day", lambda _tz: True)
+    build_both = AsyncMock(return_value=("daily", "weekly"))
+    monkeypatch.setattr(league_scheduler, "build_league_reports", build_both)
+    build_daily = AsyncMock()
+    monkeypatch.setattr(league_scheduler, "build_daily_league_report", build_daily)
+
+    await league_scheduler.send_daily_reports(bot, sessionmaker, "UTC", _fast_broadcaster(bot))
+
+    assert bot.sent == [(-10, "daily"), (-10, "weekly")]
+    build_both.assert_awaited_once_with(session, -10, "UTC")
+    build_daily.assert_not_awaited()
+
+
+async def test_send_daily_reports_removes_unavailable_chat(monkeypatch) -> None:
+    session = object()
+    sessionmaker = _sessionmaker_with_session(session)
+    bot = _RecordingBot(
+        fail_for={-30: TelegramForbiddenError(method=SendMessage(chat_id=-30, text="x"), message="kicked")}
+    )
     chat_rows = [SimpleNamespace(chat_id=-30)]
 
     monkeypatch.setattr(league_scheduler.crud, "get_group_chats", AsyncMock(return_value=chat_rows))
-    send_weekly_for_chat = AsyncMock()
-    monkeypatch.setattr(league_scheduler, "_send_weekly_for_chat", send_weekly_for_chat)
+    monkeypatch.setattr(league_scheduler, "build_league_digest", AsyncMock(return_value="daily"))
+    remove_chat = AsyncMock()
+    monkeypatch.setattr(league_scheduler.crud, "remove_group_chat", remove_chat)
 
-    await league_scheduler.send_weekly_reports(bot, sessionmaker, "UTC")
+    stats = await league_scheduler.send_daily_reports(bot, sessionmaker, "UTC", _fast_broadcaster(bot))
 
-    send_weekly_for_chat.assert_awaited_once_with(bot, sessionmaker, -30, "UTC")
+    assert stats.blocked == 1
+    remove_chat.assert_awaited_once_with(session, -30)
 
 
 async def test_send_weight_reminders_sends_only_to_matching_timezones(monkeypatch) -> None:
     session = object()
     sessionmaker = _sessionmaker_with_session(session)
-    bot = MagicMock()
+    bot = _RecordingBot()
 
     monkeypatch.setattr(
         league_scheduler.crud,
@@ -68,27 +114,31 @@ async def test_send_weight_reminders_sends_only_to_matching_timezones(monkeypatc
     monkeypatch.setattr(
         league_scheduler.crud,
         "get_user_ids_by_timezones",
-        AsyncMock(return_value=[101, 202]),
+        AsyncMock(return_value=[101, 202, 303]),
+    )
+    monkeypatch.setattr(
+        league_scheduler.crud,
+        "has_weight_log_today",
+        AsyncMock(side_effect=lambda _s, user_id, timezone: user_id == 303),
     )
     monkeypatch.setattr(
         league_scheduler,
         "_timezones_with_hour",
         lambda tzs, target_hour, fallback_tz: ["Europe/Moscow"],
     )
-    send_for_user = AsyncMock()
-    monkeypatch.setattr(league_scheduler, "_send_weight_reminder_for_user", send_for_user)
 
-    await league_scheduler.send_weight_reminders(bot, sessionmaker, "UTC")
+    stats = await league_scheduler.send_weight_reminders(bot, sessionmaker, "UTC", _fast_broadcaster(bot))
 
-    assert send_for_user.await_count == 2
-    send_for_user.assert_any_await(bot, 101)
-    send_for_user.assert_any_await(bot, 202)
+    assert stats is not None
+    assert (stats.sent, stats.skipped) == (2, 1)
+    assert sorted(chat_id for chat_id, _ in bot.sent) == [101, 202]
+    assert all(text == league_scheduler.WEIGHT_REMINDER_TEXT for _, text in bot.sent)
 
 
 async def test_send_weight_reminders_skips_when_no_matching_tz(monkeypatch) -> None:
     session = object()
     sessionmaker = _sessionmaker_with_session(session)
-    bot = MagicMock()
+    bot = _RecordingBot()
 
     monkeypatch.setattr(
         league_scheduler.crud,
@@ -100,12 +150,11 @@ async def test_send_weight_reminders_skips_when_no_matching_tz(monkeypatch) -> N
         "_timezones_with_hour",
         lambda tzs, target_hour, fallback_tz: [],
     )
-    send_for_user = AsyncMock()
-    monkeypatch.setattr(league_scheduler, "_send_weight_reminder_for_user", send_for_user)
 
-    await league_scheduler.send_weight_reminders(bot, sessionmaker, "UTC")
+    stats = await league_scheduler.send_weight_reminders(bot, sessionmaker, "UTC", _fast_broadcaster(bot))
 
-    send_for_user.assert_not_awaited()
+    assert stats is None
+    assert bot.sent == []
 
 
 def test_start_league_scheduler_adds_weight_reminder_job(monkeypatch) -> None:
@@ -143,10 +192,21 @@ def test_start_league_scheduler_adds_weight_reminder_job(monkeypatch) -> None:
     assert scheduler.started is True
     ids = {j["id"] for j in scheduler.jobs}
     assert "weight_reminder_hourly" in ids
+    # Недельная сводка уходит вместе с воскресной дневной, отдельной задачи нет.
+    assert "league_weekly_report" not in ids
     weight_job = next(j for j in scheduler.jobs if j["id"] == "weight_reminder_hourly")
     assert weight_job["func"] is league_scheduler.send_weight_reminders
     assert weight_job["trigger"].kw["minute"] == 0
     assert "hour" not in weight_job["trigger"].kw
+    broadcasters = {id(j["kwargs"]["broadcaster"]) for j in scheduler.jobs}
+    assert len(broadcasters) == 1
+
+    # С выбором лидера каждая задача обёрнута под своим id.
+    leader = MagicMock(guard=lambda job_id, func: (job_id, func))
+    guarded = league_scheduler.start_league_scheduler(bot, sessionmaker, "UTC", leader=leader)
+    assert all(j["func"][0] == j["id"] for j in guarded.jobs)
+    weight_job = next(j for j in guarded.jobs if j["id"] == "weight_reminder_hourly")
+    assert weight_job["func"][1] is league_scheduler.send_weight_reminders
 
 
 async def test_start_league_scheduler_fallback_when_apscheduler_missing(monkeypatch) -> None:
@@ -162,7 +222,9 @@ async def test_start_league_scheduler_fallback_when_apscheduler_missing(monkeypa
 
     result = league_scheduler.start_league_scheduler(bot, sessionmaker, "UTC")
 
-    ctor_mock.assert_called_once_with(bot=bot, sessionmaker=sessionmaker, timezone_name="UTC")
+    ctor_mock.assert_called_once_with(
+        bot=bot, sessionmaker=sessionmaker, timezone_name="UTC", profiles=None, leader=None
+    )
     start_mock.assert_called_once()
     assert result is scheduler_mock
 
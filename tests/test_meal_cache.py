@@ -0,0 +1,158 @@
+"""Тесты кэша оценок КБЖУ (bot.services.meal_cache)."""
+from __future__ import annotations
+
+import json
+from unittest.mock import AsyncMock, MagicMock
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from benchmark.db import count_queries
+from bot.services.ai_agent import AIAgent
+from bot.services.meal_cache import (
+    AgentTurn,
+    MealEstimateCache,
+    agent_turn,
+    is_self_contained,
+    normalize_meal_text,
+    record_logged_meal,
+    record_tool_call,
+    split_reestimate,
+)
+from bot.tools.meal_tools import meal_tool_handlers
+
+OATMEAL = {
+    "description": "Овсянка 60 г с бананом",
+    "calories": 320.0,
+    "protein_g": 9.0,
+    "fat_g": 5.0,
+    "carbs_g": 58.0,
+    "meal_type": "breakfast",
+}
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1_800_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_normalize_canonicalizes_case_spacing_and_units() -> None:
+    expected = "овсянка 60г с бананом"
+    assert normalize_meal_text("Овсянка 60г с бананом") == expected
+    assert normalize_meal_text("  съел овсянка, 60 гр.  с БАНАНОМ!") == expected
+    assert normalize_meal_text("овсянка 60 грамм с бананом") == expected
+    assert normalize_meal_text("Кофе 0,25 л и 2 шт печенья") == "кофе 250мл и 2шт печенья"
+    assert normalize_meal_text("курица 0.2 кг") == normalize_meal_text("курица 200г")
+    assert normalize_meal_text("ёжики") == "ежики"
+
+
+def test_split_reestimate() -> None:
+    assert split_reestimate("пересчитай: овсянка 60г") == (True, "овсянка 60г")
+    assert split_reestimate("Без кэша кофе с молоком") == (True, "кофе с молоком")
+    assert split_reestimate("пересчитайка") == (False, "пересчитайка")
+    assert split_reestimate("кофе") == (False, "кофе")
+
+
+async def test_memory_and_db_hits_with_ttl(db_engine, sessionmaker: async_sessionmaker) -> None:
+    clock = _Clock()
+    cache = MealEstimateCache(sessionmaker, ttl_s=3600.0, clock=clock)
+    key_args = {"model": "gpt-4o-mini", "prompt": "v1"}
+
+    assert await cache.get("Овсянка 60г с бананом", **key_args) is None
+    await cache.put("Овсянка 60г с бананом", OATMEAL, **key_args)
+    with count_queries(db_engine) as memory:
+        assert await cache.get("овсянка 60 гр с бананом", **key_args) == OATMEAL
+    assert memory.count == 0
+
+    # Другой процесс (пустая память) читает ту же запись из таблицы.
+    restarted = MealEstimateCache(sessionmaker, ttl_s=3600.0, clock=clock)
+    assert await restarted.get("овсянка 60г с бананом", **key_args) == OATMEAL
+    assert await restarted.get("овсянка 60г с бананом", model="gpt-4o", prompt="v1") is None
+    assert await restarted.get("овсянка 60г с бананом", model="gpt-4o-mini", prompt="v2") is None
+    assert restarted.stats() == {"memory_hits": 0, "db_hits": 1, "misses": 2, "hit_rate": 0.3333, "entries": 1}
+
+    clock.now += 3601.0
+    assert await cache.get("овсянка 60г с бананом", **key_args) is None
+    assert await restarted.purge_expired() == 1
+    assert len(restarted) == 0
+    assert (cache.memory_hits, cache.misses) == (1, 2)
+
+
+async def test_parse_meal_text_hits_cache_and_refresh_bypasses(sessionmaker: async_sessionmaker) -> None:
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini", meal_cache=MealEstimateCache(sessionmaker))
+    agent.client = MagicMock()
+    agent.client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(
+            choices=[MagicMock(message=MagicMock(content='{"description": "Кофе с молоком", "calories": 60}'))]
+        )
+    )
+
+    first = await agent.parse_meal_text("кофе с молоком")
+    again = await agent.parse_meal_text("Кофе  с молоком")
+    assert again == first
+    assert agent.client.chat.completions.create.await_count == 1
+
+    await agent.parse_meal_text("кофе с молоком", refresh=True)
+    assert agent.client.chat.completions.create.await_count == 2
+
+
+async def test_add_meal_tool_records_logged_estimate(sessionmaker: async_sessionmaker) -> None:
+    handlers = meal_tool_handlers(sessionmaker)
+    with agent_turn() as turn:
+        await handlers["add_meal"]({"telegram_id": 777, **OATMEAL})
+    assert turn.meals == [OATMEAL]
+    # Вне хода агента записи никуда не копятся.
+    await handlers["add_meal"]({"telegram_id": 777, **OATMEAL})
+    assert turn.meals == [OATMEAL]
+
+
+def test_single_meal_requires_add_meal_to_be_the_only_write() -> None:
+    assert AgentTurn(tools=["add_meal"], meals=[OATMEAL]).single_meal() == OATMEAL
+    assert AgentTurn(meals=[OATMEAL]).single_meal() == OATMEAL
+    assert AgentTurn(tools=["add_meal", "add_water"], meals=[OATMEAL]).single_meal() is None
+    assert AgentTurn(tools=["delete_meal", "add_meal"], meals=[OATMEAL]).single_meal() is None
+    assert AgentTurn(tools=["add_meal", "add_meal"], meals=[OATMEAL, OATMEAL]).single_meal() is None
+    with agent_turn() as turn:
+        record_tool_call("add_water")
+        record_logged_meal(OATMEAL)
+    assert turn.tools == ["add_water"]
+    assert turn.single_meal() is None
+
+
+async def test_read_only_tools_do_not_block_caching() -> None:
+    async def _add_meal(args: dict) -> dict:
+        record_logged_meal(args)
+        return {"ok": True}
+
+    agent = AIAgent(api_key="sk-fake", model="gpt-4o-mini")
+    agent.register_tools(
+        [
+            {"type": "function", "function": {"name": "lookup_food"}},
+            {"type": "function", "serial": True, "function": {"name": "add_meal"}},
+        ],
+        {"lookup_food": AsyncMock(return_value={"found": True}), "add_meal": _add_meal},
+    )
+    with agent_turn() as turn:
+        await agent._run_tool_calls([("lookup_food", '{"query": "овсянка"}'), ("add_meal", json.dumps(OATMEAL))])
+    assert turn.tools == ["add_meal"]
+    assert turn.single_meal() == OATMEAL
+
+
+def test_is_self_contained() -> None:
+    assert is_self_contained("Овсянка 60г с бананом")
+    assert is_self_contained("съел 2 яйца и тост")
+    assert not is_self_contained("ещё одну")
+    assert not is_self_contained("как вчера")
+    assert not is_self_contained("мой обычный завтрак")
+    assert not is_self_contained("150")
+
+
+async def test_estimates_are_scoped_to_user(sessionmaker: async_sessionmaker) -> None:
+    cache = MealEstimateCache(sessionmaker)
+    key_args = {"model": "gpt-4o-mini", "prompt": "v1"}
+    await cache.put("кофе с молоком", OATMEAL, user_id=1, **key_args)
+    assert await cache.get("кофе с молоком", user_id=1, **key_args) == OATMEAL
+    assert await cache.get("кофе с молоком", user_id=2, **key_args) is None
+    assert await cache.get("кофе с молоком", **key_args) is None
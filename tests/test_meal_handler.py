@@ -0,0 +1,247 @@
+"""Тесты быстрых путей записи еды (bot.handlers.meal: text_message, photo_meal)."""
+from __future__ import annotations
+
+import base64
+from datetime import UTC, datetime
+from io import BytesIO
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from PIL import Image
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+from bot.handlers import meal as meal_handler
+from bot.prompts import AGENT_SYSTEM
+from bot.services.conversation_store import ConversationStore
+from bot.services.meal_cache import MealEstimateCache, record_logged_meal, record_tool_call
+from bot.services.photo_cache import DatabaseVisionStore
+from bot.services.profile_cache import UserProfileCache
+from estimator.cache import VisionCache
+from estimator.preprocess import ImageOptions
+
+USER_ID = 5150
+
+
+@pytest.fixture
+async def ctx(sessionmaker: async_sessionmaker, monkeypatch) -> SimpleNamespace:  # noqa: ANN001
+    async with sessionmaker() as session:
+        await crud.create_or_update_user(
+            session,
+            {
+                "telegram_id": USER_ID,
+                "gender": "male",
+                "age": 30,
+                "height_cm": 180.0,
+                "weight_start_kg": 80.0,
+                "activity_level": "moderate",
+                "goal": "maintain",
+                "daily_calories_target": 2500.0,
+                "daily_protein_target": 150.0,
+                "daily_fat_target": 80.0,
+                "daily_carbs_target": 280.0,
+            },
+        )
+    agent = MagicMock(model="gpt-4o-mini", vision_model="gpt-4o")
+    agent.ask_stream = MagicMock(side_effect=AssertionError("LLM must not be called"))
+    context = SimpleNamespace(
+        settings=SimpleNamespace(league_report_timezone="UTC", telegram_bot_token="token"),
+        sessionmaker=sessionmaker,
+        agent=agent,
+        conversations=ConversationStore(sessionmaker),
+        profiles=UserProfileCache(sessionmaker),
+        meal_estimates=MealEstimateCache(sessionmaker),
+        photo_estimates=VisionCache(DatabaseVisionStore(sessionmaker)),
+        image_options=ImageOptions(max_side=256),
+    )
+    monkeypatch.setattr(meal_handler, "get_app_context", lambda: context)
+    return context
+
+
+def _message(text: str) -> MagicMock:
+    message = MagicMock()
+    message.text = text
+    message.from_user = SimpleNamespace(id=USER_ID)
+    message.chat = SimpleNamespace(id=USER_ID, type="private")
+    message.answer = AsyncMock()
+    return message
+
+
+async def _meals(sessionmaker: async_sessionmaker) -> list:
+    async with sessionmaker() as session:
+        return await crud.get_meals_for_day(session, USER_ID)
+
+
+async def test_known_foods_are_logged_from_food_table(ctx: SimpleNamespace) -> None:
+    message = _message("200г курицы, 150 г риса")
+    await meal_handler.text_message(message)
+
+    (meal,) = await _meals(ctx.sessionmaker)
+    assert (meal.description, meal.calories) == ("куриная грудка 200 г, рис отварной 150 г", 400.0)
+    assert "справочнику" in message.answer.await_args.args[0]
+    assert await ctx.conversations.history(USER_ID) == [
+        ("200г курицы, 150 г риса", message.answer.await_args.args[0])
+    ]
+
+
+async def test_repeated_meal_is_logged_from_cache(ctx: SimpleNamespace) -> None:
+    estimate = {
+        "description": "Кофе с молоком",
+        "calories": 60.0,
+        "protein_g": 2.0,
+        "fat_g": 2.5,
+        "carbs_g": 4.0,
+        "meal_type": "breakfast",
+    }
+    await ctx.meal_estimates.put(
+        "кофе с молоком", estimate, model="gpt-4o-mini", prompt=AGENT_SYSTEM, user_id=USER_ID
+    )
+
+    await meal_handler.text_message(_message("Кофе с молоком"))
+
+    (meal,) = await _meals(ctx.sessionmaker)
+    # Тип приёма пищи — по текущему часу пользователя, а не из закэшированной оценки.
+    expected_type = meal_handler._meal_type_at(datetime.now(UTC).hour)
+    assert (meal.description, meal.meal_type) == ("Кофе с молоком", expected_type)
+    assert ctx.meal_estimates.memory_hits == 1
+
+
+def _agent_reply(text: str, *tools: str, estimate: dict | None = None):  # noqa: ANN202
+    async def _reply(*args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+        for name in tools:
+            record_tool_call(name)
+        if estimate is not None:
+            record_logged_meal(estimate)
+        yield text
+
+    return _reply
+
+
+MILK = {"description": "Молоко 250 мл", "calories": 130.0, "protein_g": 7.0, "fat_g": 6.0, "carbs_g": 12.0}
+
+
+@pytest.mark.parametrize(
+    ("text", "tools"),
+    [
+        ("выпил стакан молока и 500 мл воды", ("add_meal", "add_water")),
+        ("удали банан и запиши стакан молока", ("delete_meal", "add_meal")),
+        ("ещё стакан молока", ("add_meal",)),
+    ],
+)
+async def test_turn_is_not_cached_unless_it_only_logged_a_self_contained_meal(
+    ctx: SimpleNamespace, text: str, tools: tuple[str, ...]
+) -> None:
+    ctx.agent.ask_stream = MagicMock(side_effect=_agent_reply("Готово", *tools, estimate=MILK))
+    for _ in range(2):
+        message = _message(text)
+        message.answer.return_value = MagicMock(edit_text=AsyncMock())
+        await meal_handler.text_message(message)
+    assert ctx.agent.ask_stream.call_count == 2
+    assert len(ctx.meal_estimates) == 0
+
+
+async def test_single_add_meal_turn_is_cached_per_user(ctx: SimpleNamespace) -> None:
+    ctx.agent.ask_stream = MagicMock(side_effect=_agent_reply("Записал", "add_meal", estimate=MILK))
+    message = _message("стакан молока 250 мл")
+    message.answer.return_value = MagicMock(edit_text=AsyncMock())
+    await meal_handler.text_message(message)
+    assert len(ctx.meal_estimates) == 1
+    assert await ctx.meal_estimates.get(
+        "стакан молока 250 мл", model="gpt-4o-mini", prompt=AGENT_SYSTEM, user_id=USER_ID + 1
+    ) is None
+
+
+async def test_reestimate_goes_to_the_agent(ctx: SimpleNamespace) -> None:
+    async def _reply(*args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+        yield "Пересчитал"
+
+    ctx.agent.ask_stream = MagicMock(side_effect=_reply)
+    message = _message("пересчитай 200г курицы")
+    message.answer.return_value = MagicMock(edit_text=AsyncMock())
+
+    await meal_handler.text_message(message)
+
+    ctx.agent.ask_stream.assert_called_once()
+    assert await _meals(ctx.sessionmaker) == []
+
+
+def _jpeg(size: tuple[int, int]) -> bytes:
+    image = Image.new("RGB", (64, 64))
+    image.putdata([(x * 4, y * 4, (x + y) * 2) for y in range(64) for x in range(64)])
+    buffer = BytesIO()
+    image.resize(size).save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def _photo_message(file_unique_id: str, content: bytes, caption: str | None = None) -> MagicMock:
+    message = _message("")
+    message.text = None
+    message.caption = caption
+    message.photo = [SimpleNamespace(file_id=f"id-{file_unique_id}", file_unique_id=file_unique_id)]
+
+    async def _download(file, destination: BytesIO) -> BytesIO:  # noqa: ANN001
+        destination.write(content)
+        return destination
+
+    message.bot = MagicMock()
+    message.bot.get_file = AsyncMock(return_value=SimpleNamespace(file_path="photos/file.jpg"))
+    message.bot.download = AsyncMock(side_effect=_download)
+    message.answer.return_value = MagicMock(edit_text=AsyncMock())
+    return message
+
+
+async def test_resent_photo_is_logged_without_vision_call(ctx: SimpleNamespace) -> None:
+    estimate = {
+        "description": "Омлет с сыром",
+        "calories": 350.0,
+        "protein_g": 22.0,
+        "fat_g": 27.0,
+        "carbs_g": 3.0,
+        "meal_type": "breakfast",
+    }
+
+    ctx.agent.ask_stream = MagicMock(side_effect=_agent_reply("Записал омлет", "add_meal", estimate=estimate))
+    await meal_handler.photo_meal(_photo_message("a", _jpeg((800, 600))))
+    ctx.agent.ask_stream.assert_called_once()
+
+    # Пересланное и пережатое то же фото: другой file_unique_id, близкий перцептивный хэш.
+    await meal_handler.photo_meal(_photo_message("b", _jpeg((400, 300))))
+    # Тот же файл Telegram: хит без скачивания.
+    repeat = _photo_message("a", b"")
+    await meal_handler.photo_meal(repeat)
+
+    ctx.agent.ask_stream.assert_called_once()
+    repeat.bot.download.assert_not_awaited()
+    assert ctx.photo_estimates.stats()["phash_hits"] == 1
+    assert ctx.photo_estimates.stats()["file_id_hits"] == 1
+    assert "уже оценивалось" in repeat.answer.await_args.args[0]
+
+
+async def test_photo_turn_with_other_tools_is_not_cached(ctx: SimpleNamespace) -> None:
+    ctx.agent.ask_stream = MagicMock(side_effect=_agent_reply("Готово", "add_meal", "add_water", estimate=MILK))
+    await meal_handler.photo_meal(_photo_message("m", _jpeg((800, 600))))
+    await meal_handler.photo_meal(_photo_message("m", _jpeg((800, 600))))
+    assert ctx.agent.ask_stream.call_count == 2
+    assert ctx.photo_estimates.saved_calls == 0
+
+
+async def test_photo_with_other_caption_is_estimated_again(ctx: SimpleNamespace) -> None:
+    await ctx.photo_estimates.put(
+        "scope-of-other-caption", 0, {"description": "x", "calories": 1, "protein_g": 0, "fat_g": 0, "carbs_g": 0}
+    )
+
+    async def _reply(*args, **kwargs):  # noqa: ANN002, ANN003, ANN202
+        yield "Оценил"
+
+    ctx.agent.ask_stream = MagicMock(side_effect=_reply)
+    message = _photo_message("c", _jpeg((640, 480)), caption="пересчитай, это половина порции")
+    await meal_handler.photo_meal(message)
+
+    ctx.agent.ask_stream.assert_called_once()
+    assert ctx.agent.ask_stream.call_args.args[0] == "это половина порции"
+    # Модель получает уменьшенную копию, а не ссылку на файл с токеном бота.
+    (image_url,) = ctx.agent.ask_stream.call_args.kwargs["image_urls"]
+    assert image_url.startswith("data:image/jpeg;base64,")
+    prepared = Image.open(BytesIO(base64.b64decode(image_url.split(",", 1)[1])))
+    assert max(prepared.size) == 256
@@ -4,6 +4,7 @@ from __future__ import annotations
 import pytest
 from sqlalchemy.ext.asyncio import async_sessionmaker
 
+from benchmark.db import count_queries
 from bot.database import crud
 from bot.tools.meal_tools import meal_tool_handlers
 
@@ -90,3 +91,24 @@ async def test_update_meal(
         }
     )
     assert result["ok"] is True
+
+
+async def test_add_meal_uses_single_transaction(
+    db_engine, sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+    handlers = meal_tool_handlers(sessionmaker)
+    args = {
+        "telegram_id": 77777,
+        "description": "рис",
+        "calories": 200.0,
+        "protein_g": 4.0,
+        "fat_g": 1.0,
+        "carbs_g": 44.0,
+    }
+    with count_queries(db_engine) as counter:
+        result = await handlers["add_meal"](args)
+    # SELECT профиля, INSERT ... RETURNING, upsert daily_nutrition, SELECT сводки.
+    assert counter.count == 4
+    assert result["daily_summary"]["consumed"]["calories"] == 200.0
@@ -0,0 +1,117 @@
+"""Тесты сохранённых траекторий планов веса (bot.services.plan_trajectory)."""
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from benchmark.db import count_queries
+from bot.database import crud
+from bot.services import weight_plan
+from bot.services.plan_trajectory import (
+    expected_weight_on,
+    load_plan_trajectory,
+    refresh_plan_trajectories,
+    save_plan_trajectory,
+)
+from bot.services.weight_plan import get_expected_weight_for_date
+
+PLAN_START = datetime(2026, 2, 2, 8, tzinfo=UTC)
+
+
+async def _plan_user(session: AsyncSession, telegram_id: int, **overrides):  # noqa: ANN202
+    data = {
+        "telegram_id": telegram_id,
+        "username": None,
+        "gender": "female",
+        "age": 34,
+        "height_cm": 168.0,
+        "weight_start_kg": 92.4,
+        "activity_level": "light",
+        "goal": "lose",
+        "daily_calories_target": 1800.0,
+        "daily_protein_target": 120.0,
+        "daily_fat_target": 60.0,
+        "daily_carbs_target": 180.0,
+        "target_weight_kg": 78.0,
+        "weight_plan_mode": "medium",
+        "weight_plan_start_date": PLAN_START,
+        "weight_plan_start_kg": 92.4,
+    }
+    data.update(overrides)
+    return await crud.create_or_update_user(session, data)
+
+
+def _reference(user, check_date: datetime) -> float:  # noqa: ANN001
+    return get_expected_weight_for_date(
+        plan_start_date=user.weight_plan_start_date,
+        plan_start_kg=user.weight_plan_start_kg,
+        target_weight=user.target_weight_kg,
+        mode=user.weight_plan_mode,
+        gender=user.gender,
+        age=user.age,
+        height_cm=user.height_cm,
+        activity_level=user.activity_level,
+        check_date=check_date,
+    )
+
+
+async def test_stored_trajectory_matches_forecast(session: AsyncSession) -> None:
+    user = await _plan_user(session, 1)
+    await save_plan_trajectory(session, user)
+    weight_plan.clear_forecast_cache()
+    for days in (0, 3, 7, 45, 200, 2000):
+        check = PLAN_START + timedelta(days=days, hours=5)
+        assert await expected_weight_on(session, user, check) == _reference(user, check)
+
+
+async def test_expected_weight_is_one_indexed_read(db_engine, session: AsyncSession) -> None:  # noqa: ANN001
+    user = await _plan_user(session, 2)
+    await save_plan_trajectory(session, user)
+    weight_plan.clear_forecast_cache()
+    with count_queries(db_engine) as counter:
+        await expected_weight_on(session, user, PLAN_START + timedelta(days=10))
+    assert counter.count == 1
+    assert not weight_plan._TRAJECTORIES
+
+
+async def test_stale_trajectory_is_recomputed_on_read(session: AsyncSession) -> None:
+    user = await _plan_user(session, 3)
+    await save_plan_trajectory(session, user)
+    user.weight_plan_mode = "hard"
+    user.age = 35
+    await session.commit()
+    check = PLAN_START + timedelta(days=40)
+    assert await expected_weight_on(session, user, check) == _reference(user, check)
+    row = await crud.get_weight_plan_trajectory(session, 3)
+    assert row is not None and "|35|" in row.inputs_key and row.inputs_key.endswith("|hard")
+
+
+async def test_missing_plan_returns_none(session: AsyncSession) -> None:
+    user = await _plan_user(session, 4, weight_plan_mode=None)
+    assert await load_plan_trajectory(session, user) is None
+    assert await crud.get_weight_plan_trajectory(session, 4) is None
+
+
+async def test_refresh_writes_only_stale_trajectories(session: AsyncSession) -> None:
+    users = [await _plan_user(session, 10 + i, weight_plan_start_kg=90.0 + i) for i in range(5)]
+    await save_plan_trajectory(session, users[0])
+    users[1].activity_level = "high"
+    await save_plan_trajectory(session, users[1])
+    users[1].activity_level = "low"
+    assert await refresh_plan_trajectories(session, users) == 4
+    assert await refresh_plan_trajectories(session, users) == 0
+    for user in users:
+        row = await crud.get_weight_plan_trajectory(session, user.telegram_id)
+        stored = weight_plan.Trajectory.from_bytes(row.weights)
+        assert stored.weights == weight_plan._simulate(
+            weight_plan.PlanInputs.normalized(
+                user.weight_plan_start_kg,
+                user.target_weight_kg,
+                user.gender,
+                user.age,
+                user.height_cm,
+                user.activity_level,
+                user.weight_plan_mode,
+            )
+        )
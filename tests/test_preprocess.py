@@ -0,0 +1,69 @@
+"""Тесты подготовки фото перед vision-вызовом (estimator.preprocess)."""
+from __future__ import annotations
+
+import base64
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+from estimator.preprocess import ImageOptions, preprocess_image
+
+# EXIF: 0x0112 — ориентация, 0x010F — производитель камеры.
+_ORIENTATION = 0x0112
+_MAKE = 0x010F
+
+
+def _jpeg(size: tuple[int, int], *, orientation: int | None = None) -> bytes:
+    image = Image.new("RGB", size, (200, 120, 40))
+    exif = Image.Exif()
+    exif[_MAKE] = "PhoneMaker"
+    if orientation is not None:
+        exif[_ORIENTATION] = orientation
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=95, exif=exif)
+    return buffer.getvalue()
+
+
+def test_downscales_long_side_and_strips_exif() -> None:
+    data = _jpeg((4000, 3000))
+    prepared = preprocess_image(data, ImageOptions(max_side=768))
+
+    image = Image.open(BytesIO(prepared.data))
+    assert image.size == (768, 576) == (prepared.width, prepared.height)
+    assert dict(image.getexif()) == {}
+    assert prepared.original_size == len(data) > len(prepared.data)
+
+
+def test_applies_exif_orientation_before_stripping() -> None:
+    prepared = preprocess_image(_jpeg((1200, 800), orientation=6), ImageOptions(max_side=600))
+    assert (prepared.width, prepared.height) == (400, 600)
+
+
+def test_small_images_are_not_upscaled_and_zero_keeps_size() -> None:
+    assert preprocess_image(_jpeg((300, 200)), ImageOptions(max_side=1024)).width == 300
+    assert preprocess_image(_jpeg((3000, 200)), ImageOptions(max_side=0)).width == 3000
+
+
+def test_webp_data_uri_and_transparency() -> None:
+    image = Image.new("RGBA", (100, 100), (0, 0, 0, 0))
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    prepared = preprocess_image(buffer.getvalue(), ImageOptions(format="WEBP", detail="low"))
+
+    assert prepared.mime == "image/webp"
+    assert prepared.image_url_part()["detail"] == "low"
+    header, payload = prepared.data_uri.split(",", 1)
+    assert header == "data:image/webp;base64"
+    decoded = Image.open(BytesIO(base64.b64decode(payload)))
+    assert decoded.convert("RGB").getpixel((50, 50)) == (255, 255, 255)
+
+
+def test_options_are_validated() -> None:
+    with pytest.raises(ValueError):
+        ImageOptions(format="GIF")
+    with pytest.raises(ValueError):
+        ImageOptions(detail="ultra")
+    with pytest.raises(ValueError):
+        ImageOptions(quality=0)
+    assert ImageOptions(max_side=768, detail="low").signature == "jpeg768q85low"
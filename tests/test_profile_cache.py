@@ -0,0 +1,180 @@
+"""Тесты кэша профилей (bot.services.profile_cache)."""
+from __future__ import annotations
+
+import dataclasses
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.database import crud
+from bot.services.profile_cache import UserProfileCache
+from bot.tools.goal_tools import goal_tool_handlers
+from bot.tools.meal_tools import meal_tool_handlers
+from bot.tools.user_tools import user_tool_handlers
+from bot.tools.water_tools import water_tool_handlers
+
+
+@pytest.fixture
+def sample_user_data() -> dict:
+    return {
+        "telegram_id": 4242,
+        "username": "cache_test",
+        "gender": "female",
+        "age": 31,
+        "height_cm": 168.0,
+        "weight_start_kg": 64.0,
+        "activity_level": "light",
+        "goal": "maintain",
+        "daily_calories_target": 1900.0,
+        "daily_protein_target": 95.0,
+        "daily_fat_target": 60.0,
+        "daily_carbs_target": 230.0,
+        "timezone": "Europe/Moscow",
+    }
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _count_user_loads(db_engine) -> list[str]:  # noqa: ANN001
+    statements: list[str] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        _ = (conn, cursor, parameters, context, executemany)
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            statements.append(statement)
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _before)
+    return statements
+
+
+async def test_snapshot_is_immutable_and_counted(
+    sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+    cache = UserProfileCache(sessionmaker)
+
+    first = await cache.get(4242)
+    second = await cache.get(4242)
+    assert first is second
+    assert first is not None and first.timezone == "Europe/Moscow"
+    assert (cache.hits, cache.misses) == (1, 1)
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        first.goal = "lose"  # type: ignore[misc]
+
+
+async def test_ttl_lru_and_negative_entries(
+    sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+    clock = _Clock()
+    cache = UserProfileCache(sessionmaker, ttl_s=30.0, max_entries=2, clock=clock)
+
+    assert await cache.get(1) is None
+    assert await cache.get(1) is None
+    await cache.get(4242)
+    await cache.get(2)
+    # Вытеснен самый давний по использованию — незарегистрированный 1.
+    assert len(cache) == 2
+    await cache.get(1)
+    assert (cache.hits, cache.misses) == (1, 4)
+
+    clock.now += 31.0
+    await cache.get(1)
+    assert cache.misses == 5
+
+
+async def test_uncached_reads_database_every_time(
+    sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+    cache = UserProfileCache.uncached(sessionmaker)
+
+    await cache.get(4242)
+    await cache.get(4242)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+async def test_invalidate_during_load_is_not_cached(
+    sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+    cache = UserProfileCache(sessionmaker)
+    async with sessionmaker() as s:
+        original = crud.get_user
+
+        async def _racing_get_user(session, telegram_id):  # noqa: ANN001, ANN202
+            user = await original(session, telegram_id)
+            cache.invalidate(telegram_id)
+            return user
+
+        crud.get_user = _racing_get_user  # type: ignore[assignment]
+        try:
+            await cache.get(4242, s)
+        finally:
+            crud.get_user = original  # type: ignore[assignment]
+    assert len(cache) == 0
+
+
+async def test_agent_turn_loads_profile_once(
+    db_engine, sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+        await crud.set_daily_water_target(s, 4242, 2000)
+    cache = UserProfileCache(sessionmaker)
+    meal = meal_tool_handlers(sessionmaker, profiles=cache)
+    water = water_tool_handlers(sessionmaker, profiles=cache)
+
+    loads = _count_user_loads(db_engine)
+    # Обработчик сообщения проверяет профиль, затем агент вызывает три инструмента.
+    assert await cache.get(4242) is not None
+    await meal["add_meal"](
+        {
+            "telegram_id": 4242,
+            "description": "суп",
+            "calories": 300.0,
+            "protein_g": 12.0,
+            "fat_g": 9.0,
+            "carbs_g": 30.0,
+        }
+    )
+    summary = await meal["get_today_summary"]({"telegram_id": 4242})
+    result = await water["add_water"]({"telegram_id": 4242, "amount_ml": 300})
+
+    assert len(loads) == 1
+    assert (cache.hits, cache.misses) == (3, 1)
+    assert summary["targets"]["daily_calories_target"] == 1900.0
+    assert result["target_ml"] == 2000
+
+
+async def test_writers_invalidate_cached_profile(
+    sessionmaker: async_sessionmaker, sample_user_data: dict
+) -> None:
+    async with sessionmaker() as s:
+        await crud.create_or_update_user(s, sample_user_data)
+    cache = UserProfileCache(sessionmaker)
+    goal = goal_tool_handlers(sessionmaker, profiles=cache)
+    user_tools = user_tool_handlers(sessionmaker, profiles=cache)
+
+    assert (await cache.get(4242)).target_weight_kg is None  # type: ignore[union-attr]
+    await goal["set_weight_goal"]({"telegram_id": 4242, "target_weight_kg": 60.0})
+    profile = await cache.get(4242)
+    assert profile is not None
+    assert (profile.target_weight_kg, profile.goal) == (60.0, "lose")
+
+    result = await user_tools["update_user_profile"]({"telegram_id": 4242, "fields": {"age": 45}})
+    profile = await cache.get(4242)
+    assert profile is not None and profile.age == 45
+    assert profile.daily_calories_target == result["new_targets"]["daily_calories_target"]
+    assert cache.misses == 3
@@ -0,0 +1,83 @@
+"""Проверка планов запросов: горячие CRUD-функции используют составные индексы по telegram_id."""
+from __future__ import annotations
+
+from collections.abc import Awaitable, Callable
+from datetime import UTC, date, datetime
+from typing import Any
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from bot.database import crud
+
+TID = 4242
+
+
+async def _captured_statements(
+    db_engine: AsyncEngine,
+    session: AsyncSession,
+    call: Callable[[AsyncSession], Awaitable[Any]],
+) -> list[tuple[str, Any]]:
+    captured: list[tuple[str, Any]] = []
+
+    def _before(conn, cursor, statement, parameters, context, executemany):  # noqa: ANN001
+        _ = (conn, cursor, context, executemany)
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    event.listen(db_engine.sync_engine, "before_cursor_execute", _before)
+    try:
+        await call(session)
+    finally:
+        event.remove(db_engine.sync_engine, "before_cursor_execute", _before)
+    return captured
+
+
+async def _query_plan(db_engine: AsyncEngine, statement: str, parameters: Any) -> str:
+    async with db_engine.connect() as conn:
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return "\n".join(str(row[-1]) for row in result.all())
+
+
+@pytest.mark.parametrize(
+    ("call", "index_name"),
+    [
+        (lambda s: crud.get_meals_for_day(s, TID), "ix_meal_logs_telegram_id_logged_at"),
+        (lambda s: crud.get_meal_summary_for_day(s, TID), "ix_meal_logs_telegram_id_logged_at"),
+        (
+            lambda s: crud.has_meals_in_last_hours(s, TID, now=datetime(2026, 1, 1, tzinfo=UTC)),
+            "ix_meal_logs_telegram_id_logged_at",
+        ),
+        (lambda s: crud.get_latest_weight(s, TID), "ix_weight_logs_telegram_id_logged_at"),
+        (
+            lambda s: crud.get_latest_weight_at_or_before(s, TID, datetime(2026, 1, 1, tzinfo=UTC)),
+            "ix_weight_logs_telegram_id_logged_at",
+        ),
+        (lambda s: crud.has_weight_log_today(s, TID), "ix_weight_logs_telegram_id_logged_at"),
+        (lambda s: crud.get_water_summary_for_day(s, TID), "ix_water_logs_telegram_id_logged_at"),
+        (
+            lambda s: crud.get_recent_conversation(s, TID),
+            "ix_conversation_messages_telegram_id_created_at",
+        ),
+        (
+            lambda s: crud.get_daily_checkin(s, TID, date(2026, 1, 1)),
+            "ix_daily_checkins_telegram_id_checkin_date",
+        ),
+        (
+            lambda s: crud.has_achievement_badge(s, TID, "streak_3"),
+            "ix_achievements_telegram_id_badge_key",
+        ),
+    ],
+)
+async def test_crud_query_uses_composite_index(
+    db_engine: AsyncEngine,
+    session: AsyncSession,
+    call: Callable[[AsyncSession], Awaitable[Any]],
+    index_name: str,
+) -> None:
+    statements = await _captured_statements(db_engine, session, call)
+    assert statements
+    plans = [await _query_plan(db_engine, sql, params) for sql, params in statements]
+    assert any(index_name in plan for plan in plans), plans
+    assert not any("SCAN" in plan and "USING" not in plan for plan in plans), plans
@@ -81,3 +81,34 @@ async def test_message_without_from_user_passes_through(
     msg.from_user = None
     result = await middleware(handler, msg, {})
     assert result == "handled"
+
+
+async def test_shared_limit_counts_requests_of_all_processes(sessionmaker, handler: AsyncMock) -> None:  # noqa: ANN001
+    from datetime import datetime
+
+    from aiogram.types import Chat, Message, User
+    from sqlalchemy import select
+
+    from bot.database.models import RateLimitWindow
+
+    msg = Message(
+        message_id=1,
+        date=datetime.now(),
+        chat=Chat(id=1, type="private"),
+        from_user=User(id=777, is_bot=False, first_name="T"),
+    )
+    # Два экземпляра над одной БД — как два процесса бота.
+    workers = [OpenAIRateLimitMiddleware(max_requests_per_minute=2, sessionmaker=sessionmaker) for _ in range(2)]
+    answer_mock = AsyncMock()
+    with patch.object(Message, "answer", answer_mock):
+        with patch("bot.middlewares.rate_limit.time.time", return_value=6_000_010.0):
+            results = [await workers[i % 2](handler, msg, {}) for i in range(3)]
+        assert results == ["handled", "handled", None]
+        answer_mock.assert_called_once()
+
+        with patch("bot.middlewares.rate_limit.time.time", return_value=6_000_070.0):
+            assert await workers[1](handler, msg, {}) == "handled"
+    async with sessionmaker() as session:
+        rows = (await session.execute(select(RateLimitWindow))).scalars().all()
+    # Прошлое окно удалено первым запросом нового.
+    assert [(row.window_start, row.hits) for row in rows] == [(6_000_060, 1)]
@@ -24,10 +24,29 @@ def test_get_app_context_raises_when_not_set() -> None:
 
 
 def test_app_context_has_expected_attrs() -> None:
-    settings = MagicMock()
+    settings = MagicMock(chart_workers=2, bot_workers=1, shared_deployment=False)
     sessionmaker = MagicMock()
     agent = MagicMock()
     ctx = AppContext(settings=settings, sessionmaker=sessionmaker, agent=agent)
     assert ctx.settings is settings
     assert ctx.sessionmaker is sessionmaker
     assert ctx.agent is agent
+
+
+def test_chart_workers_are_split_across_bot_processes() -> None:
+    settings = MagicMock(chart_workers=2, bot_workers=4, shared_deployment=True)
+    workers = [
+        AppContext(settings=settings, sessionmaker=MagicMock(), agent=MagicMock(), worker_index=i).charts.workers
+        for i in range(4)
+    ]
+    assert workers == [1, 1, 0, 0]
+
+
+def test_process_caches_are_off_in_shared_deployment() -> None:
+    def _context(shared: bool) -> AppContext:
+        settings = MagicMock(chart_workers=0, bot_workers=1, shared_deployment=shared)
+        return AppContext(settings=settings, sessionmaker=MagicMock(), agent=MagicMock())
+
+    single, shared = _context(False), _context(True)
+    assert single.profiles.ttl_s > 0 and single.conversations.max_users > 0 and single.meal_estimates.max_entries > 0
+    assert (shared.profiles.ttl_s, shared.conversations.max_users, shared.meal_estimates.max_entries) == (0, 0, 0)
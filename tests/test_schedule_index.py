@@ -0,0 +1,122 @@
+"""Тесты индекса расписания почасовых задач (bot.services.schedule_index)."""
+from __future__ import annotations
+
+from datetime import UTC, datetime, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from bot.database import crud
+from bot.services.schedule_index import (
+    MEAL_REMINDER,
+    WEEKLY_COACHING,
+    due_user_ids,
+    next_offset_change,
+    parse_reminder_hours,
+    refresh_schedule_index,
+    utc_slot_for_local,
+)
+
+ZONES = [None, "Europe/Moscow", "Europe/Berlin", "America/New_York", "Asia/Kolkata", "Pacific/Chatham"]
+
+
+async def _add_user(session: AsyncSession, telegram_id: int, timezone: str | None, reminders: str | None) -> None:
+    await crud.create_or_update_user(
+        session,
+        {
+            "telegram_id": telegram_id,
+            "gender": "male",
+            "age": 30,
+            "height_cm": 180.0,
+            "weight_start_kg": 80.0,
+            "activity_level": "moderate",
+            "goal": "maintain",
+            "daily_calories_target": 2500.0,
+            "daily_protein_target": 120.0,
+            "daily_fat_target": 70.0,
+            "daily_carbs_target": 280.0,
+            "timezone": timezone,
+            "meal_reminder_times": reminders,
+        },
+    )
+
+
+def test_utc_slot_for_local_handles_whole_and_fractional_offsets() -> None:
+    # Понедельник 09:00 в Москве (+3) — понедельник 06:00 UTC.
+    assert utc_slot_for_local(0, 9, 180) == 6
+    # Понедельник 02:00 в Нью-Йорке (-5) — понедельник 07:00 UTC.
+    assert utc_slot_for_local(0, 2, -300) == 7
+    # Понедельник 01:00 в Москве — воскресенье 22:00 UTC.
+    assert utc_slot_for_local(0, 1, 180) == 6 * 24 + 22
+    # Индия (+5:30): тик 04:00 UTC — это 09:30, локальный час 9.
+    assert utc_slot_for_local(0, 9, 330) == 4
+
+
+def test_next_offset_change_finds_dst_transition() -> None:
+    berlin = ZoneInfo("Europe/Berlin")
+    assert next_offset_change(berlin, datetime(2026, 3, 20, tzinfo=UTC)) == datetime(2026, 3, 29, 1, 0, tzinfo=UTC)
+    assert next_offset_change(ZoneInfo("UTC"), datetime(2026, 3, 20, tzinfo=UTC)) is None
+
+
+async def test_due_users_match_local_clock_for_every_slot(session: AsyncSession) -> None:
+    reminders = ["9,13,19", "7,12", None, "0,23", "8", "10,14,18"]
+    for idx, zone in enumerate(ZONES):
+        await _add_user(session, 100 + idx, zone, reminders[idx])
+
+    start = datetime(2026, 10, 19, 0, 0, tzinfo=UTC)
+    for hour in range(7 * 24):
+        now = start + timedelta(hours=hour)
+        meal_due = await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=now)
+        coaching_due = await due_user_ids(session, WEEKLY_COACHING, fallback_tz="UTC", now=now)
+
+        expected_meal = []
+        expected_coaching = []
+        for idx, zone in enumerate(ZONES):
+            local = now.astimezone(ZoneInfo(zone or "UTC"))
+            if local.hour in parse_reminder_hours(reminders[idx]) | {21}:
+                expected_meal.append(100 + idx)
+            if local.weekday() == 6 and local.hour == 20:
+                expected_coaching.append(100 + idx)
+        assert meal_due == expected_meal, now
+        assert coaching_due == expected_coaching, now
+
+
+async def test_dst_transition_triggers_recompute(session: AsyncSession) -> None:
+    await _add_user(session, 1, "Europe/Berlin", "9")
+    before = datetime(2026, 3, 27, 12, 0, tzinfo=UTC)
+    assert await refresh_schedule_index(session, fallback_tz="UTC", now=before) == 1
+    # До перехода 9:00 по Берлину (+1) — 08:00 UTC.
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=before.replace(hour=8)) == [1]
+
+    # После перехода на летнее время (+2) 9:00 — уже 07:00 UTC; индекс пересчитывается сам.
+    monday = datetime(2026, 3, 30, 7, 0, tzinfo=UTC)
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=monday) == [1]
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=monday.replace(hour=8)) == []
+    assert await refresh_schedule_index(session, fallback_tz="UTC", now=monday) == 0
+
+
+async def test_timezone_and_reminder_changes_invalidate_index(session: AsyncSession) -> None:
+    await _add_user(session, 1, "UTC", "9")
+    now = datetime(2026, 10, 19, 9, 0, tzinfo=UTC)
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=now) == [1]
+    assert await refresh_schedule_index(session, fallback_tz="UTC", now=now) == 0
+
+    await crud.create_or_update_user(session, {"telegram_id": 1, "timezone": "Europe/Moscow"})
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=now) == []
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=now.replace(hour=6)) == [1]
+
+    user = await crud.get_user(session, 1)
+    assert user is not None
+    user.meal_reminder_times = "10"
+    await session.commit()
+    assert await refresh_schedule_index(session, fallback_tz="UTC", now=now) == 1
+    assert await due_user_ids(session, MEAL_REMINDER, fallback_tz="UTC", now=now.replace(hour=7)) == [1]
+
+
+async def test_replace_schedule_slots_skips_rows_inserted_concurrently(session: AsyncSession) -> None:
+    await _add_user(session, 1, "UTC", "9")
+    valid_until = datetime(2026, 10, 26, tzinfo=UTC)
+    # Повтор пользователя в пакете воспроизводит вставку тех же строк параллельным пересчётом.
+    entries = [(1, {MEAL_REMINDER: {9}}, valid_until), (1, {MEAL_REMINDER: {9}}, valid_until)]
+    await crud.replace_schedule_slots(session, entries)
+    assert await crud.get_scheduled_user_ids(session, MEAL_REMINDER, 9) == [1]
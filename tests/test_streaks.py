@@ -0,0 +1,148 @@
+"""Тесты пакетного расчёта стриков: совпадение с evaluate_daily_streak_for_user."""
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from datetime import UTC, date, datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from bot.database import crud
+from bot.database.models import Achievement, Base, DailyCheckin, MealLog, User
+from bot.services.streaks import evaluate_daily_streak_for_user, evaluate_daily_streaks
+
+TZ = ZoneInfo("Europe/Moscow")
+DAY = date(2026, 5, 20)
+USER_IDS = list(range(1, 13))
+
+
+@pytest.fixture
+async def second_sessionmaker() -> AsyncIterator[async_sessionmaker[AsyncSession]]:
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(bind=engine, expire_on_commit=False)
+    await engine.dispose()
+
+
+async def _seed(session: AsyncSession) -> None:
+    for tid in USER_IDS:
+        session.add(
+            User(
+                telegram_id=tid,
+                gender="female",
+                age=30,
+                height_cm=165.0,
+                weight_start_kg=60.0,
+                activity_level="moderate",
+                goal="maintain",
+                daily_calories_target=0.0 if tid == 12 else 2000.0,
+                daily_protein_target=100.0,
+                daily_fat_target=60.0,
+                daily_carbs_target=200.0,
+                timezone="Europe/Moscow",
+            )
+        )
+        # История: tid дней подряд с calories_ok до вчера (с разрывом у чётных на 5-м дне).
+        for back in range(1, tid + 1):
+            if tid % 2 == 0 and back == 5:
+                continue
+            session.add(
+                DailyCheckin(
+                    telegram_id=tid,
+                    checkin_date=DAY - timedelta(days=back),
+                    calories_ok=True,
+                    protein_ok=False,
+                    logged_meals=2,
+                )
+            )
+        if tid % 3 == 0:
+            session.add(Achievement(telegram_id=tid, badge_key="streak_3"))
+        # Сегодняшние приёмы пищи: у части пользователей в норме, у части — нет.
+        local_noon = datetime.combine(DAY, time(12, 0), tzinfo=TZ)
+        meals = {0: [], 1: [1900.0], 2: [1000.0, 950.0], 3: [2500.0]}[tid % 4]
+        for idx, calories in enumerate(meals):
+            session.add(
+                MealLog(
+                    telegram_id=tid,
+                    description="meal",
+                    calories=calories,
+                    protein_g=45.0 + tid,
+                    fat_g=20.0,
+                    carbs_g=200.0,
+                    logged_at=(local_noon + timedelta(hours=idx)).astimezone(UTC),
+                )
+            )
+    # Существующий сегодняшний чек-ин должен обновиться, а не задвоиться.
+    session.add(DailyCheckin(telegram_id=1, checkin_date=DAY, calories_ok=False, protein_ok=False, logged_meals=0))
+    await session.commit()
+
+
+async def _state(session: AsyncSession) -> tuple[list[tuple], list[tuple]]:
+    checkins = await session.execute(
+        select(
+            DailyCheckin.telegram_id,
+            DailyCheckin.checkin_date,
+            DailyCheckin.calories_ok,
+            DailyCheckin.protein_ok,
+            DailyCheckin.logged_meals,
+        ).order_by(DailyCheckin.telegram_id, DailyCheckin.checkin_date)
+    )
+    badges = await session.execute(
+        select(Achievement.telegram_id, Achievement.badge_key).order_by(
+            Achievement.telegram_id, Achievement.badge_key
+        )
+    )
+    return [tuple(r) for r in checkins], [tuple(r) for r in badges]
+
+
+@pytest.mark.parametrize("id_batch", [500, 5])
+async def test_bulk_evaluator_matches_per_user_evaluator(
+    sessionmaker, second_sessionmaker, monkeypatch, id_batch: int
+) -> None:
+    # id_batch=5 делит пачку пользователей на несколько IN (...).
+    monkeypatch.setattr(crud, "_ID_BATCH", id_batch)
+    ids = [*USER_IDS, 999]
+    async with sessionmaker() as session:
+        await _seed(session)
+        expected = {
+            tid: await evaluate_daily_streak_for_user(session, tid, timezone=TZ, target_date=DAY)
+            for tid in ids
+        }
+        expected_state = await _state(session)
+
+    async with second_sessionmaker() as session:
+        await _seed(session)
+        actual = await evaluate_daily_streaks(session, ids, timezone=TZ, target_date=DAY)
+        actual_state = await _state(session)
+
+    assert actual == expected
+    assert actual_state == expected_state
+    assert any(result.get("new_badges") for result in actual.values())
+
+
+async def test_bulk_evaluator_is_idempotent_for_badges(sessionmaker) -> None:
+    async with sessionmaker() as session:
+        await _seed(session)
+        first = await evaluate_daily_streaks(session, USER_IDS, timezone=TZ, target_date=DAY)
+        second = await evaluate_daily_streaks(session, USER_IDS, timezone=TZ, target_date=DAY)
+
+    assert any(first[tid]["new_badges"] for tid in USER_IDS)
+    assert all(second[tid]["new_badges"] == [] for tid in USER_IDS)
+    assert [second[tid]["streak_days"] for tid in USER_IDS] == [first[tid]["streak_days"] for tid in USER_IDS]
+
+
+async def test_batched_meal_reads_match_single_user_reads(session: AsyncSession, monkeypatch) -> None:
+    monkeypatch.setattr(crud, "_ID_BATCH", 5)
+    await _seed(session)
+    summaries = await crud.get_meal_summaries_for_users(session, USER_IDS, DAY, timezone=TZ)
+    now = datetime.combine(DAY, time(13, 30), tzinfo=TZ)
+    recent = await crud.has_meals_in_last_hours_many(session, USER_IDS, hours=2, now=now)
+    for tid in USER_IDS:
+        single = await crud.get_meal_summary_for_day(session, tid, DAY, timezone=TZ)
+        meals = await crud.get_meals_for_day(session, tid, DAY, timezone=TZ)
+        assert {k: summaries[tid][k] for k in single} == single
+        assert summaries[tid]["meals_count"] == len(meals)
+        assert (tid in recent) == await crud.has_meals_in_last_hours(session, tid, hours=2, now=now)
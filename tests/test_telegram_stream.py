@@ -0,0 +1,107 @@
+"""Тесты потокового вывода в Telegram (bot.services.telegram_stream)."""
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText
+
+from bot.services.telegram_stream import TelegramStreamSink, preview_text, split_text, stream_reply
+
+
+class _Clock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class _SentMessage:
+    def __init__(self, log: list[tuple], reject_html: bool = False) -> None:
+        self.log = log
+        self.reject_html = reject_html
+
+    async def edit_text(self, text: str, parse_mode: str | None = None) -> None:
+        if parse_mode == "HTML" and self.reject_html:
+            raise TelegramBadRequest(
+                method=EditMessageText(text=text), message="Bad Request: can't parse entities"
+            )
+        self.log.append(("edit", text, parse_mode))
+
+
+class _FakeMessage:
+    def __init__(self, chat_type: str = "private", reject_html: bool = False) -> None:
+        self.chat = SimpleNamespace(type=chat_type)
+        self.log: list[tuple] = []
+        self.reject_html = reject_html
+
+    async def answer(self, text: str, parse_mode: str | None = None) -> _SentMessage:
+        self.log.append(("answer", text, parse_mode))
+        return _SentMessage(self.log, self.reject_html)
+
+
+def test_preview_strips_tags_and_unfinished_tail() -> None:
+    assert preview_text("<b>Итого</b>: 500 ккал &amp; 30 г <i") == "Итого: 500 ккал & 30 г "
+
+
+def test_split_text_prefers_newlines() -> None:
+    text = "a" * 10 + "\n" + "b" * 10
+    assert split_text(text, limit=15) == ["a" * 10, "b" * 10]
+    assert split_text("c" * 25, limit=10) == ["c" * 10, "c" * 10, "c" * 5]
+
+
+async def test_edits_are_throttled_by_interval_and_delta() -> None:
+    clock = _Clock()
+    message = _FakeMessage()
+    sink = TelegramStreamSink(message, min_delta_chars=5, clock=clock)  # type: ignore[arg-type]
+    await sink.start()
+
+    await sink.push("Сначала ")  # раньше интервала — без правки
+    clock.now = 1.0
+    await sink.push("текст")
+    await sink.push(" и ещё")  # интервал не прошёл с прошлой правки
+    clock.now = 2.0
+    await sink.push("!")
+    await sink.finish()
+
+    edits = [entry for entry in message.log if entry[0] == "edit"]
+    assert edits == [
+        ("edit", "Сначала текст", None),
+        ("edit", "Сначала текст и ещё!", None),
+        ("edit", "Сначала текст и ещё!", "HTML"),
+    ]
+    assert sink.edits == 3
+
+
+async def test_group_chats_use_longer_interval() -> None:
+    sink = TelegramStreamSink(_FakeMessage("supergroup"))  # type: ignore[arg-type]
+    assert sink.edit_interval_s == 3.0
+
+
+async def test_final_edit_falls_back_to_plain_text_and_splits_long_reply() -> None:
+    message = _FakeMessage(reject_html=True)
+    long_tail = "x" * 5000
+
+    async def _chunks():  # noqa: ANN202
+        yield "<b>Итог"
+        yield "\n" + long_tail
+
+    answer = await stream_reply(message, _chunks(), error_text="ошибка")  # type: ignore[arg-type]
+
+    assert answer == "<b>Итог\n" + long_tail
+    assert message.log[0] == ("answer", "…", None)
+    assert ("edit", "<b>Итог", None) in message.log
+    tail_parts = [entry[1] for entry in message.log[1:] if entry[0] == "answer"]
+    assert "".join(tail_parts) == long_tail
+
+
+async def test_stream_failure_replaces_placeholder() -> None:
+    message = _FakeMessage()
+
+    async def _broken():  # noqa: ANN202
+        yield "Начал"
+        raise RuntimeError("boom")
+
+    assert await stream_reply(message, _broken(), error_text="Сервис недоступен") is None  # type: ignore[arg-type]
+    assert message.log[-1] == ("edit", "Сервис недоступен", None)
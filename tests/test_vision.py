@@ -55,3 +55,20 @@ async def test_analyze_meal_photo_handles_partial_json(mock_client: MagicMock) -
     assert result["calories"] == 400.0
     assert result["description"] == "Блюдо по фото"
     assert result["protein_g"] == 0.0
+
+
+async def test_analyze_meal_photo_passes_detail_and_records_usage(mock_client: MagicMock) -> None:
+    from estimator.core import VisionUsage
+
+    mock_client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(
+            usage=MagicMock(prompt_tokens=812, completion_tokens=45),
+            choices=[MagicMock(message=MagicMock(content='{"calories": 400}'))],
+        )
+    )
+    usage = VisionUsage()
+    await analyze_meal_photo(mock_client, "gpt-4o", "data:image/jpeg;base64,AA==", detail="low", usage=usage)
+
+    user_content = mock_client.chat.completions.create.await_args.kwargs["messages"][1]["content"]
+    assert user_content[1]["image_url"] == {"url": "data:image/jpeg;base64,AA==", "detail": "low"}
+    assert (usage.calls, usage.prompt_tokens, usage.completion_tokens) == (1, 812, 45)
@@ -0,0 +1,163 @@
+"""Тесты кэша vision-оценок по перцептивному хэшу (estimator.fingerprint, estimator.cache)."""
+from __future__ import annotations
+
+from io import BytesIO
+from pathlib import Path
+from unittest.mock import AsyncMock, MagicMock
+
+from PIL import Image
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from bot.services.photo_cache import DatabaseVisionStore
+from estimator.cache import SQLiteVisionStore, VisionCache, analyze_meal_photo_cached, scope_key
+from estimator.fingerprint import NearDuplicateIndex, dhash, from_signed64, hamming, to_signed64
+
+ESTIMATE = {"description": "Борщ", "calories": 180.0, "protein_g": 6.0, "fat_g": 7.0, "carbs_g": 20.0}
+
+
+def _image(seed: int = 1) -> Image.Image:
+    image = Image.new("RGB", (64, 64))
+    image.putdata(
+        [((x * 4 * seed) % 256, (y * 4) % 256, ((x + y) * 2 * seed) % 256) for y in range(64) for x in range(64)]
+    )
+    return image
+
+
+def _encode(image: Image.Image, size: tuple[int, int], fmt: str = "JPEG", **kwargs) -> bytes:  # noqa: ANN003
+    buffer = BytesIO()
+    image.resize(size).save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+class _MemoryStore:
+    def __init__(self) -> None:
+        self.rows: list[tuple[str, int, str | None, dict]] = []
+        self.loads = 0
+
+    async def load(self, scope: str, *, limit: int | None = None) -> list[tuple[int, str | None, dict]]:
+        self.loads += 1
+        rows = [(phash, fid, estimate) for s, phash, fid, estimate in self.rows if s == scope]
+        return rows[-limit:] if limit else rows
+
+    async def save(self, scope: str, phash: int, file_unique_id: str | None, estimate: dict) -> None:
+        self.rows.append((scope, phash, file_unique_id, estimate))
+
+
+def test_dhash_is_stable_under_resize_and_reencode() -> None:
+    image = _image()
+    original = dhash(_encode(image, (1024, 768), quality=95))
+    assert hamming(original, dhash(_encode(image, (320, 240), quality=40))) <= 3
+    assert hamming(original, dhash(_encode(image, (512, 384), fmt="PNG"))) <= 3
+    assert hamming(original, dhash(_encode(_image(seed=3), (1024, 768)))) > 3
+
+
+def test_signed_roundtrip() -> None:
+    for value in (0, 1, (1 << 63) - 1, 1 << 63, (1 << 64) - 1):
+        signed = to_signed64(value)
+        assert -(1 << 63) <= signed < 1 << 63
+        assert from_signed64(signed) == value
+
+
+def test_near_duplicate_index_prefers_closest() -> None:
+    index: NearDuplicateIndex[str] = NearDuplicateIndex()
+    index.add(0b1111, "far")
+    index.add(0b0001, "near")
+    assert index.nearest(0b0000, max_distance=3) == ("near", 1)
+    assert index.nearest(1 << 48 | 1 << 32 | 1 << 16 | 1 << 5, max_distance=3) is None
+    assert len(index) == 2
+
+
+def test_near_duplicate_index_evicts_oldest() -> None:
+    index: NearDuplicateIndex[str] = NearDuplicateIndex(max_entries=2)
+    index.add(0b0001, "first")
+    index.add(1 << 20, "second")
+    index.add(0b0011, "third")
+    assert len(index) == 2
+    assert index.nearest(0b0001, max_distance=0) is None
+    assert index.nearest(0b0001, max_distance=1) == ("third", 1)
+    assert index.nearest(1 << 20, max_distance=0) == ("second", 0)
+
+
+async def test_cache_bounds_scopes_and_entries() -> None:
+    store = _MemoryStore()
+    cache = VisionCache(store, max_scopes=2, max_entries=2)
+    hashes = (0x00FF, 0xFF00 << 16, 0xFFFF << 48)
+    for phash, file_id in zip(hashes, ("f1", "f2", "f3"), strict=True):
+        await cache.put("shared", phash, ESTIMATE, file_unique_id=file_id)
+    # В памяти только две последние записи области, старая — только в хранилище.
+    assert await cache.lookup_file_id("shared", "f1") is None
+    assert await cache.lookup_file_id("shared", "f3") == ESTIMATE
+
+    await cache.lookup("a", 1)
+    await cache.lookup("b", 1)
+    assert list(cache._scopes) == ["a", "b"]
+    # Вытесненная область перечитывает из хранилища последние max_entries записей.
+    assert await cache.lookup("shared", hashes[1]) == ESTIMATE
+    assert await cache.lookup("shared", hashes[0]) is None
+    assert store.loads == 4
+
+
+async def test_scope_separates_model_and_caption() -> None:
+    cache = VisionCache(_MemoryStore())
+    scope = scope_key("gpt-4o", "v1", "Борщ")
+    await cache.put(scope, 42, ESTIMATE, file_unique_id="f1")
+
+    assert await cache.lookup(scope_key("gpt-4o", "v1", "  борщ "), 43) == ESTIMATE
+    assert await cache.lookup(scope_key("gpt-4o-mini", "v1", "борщ"), 42) is None
+    assert await cache.lookup(scope_key("gpt-4o", "v2", "борщ"), 42) is None
+    assert await cache.lookup(scope_key("gpt-4o", "v1", "полпорции борща"), 42) is None
+    assert await cache.lookup_file_id(scope, "f1") == ESTIMATE
+    assert cache.stats() == {"file_id_hits": 1, "phash_hits": 1, "misses": 3, "saved_calls": 2, "hit_rate": 0.4}
+
+
+async def test_sqlite_store_persists_between_instances(tmp_path: Path) -> None:
+    path = tmp_path / "vision.sqlite"
+    scope = scope_key("gpt-4o", "v1")
+    store = SQLiteVisionStore(path)
+    await VisionCache(store).put(scope, (1 << 64) - 5, ESTIMATE, file_unique_id="f1")
+    store.close()
+
+    reopened = VisionCache(SQLiteVisionStore(path))
+    assert await reopened.lookup(scope, (1 << 64) - 6) == ESTIMATE
+    assert await reopened.lookup_file_id(scope, "f1") == ESTIMATE
+
+
+async def test_database_store_roundtrip(sessionmaker: async_sessionmaker) -> None:
+    scope = scope_key("gpt-4o", "v1")
+    await VisionCache(DatabaseVisionStore(sessionmaker)).put(scope, 1 << 63, {**ESTIMATE, "meal_type": "lunch"})
+
+    fresh = VisionCache(DatabaseVisionStore(sessionmaker))
+    assert await fresh.lookup(scope, 1 << 63) == {**ESTIMATE, "meal_type": "lunch"}
+
+    await fresh.put(scope, 7, ESTIMATE)
+    latest = await DatabaseVisionStore(sessionmaker).load(scope, limit=1)
+    assert [phash for phash, _, _ in latest] == [7]
+
+
+async def test_analyze_cached_calls_model_once_for_duplicates() -> None:
+    client = MagicMock()
+    client.chat.completions.create = AsyncMock(
+        return_value=MagicMock(
+            choices=[
+                MagicMock(
+                    message=MagicMock(
+                        content='{"description": "Борщ", "calories": 180, "protein_g": 6, "fat_g": 7, "carbs_g": 20}'
+                    )
+                )
+            ]
+        )
+    )
+    cache = VisionCache(_MemoryStore())
+    image = _image()
+
+    first, first_cached = await analyze_meal_photo_cached(
+        client, "gpt-4o", _encode(image, (800, 600)), cache=cache
+    )
+    second, second_cached = await analyze_meal_photo_cached(
+        client, "gpt-4o", _encode(image, (400, 300), quality=50), cache=cache
+    )
+
+    assert (first_cached, second_cached) == (False, True)
+    assert second == first
+    assert client.chat.completions.create.await_count == 1
+    assert cache.saved_calls == 1
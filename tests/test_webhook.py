@@ -0,0 +1,122 @@
+"""Тесты режима webhook (bot.services.webhook) на локальном fake Telegram."""
+from __future__ import annotations
+
+import asyncio
+
+import pytest
+from aiogram import Bot, Dispatcher, Router
+from aiogram.types import Message
+from aiohttp.test_utils import TestClient, TestServer
+
+from benchmark.fake_telegram import FAKE_TOKEN, FakeTelegramSession, text_update
+from bot.config import WebhookSettings
+from bot.services.webhook import UpdateQueue, build_webhook_app
+
+SECRET = "s3cret"
+HEADERS = {"X-Telegram-Bot-Api-Secret-Token": SECRET}
+
+
+def _dispatcher(gate: asyncio.Event | None = None) -> Dispatcher:
+    router = Router()
+
+    @router.message()
+    async def echo(message: Message) -> None:
+        if gate is not None:
+            await gate.wait()
+        await message.answer(f"echo: {message.text}")
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    return dp
+
+
+def _options(**overrides) -> WebhookSettings:  # noqa: ANN003
+    return WebhookSettings(url="https://example.test", secret_token=SECRET, **overrides)
+
+
+async def _client(dp: Dispatcher, session: FakeTelegramSession, options: WebhookSettings):  # noqa: ANN202
+    bot = Bot(token=FAKE_TOKEN, session=session)
+    app, queue = build_webhook_app(dp, bot, options)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    return client, queue
+
+
+async def test_updates_are_queued_and_processed() -> None:
+    session = FakeTelegramSession()
+    client, queue = await _client(_dispatcher(), session, _options(workers=3))
+    try:
+        for i in range(20):
+            response = await client.post(_options().path, json=text_update(i, 100 + i % 4, f"hi {i}"), headers=HEADERS)
+            assert response.status == 200
+        await asyncio.wait_for(queue._queue.join(), 5)
+    finally:
+        await client.close()
+    assert queue.stats.accepted == queue.stats.processed == 20
+    assert sorted(call.text for call in session.sent()) == sorted(f"echo: hi {i}" for i in range(20))
+
+
+async def test_wrong_secret_is_rejected() -> None:
+    session = FakeTelegramSession()
+    client, queue = await _client(_dispatcher(), session, _options())
+    try:
+        response = await client.post(
+            _options().path, json=text_update(1, 100, "hi"), headers={"X-Telegram-Bot-Api-Secret-Token": "nope"}
+        )
+        assert response.status == 401
+        response = await client.post(_options().path, json=text_update(2, 100, "hi"))
+        assert response.status == 401
+    finally:
+        await client.close()
+    assert queue.stats.accepted == 0
+    assert session.calls == []
+
+
+@pytest.mark.parametrize(("overflow", "status"), [("reject", 429), ("drop", 200)])
+async def test_full_queue_applies_overflow_policy(overflow: str, status: int) -> None:
+    gate = asyncio.Event()
+    session = FakeTelegramSession()
+    client, queue = await _client(_dispatcher(gate), session, _options(workers=1, queue_size=2, overflow=overflow))
+    try:
+        statuses = []
+        for i in range(5):
+            response = await client.post(_options().path, json=text_update(i, 100, str(i)), headers=HEADERS)
+            statuses.append(response.status)
+            await asyncio.sleep(0.01)  # первый апдейт успевает уйти воркеру
+        # Один апдейт у воркера, два в очереди, остальные — по политике переполнения.
+        assert statuses == [200, 200, 200, status, status]
+        if overflow == "reject":
+            assert response.headers["Retry-After"] == "1"
+        gate.set()
+    finally:
+        await client.close()
+    assert queue.stats.processed == 3
+    assert (queue.stats.rejected, queue.stats.dropped) == ((2, 0) if overflow == "reject" else (0, 2))
+
+
+async def test_shutdown_drains_queue() -> None:
+    gate = asyncio.Event()
+    session = FakeTelegramSession()
+    client, queue = await _client(_dispatcher(gate), session, _options(workers=2))
+    for i in range(6):
+        await client.post(_options().path, json=text_update(i, 100 + i, str(i)), headers=HEADERS)
+    asyncio.get_running_loop().call_later(0.05, gate.set)
+    await client.close()
+    assert queue.stats.processed == 6
+    assert len(session.sent()) == 6
+    assert not queue.accepting
+
+
+async def test_drain_timeout_cancels_leftovers() -> None:
+    bot = Bot(token=FAKE_TOKEN, session=FakeTelegramSession())
+    queue = UpdateQueue(_dispatcher(asyncio.Event()), bot, workers=1)
+    await queue.start()
+    for i in range(3):
+        assert queue.offer(text_update(i, 100, str(i)))
+    await asyncio.sleep(0)
+    assert await queue.drain(timeout_s=0.05) == 2
+
+
+def test_unknown_overflow_policy() -> None:
+    with pytest.raises(ValueError, match="overflow"):
+        UpdateQueue(Dispatcher(), Bot(token=FAKE_TOKEN, session=FakeTelegramSession()), overflow="block")
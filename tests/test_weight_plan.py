@@ -0,0 +1,182 @@
+"""Тесты прогноза веса (bot.services.weight_plan): кэш траекторий и пакетный расчёт."""
+from __future__ import annotations
+
+import itertools
+from datetime import UTC, date, datetime, timedelta
+
+import pytest
+
+from bot.services import weight_plan
+from bot.services.nutrition import ACTIVITY_MULTIPLIERS, calculate_bmr
+from bot.services.weight_plan import (
+    PlanInputs,
+    build_weight_forecast,
+    forecast_trajectory,
+    get_expected_weight_for_date,
+    Trajectory,
+    simulate_batch,
+)
+
+
+def _legacy_forecast(current_weight, target_weight, gender, age, height_cm, activity_level, mode):  # noqa: ANN001, ANN202
+    """Исходный поштучный цикл прогноза — эталон для сравнения."""
+    direction = weight_plan._resolve_direction(current_weight, target_weight)
+    if direction == "maintain":
+        return [round(current_weight, 2)]
+    mode = mode if mode in {"light", "medium", "hard"} else "medium"
+    activity_level = activity_level if activity_level in ACTIVITY_MULTIPLIERS else "moderate"
+    base_delta = weight_plan._base_delta_kcal(direction, mode)
+    floor_kcal = weight_plan._calorie_floor(gender)
+    weight = float(current_weight)
+    result = [round(weight, 2)]
+    for week in range(1, 561):
+        if abs(weight - target_weight) <= 0.05:
+            break
+        bmr = calculate_bmr(gender=gender, age=age, height_cm=height_cm, weight_kg=weight)
+        tdee = bmr * ACTIVITY_MULTIPLIERS[activity_level]
+        if week > 8 and direction == "lose":
+            effective_tdee = tdee * (1.0 - min(0.05, 0.005 * (week - 8)))
+        else:
+            effective_tdee = tdee
+        calories_target = max(effective_tdee + base_delta, floor_kcal)
+        weekly_change = ((calories_target - effective_tdee) * 7.0) / 7700.0
+        weekly_change = min(0.0, weekly_change) if direction == "lose" else max(0.0, weekly_change)
+        next_weight = weight + weekly_change
+        if direction == "lose" and next_weight < target_weight:
+            next_weight = target_weight
+        if direction == "gain" and next_weight > target_weight:
+            next_weight = target_weight
+        weight = next_weight
+        result.append(round(weight, 2))
+    return result
+
+
+def _legacy_expected(forecast: list[float], days_delta: int) -> float:
+    days_delta = max(0, days_delta)
+    week_idx = days_delta // 7
+    if week_idx >= len(forecast):
+        return forecast[-1]
+    if days_delta % 7 == 0 or week_idx == len(forecast) - 1:
+        return forecast[week_idx]
+    left, right = forecast[week_idx], forecast[week_idx + 1]
+    return round(left + (right - left) * ((days_delta % 7) / 7.0), 2)
+
+
+PLANS = [
+    PlanInputs.normalized(start, target, gender, age, height, activity, mode)
+    for start, target, gender, age, height, activity, mode in itertools.product(
+        (48.5, 72.3, 104.0, 161.7),
+        (45.0, 72.305, 80.0, 120.0),
+        ("male", "female"),
+        (19, 67),
+        (152, 188.5),
+        ("low", "very_high", "unknown"),
+        ("light", "hard", "turbo"),
+    )
+]
+
+
+@pytest.fixture(autouse=True)
+def _clean_cache() -> None:
+    weight_plan.clear_forecast_cache()
+
+
+def test_scalar_trajectory_matches_legacy_loop() -> None:
+    for plan in PLANS[::7]:
+        expected = _legacy_forecast(
+            plan.start_kg, plan.target_kg, plan.gender, plan.age, plan.height_cm, plan.activity_level, plan.mode
+        )
+        assert list(forecast_trajectory(*_args(plan)).weights) == expected
+
+
+def test_batch_matches_scalar_bit_for_bit() -> None:
+    batch = simulate_batch(PLANS)
+    for plan, weights in zip(PLANS, batch):
+        assert weights == weight_plan._simulate(plan), plan
+
+
+def test_batch_handles_chunks_and_empty(monkeypatch: pytest.MonkeyPatch) -> None:
+    assert simulate_batch([]) == []
+    monkeypatch.setattr(weight_plan, "_BATCH_CHUNK", 5)
+    plans = PLANS[:23]
+    assert simulate_batch(plans) == [weight_plan._simulate(p) for p in plans]
+
+
+def test_vectorized_rounding_matches_builtin_round() -> None:
+    import numpy as np
+    values = np.concatenate(
+        [
+            np.linspace(30.0, 350.0, 20011),
+            (np.arange(3000, 35000) + 0.5) / 100,  # середины между сотыми
+            np.arange(30000, 350000) / 1000 + 0.005,
+        ]
+    )
+    assert weight_plan._round2(values).tolist() == [round(v, 2) for v in values.tolist()]
+
+
+def test_expected_weight_matches_legacy_interpolation() -> None:
+    plan = PlanInputs.normalized(95.0, 80.0, "female", 35, 165, "light", "medium")
+    trajectory = forecast_trajectory(*_args(plan))
+    legacy = _legacy_forecast(*_args(plan))
+    start = datetime(2026, 3, 1, 9, tzinfo=UTC)
+    for days in (-3, 0, 1, 6, 7, 30, 100, len(legacy) * 7 - 1, len(legacy) * 7 + 50):
+        assert trajectory.expected_weight(days) == _legacy_expected(legacy, days)
+        assert get_expected_weight_for_date(
+            plan_start_date=start,
+            plan_start_kg=plan.start_kg,
+            target_weight=plan.target_kg,
+            mode=plan.mode,
+            gender=plan.gender,
+            age=plan.age,
+            height_cm=plan.height_cm,
+            activity_level=plan.activity_level,
+            check_date=start + timedelta(days=days),
+        ) == _legacy_expected(legacy, days)
+
+
+def test_forecast_is_memoized(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = []
+    original = weight_plan._simulate
+    monkeypatch.setattr(weight_plan, "_simulate", lambda plan: calls.append(plan) or original(plan))
+    first = forecast_trajectory(90.0, 80.0, "male", 30, 180, "moderate", "medium")
+    second = forecast_trajectory(90, 80, "male", 30, 180.0, "moderate", "medium")
+    assert first is second
+    assert len(calls) == 1
+
+
+def test_cache_evicts_least_recently_used(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(weight_plan, "FORECAST_CACHE_SIZE", 2)
+    a = forecast_trajectory(90.0, 80.0, "male", 30, 180, "moderate", "light")
+    forecast_trajectory(90.0, 80.0, "male", 30, 180, "moderate", "medium")
+    assert forecast_trajectory(90.0, 80.0, "male", 30, 180, "moderate", "light") is a
+    forecast_trajectory(90.0, 80.0, "male", 30, 180, "moderate", "hard")
+    assert forecast_trajectory(90.0, 80.0, "male", 30, 180, "moderate", "light") is a
+    assert len(weight_plan._TRAJECTORIES) == 2
+
+
+def test_trajectory_bytes_roundtrip_is_exact() -> None:
+    trajectory = forecast_trajectory(101.37, 77.0, "female", 41, 170, "high", "light")
+    restored = Trajectory.from_bytes(trajectory.to_bytes())
+    assert restored.weights == trajectory.weights
+    assert len(trajectory.to_bytes()) == 8 * len(trajectory)
+
+
+def test_plan_key_distinguishes_inputs() -> None:
+    base = PlanInputs.normalized(90.0, 80.0, "male", 30, 180, "moderate", "medium")
+    assert base.key == PlanInputs.normalized(90, 80, "male", 30, 180.0, "moderate", "medium").key
+    assert base.key != PlanInputs.normalized(90.0, 80.0, "male", 31, 180, "moderate", "medium").key
+    assert base.key != PlanInputs.normalized(90.0, 80.0, "male", 30, 180, "moderate", "hard").key
+
+
+def test_build_weight_forecast_keeps_dict_format() -> None:
+    forecast = build_weight_forecast(90.0, 88.0, "male", 30, 180, "moderate", "hard", start_date=date(2026, 1, 5))
+    assert forecast[0] == {"week": 0, "date": "2026-01-05", "weight_kg": 90.0}
+    assert forecast[1]["date"] == "2026-01-12"
+    assert forecast[-1]["weight_kg"] == 88.0
+    assert [x["week"] for x in forecast] == list(range(len(forecast)))
+    maintain = build_weight_forecast(80.0, 80.0, "female", 30, 165, "low", "light")
+    assert maintain == [{"week": 0, "date": datetime.now().date().isoformat(), "weight_kg": 80.0}]
+
+
+def _args(plan: PlanInputs) -> tuple:
+    return (plan.start_kg, plan.target_kg, plan.gender, plan.age, plan.height_cm, plan.activity_level, plan.mode)